@@ -1,12 +1,32 @@
 # app/__init__.py
+from app.utils.startup_profile import startup_profile # First, so the startup report includes the imports below
 from flask import Flask
 import os
-import logging
 import atexit
 from app.db.db_pool_manager import initialize_db_pool, close_db_pool
+from app.db.slow_query_log import initialize_slow_query_log, shutdown_slow_query_log
+from app.db.ann_partitions import initialize_ann_router, shutdown_ann_router
+from app.utils.job_scheduler import initialize_job_scheduler, shutdown_job_scheduler
+from app.utils.http_client import initialize_http_client, close_http_client
+from app.utils.callback_delivery import initialize_callback_delivery, shutdown_callback_delivery
+from app.utils.id_token_manager import initialize_id_token_manager, shutdown_id_token_manager
+from app.utils.json_codec import FastJSONProvider, JSON_BACKEND
+from app.utils.compression import configure_compression
+from app.utils.logging_setup import configure_logging, shutdown_logging, ensure_log_listener
+from app.utils.pending_store import initialize_pending_stores, shutdown_pending_stores
+from app.utils.idempotency import initialize_idempotency_cache, shutdown_idempotency_cache
+from app.services.catalog_fragments import initialize_catalog_fragment_cache
+from app.utils.warmup import initialize_warmup, shutdown_warmup, import_sdk_modules
+from app.utils.metrics import initialize_metrics, shutdown_metrics
+from app.utils.tracing import initialize_tracing, shutdown_tracing
+from app.utils.traffic_capture import initialize_traffic_capture, shutdown_traffic_capture
+
+startup_profile.lap("imports")
 
 def create_app(config_class=None):
     app = Flask(__name__)
+    # request.get_json() and jsonify() go through the fast codec
+    app.json = FastJSONProvider(app)
 
     # --- Configuration Loading ---
     if config_class is None:
@@ -22,11 +42,77 @@ def create_app(config_class=None):
             app.config.from_object(DevelopmentConfig)
     else:
         app.config.from_object(config_class)
+    startup_profile.lap("config")
 
     # --- Logging Setup ---
-    logging.basicConfig(level=app.config.get('LOG_LEVEL', 'INFO'),
-                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    app.logger.info(f"App configured with DEBUG={app.config['DEBUG']} and LOG_LEVEL={app.config['LOG_LEVEL']}")
+    # Structured/async handlers; must run before the first app.logger access.
+    # Registered first so it runs last at exit and flushes the other shutdown logs.
+    configure_logging(app)
+    atexit.register(shutdown_logging, app)
+    app.logger.info(f"App configured with DEBUG={app.config['DEBUG']}, LOG_LEVEL={app.config['LOG_LEVEL']}, "
+                    f"LOG_FORMAT={app.config.get('LOG_FORMAT')}, LOG_ASYNC={app.config.get('LOG_ASYNC')}")
+    app.logger.info(f"JSON backend: {JSON_BACKEND}")
+    startup_profile.lap("logging")
+
+    # --- Process-independent state ---
+    # Built before any fork so gunicorn --preload workers share it copy-on-write.
+
+    # --- Dedup of retried /search and /select requests ---
+    initialize_idempotency_cache(app)
+    atexit.register(shutdown_idempotency_cache, app)
+
+    # --- Pre-rendered Catalog Item Fragments ---
+    initialize_catalog_fragment_cache(app)
+
+    # --- Callback Payload Compression ---
+    configure_compression(app)
+
+    # --- Register Blueprints ---
+    from app.controllers.beckn_controller import beckn_bp
+    from app.controllers.health_controller import health_bp
+    from app.controllers.metrics_controller import metrics_bp
+    app.register_blueprint(beckn_bp, url_prefix='/beckn')
+    app.register_blueprint(health_bp) # /healthz and /readyz at the root, where probes expect them
+    app.register_blueprint(metrics_bp) # /metrics for Prometheus
+    if app.config.get('ADMIN_ENABLED', True):
+        from app.controllers.admin_controller import admin_bp
+        app.register_blueprint(admin_bp, url_prefix='/admin') # Stats, dead letters, traces; every request needs ADMIN_TOKEN
+        if not app.config.get('ADMIN_TOKEN'):
+            app.logger.warning("ADMIN_TOKEN is not set; all /admin requests will be refused.")
+    if app.config.get('PROFILING_ENABLED'):
+        # Imported only when enabled: no profiler modules, hooks or routes otherwise.
+        from app.utils.profiling import install_profiling
+        install_profiling(app) # /admin profiler endpoints and per-request hooks
+    startup_profile.lap("app_state")
+
+    if app.config.get('DEFER_PROCESS_RESOURCES'):
+        # gunicorn --preload: sockets and threads must not cross fork(), so the
+        # post_fork hook in gunicorn.conf.py calls init_process_resources() per worker.
+        app.logger.info("Deferring DB pool, HTTP client and background threads until after fork.")
+        # SDKs are otherwise imported lazily in each worker; load them once here to share them.
+        import_sdk_modules()
+        startup_profile.lap("sdk_imports")
+    else:
+        init_process_resources(app)
+
+    # --- Register app shutdown callback to close the DB pool ---
+    # @app.teardown_appcontext
+    # def teardown_db_pool(exception=None):
+    #     close_db_pool()
+    
+    app.logger.info("Flask application initialized.")
+    return app
+
+def init_process_resources(app):
+    """
+    Creates everything that owns sockets or threads: the DB pool, the outbound
+    HTTP client, the token refresher, store sweepers, callback workers and the
+    job scheduler. Must run in the process that serves requests, i.e. after
+    fork when the app is preloaded.
+    """
+    startup_profile.restart_lap()
+    # The log listener thread does not survive fork; restart it in this process.
+    ensure_log_listener()
 
     # --- Initialize Database Connection Pool ---
     # Call initialize_db_pool here, passing the app instance to access config and logger
@@ -39,14 +125,48 @@ def create_app(config_class=None):
         # For a web server, a non-functional DB pool means the app is not ready.
         raise # Make startup fail if DB pool init fails
 
-    # --- Register Blueprints ---
-    from app.controllers.beckn_controller import beckn_bp
-    app.register_blueprint(beckn_bp, url_prefix='/beckn')
+    # --- Slow-query log with sampled EXPLAIN on its own connection ---
+    initialize_slow_query_log(app)
+    atexit.register(shutdown_slow_query_log, app)
+    initialize_ann_router(app) # Category partition indexes; the list is read by the warmup, then by a refresher thread
+    atexit.register(shutdown_ann_router, app)
+    startup_profile.lap("db_pool")
 
-    # --- Register app shutdown callback to close the DB pool ---
-    # @app.teardown_appcontext
-    # def teardown_db_pool(exception=None):
-    #     close_db_pool()
-    
-    app.logger.info("Flask application initialized.")
-    return app
\ No newline at end of file
+    # --- Initialize Shared Outbound HTTP Client ---
+    initialize_http_client(app)
+    atexit.register(close_http_client, app)
+
+    # --- Start ID Token Manager (background refresh of callback tokens) ---
+    initialize_id_token_manager(app)
+    atexit.register(shutdown_id_token_manager, app)
+
+    # --- Bounded, expiring stores for in-flight transactions ---
+    initialize_pending_stores(app)
+    atexit.register(shutdown_pending_stores, app)
+
+    # --- Span exporter (registered first so it flushes after the workers below stop) ---
+    initialize_tracing(app)
+    atexit.register(shutdown_tracing, app)
+
+    # --- Traffic capture for offline replay (opt-in) ---
+    initialize_traffic_capture(app)
+    atexit.register(shutdown_traffic_capture, app)
+
+    # --- Start Callback Delivery Workers ---
+    initialize_callback_delivery(app)
+    atexit.register(shutdown_callback_delivery, app)
+
+    # --- Start Background Job Scheduler ---
+    initialize_job_scheduler(app)
+    atexit.register(shutdown_job_scheduler, app)
+
+    # --- Metrics snapshots for cross-worker /metrics (multiprocess mode only) ---
+    initialize_metrics(app)
+    atexit.register(shutdown_metrics, app)
+    startup_profile.lap("background_services")
+
+    app.logger.info("Process resources initialized in pid %d.", os.getpid())
+
+    # --- Readiness Warmup (connections, search service, embedding, tokens) ---
+    initialize_warmup(app)
+    atexit.register(shutdown_warmup, app)
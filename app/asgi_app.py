@@ -0,0 +1,209 @@
+# app/asgi_app.py
+#
+# ASGI front end (Starlette, served by uvicorn) for the Beckn endpoints.
+#
+# /search and /select share BecknIntakeService with the Flask blueprint, so
+# both front ends behave identically; the background search, select and
+# callback machinery is the same per-process code either way. What changes is
+# waiting: long-poll and SSE clients park on the event loop instead of holding
+# a worker thread each. Every other route (/health, /metrics, /admin) is
+# passed through to the Flask app unchanged.
+import asyncio
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware # Optional: preferred WSGI bridge for the pass-through routes
+except ImportError:
+    import warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore") # Deprecated in favour of a2wsgi, but still functional
+        from starlette.middleware.wsgi import WSGIMiddleware
+
+from app.services.beckn_intake_service import BecknIntakeService
+from app.utils import json_codec
+from app.utils.beckn_utils import get_pending_request_results, get_pending_select_request_results
+from app.utils.beckn_utils import wait_for_pending_request_results_async, wait_for_pending_select_request_results_async
+from app.utils.logging_setup import should_log_payload, LazyJSON
+from app.utils.pending_store import get_pending_search_store, PendingRequestStore
+from app.utils.traffic_capture import capture_request
+
+_ACK = {"message": {"ack": {"status": "ACK"}}}
+
+
+def _json_response(body, status_code=200):
+    if not isinstance(body, bytes):
+        body = json_codec.dumps(body)
+    return Response(body, status_code=status_code, media_type="application/json")
+
+
+async def _read_json(request):
+    """
+    Returns the parsed JSON body, or None if it does not parse. Whether it is
+    a usable Beckn body is BecknIntakeService's call, as on the Flask side.
+    """
+    try:
+        return json_codec.loads(await request.body())
+    except ValueError:
+        return None
+
+
+class BecknASGIApp:
+    """
+    Starlette routes bound to one Flask app, whose config, logger and
+    process resources (stores, scheduler, callback delivery) they use.
+    Handlers run with that app's context pushed, so service code reading
+    current_app works unchanged.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+
+    async def _call_service(self, func, *args):
+        # A result lookup in the in-memory store is one lock-striped dict
+        # access and runs inline; the shared backends do network or disk I/O
+        # and go to a thread instead.
+        if isinstance(get_pending_search_store(), PendingRequestStore):
+            return func(*args)
+        return await asyncio.to_thread(func, *args) # Copies the context, app context included
+
+    async def _accept(self, func, data, traceparent):
+        # Always on a thread: intake parses the query, writes the pending store
+        # (possibly SQLite or Redis) and logs, any of which can block the loop.
+        return await asyncio.to_thread(func, data, traceparent)
+
+    def _requested_wait_seconds(self, request, default=0.0):
+        """
+        Same rules as the Flask controller: ?wait= (long-poll) or ?timeout= (SSE),
+        capped at RESULT_WAIT_MAX_SECONDS.
+        """
+        raw_value = request.query_params.get('wait', request.query_params.get('timeout'))
+        try:
+            wait_seconds = float(raw_value) if raw_value is not None else default
+        except ValueError:
+            wait_seconds = default
+        return max(0.0, min(wait_seconds, self.flask_app.config.get('RESULT_WAIT_MAX_SECONDS', 30)))
+
+    async def search(self, request):
+        data = await _read_json(request)
+        capture_request('search', data)
+        with self.flask_app.app_context():
+            ack_response, status = await self._accept(BecknIntakeService.accept_search, data, request.headers.get('traceparent'))
+        return _json_response(ack_response, status)
+
+    async def select(self, request):
+        data = await _read_json(request)
+        capture_request('select', data)
+        with self.flask_app.app_context():
+            ack_response, status = await self._accept(BecknIntakeService.accept_select, data, request.headers.get('traceparent'))
+        return _json_response(ack_response, status)
+
+    async def on_search_received(self, request):
+        data = await _read_json(request)
+        if should_log_payload('on_search'):
+            self.flask_app.logger.info("BPP received /on_search (likely from another BPP/BAP for PoC): %s", LazyJSON(data))
+        return _json_response(_ACK)
+
+    async def on_select_received(self, request):
+        data = await _read_json(request)
+        if should_log_payload('on_select'):
+            self.flask_app.logger.info("BPP received /on_select (likely from another BPP/BAP for PoC): %s", LazyJSON(data))
+        return _json_response(_ACK)
+
+    async def _get_results(self, request, label, get_func, wait_func):
+        transaction_id = request.path_params['transaction_id']
+        request_start_time = time.perf_counter()
+        logger = self.flask_app.logger
+        logger.info("Received /get_%s_results request for transaction_id: %s", label, transaction_id)
+        wait_seconds = self._requested_wait_seconds(request)
+        with self.flask_app.app_context():
+            if wait_seconds:
+                results = await wait_func(transaction_id, wait_seconds)
+            else:
+                results = await self._call_service(get_func, transaction_id)
+        processing_time_ms = (time.perf_counter() - request_start_time) * 1000
+
+        if isinstance(results, str): # "failed" / "expired" from the long-poll
+            logger.warning("Transaction %s ended %s without results. Processing time: %.2f ms.", transaction_id, results, processing_time_ms)
+            return _json_response({"error": f"No results will come for this transaction_id: it {results}.", "status": results}, 410)
+        if results:
+            logger.info("Results found for transaction_id: %s. Processing time: %.2f ms.", transaction_id, processing_time_ms)
+            return _json_response(results)
+        logger.warning("Results not found or not ready for transaction_id: %s. Processing time: %.2f ms.", transaction_id, processing_time_ms)
+        noun = "Results" if label == "search" else "Select results"
+        return _json_response({"error": f"{noun} not found or not ready for this transaction_id."}, 404)
+
+    async def get_search_results(self, request):
+        return await self._get_results(request, "search", get_pending_request_results, wait_for_pending_request_results_async)
+
+    async def get_select_results(self, request):
+        return await self._get_results(request, "select", get_pending_select_request_results, wait_for_pending_select_request_results_async)
+
+    def _stream_result_events(self, request, label, wait_func):
+        """
+        Same event stream as the Flask controller: keep-alive comments, then
+        one 'result' (or 'failed' / 'expired' / 'timeout') event.
+        """
+        transaction_id = request.path_params['transaction_id']
+        self.flask_app.logger.info("Received /stream_%s_results request for transaction_id: %s", label, transaction_id)
+        total_wait = self._requested_wait_seconds(request, default=self.flask_app.config.get('RESULT_WAIT_MAX_SECONDS', 30))
+        keepalive_seconds = self.flask_app.config.get('SSE_KEEPALIVE_SECONDS', 15)
+
+        async def generate():
+            deadline = time.monotonic() + total_wait
+            yield b"retry: 1000\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    yield b"event: timeout\ndata: {}\n\n"
+                    return
+                with self.flask_app.app_context():
+                    results = await wait_func(transaction_id, min(remaining, keepalive_seconds))
+                if isinstance(results, str):
+                    yield f'event: {results}\ndata: {{"status": "{results}"}}\n\n'.encode()
+                    return
+                if results:
+                    yield b"event: result\ndata: " + results + b"\n\n"
+                    return
+                yield b": keep-alive\n\n"
+
+        return StreamingResponse(generate(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    async def stream_search_results(self, request):
+        return self._stream_result_events(request, "search", wait_for_pending_request_results_async)
+
+    async def stream_select_results(self, request):
+        return self._stream_result_events(request, "select", wait_for_pending_select_request_results_async)
+
+    def routes(self):
+        return [
+            Route('/beckn/search', self.search, methods=['POST']),
+            Route('/beckn/select', self.select, methods=['POST']),
+            Route('/beckn/on_search', self.on_search_received, methods=['POST']),
+            Route('/beckn/on_select', self.on_select_received, methods=['POST']),
+            Route('/beckn/get_search_results/{transaction_id}', self.get_search_results, methods=['GET']),
+            Route('/beckn/get_select_results/{transaction_id}', self.get_select_results, methods=['GET']),
+            Route('/beckn/stream_search_results/{transaction_id}', self.stream_search_results, methods=['GET']),
+            Route('/beckn/stream_select_results/{transaction_id}', self.stream_select_results, methods=['GET']),
+            Mount('/', app=WSGIMiddleware(self.flask_app)), # Everything else is served by Flask
+        ]
+
+
+def create_asgi_app(flask_app=None):
+    """
+    Builds the ASGI application. Without `flask_app`, a Flask app is created
+    with create_app(), which also starts this process's resources.
+
+        uvicorn asgi:app --host 0.0.0.0 --port 8080
+    """
+    if flask_app is None:
+        from app import create_app
+        flask_app = create_app()
+    asgi_app = Starlette(routes=BecknASGIApp(flask_app).routes())
+    asgi_app.state.flask_app = flask_app
+    flask_app.logger.info("ASGI application ready: Beckn endpoints served natively, other routes via Flask.")
+    return asgi_app
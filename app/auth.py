@@ -2,13 +2,9 @@ import logging
 import requests
 from urllib.parse import urlparse, urlunparse
 from io import BytesIO
-import json # Import json for handling JSON payloads
-# Google Cloud authentication libraries
-from google.auth import default
-from google.auth.transport.requests import AuthorizedSession
-import google.oauth2.id_token # Import for fetching ID tokens
-from cachetools import TTLCache # For caching ID tokens
-import google.auth.transport.requests as google_auth_requests # For the request object for fetch_id_token
+from app.utils import json_codec # Fast JSON codec (orjson when available)
+from app.utils.http_client import get_http_client # Shared keep-alive connection pools
+from app.utils.id_token_manager import get_id_token_manager # Cached, proactively refreshed ID tokens
 
 # Assuming 'your/package/log' maps to Python's standard logging
 logger = logging.getLogger(__name__)
@@ -18,10 +14,8 @@ logger = logging.getLogger(__name__)
 # ID tokens should be fetched per request or cached with their expiry.
 # We will fetch the ID token directly in make_authenticated_request.
 
-# Cache for Google ID tokens. Tokens are valid for 1 hour. We'll cache them for 55 minutes (3300 seconds)
-# to ensure we don't use an expired token.
-id_token_cache = TTLCache(maxsize=100, ttl=3300)
-# We will fetch the ID token directly in make_authenticated_request.
+# ID tokens are cached until their real 'exp' and refreshed in the background
+# by app.utils.id_token_manager.IdTokenManager.
 
 
 # Mimicking func proxy(ctx *model.StepContext, r *http.Request, w http.ResponseWriter, target *url.URL)
@@ -84,8 +78,9 @@ def make_authenticated_request(
         requests.exceptions.RequestException: If the HTTP request fails.
         ValueError: If JSON encoding fails.
     """
-    # Use a standard requests session. Authentication will be handled by adding an ID token if audience is provided.
-    session = requests.Session()
+    # Use the shared pooled client so callbacks to the same BAP reuse open connections.
+    # Authentication will be handled by adding an ID token if audience is provided.
+    http_client = get_http_client()
     auth_header_value = None # Will hold the "Bearer <token>" string
     
     # Prepare headers - copy provided headers and ensure Authorization is handled by AuthorizedSession
@@ -98,30 +93,11 @@ def make_authenticated_request(
 
     if bearer_token:
         auth_header_value = f'Bearer {bearer_token}'
-        logger.info(f"Using provided bearer token for authentication to {url}.")
+        logger.info("Using provided bearer token for authentication to %s.", url)
     elif audience:
-        # --- Check for a cached token first ---
-        fetched_id_token = id_token_cache.get(audience)
-        if fetched_id_token:
-            logger.info(f"Using cached ID token for audience: {audience}")
-        else:
-            logger.info(f"No cached token for audience: {audience}. Fetching a new one.")
-            try:
-                # Obtain credentials using Application Default Credentials.
-                credentials, project = default()
-                auth_req = google_auth_requests.Request() # Create a transport request object
-                
-                # Fetch the ID token for the specified audience.
-                fetched_id_token = google.oauth2.id_token.fetch_id_token(auth_req, audience)
-                logger.debug(f"DEBUG: Fetched ID token (truncated): {fetched_id_token[:20]}... for audience: {audience}")
-                
-                # Store the newly fetched token in the cache
-                id_token_cache[audience] = fetched_id_token
-                logger.info(f"Successfully fetched and cached new ID token for audience: {audience}")
-            except Exception as e:
-                logger.error(f"Failed to fetch ID token for audience {audience}: {e}", exc_info=True)
-                raise ConnectionError(f"Authentication setup failed: Could not get ID token for audience {audience}.") from e
-        
+        # Served from cache in steady state; concurrent misses share a single fetch.
+        # Raises ConnectionError if no token can be obtained.
+        fetched_id_token = get_id_token_manager().get_token(audience)
         auth_header_value = f'Bearer {fetched_id_token}'
     
     if auth_header_value:
@@ -131,24 +107,24 @@ def make_authenticated_request(
     request_data = data
     if request_data is None and json_payload is not None:
         try:
-            request_data = json.dumps(json_payload).encode('utf-8')
+            request_data = json_codec.dumps(json_payload)
             # Ensure Content-Type is set for JSON if not already present
             if 'Content-Type' not in outgoing_headers:
                  outgoing_headers['Content-Type'] = 'application/json'
         except Exception as e:
-            logger.error(f"Failed to encode JSON payload: {e}", exc_info=True)
+            logger.error("Failed to encode JSON payload: %s", e, exc_info=True)
             raise ValueError(f"Failed to encode JSON payload: {e}") from e
 
     if auth_header_value:
         if bearer_token:
-            logger.info(f"Making authenticated request to {url} using provided token.")
+            logger.info("Making authenticated request to %s using provided token.", url)
         else: # Must have been an audience-fetched token
-            logger.info(f"Making authenticated request to {url} (audience: {audience})")
+            logger.info("Making authenticated request to %s (audience: %s)", url, audience)
     else:
-        logger.warning(f"Making unauthenticated request to {url} as no audience or bearer_token was provided, or ID token could not be fetched.")
+        logger.warning("Making unauthenticated request to %s as no audience or bearer_token was provided, or ID token could not be fetched.", url)
 
     try:
-        response = session.request(
+        response = http_client.request(
             method=method,
             url=url,
             headers=outgoing_headers,
@@ -162,15 +138,15 @@ def make_authenticated_request(
         if auth_header_value: # Only log if we attempted to send an Authorization header
             sent_auth_header = response.request.headers.get('Authorization')
             if sent_auth_header:
-                logger.info(f"DEBUG: Outgoing Request Authorization Header to {url}: {sent_auth_header[:20]}... (truncated for safety)")
+                logger.info("DEBUG: Outgoing Request Authorization Header to %s: %s... (truncated for safety)", url, sent_auth_header[:20])
             else: # Should not happen if id_token was set and added
-                logger.warning(f"DEBUG: Outgoing Request to {url} was intended to be authenticated but did not include an Authorization header in the final request.")
+                logger.warning("DEBUG: Outgoing Request to %s was intended to be authenticated but did not include an Authorization header in the final request.", url)
 
 
-        logger.info(f"Received response from {url}: Status={response.status_code}")
+        logger.info("Received response from %s: Status=%s", url, response.status_code)
 
         return response
 
     except requests.exceptions.RequestException as e:
-        logger.error(f"Error making authenticated request to {url}: {e}", exc_info=True)
+        logger.error("Error making authenticated request to %s: %s", url, e, exc_info=True)
         raise # Re-raise the exception after logging
\ No newline at end of file
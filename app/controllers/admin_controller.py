@@ -0,0 +1,152 @@
+# app/controllers/admin_controller.py
+#
+# Operator endpoints: slow queries, component stats, traces and dead-lettered
+# callbacks. Registered unless ADMIN_ENABLED is off, and answered only for
+# requests carrying ADMIN_TOKEN in X-Admin-Token. The profiler endpoints are
+# in profiling_controller.py, registered only when PROFILING_ENABLED is set.
+# Every endpoint reports on the worker process that serves it.
+from flask import Blueprint, request, jsonify, current_app
+import os
+from app.db.ann_partitions import get_ann_router
+from app.db.slow_query_log import get_slow_query_log
+from app.services.catalog_fragments import get_catalog_fragment_cache
+from app.utils.callback_delivery import get_callback_delivery
+from app.utils.http_client import get_http_client_stats
+from app.utils.id_token_manager import get_id_token_manager
+from app.utils.idempotency import get_idempotency_cache
+from app.utils.job_scheduler import get_job_scheduler
+from app.utils.pending_store import get_pending_search_store, get_pending_select_store
+from app.utils.result_waiters import search_result_waiters, select_result_waiters
+from app.utils.startup_profile import startup_profile
+from app.utils.tracing import get_tracer
+from app.utils.traffic_capture import get_traffic_capture
+from app.utils.warmup import get_warmup
+from app.utils.admin_auth import is_admin_request
+
+admin_bp = Blueprint('admin', __name__)
+
+@admin_bp.before_request
+def require_admin_token():
+    if not is_admin_request(current_app.config):
+        return jsonify({"error": "Admin token required."}), 403
+
+@admin_bp.route('/slow_queries', methods=['GET'])
+def list_slow_queries():
+    """Newest first, with the EXPLAIN summaries; ?limit= (default 50)."""
+    slow_queries = get_slow_query_log()
+    if slow_queries is None:
+        return jsonify({"error": "The slow-query log is off (SLOW_QUERY_THRESHOLD_MS=0)."}), 404
+    limit = request.args.get('limit', default=50, type=int)
+    return jsonify({"pid": os.getpid(), "stats": slow_queries.get_stats(), "slow_queries": slow_queries.list(limit)}), 200
+
+@admin_bp.route('/slow_queries/<entry_id>', methods=['GET'])
+def get_slow_query(entry_id):
+    """One slow query with its full EXPLAIN (ANALYZE, BUFFERS) plan, when it was sampled."""
+    slow_queries = get_slow_query_log()
+    entry = slow_queries.get(entry_id) if slow_queries is not None else None
+    if entry is None:
+        return jsonify({"error": f"No slow query {entry_id} in pid {os.getpid()}."}), 404
+    return jsonify(entry), 200
+
+@admin_bp.route('/scheduler_stats', methods=['GET'])
+def scheduler_stats_debug():
+    scheduler = get_job_scheduler()
+    if scheduler is None:
+        return jsonify({"error": "Job scheduler is not initialized."}), 503
+    return jsonify(scheduler.get_stats()), 200
+
+@admin_bp.route('/http_client_stats', methods=['GET'])
+def http_client_stats_debug():
+    return jsonify(get_http_client_stats()), 200
+
+@admin_bp.route('/dead_letters', methods=['GET'])
+def list_dead_letters():
+    delivery = get_callback_delivery()
+    if delivery is None:
+        return jsonify({"error": "Callback delivery is not initialized."}), 503
+    return jsonify({"stats": delivery.get_stats(), "dead_letters": delivery.dead_letters.list_entries()}), 200
+
+@admin_bp.route('/dead_letters/<job_id>/replay', methods=['POST'])
+def replay_dead_letter(job_id):
+    delivery = get_callback_delivery()
+    if delivery is None:
+        return jsonify({"error": "Callback delivery is not initialized."}), 503
+    if delivery.replay(job_id):
+        current_app.logger.info("Dead-lettered callback %s re-queued for delivery.", job_id)
+        return jsonify({"message": {"ack": {"status": "ACK"}}, "id": job_id}), 202
+    current_app.logger.warning("Replay requested for unknown dead-letter id: %s", job_id)
+    return jsonify({"error": "Dead-letter entry not found."}), 404
+
+@admin_bp.route('/id_token_stats', methods=['GET'])
+def id_token_stats_debug():
+    return jsonify(get_id_token_manager().get_stats()), 200
+
+@admin_bp.route('/callback_hosts', methods=['GET'])
+def callback_hosts_debug():
+    delivery = get_callback_delivery()
+    if delivery is None:
+        return jsonify({"error": "Callback delivery is not initialized."}), 503
+    return jsonify(delivery.get_host_stats()), 200
+
+@admin_bp.route('/catalog_fragment_stats', methods=['GET'])
+def catalog_fragment_stats_debug():
+    return jsonify(get_catalog_fragment_cache().get_stats()), 200
+
+@admin_bp.route('/idempotency_stats', methods=['GET'])
+def idempotency_stats_debug():
+    return jsonify(get_idempotency_cache().get_stats()), 200
+
+@admin_bp.route('/traffic_capture_stats', methods=['GET'])
+def traffic_capture_stats_debug():
+    capture = get_traffic_capture()
+    if capture is None:
+        return jsonify({"error": "Traffic capture is not enabled (TRAFFIC_CAPTURE_ENABLED)."}), 404
+    return jsonify(capture.get_stats()), 200
+
+@admin_bp.route('/ann_partition_stats', methods=['GET'])
+def ann_partition_stats_debug():
+    ann_router = get_ann_router()
+    if ann_router is None:
+        return jsonify({"error": "ANN partition routing is disabled (ANN_ROUTING_ENABLED)."}), 404
+    return jsonify(ann_router.get_stats()), 200
+
+@admin_bp.route('/pending_stats', methods=['GET'])
+def pending_stats_debug():
+    return jsonify({
+        "search": get_pending_search_store().get_stats(),
+        "select": get_pending_select_store().get_stats(),
+        "search_waiters": search_result_waiters.get_stats(),
+        "select_waiters": select_result_waiters.get_stats(),
+    }), 200
+
+@admin_bp.route('/startup_stats', methods=['GET'])
+def startup_stats_debug():
+    warmup = get_warmup()
+    return jsonify({
+        "startup": startup_profile.get_report(),
+        "warmup": warmup.get_report() if warmup is not None else None,
+    }), 200
+
+@admin_bp.route('/traces/<transaction_id>', methods=['GET'])
+def transaction_trace_debug(transaction_id):
+    """
+    This process's recorded spans for a transaction, oldest first, with the
+    slowest stage called out. Other workers answer for their own transactions.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return jsonify({"error": "Tracing is disabled (TRACING_EXPORTER=off)."}), 404
+    spans = tracer.get_transaction_spans(transaction_id)
+    if not spans:
+        return jsonify({"error": "No spans recorded in this process for this transaction_id."}), 404
+    # Only leaf stages; a parent span's duration includes its children.
+    parent_ids = {span["parent_span_id"] for span in spans}
+    leaves = [span for span in spans if span["span_id"] not in parent_ids]
+    slowest = max(leaves or spans, key=lambda span: span["duration_ms"])
+    return jsonify({
+        "transaction_id": transaction_id,
+        "trace_ids": sorted({span["trace_id"] for span in spans}),
+        "slowest_stage": {"name": slowest["name"], "duration_ms": slowest["duration_ms"]},
+        "spans": spans,
+        "tracer": tracer.get_stats(),
+    }), 200
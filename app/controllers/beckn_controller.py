@@ -1,129 +1,146 @@
 # app/controllers/beckn_controller.py
-from flask import Blueprint, request, jsonify, current_app 
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
 import time # Added for timing
-import uuid
-import json
-from app.services.search_service import SearchService
-from app.services.beckn_service import BecknService # Keep this import
-from app.utils.async_tasks import run_async_task, run_async_select_task # Import new async task runner
-from app.utils.beckn_utils import extract_search_criteria, generate_ack_response, store_pending_request, get_pending_request_results, extract_select_criteria, store_pending_select_request, get_pending_select_request_results # Import new utils
+from app.services.beckn_intake_service import BecknIntakeService # Shared with the ASGI app
+from app.utils.logging_setup import set_log_transaction_id, should_log_payload, LazyJSON
+from app.utils.beckn_utils import get_pending_request_results, get_pending_select_request_results # Import new utils
+from app.utils.beckn_utils import wait_for_pending_request_results, wait_for_pending_select_request_results
+from app.utils.traffic_capture import capture_request
 
 beckn_bp = Blueprint('beckn', __name__)
 
+@beckn_bp.before_request
+def clear_log_transaction_id():
+    # Threaded servers reuse request threads; don't tag this request's logs with the previous transaction.
+    set_log_transaction_id(None)
+
 @beckn_bp.route('/search', methods=['POST'])
 def search():
-    request_start_time = time.perf_counter()
-    data = request.get_json()
-    current_app.logger.info(f"Received /search request. Body: {json.dumps(data, indent=2)}")
-
-    context = data.get('context', {})
-    message = data.get('message', {})
-
-    transaction_id = context.get('transaction_id', str(uuid.uuid4()))
-    message_id = context.get('message_id', str(uuid.uuid4()))
-    callback_uri = context.get('bpp_uri') # URI where the on_search response should be sent
-
-    # Transform the callback URI path from '/receiver' to '/caller' for testing purposes
-    if callback_uri and '/receiver' in callback_uri:
-        original_uri = callback_uri
-        callback_uri = original_uri.replace('/receiver', '/caller')
-        current_app.logger.info(f"Transformed callback URI from '{original_uri}' to '{callback_uri}'.")
-
-    search_criteria = extract_search_criteria(message)
-
-    current_app.logger.debug(f"Storing pending request for transaction_id: {transaction_id} before ACK.")
-    store_pending_request(transaction_id, callback_uri, search_criteria, context)
-
-    ack_response = generate_ack_response(context, "search", transaction_id, message_id)
-    current_app.logger.info(f"Generated ACK for transaction_id: {transaction_id}. Preparing to send.")
-
-    # --- IMPORTANT CHANGE HERE ---
-    # Pass the actual app instance to the async task function
-    run_async_task(current_app._get_current_object(), transaction_id, message_id, search_criteria, context, callback_uri)
-    # --- END CHANGE ---
-
-    request_end_time = time.perf_counter()
-    current_app.logger.info(f"ACK sent and async search initiated for transaction_id: {transaction_id}. Sync processing time: {(request_end_time - request_start_time) * 1000:.2f} ms.")
-
-    return jsonify(ack_response), 202
+    data = request.get_json(silent=True) # None if unparseable; the intake answers 400
+    capture_request('search', data)
+    ack_response, status = BecknIntakeService.accept_search(data, request.headers.get('traceparent'))
+    return jsonify(ack_response), status
 
 @beckn_bp.route('/select', methods=['POST'])
 def select():
-    request_start_time = time.perf_counter()
-    data = request.get_json()
-    current_app.logger.info(f"Received /select request. Body: {json.dumps(data, indent=2)}")
-
-    context = data.get('context', {})
-    message = data.get('message', {})
-
-    transaction_id = context.get('transaction_id', str(uuid.uuid4()))
-    message_id = context.get('message_id', str(uuid.uuid4()))
-    callback_uri = context.get('bpp_uri') # URI where the on_select response should be sent
-
-    # Transform the callback URI path from '/receiver' to '/caller' for testing purposes
-    if callback_uri and '/receiver' in callback_uri:
-        original_uri = callback_uri
-        callback_uri = original_uri.replace('/receiver', '/caller')
-        current_app.logger.info(f"Transformed callback URI from '{original_uri}' to '{callback_uri}'.")
-
-    select_criteria = extract_select_criteria(message)
-    product_id = select_criteria.get('product_id')
-
-    if not product_id:
-        current_app.logger.error(f"Invalid /select request: product_id not found in message. Transaction ID: {transaction_id}")
-        return jsonify({"error": "Product ID not found in request message."}), 400
-
-    current_app.logger.debug(f"Storing pending select request for transaction_id: {transaction_id} before ACK.")
-    store_pending_select_request(transaction_id, callback_uri, product_id, context)
-
-    ack_response = generate_ack_response(context, "select", transaction_id, message_id)
-    current_app.logger.info(f"Generated ACK for transaction_id: {transaction_id}. Preparing to send.")
-
-    run_async_select_task(current_app._get_current_object(), transaction_id, message_id, product_id, context, callback_uri)
-
-    request_end_time = time.perf_counter()
-    current_app.logger.info(f"ACK sent and async select initiated for transaction_id: {transaction_id}. Sync processing time: {(request_end_time - request_start_time) * 1000:.2f} ms.")
-
-    return jsonify(ack_response), 202
+    data = request.get_json(silent=True)
+    capture_request('select', data)
+    ack_response, status = BecknIntakeService.accept_select(data, request.headers.get('traceparent'))
+    return jsonify(ack_response), status
 
 @beckn_bp.route('/on_search', methods=['POST'])
 def on_search_received():
     data = request.get_json()
-    current_app.logger.info(f"BPP received /on_search (likely from another BPP/BAP for PoC): {json.dumps(data, indent=2)}")
+    if should_log_payload('on_search'):
+        current_app.logger.info("BPP received /on_search (likely from another BPP/BAP for PoC): %s", LazyJSON(data))
     return jsonify({"message": {"ack": {"status": "ACK"}}}), 200
 
 @beckn_bp.route('/on_select', methods=['POST'])
 def on_select_received():
     data = request.get_json()
-    current_app.logger.info(f"BPP received /on_select (likely from another BPP/BAP for PoC): {json.dumps(data, indent=2)}")
+    if should_log_payload('on_select'):
+        current_app.logger.info("BPP received /on_select (likely from another BPP/BAP for PoC): %s", LazyJSON(data))
     return jsonify({"message": {"ack": {"status": "ACK"}}}), 200
 
+def _requested_wait_seconds(default=0.0):
+    """
+    Reads ?wait=<seconds> (long-poll) or ?timeout=<seconds> (SSE), capped at RESULT_WAIT_MAX_SECONDS.
+    """
+    wait_seconds = request.args.get('wait', type=float)
+    if wait_seconds is None:
+        wait_seconds = request.args.get('timeout', default=default, type=float)
+    return max(0.0, min(wait_seconds, current_app.config.get('RESULT_WAIT_MAX_SECONDS', 30)))
+
+def _failed_event(status):
+    return f'event: {status}\ndata: {{"status": "{status}"}}\n\n'.encode()
+
+def _failed_response(transaction_id, status, processing_time_ms):
+    current_app.logger.warning("Transaction %s ended %s without results. Processing time: %.2f ms.", transaction_id, status, processing_time_ms)
+    return jsonify({"error": f"No results will come for this transaction_id: it {status}.", "status": status}), 410
+
+def _stream_result_events(transaction_id, wait_func):
+    """
+    Server-sent events for one transaction: keep-alive comments while the
+    result is pending, then a single 'result' event and close. A transaction
+    that ends without a result closes with a 'failed' or 'expired' event,
+    and one still pending when the wait runs out with 'timeout'.
+    """
+    total_wait = _requested_wait_seconds(default=current_app.config.get('RESULT_WAIT_MAX_SECONDS', 30))
+    keepalive_seconds = current_app.config.get('SSE_KEEPALIVE_SECONDS', 15)
+
+    def generate():
+        deadline = time.monotonic() + total_wait
+        yield b"retry: 1000\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield b"event: timeout\ndata: {}\n\n"
+                return
+            results = wait_func(transaction_id, min(remaining, keepalive_seconds))
+            if isinstance(results, str):
+                yield _failed_event(results)
+                return
+            if results:
+                # Stored as compact JSON, which never contains a raw newline.
+                yield b"event: result\ndata: " + results + b"\n\n"
+                return
+            yield b": keep-alive\n\n"
+
+    response = current_app.response_class(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Stop reverse proxies from buffering the stream
+    return response
+
 @beckn_bp.route('/get_search_results/<transaction_id>', methods=['GET'])
 def get_search_results_debug(transaction_id):
     request_start_time = time.perf_counter()
-    current_app.logger.info(f"Received /get_search_results request for transaction_id: {transaction_id}")
-    results = get_pending_request_results(transaction_id)
+    current_app.logger.info("Received /get_search_results request for transaction_id: %s", transaction_id)
+    wait_seconds = _requested_wait_seconds()
+    if wait_seconds:
+        # Long-poll: block until the background task stores the result or the wait runs out.
+        results = wait_for_pending_request_results(transaction_id, wait_seconds)
+    else:
+        results = get_pending_request_results(transaction_id)
     request_end_time = time.perf_counter()
     processing_time_ms = (request_end_time - request_start_time) * 1000
 
+    if isinstance(results, str): # "failed" / "expired" from the long-poll
+        return _failed_response(transaction_id, results, processing_time_ms)
     if results:
-        current_app.logger.info(f"Results found for transaction_id: {transaction_id}. Processing time: {processing_time_ms:.2f} ms.")
-        return jsonify(results), 200
+        current_app.logger.info("Results found for transaction_id: %s. Processing time: %.2f ms.", transaction_id, processing_time_ms)
+        # Stored already serialized; served without re-encoding
+        return current_app.response_class(results, mimetype='application/json'), 200
     
-    current_app.logger.warning(f"Results not found or not ready for transaction_id: {transaction_id}. Processing time: {processing_time_ms:.2f} ms.")
+    current_app.logger.warning("Results not found or not ready for transaction_id: %s. Processing time: %.2f ms.", transaction_id, processing_time_ms)
     return jsonify({"error": "Results not found or not ready for this transaction_id."}), 404
 
 @beckn_bp.route('/get_select_results/<transaction_id>', methods=['GET'])
 def get_select_results_debug(transaction_id):
     request_start_time = time.perf_counter()
-    current_app.logger.info(f"Received /get_select_results request for transaction_id: {transaction_id}")
-    results = get_pending_select_request_results(transaction_id)
+    current_app.logger.info("Received /get_select_results request for transaction_id: %s", transaction_id)
+    wait_seconds = _requested_wait_seconds()
+    if wait_seconds:
+        results = wait_for_pending_select_request_results(transaction_id, wait_seconds)
+    else:
+        results = get_pending_select_request_results(transaction_id)
     request_end_time = time.perf_counter()
     processing_time_ms = (request_end_time - request_start_time) * 1000
 
+    if isinstance(results, str): # "failed" / "expired" from the long-poll
+        return _failed_response(transaction_id, results, processing_time_ms)
     if results:
-        current_app.logger.info(f"Select results found for transaction_id: {transaction_id}. Processing time: {processing_time_ms:.2f} ms.")
-        return jsonify(results), 200
+        current_app.logger.info("Select results found for transaction_id: %s. Processing time: %.2f ms.", transaction_id, processing_time_ms)
+        return current_app.response_class(results, mimetype='application/json'), 200
     
-    current_app.logger.warning(f"Select results not found or not ready for transaction_id: {transaction_id}. Processing time: {processing_time_ms:.2f} ms.")
-    return jsonify({"error": "Select results not found or not ready for this transaction_id."}), 404
\ No newline at end of file
+    current_app.logger.warning("Select results not found or not ready for transaction_id: %s. Processing time: %.2f ms.", transaction_id, processing_time_ms)
+    return jsonify({"error": "Select results not found or not ready for this transaction_id."}), 404
+
+@beckn_bp.route('/stream_search_results/<transaction_id>', methods=['GET'])
+def stream_search_results(transaction_id):
+    current_app.logger.info("Received /stream_search_results request for transaction_id: %s", transaction_id)
+    return _stream_result_events(transaction_id, wait_for_pending_request_results)
+
+@beckn_bp.route('/stream_select_results/<transaction_id>', methods=['GET'])
+def stream_select_results(transaction_id):
+    current_app.logger.info("Received /stream_select_results request for transaction_id: %s", transaction_id)
+    return _stream_result_events(transaction_id, wait_for_pending_select_request_results)
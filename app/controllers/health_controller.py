@@ -0,0 +1,25 @@
+# app/controllers/health_controller.py
+from flask import Blueprint, jsonify
+from app.utils.warmup import get_warmup
+
+health_bp = Blueprint('health', __name__)
+
+@health_bp.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness: the process is up and serving. Says nothing about dependencies.
+    return jsonify({"status": "ok"}), 200
+
+@health_bp.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    Readiness: 200 once this process's warmup has finished (DB connections
+    tested, search service built), 503 before that. Point the startup and
+    readiness probes here so no traffic is routed to a cold instance.
+    """
+    warmup = get_warmup()
+    if warmup is None:
+        return jsonify({"status": "starting", "warmup": None}), 503
+    report = warmup.get_report()
+    if warmup.is_ready():
+        return jsonify({"status": "ready", "warmup": report}), 200
+    return jsonify({"status": report["state"], "warmup": report}), 503
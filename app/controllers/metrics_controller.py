@@ -0,0 +1,10 @@
+# app/controllers/metrics_controller.py
+from flask import Blueprint, current_app
+from app.utils.metrics import render_latest_metrics, CONTENT_TYPE
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    # All workers' metrics when METRICS_MULTIPROC_DIR is set, otherwise this process's.
+    return current_app.response_class(render_latest_metrics(), mimetype=None, content_type=CONTENT_TYPE), 200
@@ -0,0 +1,98 @@
+# app/controllers/profiling_controller.py
+#
+# Profiler endpoints under /admin: thread-stack sampling, per-request
+# cProfile results and tracemalloc. Registered by install_profiling only when
+# PROFILING_ENABLED is set, and answered only for requests carrying
+# ADMIN_TOKEN in X-Admin-Token. Every endpoint profiles the worker process
+# that serves it.
+from flask import Blueprint, request, jsonify, current_app
+import os
+from app.services.catalog_fragments import get_catalog_fragment_cache
+from app.utils.admin_auth import is_admin_request
+from app.utils.idempotency import get_idempotency_cache
+from app.utils.pending_store import get_pending_search_store, get_pending_select_store
+from app.utils.profiling import request_profiles, sampling_profiler, tracemalloc_tracker
+from app.utils.profiling import format_profile_text, dump_profile, format_collapsed
+
+profiling_bp = Blueprint('profiling', __name__)
+
+@profiling_bp.before_request
+def require_admin_token():
+    if not is_admin_request(current_app.config):
+        return jsonify({"error": "Admin token required."}), 403
+
+@profiling_bp.route('/profile/stacks', methods=['GET'])
+def sample_stacks():
+    """
+    Samples all threads of this worker for ?seconds= (default 10) every
+    ?interval_ms= (default 5) and returns collapsed stacks. Threads parked in
+    a wait are left out unless ?idle=1. ?seconds= is capped at the profiler's
+    max_seconds, which stays below the worker timeout; X-Profile-Seconds has
+    the duration actually sampled.
+    """
+    seconds = max(0.0, min(request.args.get('seconds', default=10.0, type=float), sampling_profiler.max_seconds))
+    interval_ms = request.args.get('interval_ms', default=5.0, type=float)
+    include_idle = request.args.get('idle', default='0') in ('1', 'true')
+    result = sampling_profiler.sample(seconds, max(interval_ms, 1.0) / 1000, include_idle)
+    if result is None:
+        return jsonify({"error": "A sampling run is already in progress in this worker."}), 409
+    stacks, rounds = result
+    current_app.logger.info("Sampled %d rounds of thread stacks over %.1f s in pid %d.", rounds, seconds, os.getpid())
+    response = current_app.response_class(format_collapsed(stacks), mimetype='text/plain')
+    response.headers["X-Profile-Pid"] = str(os.getpid())
+    response.headers["X-Profile-Samples"] = str(rounds)
+    response.headers["X-Profile-Seconds"] = f"{seconds:g}"
+    return response, 200
+
+@profiling_bp.route('/profile/requests', methods=['GET'])
+def list_request_profiles():
+    return jsonify({"pid": os.getpid(), "profiles": request_profiles.list()}), 200
+
+@profiling_bp.route('/profile/requests/<profile_id>', methods=['GET'])
+def get_request_profile(profile_id):
+    """?format=text (default; ?sort= and ?limit= apply) or ?format=pstats for a .prof file."""
+    profile = request_profiles.get(profile_id)
+    if profile is None:
+        return jsonify({"error": f"No profile {profile_id} in pid {os.getpid()}."}), 404
+    if request.args.get('format') == 'pstats':
+        response = current_app.response_class(dump_profile(profile), mimetype='application/octet-stream')
+        response.headers["Content-Disposition"] = f'attachment; filename="request-{profile_id}.prof"'
+        return response, 200
+    text = format_profile_text(profile, request.args.get('sort', 'cumulative'), request.args.get('limit', default=60, type=int))
+    return current_app.response_class(text, mimetype='text/plain'), 200
+
+@profiling_bp.route('/tracemalloc/start', methods=['POST'])
+def start_tracemalloc():
+    frames = request.args.get('frames', default=10, type=int)
+    tracemalloc_tracker.start(frames)
+    current_app.logger.warning("tracemalloc started in pid %d with %d frames; allocations are slower until it is stopped.", os.getpid(), frames)
+    return jsonify({"pid": os.getpid(), "tracing": True, "frames": frames}), 200
+
+@profiling_bp.route('/tracemalloc/snapshot', methods=['GET'])
+def tracemalloc_snapshot():
+    """
+    Growth by allocation site since ?against=baseline (default, the start)
+    or ?against=previous, with the store and cache sizes alongside.
+    ?group_by=lineno|traceback|filename, ?limit=, ?filter=app/
+    """
+    report = tracemalloc_tracker.compare(
+        against=request.args.get('against', 'baseline'),
+        group_by=request.args.get('group_by', 'lineno'),
+        limit=request.args.get('limit', default=25, type=int),
+        path_filter=request.args.get('filter')
+    )
+    if report is None:
+        return jsonify({"error": "tracemalloc is not running in this worker; POST /admin/tracemalloc/start first."}), 409
+    report["stores"] = {
+        "pending_search": get_pending_search_store().get_stats(),
+        "pending_select": get_pending_select_store().get_stats(),
+        "idempotency": get_idempotency_cache().get_stats(),
+        "catalog_fragments": get_catalog_fragment_cache().get_stats(),
+    }
+    return jsonify(report), 200
+
+@profiling_bp.route('/tracemalloc/stop', methods=['POST'])
+def stop_tracemalloc():
+    tracemalloc_tracker.stop()
+    current_app.logger.info("tracemalloc stopped in pid %d.", os.getpid())
+    return jsonify({"pid": os.getpid(), "tracing": False}), 200
@@ -0,0 +1,295 @@
+# app/db/ann_partitions.py
+#
+# Per-category ANN indexes. A single HNSW index over the whole catalog serves
+# category-restricted searches badly: the index walk returns the nearest
+# products of every category and the category filter then discards most of
+# them, so a search can come back short or go on to scan far more of the
+# graph than it returns. A partial index per large master_category (or
+# article_type) contains only that category's rows:
+#
+#   CREATE INDEX products_ann_master_category_footwear_1a2b3c ON products
+#       USING hnsw (description_embedding vector_l2_ops) WHERE lower(master_category) = 'footwear'
+#
+# Each index carries its metadata as a JSON comment; the router reads those
+# back, and search_products uses it to run a search whose hard filter is one
+# such category with exactly the index predicate
+# (lower(master_category) = 'footwear'), which the planner needs to see to
+# pick the partial index. Routing never adds a filter the search did not
+# already have, so it changes which index answers, not which products match.
+#
+# `python -m app.db.catalog_indexes --ann-partitions` creates, rebuilds and
+# prunes these indexes from the catalog statistics.
+import hashlib
+import json
+import logging
+import math
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from psycopg2 import sql
+
+logger = logging.getLogger(__name__)
+
+ann_router = None
+
+PARTITION_COLUMNS = ("article_type", "master_category") # Routing priority: the narrower partition first
+INDEX_PREFIX = "products_ann_"
+_SLUG_PATTERN = re.compile(r"[^a-z0-9]+")
+
+_LOAD_SQL = """
+    SELECT c.relname, obj_description(c.oid, 'pg_class')
+    FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE i.indrelid = 'products'::regclass AND i.indisvalid AND left(c.relname, %s) = %s
+"""
+
+
+def partition_index_name(column, value):
+    """products_ann_<column>_<slug>_<hash>, unique per (column, value) and within the 63-byte identifier limit."""
+    slug = _SLUG_PATTERN.sub("_", value.lower()).strip("_")[:24]
+    digest = hashlib.blake2b(f"{column}={value}".encode("utf-8"), digest_size=3).hexdigest()
+    return f"{INDEX_PREFIX}{column}_{slug}_{digest}"
+
+def load_partitions(cursor):
+    """{(column, value): metadata} for the valid partition indexes on products."""
+    cursor.execute(_LOAD_SQL, (len(INDEX_PREFIX), INDEX_PREFIX))
+    partitions = {}
+    for index_name, comment in cursor.fetchall():
+        try:
+            metadata = json.loads(comment or "")
+        except ValueError:
+            continue
+        if isinstance(metadata, dict) and metadata.get("column") in PARTITION_COLUMNS and metadata.get("value"):
+            metadata["index"] = index_name
+            partitions[(metadata["column"], metadata["value"])] = metadata
+    return partitions
+
+
+class AnnPartitionRouter:
+    """
+    Knows which category partitions have their own ANN index and picks the one
+    a search should use. The warmup reads the index list, and a background
+    thread re-reads it every `refresh_seconds` on a pooled connection, so
+    indexes built by the maintenance command are picked up without a restart
+    and searches never wait for the catalog query.
+    """
+
+    def __init__(self, refresh_seconds: float = 300):
+        self.refresh_seconds = refresh_seconds
+        self._partitions = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self, app):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, args=(app,), name="ann-partition-refresh", daemon=True)
+            self._thread.start()
+
+    def _refresh_loop(self, app):
+        while not self._stop_event.wait(self.refresh_seconds):
+            try:
+                self.refresh_from_pool(app)
+            except Exception as e:
+                logger.warning("Reading the ANN partition indexes failed; keeping the previous list: %s", e)
+
+    def shutdown(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def refresh(self, connection):
+        with connection.cursor() as cursor:
+            partitions = load_partitions(cursor)
+        with self._lock:
+            changed = set(partitions) != set(self._partitions)
+            self._partitions = partitions
+            self._loaded_at = time.monotonic()
+        if changed:
+            logger.info("ANN partition indexes: %s", ", ".join(f"{column}={value}" for column, value in sorted(partitions)) or "none")
+        return partitions
+
+    def refresh_from_pool(self, app):
+        from app.db.db_pool_manager import get_db_connection, put_db_connection
+        with app.app_context():
+            connection = get_db_connection()
+            try:
+                self.refresh(connection)
+                connection.rollback()
+            finally:
+                put_db_connection(connection)
+
+    def route(self, filters):
+        """
+        (column, value, index name) for the partition to search, or None for
+        the global index. Only a hard filter with a single value on a
+        partitioned column routes; the search is restricted to that value
+        either way.
+        """
+        partitions = self._partitions
+        if not partitions or not filters:
+            return None
+        for column in PARTITION_COLUMNS:
+            values = filters.get(column)
+            if values and len(values) == 1:
+                partition = partitions.get((column, str(values[0]).lower()))
+                if partition is not None:
+                    return column, partition["value"], partition["index"]
+        return None
+
+    def get_stats(self):
+        with self._lock:
+            partitions = sorted(self._partitions.values(), key=lambda metadata: (metadata["column"], -metadata.get("rows", 0)))
+            loaded_at = self._loaded_at
+        return {
+            "partitions": [{key: metadata.get(key) for key in ("column", "value", "index", "rows", "method", "built_at")}
+                           for metadata in partitions],
+            "loaded_seconds_ago": round(time.monotonic() - loaded_at, 1) if loaded_at is not None else None,
+            "refresh_seconds": self.refresh_seconds,
+        }
+
+
+def initialize_ann_router(app):
+    """
+    Creates this process's partition router and its refresher thread unless
+    ANN_ROUTING_ENABLED is off. The index list is first read by the warmup
+    (until then, and without a warmup until the first refresh, searches use
+    the global index). This should be called once per serving process (after fork).
+    """
+    global ann_router
+    if not app.config.get('ANN_ROUTING_ENABLED', True):
+        return None
+    if ann_router is None:
+        ann_router = AnnPartitionRouter(refresh_seconds=app.config.get('ANN_PARTITION_REFRESH_SECONDS', 300))
+        ann_router.start(app)
+    return ann_router
+
+def get_ann_router():
+    return ann_router
+
+def shutdown_ann_router(app=None):
+    """Stops the refresher thread."""
+    global ann_router
+    if ann_router is not None:
+        ann_router.shutdown()
+        ann_router = None
+
+
+# --- Maintenance (python -m app.db.catalog_indexes --ann-partitions) ---
+
+def category_counts(cursor, column, exact=False):
+    """
+    ({lowercased value: rows}, total rows) for `column`. By default from the
+    planner statistics (pg_stats most common values x pg_class.reltuples),
+    which costs nothing; exact=True counts with a full scan.
+    """
+    if not exact:
+        cursor.execute("SELECT reltuples FROM pg_class WHERE oid = 'products'::regclass")
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT most_common_vals::text::text[], most_common_freqs FROM pg_stats "
+            "WHERE schemaname = current_schema() AND tablename = 'products' AND attname = %s",
+            (column,)
+        )
+        row = cursor.fetchone()
+        if total and total > 0 and row and row[0]:
+            counts = {}
+            for value, frequency in zip(row[0], row[1]):
+                counts[value.lower()] = counts.get(value.lower(), 0) + int(frequency * total)
+            return counts, int(total)
+        # Never analyzed, or no common values: fall back to counting
+    cursor.execute(
+        sql.SQL("SELECT lower({column}), count(*) FROM products WHERE {column} IS NOT NULL AND description_embedding IS NOT NULL "
+                "GROUP BY 1").format(column=sql.Identifier(column))
+    )
+    counts = dict(cursor.fetchall())
+    cursor.execute("SELECT count(*) FROM products WHERE description_embedding IS NOT NULL")
+    return counts, cursor.fetchone()[0]
+
+def plan_partitions(counts, total, min_rows=20000, max_share=0.5, max_indexes=16):
+    """
+    The (value, rows) pairs worth a partial index, largest first. A small
+    category is served well by the attribute index plus an exact sort, and
+    one holding most of the catalog gains little over the global index.
+    """
+    eligible = [(value, rows) for value, rows in counts.items()
+                if rows >= min_rows and (not total or rows / total <= max_share)]
+    eligible.sort(key=lambda item: -item[1])
+    return eligible[:max_indexes]
+
+def _create_partition_sql(index_name, column, value, method, rows):
+    with_clause = sql.SQL("")
+    if method == "ivfflat":
+        with_clause = sql.SQL(" WITH (lists = {lists})").format(lists=sql.Literal(max(10, int(math.sqrt(rows)))))
+    return sql.SQL(
+        "CREATE INDEX CONCURRENTLY {index} ON products USING {method} (description_embedding vector_l2_ops){with_clause} "
+        "WHERE lower({column}) = {value}"
+    ).format(index=sql.Identifier(index_name), method=sql.SQL(method), with_clause=with_clause,
+             column=sql.Identifier(column), value=sql.Literal(value))
+
+def _build_partition(cursor, column, value, rows, method, replace=None, log=print):
+    index_name = partition_index_name(column, value)
+    build_name = index_name + "_new" if replace else index_name
+    started = time.perf_counter()
+    cursor.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {index}").format(index=sql.Identifier(build_name))) # Left INVALID by an interrupted run
+    cursor.execute(_create_partition_sql(build_name, column, value, method, rows))
+    metadata = {"column": column, "value": value, "rows": rows, "method": method,
+                "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+    cursor.execute(sql.SQL("COMMENT ON INDEX {index} IS {comment}").format(index=sql.Identifier(build_name),
+                                                                           comment=sql.Literal(json.dumps(metadata))))
+    if replace:
+        # The new index is complete before the old one goes; searches never lose their partition
+        cursor.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {index}").format(index=sql.Identifier(replace)))
+        cursor.execute(sql.SQL("ALTER INDEX {build} RENAME TO {index}").format(build=sql.Identifier(build_name),
+                                                                              index=sql.Identifier(index_name)))
+    log(f"  {'rebuilt' if replace else 'created'} {index_name} ({column}={value}, {rows} rows, {method}) in {time.perf_counter() - started:.1f} s")
+
+def refresh_partitions(connection, columns=("master_category",), method="hnsw", min_rows=20000, max_share=0.5, max_indexes=16,
+                       rebuild_drift=0.5, prune=False, exact=False, dry_run=False, log=print):
+    """
+    Brings the partition indexes in line with the catalog: creates the missing
+    ones, rebuilds those whose category has grown or shrunk by more than
+    `rebuild_drift` since they were built (ivfflat lists are sized by row
+    count; HNSW graphs degrade with heavy churn), and with prune=True drops
+    indexes of categories that no longer qualify. Returns the counts of each.
+    """
+    connection.autocommit = True # CREATE/DROP INDEX CONCURRENTLY cannot run in a transaction
+    summary = {"created": 0, "rebuilt": 0, "kept": 0, "dropped": 0}
+    with connection.cursor() as cursor:
+        existing = load_partitions(cursor)
+        for column in columns:
+            counts, total = category_counts(cursor, column, exact=exact)
+            planned = plan_partitions(counts, total, min_rows, max_share, max_indexes)
+            log(f"{column}: {len(counts)} values over {total} rows; {len(planned)} qualify for a partition index")
+            for value, rows in planned:
+                current = existing.pop((column, value), None)
+                if current is None:
+                    action = "created"
+                elif current.get("method") != method or abs(rows - current.get("rows", 0)) > rebuild_drift * max(current.get("rows", 0), 1):
+                    action = "rebuilt"
+                else:
+                    summary["kept"] += 1
+                    continue
+                summary[action] += 1
+                if dry_run:
+                    log(f"  would {'create' if action == 'created' else 'rebuild'} {column}={value} ({rows} rows)")
+                else:
+                    _build_partition(cursor, column, value, rows, method, replace=current["index"] if current else None, log=log)
+        for (column, value), metadata in sorted(existing.items()):
+            if column not in columns:
+                continue
+            if not prune:
+                log(f"  {metadata['index']} ({column}={value}) no longer qualifies; --prune drops it")
+                continue
+            summary["dropped"] += 1
+            if dry_run:
+                log(f"  would drop {metadata['index']} ({column}={value})")
+            else:
+                cursor.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {index}").format(index=sql.Identifier(metadata["index"])))
+                log(f"  dropped {metadata['index']} ({column}={value})")
+        if not dry_run and (summary["created"] or summary["rebuilt"]):
+            cursor.execute("ANALYZE products")
+    return summary
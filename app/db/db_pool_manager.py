@@ -25,8 +25,8 @@ def initialize_db_pool(app):
                 raise ValueError("Database credentials missing in Flask app config.")
 
             db_pool = pool.ThreadedConnectionPool(
-                minconn=1,
-                maxconn=10, # Adjust maxconn based on your application's concurrency needs
+                minconn=app.config.get('DB_POOL_MIN_CONNECTIONS', 1),
+                maxconn=app.config.get('DB_POOL_MAX_CONNECTIONS', 10), # Per worker process; see gunicorn.conf.py
                 host=DB_HOST,
                 port=DB_PORT,
                 database=DB_NAME,
@@ -35,7 +35,7 @@ def initialize_db_pool(app):
             )
             app.logger.info("Database connection pool initialized successfully. with host: %s, port: %s, dbname: %s", DB_HOST, DB_PORT, DB_NAME)
         except Exception as e:
-            app.logger.critical(f"CRITICAL ERROR: Error initializing database connection pool: {e}", exc_info=True)
+            app.logger.critical("CRITICAL ERROR: Error initializing database connection pool: %s", e, exc_info=True)
             raise # Re-raise the exception to indicate a severe startup failure
 
 def get_db_connection():
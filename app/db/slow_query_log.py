@@ -0,0 +1,300 @@
+# app/db/slow_query_log.py
+#
+# Slow-query recorder for the search and select queries. A query slower than
+# SLOW_QUERY_THRESHOLD_MS is kept in a bounded per-process ring with its SQL
+# shape, parameters (embedding vectors elided) and row count. A sample of
+# them is re-executed under EXPLAIN (ANALYZE, BUFFERS) on a dedicated side
+# connection by a background thread, never on the request's pooled
+# connection, together with the planner's selectivity estimate for the
+# query's hard filters. Seq Scans and missed indexes are flagged in the
+# summary. Read them at /admin/slow_queries.
+import itertools
+import logging
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from pgvector.psycopg2 import register_vector
+
+from app.utils.metrics import SLOW_QUERIES
+
+logger = logging.getLogger(__name__)
+
+slow_query_log = None
+
+_WHITESPACE = re.compile(r"\s+")
+_SQL_COMMENT = re.compile(r"--[^\n]*")
+
+
+def sql_shape(sql):
+    """The statement on one line without comments; parameters are already %s placeholders."""
+    return _WHITESPACE.sub(" ", _SQL_COMMENT.sub("", sql)).strip()
+
+def elide_params(params):
+    """JSON-friendly copy of the parameters with embedding vectors replaced by '<vector(N)>'."""
+    elided = []
+    for value in params:
+        if hasattr(value, "tolist") and not isinstance(value, (str, bytes)): # numpy arrays, pgvector Vector
+            value = value.tolist()
+        if isinstance(value, (list, tuple)) and len(value) > 16 and all(isinstance(v, (int, float)) for v in value[:16]):
+            elided.append(f"<vector({len(value)})>")
+        elif value is None or isinstance(value, (str, int, float, bool)):
+            elided.append(value)
+        else:
+            elided.append(str(value))
+    return elided
+
+
+def summarize_plan(plan_document):
+    """
+    Condenses EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) output: node types,
+    Seq Scans and indexes by relation, the observed selectivity of filtered
+    scans, buffer totals and timings.
+    """
+    root = plan_document[0] if isinstance(plan_document, list) else plan_document
+    nodes = []
+    seq_scans = []
+    indexes = []
+    filtered_scans = []
+
+    def walk(node):
+        node_type = node.get("Node Type")
+        nodes.append(node_type)
+        relation = node.get("Relation Name")
+        if node_type == "Seq Scan" and relation:
+            seq_scans.append(relation)
+        if node.get("Index Name"):
+            indexes.append(node["Index Name"])
+        removed = node.get("Rows Removed by Filter")
+        if removed is not None:
+            kept = node.get("Actual Rows", 0) * node.get("Actual Loops", 1)
+            filtered_scans.append({
+                "node": node_type,
+                "relation": relation,
+                "filter": node.get("Filter"),
+                "rows": kept,
+                "rows_removed": removed * node.get("Actual Loops", 1),
+                "selectivity": kept / (kept + removed) if kept + removed else None,
+            })
+        for child in node.get("Plans", ()):
+            walk(child)
+
+    plan = root.get("Plan", {})
+    walk(plan)
+    return {
+        "nodes": nodes,
+        "seq_scans": seq_scans,
+        "indexes": indexes,
+        "filtered_scans": filtered_scans,
+        "shared_hit_blocks": plan.get("Shared Hit Blocks"),
+        "shared_read_blocks": plan.get("Shared Read Blocks"),
+        "planning_ms": root.get("Planning Time"),
+        "execution_ms": root.get("Execution Time"),
+    }
+
+
+class SlowQueryLog:
+    """
+    Keeps the last `capacity` queries slower than `threshold_ms`. observe()
+    runs on the request thread and only compares a number unless the query
+    was slow. At most one EXPLAIN is queued per `explain_min_interval_seconds`
+    (and only for `explain_sample_rate` of slow queries), so a database that
+    is already struggling gets little extra load from the diagnosis.
+    """
+
+    def __init__(self, threshold_ms: float = 500, capacity: int = 200, explain_sample_rate: float = 0.1,
+                 explain_min_interval_seconds: float = 30, explain_timeout_ms: int = 10000, connect_kwargs=None):
+        self.threshold_seconds = threshold_ms / 1000
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_min_interval_seconds = explain_min_interval_seconds
+        self.explain_timeout_ms = explain_timeout_ms
+        self.connect_kwargs = dict(connect_kwargs or {})
+        self._entries = deque(maxlen=capacity)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._last_explain_at = float("-inf")
+        self._explain_queue = queue.Queue(maxsize=4)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._connection = None # Side connection, only touched by the explain thread
+        self._stats = {"slow_queries": 0, "explains": 0, "explain_errors": 0, "explains_dropped": 0}
+
+    def start(self):
+        if self.explain_sample_rate > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._explain_loop, name="slow-query-explain", daemon=True)
+            self._thread.start()
+
+    def observe(self, query, sql, params, duration_seconds, rows, filter_sql=None, filter_params=()):
+        """
+        Records the query if it took at least the threshold. `filter_sql` and
+        `filter_params` are the hard WHERE predicates (without the vector), used
+        to estimate their selectivity. Returns the entry, or None.
+        """
+        if duration_seconds < self.threshold_seconds:
+            return None
+        SLOW_QUERIES.labels(query).inc()
+        entry = {
+            "id": f"sq-{next(self._ids)}",
+            "ts": round(time.time(), 3),
+            "query": query,
+            "duration_ms": round(duration_seconds * 1000, 2),
+            "threshold_ms": round(self.threshold_seconds * 1000, 2),
+            "rows": rows,
+            "sql": sql_shape(sql),
+            "params": elide_params(params),
+            "filter_sql": filter_sql or None,
+            "explain": {"status": "not_sampled"},
+        }
+        now = time.monotonic()
+        with self._lock:
+            self._stats["slow_queries"] += 1
+            self._entries.append(entry)
+            explain = (self._thread is not None and now - self._last_explain_at >= self.explain_min_interval_seconds
+                       and random.random() < self.explain_sample_rate)
+            if explain:
+                self._last_explain_at = now
+                entry["explain"] = {"status": "pending"}
+        if explain:
+            try:
+                self._explain_queue.put_nowait((entry, sql, tuple(params), filter_sql, tuple(filter_params)))
+            except queue.Full:
+                with self._lock:
+                    self._stats["explains_dropped"] += 1
+                    entry["explain"] = {"status": "dropped"}
+        logger.warning("Slow %s query: %.1f ms (threshold %.0f ms), %s rows, params %s [%s].", query, entry["duration_ms"],
+                       entry["threshold_ms"], rows, entry["params"], entry["id"])
+        return entry
+
+    def _get_connection(self):
+        if self._connection is None or self._connection.closed:
+            self._connection = psycopg2.connect(application_name="bpp-slow-query-explain", **self.connect_kwargs)
+            register_vector(self._connection)
+        return self._connection
+
+    def _explain(self, sql, params, filter_sql, filter_params):
+        connection = self._get_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", (self.explain_timeout_ms,))
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql.strip().rstrip(";"), params)
+                plan = cursor.fetchone()[0]
+                result = {"status": "done", "summary": summarize_plan(plan), "plan": plan}
+                if filter_sql:
+                    # Planner estimate only: counting the matching rows would be a full scan of its own.
+                    cursor.execute("SELECT reltuples FROM pg_class WHERE relname = 'products'")
+                    total = cursor.fetchone()[0]
+                    cursor.execute("EXPLAIN (FORMAT JSON) SELECT 1 FROM products WHERE " + filter_sql, filter_params)
+                    estimated = cursor.fetchone()[0][0]["Plan"]["Plan Rows"]
+                    result["filter_selectivity_estimate"] = estimated / total if total and total > 0 else None
+            return result
+        finally:
+            connection.rollback() # Also discards SET LOCAL
+
+    def _explain_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                entry, sql, params, filter_sql, filter_params = self._explain_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            started = time.perf_counter()
+            try:
+                result = self._explain(sql, params, filter_sql, filter_params)
+                result["explain_ms"] = round((time.perf_counter() - started) * 1000, 2)
+                with self._lock:
+                    self._stats["explains"] += 1
+                    entry["explain"] = result
+                summary = result["summary"]
+                logger.warning("EXPLAIN for slow %s query %s: %.1f ms, seq scans %s, indexes %s.", entry["query"], entry["id"],
+                               summary["execution_ms"] or 0.0, summary["seq_scans"] or "none", summary["indexes"] or "none")
+            except Exception as e: # Side connection down or the re-run timed out: note it, keep serving
+                with self._lock:
+                    self._stats["explain_errors"] += 1
+                    entry["explain"] = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+                if self._connection is not None and (self._connection.closed or isinstance(e, psycopg2.OperationalError)):
+                    self._close_connection()
+                logger.warning("EXPLAIN for slow %s query %s failed: %s", entry["query"], entry["id"], e)
+
+    def list(self, limit=None):
+        """Newest first, without the full plans."""
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        summaries = []
+        for entry in entries[:limit]:
+            summary = dict(entry)
+            summary["explain"] = {key: value for key, value in entry["explain"].items() if key != "plan"}
+            summaries.append(summary)
+        return summaries
+
+    def get(self, entry_id):
+        with self._lock:
+            for entry in self._entries:
+                if entry["id"] == entry_id:
+                    return dict(entry)
+        return None
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        stats["threshold_ms"] = self.threshold_seconds * 1000
+        stats["explain_sample_rate"] = self.explain_sample_rate
+        return stats
+
+    def _close_connection(self):
+        try:
+            self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+
+    def shutdown(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._connection is not None:
+            self._close_connection()
+
+
+def initialize_slow_query_log(app):
+    """
+    Creates this process's slow-query log unless SLOW_QUERY_THRESHOLD_MS is 0.
+    This should be called once per serving process (after fork).
+    """
+    global slow_query_log
+    threshold_ms = app.config.get('SLOW_QUERY_THRESHOLD_MS', 500)
+    if not threshold_ms or threshold_ms <= 0:
+        return None
+    if slow_query_log is None:
+        slow_query_log = SlowQueryLog(
+            threshold_ms=threshold_ms,
+            capacity=app.config.get('SLOW_QUERY_LOG_SIZE', 200),
+            explain_sample_rate=app.config.get('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 0.1),
+            explain_min_interval_seconds=app.config.get('SLOW_QUERY_EXPLAIN_MIN_INTERVAL_SECONDS', 30),
+            explain_timeout_ms=app.config.get('SLOW_QUERY_EXPLAIN_TIMEOUT_MS', 10000),
+            connect_kwargs={
+                "host": app.config.get('DB_HOST'),
+                "port": app.config.get('DB_PORT'),
+                "database": app.config.get('DB_NAME'),
+                "user": app.config.get('DB_USER'),
+                "password": app.config.get('DB_PASSWORD'),
+            }
+        )
+        slow_query_log.start()
+        app.logger.info("Slow-query log: threshold %.0f ms, EXPLAIN sample rate %.2f.", threshold_ms, slow_query_log.explain_sample_rate)
+    return slow_query_log
+
+def get_slow_query_log():
+    return slow_query_log
+
+def shutdown_slow_query_log(app=None):
+    """Stops the EXPLAIN thread and closes the side connection."""
+    global slow_query_log
+    if slow_query_log is not None:
+        slow_query_log.shutdown()
+        slow_query_log = None
@@ -0,0 +1,193 @@
+# app/services/attribute_dictionary.py
+#
+# Catalog attribute vocabulary used by the query parser. It serves two purposes:
+# it resolves the attribute names and values of explicit filters
+# ("colour: Black", "gender in (mens, women)") to the catalog column and the
+# canonical value (values it does not know stay search text, not filters),
+# and it recognizes attribute values among bare search words
+# ("navy blue shirts for men" -> base_color navy blue, article_type shirts,
+# gender men). Values are stored lowercased, and the search query compares them
+# with lower(column), which is what the expression indexes in
+# app/db/catalog_indexes.py cover.
+#
+# The built-in vocabulary covers colors, genders (with their common synonyms)
+# and master categories. Brands and article types come from the catalog
+# itself: the attribute_dictionary warmup step loads the most frequent values
+# of each column into every worker.
+import re
+
+# Catalog columns that can become SQL predicates. Interpolated into SQL, so only these names are ever used.
+ATTRIBUTE_COLUMNS = ("base_color", "gender", "article_type", "brand_name", "master_category")
+
+# Attribute names accepted in "attr:value" and "attr in (...)" -> column
+ATTRIBUTE_ALIASES = {
+    "color": "base_color", "colour": "base_color", "base_color": "base_color", "basecolor": "base_color",
+    "gender": "gender", "sex": "gender",
+    "type": "article_type", "article_type": "article_type", "articletype": "article_type",
+    "brand": "brand_name", "brand_name": "brand_name",
+    "category": "master_category", "master_category": "master_category", "mastercategory": "master_category",
+}
+
+_BUILTIN_VOCABULARY = {
+    "base_color": dict({color: color for color in (
+        "black", "white", "navy blue", "blue", "red", "grey", "green", "brown", "pink", "maroon", "beige", "olive",
+        "yellow", "purple", "orange", "teal", "silver", "gold", "cream", "off white", "charcoal", "khaki", "magenta",
+        "lavender", "peach", "turquoise blue", "mustard", "multi",
+    )}, navy="navy blue", gray="grey"),
+    "gender": {
+        "men": "men", "mens": "men", "man": "men", "male": "men", "gents": "men",
+        "women": "women", "womens": "women", "woman": "women", "female": "women", "ladies": "women",
+        "boys": "boys", "boy": "boys", "girls": "girls", "girl": "girls", "unisex": "unisex",
+    },
+    "article_type": {"t shirt": "tshirts", "t shirts": "tshirts", "tee": "tshirts", "tees": "tshirts", "tshirt": "tshirts"},
+    "master_category": {
+        "apparel": "apparel", "clothing": "apparel", "footwear": "footwear", "accessories": "accessories",
+        "personal care": "personal care",
+    },
+}
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+MAX_RECOGNIZED_TOKENS = 64 # Bare words scanned per query; keeps pathological queries cheap
+
+
+def phrase_key(text):
+    """Lowercased alphanumeric words joined by single spaces ("U.S. Polo Assn." -> "u s polo assn")."""
+    return " ".join(_TOKEN_PATTERN.findall(text.lower()))
+
+def _singular(word):
+    if word.endswith(("ses", "shes", "ches", "xes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return None
+
+
+class AttributeDictionary:
+    """
+    Phrase -> canonical value maps per column, and a longest-match recognizer
+    over them. A phrase that names values in two columns is dropped from the
+    recognizer (but still resolves explicit filters on either column).
+    """
+
+    def __init__(self, vocabulary):
+        self.vocabulary = {column: dict(vocabulary.get(column, {})) for column in ATTRIBUTE_COLUMNS}
+        self._phrases = {} # phrase key -> (column, canonical value)
+        ambiguous = set()
+        for column, values in self.vocabulary.items():
+            for phrase, canonical in values.items():
+                key = phrase_key(phrase)
+                if not key:
+                    continue
+                previous = self._phrases.get(key)
+                if previous is not None and previous[0] != column:
+                    ambiguous.add(key)
+                self._phrases.setdefault(key, (column, canonical))
+        for key in ambiguous:
+            del self._phrases[key]
+        # First word -> longest phrase starting with it, so most words cost one set lookup
+        self._first_words = {}
+        for key in self._phrases:
+            first_word = key.split(" ", 1)[0]
+            self._first_words[first_word] = max(self._first_words.get(first_word, 1), key.count(" ") + 1)
+
+    @classmethod
+    def with_catalog_values(cls, catalog_values):
+        """
+        The built-in vocabulary plus {column: [value, ...]} read from the
+        catalog. Built-in entries win; single-character and numeric values are
+        skipped, and article types are also registered in the singular.
+        """
+        vocabulary = {column: dict(values) for column, values in _BUILTIN_VOCABULARY.items()}
+        for column, values in catalog_values.items():
+            entries = vocabulary.setdefault(column, {})
+            for value in values:
+                canonical = value.strip().lower()
+                key = phrase_key(canonical)
+                if len(key) < 2 or key.replace(" ", "").isdigit():
+                    continue
+                entries.setdefault(key, canonical)
+                if column == "article_type":
+                    last_word = key.rsplit(" ", 1)[-1]
+                    singular = _singular(last_word)
+                    if singular:
+                        entries.setdefault(key[:-len(last_word)] + singular, canonical)
+        return cls(vocabulary)
+
+    def resolve(self, column, value):
+        """Canonical value of an explicit filter, or None if `value` is not in the column's vocabulary."""
+        return self.vocabulary[column].get(phrase_key(value))
+
+    def resolve_all(self, column, values):
+        """
+        Canonical values (deduplicated) of an explicit filter's values, or None
+        if any of them is unknown. A filter that does not fully resolve is
+        searched as text instead of becoming a predicate that matches nothing
+        ("type: casual wear" is not an article type).
+        """
+        resolved = []
+        for value in values:
+            canonical = self.vocabulary[column].get(phrase_key(value))
+            if canonical is None:
+                return None
+            if canonical not in resolved:
+                resolved.append(canonical)
+        return resolved
+
+    def recognize(self, texts):
+        """
+        {column: [canonical value, ...]} for the attribute phrases among the
+        words of `texts`, longest phrase first. Only the first
+        MAX_RECOGNIZED_TOKENS words are looked at.
+        """
+        recognized = {}
+        budget = MAX_RECOGNIZED_TOKENS
+        for text in texts:
+            if budget <= 0:
+                break
+            tokens = _TOKEN_PATTERN.findall(text[:budget * 16].lower())[:budget]
+            budget -= len(tokens)
+            i = 0
+            while i < len(tokens):
+                max_words = self._first_words.get(tokens[i])
+                if max_words is None:
+                    i += 1
+                    continue
+                for length in range(min(max_words, len(tokens) - i), 0, -1):
+                    match = self._phrases.get(" ".join(tokens[i:i + length]))
+                    if match is not None:
+                        values = recognized.setdefault(match[0], [])
+                        if match[1] not in values:
+                            values.append(match[1])
+                        i += length
+                        break
+                else:
+                    i += 1
+        return recognized
+
+    def get_stats(self):
+        return {column: len(values) for column, values in self.vocabulary.items()}
+
+
+attribute_dictionary = AttributeDictionary(_BUILTIN_VOCABULARY) # Replaced by load_attribute_dictionary() during warmup
+
+def get_attribute_dictionary():
+    return attribute_dictionary
+
+def load_attribute_dictionary(connection, max_values_per_column=500):
+    """
+    Rebuilds the dictionary from the built-in vocabulary and the most frequent
+    values of each attribute column in `products`. Returns the new dictionary.
+    """
+    global attribute_dictionary
+    catalog_values = {}
+    with connection.cursor() as cursor:
+        for column in ATTRIBUTE_COLUMNS:
+            cursor.execute(
+                f"SELECT lower({column}) FROM products WHERE {column} IS NOT NULL "
+                f"GROUP BY lower({column}) ORDER BY count(*) DESC LIMIT %s",
+                (max_values_per_column,)
+            )
+            catalog_values[column] = [row[0] for row in cursor.fetchall()]
+    connection.rollback()
+    attribute_dictionary = AttributeDictionary.with_catalog_values(catalog_values)
+    return attribute_dictionary
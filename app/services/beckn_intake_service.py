@@ -0,0 +1,212 @@
+# app/services/beckn_intake_service.py
+import functools
+import time
+import uuid
+from flask import current_app
+from app.services.beckn_service import BecknService
+from app.utils.async_tasks import run_async_task, run_async_select_task, create_transaction_deadline
+from app.utils.beckn_utils import extract_search_criteria, extract_select_criteria, generate_ack_response, generate_nack_response, store_pending_request, store_pending_select_request
+from app.utils.beckn_utils import mark_pending_request_failed, mark_pending_select_request_failed
+from app.utils.idempotency import get_idempotency_cache, NEW, DUPLICATE_COMPLETED
+from app.utils.logging_setup import set_log_transaction_id, reset_log_transaction_id, should_log_payload, LazyJSON
+from app.utils.metrics import ACK_LATENCY, ERRORS
+from app.utils.tracing import start_span, KIND_SERVER
+
+
+def _body_error(data):
+    """The reason a request body cannot be processed, or None if it is usable."""
+    if not isinstance(data, dict):
+        return "Request body must be a JSON object."
+    if not isinstance(data.get('context', {}), dict) or not isinstance(data.get('message', {}), dict):
+        return "Request 'context' and 'message' must be JSON objects."
+    return None
+
+
+def _traced_intake(action):
+    """
+    Runs accept_<action> as the root span of its transaction's trace, or as a
+    child of the caller's span when it sent a `traceparent` header. A body
+    that is not a JSON object (or None, for one that did not parse) is
+    answered with 400 before any of that.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(data, traceparent=None):
+            error = _body_error(data)
+            if error is not None:
+                current_app.logger.warning("Rejected /%s request: %s", action, error)
+                return {"error": error}, 400
+            context = data.get('context', {})
+            log_token = set_log_transaction_id(context.get('transaction_id')) # Reset below; the thread or task goes on serving others
+            try:
+                with start_span(f"beckn.{action}", traceparent=traceparent, kind=KIND_SERVER,
+                                transaction_id=context.get('transaction_id'), message_id=context.get('message_id')) as span:
+                    body, status = func(data)
+                    if span is not None:
+                        span.set_attribute("http.status_code", status)
+                    return body, status
+            finally:
+                reset_log_transaction_id(log_token)
+        return wrapper
+    return decorator
+
+
+class BecknIntakeService:
+    """
+    The synchronous part of /search and /select: parse, dedup, store the
+    pending transaction, queue the background work and build the ACK.
+    Framework-neutral, so the Flask blueprint and the ASGI app share it.
+    """
+
+    @staticmethod
+    def _handle_duplicate(action, context, transaction_id, message_id, callback_uri, deadline, send_callback):
+        """
+        Claims (action, transaction_id, message_id) for this request. For a retry
+        of a request we have already seen, returns the ACK to send without
+        starting new work: an in-flight original will deliver the callback
+        itself, and a completed one has its stored body re-delivered.
+        Returns None for a new request.
+        """
+        outcome, stored_response = get_idempotency_cache().begin(action, transaction_id, message_id, deadline.expires_at)
+        if outcome == NEW:
+            return None
+        if outcome == DUPLICATE_COMPLETED:
+            current_app.logger.info("Duplicate /%s for transaction_id %s, message_id %s: re-delivering the stored response.", action, transaction_id, message_id)
+            send_callback(callback_uri, stored_response, transaction_id, deadline=deadline)
+        else:
+            current_app.logger.info("Duplicate /%s for transaction_id %s, message_id %s: attached to the in-flight request.", action, transaction_id, message_id)
+        return generate_ack_response(context, action, transaction_id, message_id), 202
+
+    @staticmethod
+    def _expired(action, context, transaction_id, message_id):
+        """
+        The NACK for a request whose context.timestamp + ttl has already
+        passed: the BAP has stopped waiting, so nothing is stored or queued.
+        """
+        ERRORS.labels("expired_on_arrival").inc()
+        current_app.logger.warning("NACKing /%s for transaction_id %s: its ttl expired before it arrived (timestamp %s, ttl %s).",
+                                   action, transaction_id, context.get('timestamp'), context.get('ttl'))
+        return generate_nack_response(context, action, transaction_id, message_id, "EXPIRED", "Request ttl has already expired."), 400
+
+    @staticmethod
+    def _shed(action, context, transaction_id, message_id, mark_failed):
+        """
+        Undoes the intake of a request the job scheduler had no room for and
+        returns the NACK to send instead of the ACK, so the BAP retries later
+        rather than waiting for a callback that would never come.
+        """
+        get_idempotency_cache().forget(action, transaction_id, message_id)
+        mark_failed(transaction_id)
+        current_app.logger.warning("Job queue full: NACKing /%s for transaction_id %s.", action, transaction_id)
+        return generate_nack_response(context, action, transaction_id, message_id, "BUSY", "Too many requests in progress. Retry later."), 503
+
+    @staticmethod
+    @_traced_intake("search")
+    def accept_search(data):
+        """
+        Validates and ACKs a /search, then queues the search and callback.
+        Returns (response body, HTTP status). Needs an app context. Pass the
+        request's `traceparent` header, if any, to continue the caller's trace.
+        """
+        request_start_time = time.perf_counter()
+        context = data.get('context', {})
+        message = data.get('message', {})
+
+        transaction_id = context.get('transaction_id', str(uuid.uuid4()))
+        set_log_transaction_id(transaction_id)
+        if should_log_payload('search'):
+            current_app.logger.info("Received /search request. Body: %s", LazyJSON(data))
+        message_id = context.get('message_id', str(uuid.uuid4()))
+        callback_uri = context.get('bpp_uri') # URI where the on_search response should be sent
+
+        # Transform the callback URI path from '/receiver' to '/caller' for testing purposes
+        if callback_uri and '/receiver' in callback_uri:
+            original_uri = callback_uri
+            callback_uri = original_uri.replace('/receiver', '/caller')
+            current_app.logger.info("Transformed callback URI from '%s' to '%s'.", original_uri, callback_uri)
+
+        # The transaction's end-to-end budget: every downstream stage gets only what is left of it.
+        deadline = create_transaction_deadline(current_app, context)
+        if deadline.expired():
+            return BecknIntakeService._expired("search", context, transaction_id, message_id)
+
+        duplicate_ack = BecknIntakeService._handle_duplicate("search", context, transaction_id, message_id, callback_uri, deadline, BecknService.send_on_search_callback)
+        if duplicate_ack is not None:
+            ACK_LATENCY.labels("search").observe(time.perf_counter() - request_start_time)
+            return duplicate_ack
+
+        search_criteria = extract_search_criteria(message)
+
+        current_app.logger.debug("Storing pending request for transaction_id: %s before ACK.", transaction_id)
+        store_pending_request(transaction_id, callback_uri, search_criteria, context)
+
+        # --- IMPORTANT CHANGE HERE ---
+        # Pass the actual app instance to the async task function
+        if not run_async_task(current_app._get_current_object(), transaction_id, message_id, search_criteria, context, callback_uri, deadline):
+            return BecknIntakeService._shed("search", context, transaction_id, message_id, mark_pending_request_failed)
+        # --- END CHANGE ---
+
+        ack_response = generate_ack_response(context, "search", transaction_id, message_id)
+        current_app.logger.info("Generated ACK for transaction_id: %s. Preparing to send.", transaction_id)
+
+        ack_seconds = time.perf_counter() - request_start_time
+        ACK_LATENCY.labels("search").observe(ack_seconds)
+        current_app.logger.info("ACK sent and async search initiated for transaction_id: %s. Sync processing time: %.2f ms.", transaction_id, ack_seconds * 1000)
+
+        return ack_response, 202
+
+    @staticmethod
+    @_traced_intake("select")
+    def accept_select(data):
+        """
+        Validates and ACKs a /select, then queues the lookup and callback.
+        Returns (response body, HTTP status). Needs an app context. Pass the
+        request's `traceparent` header, if any, to continue the caller's trace.
+        """
+        request_start_time = time.perf_counter()
+        context = data.get('context', {})
+        message = data.get('message', {})
+
+        transaction_id = context.get('transaction_id', str(uuid.uuid4()))
+        set_log_transaction_id(transaction_id)
+        if should_log_payload('select'):
+            current_app.logger.info("Received /select request. Body: %s", LazyJSON(data))
+        message_id = context.get('message_id', str(uuid.uuid4()))
+        callback_uri = context.get('bpp_uri') # URI where the on_select response should be sent
+
+        # Transform the callback URI path from '/receiver' to '/caller' for testing purposes
+        if callback_uri and '/receiver' in callback_uri:
+            original_uri = callback_uri
+            callback_uri = original_uri.replace('/receiver', '/caller')
+            current_app.logger.info("Transformed callback URI from '%s' to '%s'.", original_uri, callback_uri)
+
+        deadline = create_transaction_deadline(current_app, context)
+        if deadline.expired():
+            return BecknIntakeService._expired("select", context, transaction_id, message_id)
+
+        select_criteria = extract_select_criteria(message)
+        product_id = select_criteria.get('product_id')
+
+        if not product_id:
+            current_app.logger.error("Invalid /select request: product_id not found in message. Transaction ID: %s", transaction_id)
+            return {"error": "Product ID not found in request message."}, 400
+
+        duplicate_ack = BecknIntakeService._handle_duplicate("select", context, transaction_id, message_id, callback_uri, deadline, BecknService.send_on_select_callback)
+        if duplicate_ack is not None:
+            ACK_LATENCY.labels("select").observe(time.perf_counter() - request_start_time)
+            return duplicate_ack
+
+        current_app.logger.debug("Storing pending select request for transaction_id: %s before ACK.", transaction_id)
+        store_pending_select_request(transaction_id, callback_uri, product_id, context)
+
+        if not run_async_select_task(current_app._get_current_object(), transaction_id, message_id, product_id, context, callback_uri, deadline):
+            return BecknIntakeService._shed("select", context, transaction_id, message_id, mark_pending_select_request_failed)
+
+        ack_response = generate_ack_response(context, "select", transaction_id, message_id)
+        current_app.logger.info("Generated ACK for transaction_id: %s. Preparing to send.", transaction_id)
+
+        ack_seconds = time.perf_counter() - request_start_time
+        ACK_LATENCY.labels("select").observe(ack_seconds)
+        current_app.logger.info("ACK sent and async select initiated for transaction_id: %s. Sync processing time: %.2f ms.", transaction_id, ack_seconds * 1000)
+
+        return ack_response, 202
@@ -1,22 +1,37 @@
 # app/services/beckn_service.py
 import time
 import uuid
-import requests
 from urllib.parse import urlparse # Added for audience determination
 from flask import current_app
-# Import the function from your auth module
-from app.auth import make_authenticated_request # Ensure this path is correct
+from app.utils.callback_delivery import CallbackJob, get_callback_delivery, deliver_callback_once, CALLBACK_TIMEOUT_SECONDS
+from app.utils import json_codec
+from app.services.catalog_fragments import get_catalog_fragment_cache
+
+# Static parts of every on_search catalog, encoded once.
+_CATALOG_DESCRIPTOR = {
+    "name": "Your E-commerce BPP",
+    "short_desc": "BPP for seller services"
+}
+_PROVIDER_ID = "provider1"
+_PROVIDER_DESCRIPTOR = {
+    "name": "Product Provider Co."
+}
+_ON_SEARCH_MESSAGE_PREFIX = (
+    b'"message":{"catalog":{"bpp/descriptor":' + json_codec.dumps(_CATALOG_DESCRIPTOR) +
+    b',"bpp/providers":[{"id":' + json_codec.dumps(_PROVIDER_ID) +
+    b',"descriptor":' + json_codec.dumps(_PROVIDER_DESCRIPTOR) + b',"items":['
+)
+_ON_SEARCH_MESSAGE_SUFFIX = b']}]}}}'
 
 class BecknService:
     @staticmethod
-    def generate_on_search_response(products, transaction_id, message_id, context):
-
+    def _build_response_context(context, action, transaction_id, message_id):
         # Start with a copy of the original search request's context.
         # This preserves fields like bap_id, bap_uri, domain, country, city, etc.
         response_context = context.copy()
 
-        # Override fields specific to this BPP and the 'on_search' action.
-        response_context['action'] = "on_search"
+        # Override fields specific to this BPP and the response action.
+        response_context['action'] = action
         response_context['bpp_id'] = context.get('bpp_id')
         response_context['bpp_uri'] = context.get('bpp_uri')
         
@@ -24,10 +39,10 @@ class BecknService:
         # (It's passed as a parameter and should match context['transaction_id'])
         response_context['transaction_id'] = transaction_id
         
-        # Set the new message_id for this on_search response.
+        # Set the new message_id for this response.
         response_context['message_id'] = message_id
         
-        # Set a new timestamp for this on_search response.
+        # Set a new timestamp for this response.
         response_context['timestamp'] = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
 
         # Handle the version field: output "version" key.
@@ -52,45 +67,62 @@ class BecknService:
         response_context["domain"] = response_context.get("domain", "e-commerce")
         response_context["country"] = response_context.get("country", "IND")
         response_context["city"] = response_context.get("city", "std:080")
+        return response_context
 
-        catalog_items = []
-        for product in products:
-            # Generate image_url as per requirement: gcs/<product_id>.jpg
-            # ProductSearchService might return an image_url, but the request specifies to generate it.
-            generated_image_url = f"https://storage.mtls.cloud.google.com/retail_images__agenticdemo/images/{product.get('id')}.jpg"
+    @staticmethod
+    def _build_catalog_item(product):
+        # Generate image_url as per requirement: gcs/<product_id>.jpg
+        # ProductSearchService might return an image_url, but the request specifies to generate it.
+        generated_image_url = f"https://storage.mtls.cloud.google.com/retail_images__agenticdemo/images/{product.get('id')}.jpg"
 
-            # Construct the simplified catalog item as per new requirements
-            catalog_item = {
-                "Item_id": product.get("id"),
-                "name": product.get("name"),  # Was previously product.get("name") mapped to descriptor.name
-                "images": [generated_image_url], # Was previously under descriptor.images
-                "price": {
-                    "currency": product.get("currency", "INR"), # price, with default currency
-                    "value": str(product.get("price")) 
-                },
-                "brand_name": product.get("brand") # Directly include brand_name
-            }
-            catalog_items.append(catalog_item)
+        # Construct the simplified catalog item as per new requirements
+        return {
+            "Item_id": product.get("id"),
+            "name": product.get("name"),  # Was previously product.get("name") mapped to descriptor.name
+            "images": [generated_image_url], # Was previously under descriptor.images
+            "price": {
+                "currency": product.get("currency", "INR"), # price, with default currency
+                "value": str(product.get("price")) 
+            },
+            "brand_name": product.get("brand") # Directly include brand_name
+        }
+
+    @staticmethod
+    def generate_on_search_response(products, transaction_id, message_id, context):
+        response_context = BecknService._build_response_context(context, "on_search", transaction_id, message_id)
+        catalog_items = [BecknService._build_catalog_item(product) for product in products]
 
         return {
             "context": response_context,
             "message": {
                 "catalog": {
-                    "bpp/descriptor": {
-                        "name": "Your E-commerce BPP",
-                        "short_desc": "BPP for seller services"
-                    },
+                    "bpp/descriptor": dict(_CATALOG_DESCRIPTOR),
                     "bpp/providers": [{
-                        "id": "provider1",
-                        "descriptor": {
-                            "name": "Product Provider Co."
-                        },
+                        "id": _PROVIDER_ID,
+                        "descriptor": dict(_PROVIDER_DESCRIPTOR),
                         "items": catalog_items
                     }]
                 }
             }
         }
 
+    @staticmethod
+    def render_on_search_response(products, transaction_id, message_id, context) -> bytes:
+        """
+        Same payload as generate_on_search_response, rendered straight to JSON bytes.
+
+        Only the context is built per call. Each catalog item comes from the
+        pre-serialized fragment cache, so a 10- or 100-item response is a join
+        of cached byte strings rather than dict construction plus encoding.
+        """
+        response_context = BecknService._build_response_context(context, "on_search", transaction_id, message_id)
+        fragment_cache = get_catalog_fragment_cache()
+        items = b",".join(fragment_cache.get_fragments(products, BecknService._build_catalog_item))
+        return (
+            b'{"context":' + json_codec.dumps(response_context) + b',' +
+            _ON_SEARCH_MESSAGE_PREFIX + items + _ON_SEARCH_MESSAGE_SUFFIX
+        )
+
     @staticmethod
     def generate_on_select_response(product_details, transaction_id, message_id, context):
         """
@@ -105,30 +137,7 @@ class BecknService:
         Returns:
             dict: The 'on_select' response payload.
         """
-        response_context = context.copy()
-        response_context['action'] = "on_select"
-        response_context['bpp_id'] = context.get('bpp_id')
-        response_context['bpp_uri'] = context.get('bpp_uri')
-        response_context['transaction_id'] = transaction_id
-        response_context['message_id'] = message_id
-        response_context['timestamp'] = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
-
-        input_version_val = context.get("version")
-        input_core_version_val = context.get("core_version")
-
-        if input_version_val is not None:
-            response_context['version'] = input_version_val
-        elif input_core_version_val is not None:
-            response_context['version'] = input_core_version_val
-        else:
-            response_context['version'] = "2.0.0" # Default if neither is present
-
-        if 'core_version' in response_context:
-            del response_context['core_version']
-            
-        response_context["domain"] = response_context.get("domain", "e-commerce")
-        response_context["country"] = response_context.get("country", "IND")
-        response_context["city"] = response_context.get("city", "std:080")
+        response_context = BecknService._build_response_context(context, "on_select", transaction_id, message_id)
 
         # Generate image_url as per requirement: gcs/<product_id>.jpg
         generated_image_url = f"https://storage.mtls.cloud.google.com/retail_images__agenticdemo/images/{product_details.get('id')}.jpg"
@@ -197,89 +206,70 @@ class BecknService:
         }
 
     @staticmethod
-    def send_on_search_callback(callback_uri: str, response_payload: dict, transaction_id: str):
-        if not callback_uri:
-            current_app.logger.warning(f"No callback URI provided for transaction {transaction_id}. Cannot send callback.")
-            return
+    def _build_callback_target(callback_uri: str, action: str, transaction_id: str):
+        """
+        Returns (target_url, audience) for a callback, or None if callback_uri is unusable.
 
-        # Determine the target URL for the request and the audience for the token.
-        # The `callback_uri` from the Beckn context is typically the base URI of the BAP.
-        # The specific action (e.g., /on_search) is appended to this base URI.
-        # The `audience` for the ID token is the canonical base URL of the BAP service.
+        The `callback_uri` from the Beckn context is typically the base URI of the BAP.
+        The specific action (e.g., /on_search) is appended to this base URI.
+        The `audience` for the ID token is the canonical base URL of the BAP service.
+        """
+        if not callback_uri:
+            current_app.logger.warning("No callback URI provided for transaction %s. Cannot send %s callback.", transaction_id, action)
+            return None
 
         if not callback_uri.startswith(('http://', 'https://')):
-            current_app.logger.error(f"Invalid callback_uri scheme for transaction {transaction_id}: {callback_uri}. Must be http or https.")
-            return
+            current_app.logger.error("Invalid callback_uri scheme for transaction %s: %s. Must be http or https.", transaction_id, callback_uri)
+            return None
 
         try:
             parsed_bap_uri = urlparse(callback_uri)
             audience_for_token = f"{parsed_bap_uri.scheme}://{parsed_bap_uri.netloc}"
-            
-            # Construct the full target URL by appending '/on_search'
-            # Ensure no double slashes if callback_uri already ends with one.
-            target_url_for_request = parsed_bap_uri._replace(path=parsed_bap_uri.path.rstrip('/') + '/on_search').geturl()
 
+            # Construct the full target URL by appending the action.
+            # Ensure no double slashes if callback_uri already ends with one.
+            target_url_for_request = parsed_bap_uri._replace(path=parsed_bap_uri.path.rstrip('/') + f'/{action}').geturl()
         except Exception as e:
-            current_app.logger.error(f"Failed to parse callback_uri or construct target URL for transaction {transaction_id}: {callback_uri}. Error: {e}", exc_info=True)
-            return
+            current_app.logger.error("Failed to parse callback_uri or construct target URL for transaction %s: %s. Error: %s", transaction_id, callback_uri, e, exc_info=True)
+            return None
 
-        try:
-            current_app.logger.info(f"Attempting to send authenticated on_search for transaction {transaction_id} to {target_url_for_request} with audience {audience_for_token}")
-
-            response = make_authenticated_request(
-                url=target_url_for_request, # The full URL to POST to
-                method="POST",
-                json_payload=response_payload,
-                audience=audience_for_token, # The audience for the ID token
-                timeout=10
-            )
-            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-            current_app.logger.info(f"Successfully sent on_search response for transaction {transaction_id} to {target_url_for_request}. Status: {response.status_code}")
-        except ConnectionError as e: # From _get_authenticated_session
-            current_app.logger.error(f"Authentication setup failed for callback to {target_url_for_request} (audience: {audience_for_token}): {e}", exc_info=True)
-        except requests.exceptions.RequestException as e:
-            current_app.logger.error(f"Failed to send on_search response for transaction {transaction_id} to {target_url_for_request}: {e}", exc_info=True)
-        except ValueError as e: # From JSON encoding in make_authenticated_request
-            current_app.logger.error(f"Data encoding error for callback to {target_url_for_request}: {e}", exc_info=True)
-        except Exception as e: # Catch-all for other unexpected errors
-            current_app.logger.error(f"An unexpected error occurred sending on_search to {target_url_for_request}: {e}", exc_info=True)
+        return target_url_for_request, audience_for_token
 
     @staticmethod
-    def send_on_select_callback(callback_uri: str, response_payload: dict, transaction_id: str):
-        if not callback_uri:
-            current_app.logger.warning(f"No callback URI provided for transaction {transaction_id}. Cannot send on_select callback.")
+    def _dispatch_callback(callback_uri: str, action: str, response_payload: dict, transaction_id: str, deadline=None):
+        """
+        Hands the payload to the callback delivery queue, which retries and
+        dead-letters on failure. Falls back to a single inline attempt if the
+        queue was not initialized (e.g. in standalone scripts).
+        """
+        target = BecknService._build_callback_target(callback_uri, action, transaction_id)
+        if target is None:
             return
+        target_url_for_request, audience_for_token = target
 
-        if not callback_uri.startswith(('http://', 'https://')):
-            current_app.logger.error(f"Invalid callback_uri scheme for transaction {transaction_id}: {callback_uri}. Must be http or https.")
+        if deadline is not None and deadline.expired():
+            current_app.logger.warning("Skipping %s callback for transaction %s: deadline already passed.", action, transaction_id)
             return
 
-        try:
-            parsed_bap_uri = urlparse(callback_uri)
-            audience_for_token = f"{parsed_bap_uri.scheme}://{parsed_bap_uri.netloc}"
-            
-            # Construct the full target URL by appending '/on_select'
-            target_url_for_request = parsed_bap_uri._replace(path=parsed_bap_uri.path.rstrip('/') + '/on_select').geturl()
-
-        except Exception as e:
-            current_app.logger.error(f"Failed to parse callback_uri or construct target URL for transaction {transaction_id}: {callback_uri}. Error: {e}", exc_info=True)
+        job = CallbackJob(transaction_id, action, target_url_for_request, audience_for_token, response_payload, deadline)
+        delivery = get_callback_delivery()
+        if delivery is not None:
+            delivery.enqueue(job)
+            current_app.logger.info("Queued %s for transaction %s to %s with audience %s", action, transaction_id, target_url_for_request, audience_for_token)
             return
 
+        current_app.logger.warning("Callback delivery queue not initialized. Sending %s for transaction %s inline, without retries.", action, transaction_id)
+        timeout = min(CALLBACK_TIMEOUT_SECONDS, deadline.remaining()) if deadline is not None else CALLBACK_TIMEOUT_SECONDS
         try:
-            current_app.logger.info(f"Attempting to send authenticated on_select for transaction {transaction_id} to {target_url_for_request} with audience {audience_for_token}")
+            response = deliver_callback_once(job, timeout)
+            current_app.logger.info("Successfully sent %s response for transaction %s to %s. Status: %s", action, transaction_id, target_url_for_request, response.status_code)
+        except Exception as e: # Catch-all: a failed callback must not crash the background task
+            current_app.logger.error("Failed to send %s response for transaction %s to %s: %s", action, transaction_id, target_url_for_request, e, exc_info=True)
 
-            response = make_authenticated_request(
-                url=target_url_for_request,
-                method="POST",
-                json_payload=response_payload,
-                audience=audience_for_token,
-                timeout=10
-            )
-            response.raise_for_status()
+    @staticmethod
+    def send_on_search_callback(callback_uri: str, response_payload: dict, transaction_id: str, deadline=None):
+        BecknService._dispatch_callback(callback_uri, "on_search", response_payload, transaction_id, deadline)
 
-            current_app.logger.info(f"Successfully sent on_select response for transaction {transaction_id} to {target_url_for_request}. Status: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            current_app.logger.error(f"Failed to send on_select response for transaction {transaction_id} to {target_url_for_request}: {e}", exc_info=True)
-        except Exception as e:
-            current_app.logger.error(f"An unexpected error occurred sending on_select to {target_url_for_request}: {e}", exc_info=True)
\ No newline at end of file
+    @staticmethod
+    def send_on_select_callback(callback_uri: str, response_payload: dict, transaction_id: str, deadline=None):
+        BecknService._dispatch_callback(callback_uri, "on_select", response_payload, transaction_id, deadline)
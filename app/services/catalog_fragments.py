@@ -0,0 +1,109 @@
+# app/services/catalog_fragments.py
+import threading
+import time
+
+from app.utils import json_codec
+from app.utils.metrics import CACHE_LOOKUPS
+
+catalog_fragment_cache = None
+
+_FRAGMENT_HITS = CACHE_LOOKUPS.labels("catalog_fragments", "hit")
+_FRAGMENT_MISSES = CACHE_LOOKUPS.labels("catalog_fragments", "miss")
+
+
+class CatalogFragmentCache:
+    """
+    Pre-serialized on_search catalog items, keyed by (product_id, catalog_version).
+
+    A product renders to the same item JSON on every search, so it is encoded
+    once and the bytes are reused. Each fragment remembers the product fields
+    it was rendered from, and a hit only counts when the fresh row from this
+    search has the same fields; a changed price or name re-renders at once.
+    Bumping CATALOG_VERSION drops every fragment; the TTL only ages out
+    entries of products that are no longer searched for.
+
+    Reads are a plain dict lookup without locking (dict.get is atomic in
+    CPython); only inserts and evictions take the lock. When full, the oldest
+    inserted fragment is evicted.
+    """
+
+    def __init__(self, catalog_version: str = "1", maxsize: int = 10000, ttl_seconds: float = 300):
+        self.catalog_version = catalog_version
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._fragments = {} # (product_id, catalog_version) -> (fragment bytes, expires_at, product dict rendered)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get_fragments(self, products, render_item):
+        """
+        Returns the serialized catalog item for each product, rendering misses
+        with render_item(product) and encoding them once. render_item must
+        depend on nothing but the product dict.
+        """
+        now = time.monotonic()
+        version = self.catalog_version
+        fragments_by_key = self._fragments
+        fragments = []
+        misses = 0
+        for product in products:
+            key = (product.get("id"), version)
+            entry = fragments_by_key.get(key)
+            if entry is None or entry[1] < now or entry[2] != product: # A dict compare; nothing is built on a hit
+                misses += 1
+                fragment = json_codec.dumps(render_item(product))
+                self._store(key, fragment, now + self.ttl_seconds, dict(product))
+            else:
+                fragment = entry[0]
+            fragments.append(fragment)
+        # Approximate under concurrency; these only feed the stats endpoint.
+        self._hits += len(fragments) - misses
+        self._misses += misses
+        _FRAGMENT_HITS.inc(len(fragments) - misses) # Exact and merged across workers, for /metrics
+        _FRAGMENT_MISSES.inc(misses)
+        return fragments
+
+    def _store(self, key, fragment, expires_at, product):
+        with self._lock:
+            if key not in self._fragments and len(self._fragments) >= self.maxsize:
+                self._fragments.pop(next(iter(self._fragments)), None)
+            self._fragments[key] = (fragment, expires_at, product)
+
+    def set_catalog_version(self, catalog_version: str):
+        with self._lock:
+            self.catalog_version = catalog_version
+            self._fragments = {}
+
+    def get_stats(self):
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "size": len(self._fragments),
+            "catalog_version": self.catalog_version,
+        }
+
+
+def initialize_catalog_fragment_cache(app):
+    """
+    Creates the global fragment cache from app config.
+    This should be called only once at application startup.
+    """
+    global catalog_fragment_cache
+    if catalog_fragment_cache is None:
+        catalog_fragment_cache = CatalogFragmentCache(
+            catalog_version=app.config.get('CATALOG_VERSION', '1'),
+            maxsize=app.config.get('CATALOG_FRAGMENT_CACHE_SIZE', 10000),
+            ttl_seconds=app.config.get('CATALOG_FRAGMENT_TTL_SECONDS', 300)
+        )
+    return catalog_fragment_cache
+
+def get_catalog_fragment_cache():
+    """
+    Returns the global fragment cache, creating one with default settings
+    if the app did not initialize it (e.g. in benchmarks).
+    """
+    global catalog_fragment_cache
+    if catalog_fragment_cache is None:
+        catalog_fragment_cache = CatalogFragmentCache()
+    return catalog_fragment_cache
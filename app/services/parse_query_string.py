@@ -1,44 +1,113 @@
 import re
 import math
 
+from app.services.attribute_dictionary import ATTRIBUTE_ALIASES, get_attribute_dictionary
+
+_PRICE_PATTERN = re.compile(r"price\s*([><]=?)\s*(\d+(?:\.\d+)?)", re.IGNORECASE)
+_PRICE_RANGE_PATTERN = re.compile(r"price\s*:?\s*(\d+(?:\.\d+)?)\s*(?:-|to)\s*(\d+(?:\.\d+)?)", re.IGNORECASE)
+_ATTRIBUTE_IN_PATTERN = re.compile(r"([a-z][a-z_]*)\s+in\s*\((.*)\)", re.IGNORECASE | re.DOTALL)
+_ATTRIBUTE_VALUE_PATTERN = re.compile(r"([a-z][a-z_]*)\s*[:=]\s*(.+)", re.IGNORECASE | re.DOTALL)
+# A comma-separated part; commas inside "(...)" belong to an "attr in (...)" list
+_PART_PATTERN = re.compile(r"(?:[^,(]|\([^)]*\)?)+")
+_VALUE_SEPARATOR = re.compile(r"[,|]")
+
+def _split_parts(query_str):
+    if '(' not in query_str:
+        parts = query_str.split(',')
+    else:
+        parts = _PART_PATTERN.findall(query_str)
+    return [part.strip() for part in parts if part.strip()]
+
+def _parse_attribute(part):
+    """
+    (column, [values]) for "attr:value", "attr=value", "attr:a|b" and
+    "attr in (a, b)" parts naming a known attribute, else None.
+    """
+    match = _ATTRIBUTE_IN_PATTERN.fullmatch(part) or _ATTRIBUTE_VALUE_PATTERN.fullmatch(part)
+    if not match:
+        return None
+    column = ATTRIBUTE_ALIASES.get(match.group(1).lower())
+    if column is None:
+        return None
+    values = [value.strip() for value in _VALUE_SEPARATOR.split(match.group(2)) if value.strip()]
+    return (column, values) if values else None
+
 def parse_ondc_query_string(query_str):
     """
-    Parses a comma-separated query string to extract keywords and min/max price.
+    Parses a comma-separated query string to extract keywords, min/max price
+    and attribute filters.
     This is the core parsing engine.
 
+    Grammar of each part:
+        price > 1000, price <= 2000     price bounds (the tightest ones win)
+        price 1000-2000, price:1000-2000
+        color:black, brand=Nike, gender:men|women
+        color in (black, navy blue)     attributes: color/colour, gender, type,
+                                        brand, category (see attribute_dictionary)
+        anything else                   keywords for the embedding text
+
+    An attribute part is a filter only if all its values are in the attribute
+    dictionary; otherwise its values become keywords ("type: casual wear").
+
+    Attribute values in keywords ("black", "for men") are also recognized
+    from the attribute dictionary, for columns without an explicit filter.
+
     Args:
         query_str (str): The query string, e.g.,
-                         "t-shirt,black,price > 1000,price < 2000"
+                         "t-shirt,color:black,price > 1000,price < 2000"
 
     Returns:
-        dict: A dictionary containing only keywords, min_price_val, and max_price_val.
+        dict: keywords, min_price_val, max_price_val, attributes (explicit,
+              {column: [lowercased values]}) and recognized_attributes.
     """
     if not query_str:
         return {
             "keywords": [],
             "min_price_val": None,
             "max_price_val": None,
+            "attributes": {},
+            "recognized_attributes": {},
         }
 
-    parts = [part.strip() for part in query_str.split(',') if part.strip()]
+    parts = _split_parts(query_str)
     keywords = []
+    attributes = {}
+    dictionary = get_attribute_dictionary()
 
     # Effective range boundaries
     min_val = -math.inf
     max_val = math.inf
 
-    price_pattern = re.compile(r"price\s*([><]=?)\s*(\d+(?:\.\d+)?)", re.IGNORECASE)
-
     for part in parts:
-        match = price_pattern.fullmatch(part)
-        if match:
-            operator = match.group(1)
-            value = float(match.group(2))
-
-            if operator in ('>', '>=') and value > min_val:
-                min_val = value
-            elif operator in ('<', '<=') and value < max_val:
-                max_val = value
+        if part[:5].lower() == 'price':
+            match = _PRICE_PATTERN.fullmatch(part)
+            if match:
+                operator = match.group(1)
+                value = float(match.group(2))
+
+                if operator in ('>', '>=') and value > min_val:
+                    min_val = value
+                elif operator in ('<', '<=') and value < max_val:
+                    max_val = value
+                continue
+
+            match = _PRICE_RANGE_PATTERN.fullmatch(part)
+            if match:
+                low, high = sorted((float(match.group(1)), float(match.group(2))))
+                min_val = max(min_val, low)
+                max_val = min(max_val, high)
+                continue
+
+        # Only parts with ':', '=' or '(' can be attribute filters; plain keywords skip the regexes
+        attribute = _parse_attribute(part) if (':' in part or '=' in part or '(' in part) else None
+        if attribute:
+            column, values = attribute
+            resolved = dictionary.resolve_all(column, values)
+            if resolved is None:
+                keywords.extend(values) # Not catalog values: a soft match on the text, not an empty filter
+                continue
+            existing = attributes.setdefault(column, [])
+            existing.extend(value for value in resolved if value not in existing)
         else:
             keywords.append(part)
 
@@ -53,11 +122,16 @@ def parse_ondc_query_string(query_str):
             final_min_price = None
             final_max_price = None
 
-    # Return the simplified dictionary as requested.
+    recognized = dictionary.recognize(keywords)
+    for column in attributes:
+        recognized.pop(column, None) # An explicit filter on the column wins
+
     return {
         "keywords": keywords,
         "min_price_val": final_min_price,
-        "max_price_val": final_max_price
+        "max_price_val": final_max_price,
+        "attributes": attributes,
+        "recognized_attributes": recognized,
     }
 
 def process_search_request(request_body):
@@ -80,4 +154,6 @@ def process_search_request(request_body):
             "keywords": [],
             "min_price_val": None,
             "max_price_val": None,
+            "attributes": {},
+            "recognized_attributes": {},
         }
@@ -1,10 +1,28 @@
 # app/services/product_search_service.py
 import psycopg2
 from psycopg2 import Error
-import google.generativeai as genai
 import time
 from flask import current_app # Import current_app to access Flask config and logger
 from app.db.db_pool_manager import get_db_connection, put_db_connection
+from app.db.ann_partitions import get_ann_router
+from app.db.slow_query_log import get_slow_query_log
+from app.services.attribute_dictionary import ATTRIBUTE_COLUMNS
+from app.utils.deadline import DeadlineExceeded
+from app.utils.metrics import EMBEDDING_LATENCY, POOL_ACQUIRE_LATENCY, SQL_LATENCY, ERRORS, ANN_ROUTES
+from app.utils.tracing import record_span, KIND_CLIENT
+
+genai = None # google.generativeai, imported on first use: it alone is most of the app's import time
+
+def load_genai():
+    """
+    Imports the Google Generative AI SDK once and returns it. Called when the
+    first ProductSearchService is built (by the warmup, or the first search).
+    """
+    global genai
+    if genai is None:
+        import google.generativeai as genai_module
+        genai = genai_module
+    return genai
 
 class ProductSearchService: 
     def __init__(self):
@@ -13,7 +31,13 @@ class ProductSearchService:
         if not google_api_key:
             current_app.logger.critical("GOOGLE_API_KEY not configured in Flask app config.")
             raise ValueError("GOOGLE_API_KEY not configured in Flask app config.")
-        genai.configure(api_key=google_api_key)
+        api_endpoint = current_app.config.get('EMBEDDING_API_ENDPOINT')
+        if api_endpoint:
+            # Load tests point this at a local stand-in; only the REST transport allows a plain-HTTP host.
+            load_genai().configure(api_key=google_api_key, transport="rest", client_options={"api_endpoint": api_endpoint})
+            current_app.logger.warning("Embedding API endpoint overridden: %s", api_endpoint)
+        else:
+            load_genai().configure(api_key=google_api_key)
         self.EMBEDDING_MODEL = current_app.config.get('EMBEDDING_MODEL', 'models/text-embedding-004')
 
         # Database connection details are no longer directly used here,
@@ -21,37 +45,73 @@ class ProductSearchService:
         # Basic validation can be removed here as it's done in initialize_db_pool()
         current_app.logger.debug("ProductSearchService initialized.")
 
-    def get_embedding(self, text: str) -> list[float]:
+    def get_embedding(self, text: str, deadline=None) -> list[float]:
         """
         Generates a vector embedding for the given text using Google's text-embedding-004 model.
+        If a deadline is given, the API call's timeout is the remaining budget and
+        DeadlineExceeded is raised instead of returning None once the budget is gone.
         """
         if not text:
             return None
+        request_options = None
+        if deadline is not None:
+            request_options = {"timeout": deadline.timeout_for("embedding")}
+        embedding_start_time = time.perf_counter()
         try:
-            embedding_start_time = time.perf_counter()
             result = genai.embed_content(
                 model=self.EMBEDDING_MODEL,
                 content=text,
-                task_type="RETRIEVAL_QUERY"
+                task_type="RETRIEVAL_QUERY",
+                request_options=request_options
             )
             embedding_end_time = time.perf_counter()
-            current_app.logger.debug(f"Embedding generation latency: {(embedding_end_time - embedding_start_time) * 1000:.2f} ms")
+            EMBEDDING_LATENCY.observe(embedding_end_time - embedding_start_time)
+            record_span("embedding", embedding_start_time, embedding_end_time, {"embedding.model": self.EMBEDDING_MODEL}, kind=KIND_CLIENT)
+            current_app.logger.debug("Embedding generation latency: %.2f ms", (embedding_end_time - embedding_start_time) * 1000)
             return result['embedding']
         except Exception as e:
-            current_app.logger.error(f"Error getting Google embedding for query: {e}")
+            record_span("embedding", embedding_start_time, time.perf_counter(), {"embedding.model": self.EMBEDDING_MODEL},
+                        kind=KIND_CLIENT, error=f"{type(e).__name__}: {e}")
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded("embedding") from e
+            ERRORS.labels("embedding").inc()
+            current_app.logger.error("Error getting Google embedding for query: %s", e)
             return None
 
-    def search_products(self, query_text: str, filters: dict = None, top_n: int = 5):
+    @staticmethod
+    def _apply_statement_timeout(cursor, deadline, stage: str):
         """
-        Performs a flexible hybrid search. Price filters remain hard SQL constraints.
-        Other categorical/text filters are softened into semantic hints for the embedding.
+        Limits the next statements on this connection to the remaining budget.
+        SET LOCAL only lasts until the end of the current transaction, and the
+        pool rolls the transaction back when the connection is returned.
+        """
+        if deadline is None:
+            return
+        timeout_ms = max(1, int(deadline.timeout_for(stage) * 1000))
+        cursor.execute("SET LOCAL statement_timeout = %s", (timeout_ms,))
+
+    def search_products(self, query_text: str, filters: dict = None, top_n: int = 5, deadline=None, boost_attributes: dict = None):
+        """
+        Performs a flexible hybrid search. Price and catalog attribute filters are hard
+        SQL constraints, applied before the vector ranking. Other filters are softened
+        into semantic hints for the embedding.
 
         Args:
             query_text (str): The natural language query (e.g., "red shirt").
             filters (dict, optional): A dictionary of attributes.
                                       'min_price'/'max_price' are strict SQL filters.
-                                      Others (brand, category, color, etc.) are added to query_text.
+                                      base_color, gender, article_type, brand_name and master_category
+                                      (lists of lowercased values, any of which matches) are strict SQL filters.
+                                      Others are added to query_text.
             top_n (int, optional): The number of top similar products to return. Defaults to 5.
+            deadline (Deadline, optional): Transaction budget. Raises DeadlineExceeded when spent.
+            boost_attributes (dict, optional): {column: [values]} of the same columns. The nearest
+                                      top_n * SEARCH_BOOST_CANDIDATE_FACTOR products are re-ranked so
+                                      that each matching attribute counts as SEARCH_ATTRIBUTE_BOOST less distance.
+
+        A search whose hard filter is a single article_type or master_category with its own
+        partial ANN index (app/db/ann_partitions.py) spells that filter as exactly the index's
+        predicate, so the planner can search that index. Results are the same either way.
         """
         connection = None
         cursor = None
@@ -69,6 +129,13 @@ class ProductSearchService:
             soft_filters_for_embedding = {}
             hard_filters_for_debug_print = {}
 
+            ann_router = get_ann_router()
+            route = ann_router.route(filters) if ann_router is not None else None
+            if route is not None:
+                # (column, value, index): the search already filters on exactly this category
+                current_app.logger.info("Search routed to partition index %s (%s=%s).", route[2], route[0], route[1])
+            ANN_ROUTES.labels(route[0] if route is not None else "global").inc()
+
             if filters:
                 for key, value in filters.items():
                     if value is not None:
@@ -80,6 +147,16 @@ class ProductSearchService:
                             hard_filters_sql.append("price <= %s")
                             sql_params.append(value)
                             hard_filters_for_debug_print[key] = value
+                        elif route is not None and key == route[0]:
+                            # Literally the partial index's predicate; the planner must prove it implies the index's WHERE
+                            hard_filters_sql.append(f"lower({key}) = %s")
+                            sql_params.append(route[1])
+                            hard_filters_for_debug_print[key] = value
+                        elif key in ATTRIBUTE_COLUMNS and value:
+                            # lower(column) is what the expression indexes cover (app/db/catalog_indexes.py)
+                            hard_filters_sql.append(f"lower({key}) = ANY(%s)")
+                            sql_params.append([str(v).lower() for v in value])
+                            hard_filters_for_debug_print[key] = value
                         else:
                             soft_filters_for_embedding[key] = value
             
@@ -87,9 +164,9 @@ class ProductSearchService:
                 for key, value in soft_filters_for_embedding.items():
                     search_query_text += f" {key}: {value}"
 
-            current_app.logger.info(f"Generating embedding for combined query: '{search_query_text}'...")
+            current_app.logger.info("Generating embedding for combined query: '%s'...", search_query_text)
             embedding_call_start_time = time.perf_counter()
-            query_embedding = self.get_embedding(search_query_text)
+            query_embedding = self.get_embedding(search_query_text, deadline=deadline)
             embedding_call_end_time = time.perf_counter()
             embedding_generation_time = (embedding_call_end_time - embedding_call_start_time) * 1000 # in ms
 
@@ -97,17 +174,27 @@ class ProductSearchService:
                 current_app.logger.error("Failed to generate embedding for query. Cannot perform search.")
                 return []
 
-            current_app.logger.info(f"Query embedding generated. Dimension: {len(query_embedding)}")
+            current_app.logger.info("Query embedding generated. Dimension: %s", len(query_embedding))
 
             # --- Get connection from the pool ---
             conn_get_start_time = time.perf_counter()
             connection = get_db_connection() # Use the pool manager function
             conn_get_end_time = time.perf_counter()
             db_connection_time = (conn_get_end_time - conn_get_start_time) * 1000 # in ms
-            current_app.logger.debug(f"Database connection retrieved from pool: {db_connection_time:.2f} ms")
+            POOL_ACQUIRE_LATENCY.labels("search").observe(db_connection_time / 1000)
+            record_span("db.pool_acquire", conn_get_start_time, conn_get_end_time, {"db.query": "search"})
+            current_app.logger.debug("Database connection retrieved from pool: %.2f ms", db_connection_time)
 
             # register_vector(connection) # No longer needed here, done by get_db_connection()
             cursor = connection.cursor()
+            self._apply_statement_timeout(cursor, deadline, "db_query")
+            boost_sql = []
+            boost_params = []
+            for key, values in (boost_attributes or {}).items():
+                if key in ATTRIBUTE_COLUMNS and values and key not in hard_filters_for_debug_print:
+                    boost_sql.append(f"COALESCE(lower({key}) = ANY(%s), false)::int")
+                    boost_params.append([str(v).lower() for v in values])
+            boost_column = f",\n                    {' + '.join(boost_sql)} AS attribute_matches" if boost_sql else ""
             base_sql = f"""
                 SELECT
                     product_id,
@@ -115,14 +202,14 @@ class ProductSearchService:
                     brand_name,
                     price,
                     image_url, -- Added image_url to match unpacking
-                    description_embedding <-> %s::vector AS cosine_distance
+                    description_embedding <-> %s::vector AS cosine_distance{boost_column}
                 FROM
                     products
                 WHERE
                     description_embedding IS NOT NULL
                 """
         
-            final_sql_params = [query_embedding] + sql_params
+            final_sql_params = [query_embedding] + boost_params + sql_params
 
             if hard_filters_sql:
                 base_sql += " AND " + " AND ".join(hard_filters_sql)
@@ -130,18 +217,37 @@ class ProductSearchService:
             base_sql += """
             ORDER BY
                 cosine_distance
-            LIMIT %s;
+            LIMIT %s
+            """
+            if boost_sql:
+                # Re-rank the nearest candidates only, so the inner ORDER BY can still use the ANN index
+                final_sql_params.append(top_n * current_app.config.get('SEARCH_BOOST_CANDIDATE_FACTOR', 4))
+                base_sql = f"""
+            SELECT product_id, product_display_name, brand_name, price, image_url, cosine_distance
+            FROM ({base_sql}) AS candidates
+            ORDER BY
+                cosine_distance - %s * attribute_matches
+            LIMIT %s
             """
+                final_sql_params.append(current_app.config.get('SEARCH_ATTRIBUTE_BOOST', 0.05))
             final_sql_params.append(top_n)
 
-            current_app.logger.info(f"Executing flexible hybrid search for '{search_query_text}' with hard filters: {hard_filters_for_debug_print}...")
+            current_app.logger.info("Executing flexible hybrid search for '%s' with hard filters: %s, boosts: %s...",
+                                    search_query_text, hard_filters_for_debug_print, boost_attributes)
             
             query_exec_start_time = time.perf_counter()
             cursor.execute(base_sql, tuple(final_sql_params))
             results = cursor.fetchall()
             query_exec_end_time = time.perf_counter()
             db_query_time = (query_exec_end_time - query_exec_start_time) * 1000 # in ms
-            current_app.logger.debug(f"SQL query execution latency: {db_query_time:.2f} ms")
+            SQL_LATENCY.labels("search").observe(db_query_time / 1000)
+            record_span("db.query", query_exec_start_time, query_exec_end_time,
+                        {"db.query": "search", "db.rows": len(results), "db.ann_index": route[2] if route is not None else "global"}, kind=KIND_CLIENT)
+            slow_query_log = get_slow_query_log()
+            if slow_query_log is not None:
+                slow_query_log.observe("search", base_sql, final_sql_params, db_query_time / 1000, len(results),
+                                       filter_sql=" AND ".join(hard_filters_sql), filter_params=sql_params)
+            current_app.logger.debug("SQL query execution latency: %.2f ms", db_query_time)
             current_app.logger.info("Search complete.")
 
             formatted_results = []
@@ -158,11 +264,20 @@ class ProductSearchService:
                     # "cosine_distance": cosine_distance # Optional, if needed downstream
                 })
             
-            current_app.logger.info(f"Found {len(formatted_results)} products for query: '{search_query_text}' with hard filters: {hard_filters_for_debug_print}")
+            current_app.logger.info("Found %s products for query: '%s' with hard filters: %s", len(formatted_results), search_query_text, hard_filters_for_debug_print)
             return formatted_results
 
+        except DeadlineExceeded:
+            raise
+        except psycopg2.extensions.QueryCanceledError as e:
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded("db_query") from e
+            ERRORS.labels("db_query").inc()
+            current_app.logger.critical("Product search query was cancelled: %s", e, exc_info=True)
+            return []
         except (Exception, Error) as e:
-            current_app.logger.critical(f"An error occurred during product search: {e}", exc_info=True)
+            ERRORS.labels("db_query").inc()
+            current_app.logger.critical("An error occurred during product search: %s", e, exc_info=True)
             if isinstance(e, psycopg2.OperationalError):
                 current_app.logger.error("  - Check DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD in .env/.config.py.")
                 current_app.logger.error("  - Ensure your Cloud SQL instance is running and accessible from the Docker container.")
@@ -176,19 +291,19 @@ class ProductSearchService:
                 current_app.logger.debug("Database connection returned to pool.")
             search_end_time = time.perf_counter()
             overall_search_latency_ms = (search_end_time - search_start_time) * 1000
-            current_app.logger.info(f"Overall search function latency: {overall_search_latency_ms:.2f} ms")
+            current_app.logger.info("Overall search function latency: %.2f ms", overall_search_latency_ms)
             current_app.logger.info(
-                f"Search Latency Breakdown - Embedding: {embedding_generation_time:.2f} ms, "
-                f"DB Connect: {db_connection_time:.2f} ms, "
-                f"DB Query: {db_query_time:.2f} ms"
+                "Search Latency Breakdown - Embedding: %.2f ms, DB Connect: %.2f ms, DB Query: %.2f ms",
+                embedding_generation_time, db_connection_time, db_query_time
             )
 
-    def select_products(self, product_id: str):
+    def select_products(self, product_id: str, deadline=None):
         """
         Retrieves a single product's details by its product_id.
 
         Args:
             product_id (str): The unique identifier of the product.
+            deadline (Deadline, optional): Transaction budget. Raises DeadlineExceeded when spent.
 
         Returns:
             dict: A dictionary containing the product's details, or None if not found.
@@ -200,15 +315,18 @@ class ProductSearchService:
         db_query_time = 0.0
 
         try:
-            current_app.logger.info(f"Attempting to select product with ID: {product_id}")
+            current_app.logger.info("Attempting to select product with ID: %s", product_id)
 
             conn_get_start_time = time.perf_counter()
             connection = get_db_connection()
             conn_get_end_time = time.perf_counter()
             db_connection_time = (conn_get_end_time - conn_get_start_time) * 1000
-            current_app.logger.debug(f"Database connection retrieved from pool: {db_connection_time:.2f} ms")
+            POOL_ACQUIRE_LATENCY.labels("select").observe(db_connection_time / 1000)
+            record_span("db.pool_acquire", conn_get_start_time, conn_get_end_time, {"db.query": "select"})
+            current_app.logger.debug("Database connection retrieved from pool: %.2f ms", db_connection_time)
 
             cursor = connection.cursor()
+            self._apply_statement_timeout(cursor, deadline, "db_select")
             sql_query = """
                 SELECT
                     product_id,
@@ -236,7 +354,12 @@ class ProductSearchService:
             row = cursor.fetchone()
             query_exec_end_time = time.perf_counter()
             db_query_time = (query_exec_end_time - query_exec_start_time) * 1000
-            current_app.logger.debug(f"SQL select query execution latency: {db_query_time:.2f} ms")
+            SQL_LATENCY.labels("select").observe(db_query_time / 1000)
+            record_span("db.query", query_exec_start_time, query_exec_end_time, {"db.query": "select", "db.rows": int(row is not None)}, kind=KIND_CLIENT)
+            slow_query_log = get_slow_query_log()
+            if slow_query_log is not None:
+                slow_query_log.observe("select", sql_query, (product_id,), db_query_time / 1000, int(row is not None))
+            current_app.logger.debug("SQL select query execution latency: %.2f ms", db_query_time)
 
             if row:
                 # Map row to a dictionary, ensuring column names match Beckn expected fields
@@ -261,11 +384,20 @@ class ProductSearchService:
                     "image_url": img_url
                 }
             else:
-                current_app.logger.warning(f"Product with ID {product_id} not found.")
+                current_app.logger.warning("Product with ID %s not found.", product_id)
                 return None
 
+        except DeadlineExceeded:
+            raise
+        except psycopg2.extensions.QueryCanceledError as e:
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded("db_select") from e
+            ERRORS.labels("db_select").inc()
+            current_app.logger.critical("Product select query was cancelled for ID %s: %s", product_id, e, exc_info=True)
+            return None
         except (Exception, Error) as e:
-            current_app.logger.critical(f"An error occurred during product selection for ID {product_id}: {e}", exc_info=True)
+            ERRORS.labels("db_select").inc()
+            current_app.logger.critical("An error occurred during product selection for ID %s: %s", product_id, e, exc_info=True)
             return None
         finally:
             if cursor:
@@ -275,8 +407,8 @@ class ProductSearchService:
                 current_app.logger.debug("Database connection returned to pool after select.")
             select_end_time = time.perf_counter()
             overall_select_latency_ms = (select_end_time - select_start_time) * 1000
-            current_app.logger.info(f"Overall select function latency: {overall_select_latency_ms:.2f} ms")
+            current_app.logger.info("Overall select function latency: %.2f ms", overall_select_latency_ms)
             current_app.logger.info(
-                f"Select Latency Breakdown - DB Connect: {db_connection_time:.2f} ms, "
-                f"DB Query: {db_query_time:.2f} ms"
+                "Select Latency Breakdown - DB Connect: %.2f ms, DB Query: %.2f ms",
+                db_connection_time, db_query_time
             )
\ No newline at end of file
@@ -16,7 +16,7 @@ class SearchService:
         return cls._product_search_service
 
     @staticmethod
-    def perform_product_search(search_criteria):
+    def perform_product_search(search_criteria, deadline=None):
         product_search_service = SearchService._get_product_search_service()
         
         # --- Adapt to the output of beckn_utils.extract_search_criteria ---
@@ -25,7 +25,7 @@ class SearchService:
 
         keywords_list = search_criteria.get('keywords', [])
         query_text = " ".join(keywords_list).strip()
-        current_app.logger.info(f"Combined query text from keywords: '{query_text}'")
+        current_app.logger.info("Combined query text from keywords: '%s'", query_text)
 
         filters = {}
         min_price = search_criteria.get('min_price_val')
@@ -34,36 +34,47 @@ class SearchService:
         if min_price is not None:
             try:
                 filters['min_price'] = float(min_price) # ProductSearchService expects 'min_price'
-                current_app.logger.debug(f"Added hard filter: min_price={filters['min_price']}")
+                current_app.logger.debug("Added hard filter: min_price=%s", filters['min_price'])
             except ValueError:
-                current_app.logger.warning(f"Invalid min_price_val: {min_price}. Skipping min_price filter.")
+                current_app.logger.warning("Invalid min_price_val: %s. Skipping min_price filter.", min_price)
         
         if max_price is not None:
             try:
                 filters['max_price'] = float(max_price) # ProductSearchService expects 'max_price'
-                current_app.logger.debug(f"Added hard filter: max_price={filters['max_price']}")
+                current_app.logger.debug("Added hard filter: max_price=%s", filters['max_price'])
             except ValueError:
-                current_app.logger.warning(f"Invalid max_price_val: {max_price}. Skipping max_price filter.")
+                current_app.logger.warning("Invalid max_price_val: %s. Skipping max_price filter.", max_price)
 
-        # Other attributes like color, brand, type are now part of the `query_text`.
-        # The ProductSearchService.search_products method's logic for `soft_filters_for_embedding`
-        # will not be populated with these from here, which is correct as they are already in `query_text`.
+        # Explicit attribute filters (color:black, gender in (...)) with known values are hard
+        # SQL predicates. Attribute values recognized among the keywords stay in `query_text`
+        # too, and are boosted or filtered on as SEARCH_RECOGNIZED_ATTRIBUTES says (default off).
+        filters.update(search_criteria.get('attributes') or {})
+        boost_attributes = None
+        recognized = search_criteria.get('recognized_attributes') or {}
+        recognized_mode = current_app.config.get('SEARCH_RECOGNIZED_ATTRIBUTES', 'off')
+        if recognized and recognized_mode == 'filter':
+            for column, values in recognized.items():
+                filters.setdefault(column, values)
+        elif recognized and recognized_mode == 'boost':
+            boost_attributes = {column: values for column, values in recognized.items() if column not in filters}
 
-        current_app.logger.info(f"Performing hybrid search with query: '{query_text}', filters: {filters}")
+        current_app.logger.info("Performing hybrid search with query: '%s', filters: %s, boosts: %s", query_text, filters, boost_attributes)
         
         # Call the actual hybrid search function
         products = product_search_service.search_products(
             query_text=query_text,
             filters=filters,
-            top_n=10 # You can make this configurable
+            top_n=10, # You can make this configurable
+            deadline=deadline,
+            boost_attributes=boost_attributes
         )
         return products
 
     @staticmethod
-    def perform_product_select(product_id: str):
+    def perform_product_select(product_id: str, deadline=None):
         """
         Performs a product selection based on a given product ID.
         """
         product_search_service = SearchService._get_product_search_service()
-        product_details = product_search_service.select_products(product_id=product_id)
+        product_details = product_search_service.select_products(product_id=product_id, deadline=deadline)
         return product_details
\ No newline at end of file
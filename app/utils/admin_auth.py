@@ -0,0 +1,13 @@
+# app/utils/admin_auth.py
+import hmac
+
+from flask import request
+
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+
+def is_admin_request(config) -> bool:
+    """True if the request carries ADMIN_TOKEN. Without a configured token, nobody is admin."""
+    expected = config.get('ADMIN_TOKEN')
+    supplied = request.headers.get(ADMIN_TOKEN_HEADER)
+    return bool(expected) and supplied is not None and hmac.compare_digest(supplied.encode(), expected.encode())
@@ -1,59 +1,158 @@
 # app/utils/async_tasks.py
+import functools
 import threading
+import time
 # from flask import current_app # No longer needed here
 from app.services.search_service import SearchService
 from app.services.beckn_service import BecknService
-from app.utils.beckn_utils import update_pending_request_with_result, update_pending_select_request_with_result
+from app.utils.beckn_utils import update_pending_request_with_result, update_pending_select_request_with_result, get_context_deadline
+from app.utils.beckn_utils import mark_pending_request_failed, mark_pending_select_request_failed
+from app.utils.job_scheduler import get_job_scheduler, PRIORITY_SEARCH, PRIORITY_SELECT
+from app.utils.deadline import Deadline, DeadlineExceeded
+from app.utils.logging_setup import set_log_transaction_id, reset_log_transaction_id
+from app.utils.idempotency import get_idempotency_cache
+from app.utils.pending_store import serialize_payload
+from app.utils.metrics import RESPONSE_BUILD_LATENCY, RESULTS, EMPTY_RESULTS, ERRORS
+from app.utils.tracing import traced, record_span, bind_to_current_span, mark_current_span_failed
 
 # --- IMPORTANT CHANGE HERE ---
 # The function now accepts the 'app_instance'
-def _perform_search_and_callback(app_instance, transaction_id, message_id, search_criteria, context, callback_uri):
+@traced("search.task")
+def _perform_search_and_callback(app_instance, transaction_id, message_id, search_criteria, context, callback_uri, deadline):
     # Use the passed app_instance to push the context
+    log_token = set_log_transaction_id(transaction_id) # Worker threads are reused; reset below
     with app_instance.app_context():
         try:
-            app_instance.logger.info(f"Async task: Starting search for transaction_id: {transaction_id}")
-            products = SearchService.perform_product_search(search_criteria)
-            beckn_response = BecknService.generate_on_search_response(products, transaction_id, message_id, context)
+            app_instance.logger.info("Async task: Starting search for transaction_id: %s", transaction_id)
+            products = SearchService.perform_product_search(search_criteria, deadline=deadline)
+            (RESULTS if products else EMPTY_RESULTS).labels("search").inc()
+            # Rendered straight to JSON bytes from cached catalog item fragments
+            build_start_time = time.perf_counter()
+            beckn_response = BecknService.render_on_search_response(products, transaction_id, message_id, context)
+            build_end_time = time.perf_counter()
+            RESPONSE_BUILD_LATENCY.labels("on_search").observe(build_end_time - build_start_time)
+            record_span("response.build", build_start_time, build_end_time, {"beckn.action": "on_search", "result.count": len(products or ())})
+            # Retries of this request now get this body re-delivered instead of a new search
+            get_idempotency_cache().complete("search", transaction_id, message_id, beckn_response)
 
             update_pending_request_with_result(transaction_id, beckn_response)
 
-            BecknService.send_on_search_callback(callback_uri, beckn_response, transaction_id)
+            BecknService.send_on_search_callback(callback_uri, beckn_response, transaction_id, deadline=deadline)
 
-            app_instance.logger.info(f"Async task: Completed for transaction_id: {transaction_id}")
+            app_instance.logger.info("Async task: Completed for transaction_id: %s", transaction_id)
+        except DeadlineExceeded as e:
+            ERRORS.labels("deadline_exceeded").inc()
+            mark_current_span_failed(e)
+            get_idempotency_cache().forget("search", transaction_id, message_id)
+            mark_pending_request_failed(transaction_id, "expired")
+            app_instance.logger.warning("Async task: Search cancelled for transaction_id %s: %s", transaction_id, e)
         except Exception as e:
-            app_instance.logger.error(f"Async task: Error during search for transaction_id {transaction_id}: {e}")
+            ERRORS.labels("search_task").inc()
+            mark_current_span_failed(e)
+            get_idempotency_cache().forget("search", transaction_id, message_id) # Let a retry recompute
+            mark_pending_request_failed(transaction_id)
+            app_instance.logger.error("Async task: Error during search for transaction_id %s: %s", transaction_id, e)
+        finally:
+            reset_log_transaction_id(log_token)
+
+def create_transaction_deadline(app_instance, context):
+    """
+    Builds the end-to-end budget for a transaction from context.timestamp + context.ttl.
+    """
+    return Deadline(get_context_deadline(context, app_instance.config.get('SCHEDULER_DEFAULT_TTL_SECONDS', 30),
+                                         app_instance.config.get('CONTEXT_MAX_CLOCK_SKEW_SECONDS', 5)))
+
+def _expire_transaction(app_instance, action, transaction_id, message_id):
+    """
+    Drop handler for a job that expired in the scheduler queue: the pending
+    entry is marked expired and a retry of the request may start over.
+    """
+    mark_failed = mark_pending_request_failed if action == "search" else mark_pending_select_request_failed
+    with app_instance.app_context():
+        get_idempotency_cache().forget(action, transaction_id, message_id)
+        mark_failed(transaction_id, "expired")
+
+def _submit_job(app_instance, job_name, priority, deadline, target, args, on_drop=None):
+    """
+    Hands the job to the deadline-aware scheduler. Falls back to a dedicated
+    thread if the scheduler was not initialized (e.g. in standalone scripts).
+    The job runs in the caller's trace; its time in the queue is a span too.
+    Returns False if the scheduler's queue is full and the job was not queued.
+    """
+    target = bind_to_current_span(target)
+    scheduler = get_job_scheduler()
+    if scheduler is None:
+        app_instance.logger.warning("Job scheduler not initialized. Running %s in a dedicated thread.", job_name)
+        threading.Thread(target=target, args=args).start()
+        return True
+    return scheduler.submit(job_name, priority, deadline.expires_at, target, *args, on_drop=on_drop)
 
 # The run_async_task also needs to accept 'app_instance'
-def run_async_task(app_instance, transaction_id, message_id, search_criteria, context, callback_uri):
-    thread = threading.Thread(target=_perform_search_and_callback,
-                              args=(app_instance, transaction_id, message_id, search_criteria, context, callback_uri))
-    thread.start()
-    app_instance.logger.info(f"Async search task for transaction {transaction_id} started in background.")
+def run_async_task(app_instance, transaction_id, message_id, search_criteria, context, callback_uri, deadline=None):
+    if deadline is None:
+        deadline = create_transaction_deadline(app_instance, context)
+    queued = _submit_job(app_instance, f"search:{transaction_id}", PRIORITY_SEARCH, deadline,
+                         _perform_search_and_callback,
+                         (app_instance, transaction_id, message_id, search_criteria, context, callback_uri, deadline),
+                         on_drop=functools.partial(_expire_transaction, app_instance, "search", transaction_id, message_id))
+    if queued:
+        app_instance.logger.info("Async search task for transaction %s queued in background.", transaction_id)
+    return queued
 
-def _perform_select_and_callback(app_instance, transaction_id, message_id, product_id, context, callback_uri):
+@traced("select.task")
+def _perform_select_and_callback(app_instance, transaction_id, message_id, product_id, context, callback_uri, deadline):
     """
     Background task to perform product selection and send the on_select callback.
     """
+    log_token = set_log_transaction_id(transaction_id)
     with app_instance.app_context():
         try:
-            app_instance.logger.info(f"Async select task: Starting select for transaction_id: {transaction_id}, product_id: {product_id}")
-            product_details = SearchService.perform_product_select(product_id)
+            app_instance.logger.info("Async select task: Starting select for transaction_id: %s, product_id: %s", transaction_id, product_id)
+            product_details = SearchService.perform_product_select(product_id, deadline=deadline)
 
             if not product_details:
-                app_instance.logger.error(f"Async select task: Product with ID {product_id} not found. Cannot generate on_select. Transaction ID: {transaction_id}")
+                EMPTY_RESULTS.labels("select").inc()
+                app_instance.logger.error("Async select task: Product with ID %s not found. Cannot generate on_select. Transaction ID: %s", product_id, transaction_id)
+                get_idempotency_cache().forget("select", transaction_id, message_id)
+                mark_pending_select_request_failed(transaction_id)
                 return
 
-            beckn_response = BecknService.generate_on_select_response(product_details, transaction_id, message_id, context)
+            RESULTS.labels("select").inc()
+            # Serialized once for the result store, the dedup cache and the callback
+            build_start_time = time.perf_counter()
+            beckn_response = serialize_payload(BecknService.generate_on_select_response(product_details, transaction_id, message_id, context))
+            build_end_time = time.perf_counter()
+            RESPONSE_BUILD_LATENCY.labels("on_select").observe(build_end_time - build_start_time)
+            record_span("response.build", build_start_time, build_end_time, {"beckn.action": "on_select"})
+            get_idempotency_cache().complete("select", transaction_id, message_id, beckn_response)
 
             update_pending_select_request_with_result(transaction_id, beckn_response)
 
-            BecknService.send_on_select_callback(callback_uri, beckn_response, transaction_id)
-            app_instance.logger.info(f"Async select task: Completed for transaction_id: {transaction_id}")
+            BecknService.send_on_select_callback(callback_uri, beckn_response, transaction_id, deadline=deadline)
+            app_instance.logger.info("Async select task: Completed for transaction_id: %s", transaction_id)
+        except DeadlineExceeded as e:
+            ERRORS.labels("deadline_exceeded").inc()
+            mark_current_span_failed(e)
+            get_idempotency_cache().forget("select", transaction_id, message_id)
+            mark_pending_select_request_failed(transaction_id, "expired")
+            app_instance.logger.warning("Async select task: Select cancelled for transaction_id %s: %s", transaction_id, e)
         except Exception as e:
-            app_instance.logger.error(f"Async select task: Error during select for transaction_id {transaction_id}: {e}", exc_info=True)
+            ERRORS.labels("select_task").inc()
+            mark_current_span_failed(e)
+            get_idempotency_cache().forget("select", transaction_id, message_id)
+            mark_pending_select_request_failed(transaction_id)
+            app_instance.logger.error("Async select task: Error during select for transaction_id %s: %s", transaction_id, e, exc_info=True)
+        finally:
+            reset_log_transaction_id(log_token)
 
-def run_async_select_task(app_instance, transaction_id, message_id, product_id, context, callback_uri):
-    thread = threading.Thread(target=_perform_select_and_callback, args=(app_instance, transaction_id, message_id, product_id, context, callback_uri))
-    thread.start()
-    app_instance.logger.info(f"Async select task for transaction {transaction_id} started in background.")
+def run_async_select_task(app_instance, transaction_id, message_id, product_id, context, callback_uri, deadline=None):
+    if deadline is None:
+        deadline = create_transaction_deadline(app_instance, context)
+    queued = _submit_job(app_instance, f"select:{transaction_id}", PRIORITY_SELECT, deadline,
+                         _perform_select_and_callback,
+                         (app_instance, transaction_id, message_id, product_id, context, callback_uri, deadline),
+                         on_drop=functools.partial(_expire_transaction, app_instance, "select", transaction_id, message_id))
+    if queued:
+        app_instance.logger.info("Async select task for transaction %s queued in background.", transaction_id)
+    return queued
 # --- END CHANGE ---
\ No newline at end of file
@@ -1,10 +1,59 @@
 # app/utils/beckn_utils.py
+import asyncio
+import re
 import time
 import uuid
+from datetime import datetime, timezone
 from flask import current_app
 from app.services.parse_query_string import parse_ondc_query_string # Import the new parser
+from app.services.attribute_dictionary import ATTRIBUTE_ALIASES, get_attribute_dictionary
+from app.utils.pending_store import get_pending_search_store, get_pending_select_store, PendingRequestStore
+from app.utils.result_waiters import search_result_waiters, select_result_waiters
 
-_pending_requests = {}
+_ISO8601_DURATION_PATTERN = re.compile(
+    r"P(?:(?P<days>\d+(?:\.\d+)?)D)?(?:T(?:(?P<hours>\d+(?:\.\d+)?)H)?(?:(?P<minutes>\d+(?:\.\d+)?)M)?(?:(?P<seconds>\d+(?:\.\d+)?)S)?)?",
+    re.IGNORECASE
+)
+
+def parse_iso8601_duration(duration_str):
+    """
+    Converts a Beckn 'ttl' value (an ISO 8601 duration such as "PT30S" or "P1DT2H")
+    into seconds. Returns None if the value is missing or cannot be parsed.
+    """
+    if not duration_str or not isinstance(duration_str, str):
+        return None
+    match = _ISO8601_DURATION_PATTERN.fullmatch(duration_str.strip())
+    if not match or not any(match.groupdict().values()):
+        return None
+    parts = {key: float(value) if value else 0.0 for key, value in match.groupdict().items()}
+    return parts["days"] * 86400 + parts["hours"] * 3600 + parts["minutes"] * 60 + parts["seconds"]
+
+def get_context_deadline(context, default_ttl_seconds, max_clock_skew_seconds=5.0):
+    """
+    Returns the epoch time (seconds) after which the BAP no longer expects a
+    callback for this request: context.timestamp + context.ttl, which is in
+    the past for a request that arrives after its ttl.
+    A timestamp further in the future than max_clock_skew_seconds is clamped
+    to now + max_clock_skew_seconds, so a BAP clock running ahead cannot
+    stretch the budget past its ttl. Falls back to the time of receipt
+    and/or default_ttl_seconds when either field is missing or malformed.
+    """
+    now = time.time()
+    start = now
+    timestamp_str = context.get('timestamp')
+    if timestamp_str:
+        try:
+            parsed = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            start = min(parsed.timestamp(), now + max_clock_skew_seconds)
+        except (ValueError, TypeError, AttributeError):
+            current_app.logger.warning("Invalid context.timestamp '%s'. Using time of receipt for deadline.", timestamp_str)
+
+    ttl_seconds = parse_iso8601_duration(context.get('ttl'))
+    if ttl_seconds is None:
+        ttl_seconds = default_ttl_seconds
+    return start + ttl_seconds
 
 def extract_search_criteria(message):
     # Initialize with keys expected by the (potentially updated) SearchService
@@ -13,13 +62,15 @@ def extract_search_criteria(message):
     search_criteria = {
         "keywords": [],
         "min_price_val": None,
-        "max_price_val": None
+        "max_price_val": None,
+        "attributes": {}, # Hard filters, {column: [lowercased values]}
+        "recognized_attributes": {} # Attribute values recognized among the keywords
     }
 
     if not message or 'intent' not in message:
         current_app.logger.warning("No 'intent' found in message. Cannot extract search criteria.")
         end_time = time.perf_counter()
-        current_app.logger.info(f"Search criteria extraction completed in {(end_time - start_time) * 1000:.2f} ms. Criteria: {search_criteria}")
+        current_app.logger.info("Search criteria extraction completed in %.2f ms. Criteria: %s", (end_time - start_time) * 1000, search_criteria)
         return search_criteria
 
     intent = message['intent']
@@ -28,7 +79,7 @@ def extract_search_criteria(message):
     if 'query' in intent and isinstance(intent['query'], str) and intent['query'].strip():
         query_str = intent['query']
         # Note: query_str should contain literal '>' and '<', not HTML entities like '&gt;'.
-        current_app.logger.info(f"Found 'message.intent.query': \"{query_str}\". Using new parser.")
+        current_app.logger.info("Found 'message.intent.query': \"%s\". Using new parser.", query_str)
         
         parsed_query = parse_ondc_query_string(query_str)
         
@@ -37,6 +88,8 @@ def extract_search_criteria(message):
             search_criteria['min_price_val'] = parsed_query['min_price_val']
         if parsed_query.get('max_price_val') is not None:
             search_criteria['max_price_val'] = parsed_query['max_price_val']
+        search_criteria['attributes'] = parsed_query.get('attributes', {})
+        search_criteria['recognized_attributes'] = parsed_query.get('recognized_attributes', {})
         
         # If query string provides price, we might decide to ignore payment block for price.
         # For now, the payment block below will only fill prices if they are still None.
@@ -55,11 +108,23 @@ def extract_search_criteria(message):
         if 'category_id' in item and item['category_id']:
             search_criteria['keywords'].append(item['category_id'])
 
-        # Extract tags (color, type, brand etc. add to keywords)
+        # Extract tags (catalog attributes such as color, type, brand become filters; other tags add to keywords)
         if 'descriptor' in item and 'tags' in item['descriptor']:
+            dictionary = get_attribute_dictionary()
             for tag_group in item['descriptor']['tags']:
-                if tag_group.get('list'):
-                    # Example: if tag_group.get('code') is 'color', 'brand', 'type'
+                column = ATTRIBUTE_ALIASES.get(str(tag_group.get('code', '')).lower())
+                if column and tag_group.get('list'):
+                    # A catalog attribute (color, brand, gender, ...): a hard filter if every listed value is known, else keywords
+                    names = [tag_item['value'] for tag_item in tag_group['list']
+                             if tag_item.get('code') == 'name' and isinstance(tag_item.get('value'), str) and tag_item['value'].strip()]
+                    resolved = dictionary.resolve_all(column, names) if names else None
+                    if resolved is None:
+                        search_criteria['keywords'].extend(names)
+                    else:
+                        values = search_criteria['attributes'].setdefault(column, [])
+                        values.extend(value for value in resolved if value not in values)
+                elif tag_group.get('list'):
+                    # Example: if tag_group.get('code') is 'material' or 'style'
                     # and tag_item.get('code') is 'name'
                     for tag_item in tag_group['list']:
                         if tag_item.get('code') == 'name' and tag_item.get('value'):
@@ -69,6 +134,10 @@ def extract_search_criteria(message):
                             # For simplicity, keeping it to one value per distinct tag group code for now.
                             break 
 
+        recognized = get_attribute_dictionary().recognize(search_criteria['keywords'])
+        search_criteria['recognized_attributes'] = {column: values for column, values in recognized.items()
+                                                    if column not in search_criteria['attributes']}
+
     # --- Payment details: Apply if not already set by the query string parser, or augment ---
     if 'payment' in intent:
         payment = intent['payment']
@@ -79,17 +148,17 @@ def extract_search_criteria(message):
             try:
                 search_criteria['min_price_val'] = float(payment['min_amount'])
             except ValueError:
-                current_app.logger.warning(f"Invalid min_amount value: {payment['min_amount']}. Skipping price filter.")
+                current_app.logger.warning("Invalid min_amount value: %s. Skipping price filter.", payment['min_amount'])
         
         if search_criteria.get('max_price_val') is None and \
            'max_amount' in payment and payment['max_amount'] is not None:
             try:
                 search_criteria['max_price_val'] = float(payment['max_amount'])
             except ValueError:
-                current_app.logger.warning(f"Invalid max_amount value: {payment['max_amount']}. Skipping price filter.")
+                current_app.logger.warning("Invalid max_amount value: %s. Skipping price filter.", payment['max_amount'])
                 
     end_time = time.perf_counter()
-    current_app.logger.info(f"Search criteria extraction completed in {(end_time - start_time) * 1000:.2f} ms. Criteria: {search_criteria}")
+    current_app.logger.info("Search criteria extraction completed in %.2f ms. Criteria: %s", (end_time - start_time) * 1000, search_criteria)
     return search_criteria
 
 def generate_ack_response(original_context, action, transaction_id, message_id):
@@ -135,8 +204,17 @@ def generate_ack_response(original_context, action, transaction_id, message_id):
         }
     }
 
+def generate_nack_response(original_context, action, transaction_id, message_id, error_code, error_message):
+    """
+    A NACK for a request we cannot take on, in the same shape as the ACK plus
+    the Beckn `error` object.
+    """
+    response = generate_ack_response(original_context, action, transaction_id, message_id)
+    response["message"]["ack"]["status"] = "NACK"
+    response["error"] = {"type": "CORE-ERROR", "code": error_code, "message": error_message}
+    return response
+
 # --- Select Request Management ---
-_pending_select_requests = {}
 
 def extract_select_criteria(message):
     """
@@ -147,57 +225,103 @@ def extract_select_criteria(message):
     if message and 'order' in message and 'items' in message['order'] and message['order']['items']:
         # Assuming only one item is selected for simplicity in this context
         product_id = message['order']['items'][0].get('id')
-    current_app.logger.info(f"Extracted product_id for select: {product_id}")
+    current_app.logger.info("Extracted product_id for select: %s", product_id)
     return {"product_id": product_id}
 
 def store_pending_select_request(transaction_id, callback_uri, product_id, context):
-    _pending_select_requests[transaction_id] = {
-        "callback_uri": callback_uri,
-        "product_id": product_id,
-        "context": context,
-        "status": "pending",
-        "timestamp": time.time(),
-        "beckn_response": None
-    }
-    current_app.logger.debug(f"Stored pending select request for transaction_id: {transaction_id}")
+    get_pending_select_store().put(transaction_id, callback_uri, product_id, context)
+    current_app.logger.debug("Stored pending select request for transaction_id: %s", transaction_id)
 
 
 def store_pending_request(transaction_id, callback_uri, search_criteria, context):
-    _pending_requests[transaction_id] = {
-        "callback_uri": callback_uri, # Store the URI where the on_search should be sent
-        "search_criteria": search_criteria,
-        "context": context,
-        "status": "pending",
-        "timestamp": time.time(),
-        "beckn_response": None
-    }
-    current_app.logger.debug(f"Stored pending search request for transaction_id: {transaction_id}")
+    get_pending_search_store().put(transaction_id, callback_uri, search_criteria, context)
+    current_app.logger.debug("Stored pending search request for transaction_id: %s", transaction_id)
 
 def get_pending_select_request_results(transaction_id):
-    request_data = _pending_select_requests.get(transaction_id)
-    if request_data and request_data.get("beckn_response"):
-        del _pending_select_requests[transaction_id] # Clean up after retrieval
-        return request_data["beckn_response"]
-    return None
+    return get_pending_select_store().pop_result(transaction_id) # Cleaned up on retrieval
 
 def get_pending_request_results(transaction_id):
-    request_data = _pending_requests.get(transaction_id)
-    if request_data and request_data.get("beckn_response"):
-        del _pending_requests[transaction_id] # Clean up after retrieval
-        return request_data["beckn_response"]
-    return None
+    return get_pending_search_store().pop_result(transaction_id) # Cleaned up on retrieval
 
 def update_pending_select_request_with_result(transaction_id, beckn_response):
-    if transaction_id in _pending_select_requests:
-        _pending_select_requests[transaction_id]["beckn_response"] = beckn_response
-        _pending_select_requests[transaction_id]["status"] = "completed"
-        current_app.logger.debug(f"Updated pending select request with result for transaction_id: {transaction_id}")
+    if get_pending_select_store().complete(transaction_id, beckn_response):
+        select_result_waiters.notify(transaction_id) # Wake long-poll/SSE clients
+        current_app.logger.debug("Updated pending select request with result for transaction_id: %s", transaction_id)
 
 def update_pending_request_with_result(transaction_id, beckn_response):
-    if transaction_id in _pending_requests:
-        _pending_requests[transaction_id]["beckn_response"] = beckn_response
-        _pending_requests[transaction_id]["status"] = "completed"
-        current_app.logger.debug(f"Updated pending search request with result for transaction_id: {transaction_id}")
+    if get_pending_search_store().complete(transaction_id, beckn_response):
+        search_result_waiters.notify(transaction_id) # Wake long-poll/SSE clients
+        current_app.logger.debug("Updated pending search request with result for transaction_id: %s", transaction_id)
+
+def mark_pending_select_request_failed(transaction_id, status="failed"):
+    if get_pending_select_store().fail(transaction_id, status):
+        select_result_waiters.notify(transaction_id) # Waiting clients get the status instead of their full timeout
+        current_app.logger.debug("Marked pending select request %s for transaction_id: %s", status, transaction_id)
+
+def mark_pending_request_failed(transaction_id, status="failed"):
+    """
+    Records that no result will come for a pending transaction, as "failed"
+    or "expired", so status lookups stop reporting it as pending and
+    long-poll/SSE clients waiting on it are told at once.
+    """
+    if get_pending_search_store().fail(transaction_id, status):
+        search_result_waiters.notify(transaction_id)
+        current_app.logger.debug("Marked pending search request %s for transaction_id: %s", status, transaction_id)
+
+FAILED_STATUSES = ("failed", "expired") # Pending-entry statuses after which no result will come
+
+def _peek_outcome(store, transaction_id):
+    """The result bytes of a completed transaction, "failed"/"expired" for one that ended without, else None."""
+    entry = store.get(transaction_id)
+    if entry is None:
+        return None
+    if entry.beckn_response is not None:
+        return entry.beckn_response
+    return entry.status if entry.status in FAILED_STATUSES else None
+
+def _wait_for_result(store, waiters, transaction_id, timeout):
+    # A shared store can be completed by another worker, whose notify() never
+    # reaches this process, so those backends are also re-checked periodically.
+    recheck_interval = None
+    if not isinstance(store, PendingRequestStore):
+        recheck_interval = current_app.config.get('RESULT_WAIT_RECHECK_SECONDS', 0.5)
+    return waiters.wait(transaction_id, timeout, lambda: _peek_outcome(store, transaction_id), recheck_interval)
+
+def wait_for_pending_request_results(transaction_id, timeout):
+    """
+    Blocks up to `timeout` seconds until the on_search result is ready, then
+    returns it (JSON bytes). Returns the status string "failed" or "expired"
+    as soon as the transaction ends without a result, and None on timeout.
+
+    The result is not removed: every client waiting on the transaction gets
+    it, and one that disconnects before it arrives can ask again. It expires
+    with the pending entry (PENDING_TTL_SECONDS).
+    """
+    return _wait_for_result(get_pending_search_store(), search_result_waiters, transaction_id, timeout)
+
+def wait_for_pending_select_request_results(transaction_id, timeout):
+    return _wait_for_result(get_pending_select_store(), select_result_waiters, transaction_id, timeout)
+
+async def _wait_for_result_async(store, waiters, transaction_id, timeout):
+    recheck_interval = None
+    if isinstance(store, PendingRequestStore):
+        async def check():
+            return _peek_outcome(store, transaction_id) # In-process and lock-striped: fine on the event loop
+    else:
+        recheck_interval = current_app.config.get('RESULT_WAIT_RECHECK_SECONDS', 0.5)
+        async def check():
+            return await asyncio.to_thread(_peek_outcome, store, transaction_id) # SQLite/Redis I/O
+    return await waiters.wait_async(transaction_id, timeout, check, recheck_interval)
+
+async def wait_for_pending_request_results_async(transaction_id, timeout):
+    """
+    Coroutine version of wait_for_pending_request_results() for the ASGI app.
+    """
+    return await _wait_for_result_async(get_pending_search_store(), search_result_waiters, transaction_id, timeout)
+
+async def wait_for_pending_select_request_results_async(transaction_id, timeout):
+    return await _wait_for_result_async(get_pending_select_store(), select_result_waiters, transaction_id, timeout)
 
 def get_pending_request_details(transaction_id):
-    return _pending_requests.get(transaction_id)
\ No newline at end of file
+    entry = get_pending_search_store().get(transaction_id)
+    return entry.as_dict() if entry else None
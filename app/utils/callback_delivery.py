@@ -0,0 +1,418 @@
+# app/utils/callback_delivery.py
+import heapq
+import itertools
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import requests
+
+from app.auth import make_authenticated_request
+from app.utils.circuit_breaker import CircuitBreaker, AIMDLimiter, HostHealth, OPEN
+from app.utils.compression import get_compression_negotiator
+from app.utils import json_codec
+from app.utils.logging_setup import set_log_transaction_id, reset_log_transaction_id
+from app.utils.metrics import CALLBACK_LATENCY, ERRORS
+from app.utils.tracing import current_span, start_span, KIND_CLIENT
+
+callback_delivery = None
+
+# Upper bound for a single callback POST, even when the transaction budget is larger.
+CALLBACK_TIMEOUT_SECONDS = 10
+
+# How long a job waits before re-checking a BAP that is at its concurrency limit.
+_HOST_BUSY_RECHECK_SECONDS = 0.05
+
+
+class CallbackJob:
+    """
+    One on_search/on_select payload waiting to be POSTed to a BAP.
+    payload is either a dict or an already-serialized JSON body (bytes).
+    """
+
+    __slots__ = ("job_id", "transaction_id", "action", "target_url", "audience", "payload", "body", "deadline", "attempts", "last_error",
+                 "trace_parent")
+
+    def __init__(self, transaction_id, action, target_url, audience, payload, deadline=None):
+        self.job_id = str(uuid.uuid4())
+        self.transaction_id = transaction_id
+        self.action = action
+        self.target_url = target_url
+        self.audience = audience
+        self.payload = payload
+        self.body = payload if isinstance(payload, bytes) else None # Serialized once, on the first attempt
+        self.deadline = deadline
+        self.attempts = 0
+        self.last_error = None
+        self.trace_parent = current_span() # Delivery attempts run on other threads; they join this trace
+
+
+class _RetryableDeliveryError(Exception):
+    pass
+
+
+class DeadLetterStore:
+    """
+    Bounded in-memory store of callbacks that could not be delivered.
+    The oldest entries are discarded once max_entries is reached.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job: CallbackJob, reason: str):
+        with self._lock:
+            self._entries[job.job_id] = {"job": job, "reason": reason, "failed_at": time.time()}
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, job_id: str):
+        with self._lock:
+            entry = self._entries.pop(job_id, None)
+        return entry["job"] if entry else None
+
+    def list_entries(self):
+        with self._lock:
+            entries = list(self._entries.values())
+        return [{
+            "id": entry["job"].job_id,
+            "transaction_id": entry["job"].transaction_id,
+            "action": entry["job"].action,
+            "target_url": entry["job"].target_url,
+            "attempts": entry["job"].attempts,
+            "last_error": entry["job"].last_error,
+            "reason": entry["reason"],
+            "failed_at": entry["failed_at"],
+        } for entry in entries]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def deliver_callback_once(job: CallbackJob, timeout: float):
+    """
+    Makes a single delivery attempt, traced as a `callback.deliver` span whose
+    context is sent to the BAP in a `traceparent` header.
+
+    Raises:
+        _RetryableDeliveryError: on timeouts, connection errors, auth setup
+                                 failures, 429 and 5xx responses. A compressed
+                                 body rejected with 415 is resent uncompressed
+                                 within the same attempt.
+        requests.exceptions.RequestException / ValueError: on failures that
+                                 retrying will not fix (e.g. 4xx).
+    """
+    with start_span("callback.deliver", parent=job.trace_parent, kind=KIND_CLIENT, transaction_id=job.transaction_id,
+                    attributes={"beckn.action": job.action, "http.url": job.target_url, "callback.attempt": job.attempts + 1}) as span:
+        response = _post_callback(job, timeout, span)
+        if span is not None:
+            span.set_attribute("http.status_code", response.status_code)
+        return response
+
+def _post_callback(job: CallbackJob, timeout: float, span=None):
+    job.attempts += 1
+    if job.body is None:
+        job.body = json_codec.dumps(job.payload)
+    negotiator = get_compression_negotiator()
+    body, content_encoding = negotiator.encode(job.audience, job.body)
+    headers = {"Content-Type": "application/json"}
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    if span is not None:
+        headers["traceparent"] = span.traceparent()
+
+    response = _send_callback(job, headers, body, timeout)
+    if content_encoding and response.status_code == 415:
+        # The BAP is up, it only cannot read the encoding: resend within this
+        # attempt, so nothing counts against its breaker or limiter.
+        negotiator.mark_unsupported(job.audience)
+        del headers["Content-Encoding"]
+        response = _send_callback(job, headers, job.body, timeout)
+    if response.status_code >= 500 or response.status_code == 429:
+        raise _RetryableDeliveryError(f"HTTP {response.status_code}")
+    response.raise_for_status()
+    return response
+
+def _send_callback(job: CallbackJob, headers, body, timeout: float):
+    try:
+        return make_authenticated_request(
+            url=job.target_url,
+            method="POST",
+            headers=headers,
+            data=body,
+            audience=job.audience,
+            timeout=timeout
+        )
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError, ConnectionError) as e:
+        raise _RetryableDeliveryError(str(e)) from e
+
+
+class CallbackDeliveryQueue:
+    """
+    Worker pool that POSTs finished Beckn payloads to BAPs.
+
+    Failed attempts on 5xx/429/timeouts are retried with exponential backoff
+    and full jitter, at most `max_attempts` times.
+
+    Each BAP (keyed by token audience) has its own circuit breaker and an
+    AIMD concurrency limit, so a slow or failing BAP is shed quickly and
+    cannot starve callbacks to healthy ones; its limit grows back as it recovers.
+
+    Jobs that exhaust their attempts, hit a non-retryable error, or run out of
+    transaction budget (including while waiting on an open circuit) go to the
+    dead-letter store.
+    """
+
+    def __init__(self, app, num_workers: int = 4, max_attempts: int = 5,
+                 backoff_base_seconds: float = 0.5, backoff_max_seconds: float = 30.0,
+                 per_host_concurrency: int = 4, min_host_concurrency: int = 1, max_host_concurrency: int = 16,
+                 circuit_failure_threshold: int = 5, circuit_open_seconds: float = 30.0,
+                 dead_letter_max_entries: int = 1000):
+        self.app = app
+        self.num_workers = num_workers
+        self.max_attempts = max_attempts
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.per_host_concurrency = per_host_concurrency
+        self.min_host_concurrency = min_host_concurrency
+        self.max_host_concurrency = max_host_concurrency
+        self.circuit_failure_threshold = circuit_failure_threshold
+        self.circuit_open_seconds = circuit_open_seconds
+        self.dead_letters = DeadLetterStore(dead_letter_max_entries)
+
+        self._heap = [] # (ready_at, sequence, job)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._hosts = {} # audience -> HostHealth, guarded by _condition
+        self._workers = []
+        self._running = False
+        self._stats = {"enqueued": 0, "delivered": 0, "retried": 0, "dead_lettered": 0}
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"callback-delivery-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        self.app.logger.info("Callback delivery started with %d workers.", self.num_workers)
+
+    def enqueue(self, job: CallbackJob):
+        with self._condition:
+            self._stats["enqueued"] += 1
+        self._schedule(job)
+
+    def _schedule(self, job: CallbackJob, delay: float = 0.0):
+        with self._condition:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), job))
+            self._condition.notify()
+
+    def _host(self, audience) -> HostHealth:
+        host = self._hosts.get(audience)
+        if host is None:
+            host = HostHealth(
+                CircuitBreaker(self.circuit_failure_threshold, self.circuit_open_seconds),
+                AIMDLimiter(self.per_host_concurrency, self.min_host_concurrency, self.max_host_concurrency)
+            )
+            self._hosts[audience] = host
+        return host
+
+    def _next_job(self):
+        """Blocks until a job is due and its BAP accepts another delivery."""
+        with self._condition:
+            while self._running:
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    _, _, job = heapq.heappop(self._heap)
+                    host = self._host(job.audience)
+                    if not host.breaker.allow(now, host.in_flight):
+                        retry_at = host.breaker.retry_at() if host.breaker.state == OPEN else now + _HOST_BUSY_RECHECK_SECONDS
+                        if job.deadline is not None and job.deadline.remaining() < retry_at - now:
+                            self._dead_letter(job, "circuit_open")
+                            continue
+                        heapq.heappush(self._heap, (retry_at, next(self._sequence), job))
+                        continue
+                    if host.in_flight >= host.limiter.limit:
+                        heapq.heappush(self._heap, (now + _HOST_BUSY_RECHECK_SECONDS, next(self._sequence), job))
+                        continue
+                    host.in_flight += 1
+                    return job
+                wait = self._heap[0][0] - now if self._heap else None
+                self._condition.wait(timeout=wait)
+            return None
+
+    def _release(self, job: CallbackJob, outcome):
+        """
+        Frees the BAP's concurrency slot and feeds the attempt's outcome
+        (healthy, latency_ms) into its breaker and limiter. outcome is None
+        when no HTTP attempt was made.
+        """
+        with self._condition:
+            host = self._host(job.audience)
+            host.in_flight = max(0, host.in_flight - 1)
+            if outcome is not None:
+                healthy, latency_ms = outcome
+                previous_state = host.breaker.state
+                host.record(time.monotonic(), healthy, latency_ms)
+                if host.breaker.state != previous_state:
+                    self.app.logger.warning("Circuit for %s changed from %s to %s.", job.audience, previous_state, host.breaker.state)
+            self._condition.notify()
+
+    def _backoff(self, attempts: int) -> float:
+        # Full jitter: uniform in [0, min(cap, base * 2^(attempts-1))]
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** (attempts - 1))))
+
+    def _dead_letter(self, job: CallbackJob, reason: str):
+        self.dead_letters.add(job, reason)
+        with self._condition:
+            self._stats["dead_lettered"] += 1
+        ERRORS.labels("callback_dead_lettered").inc()
+        self.app.logger.error(
+            "Callback %s for transaction %s moved to dead-letter store after %s attempt(s): %s. Last error: %s",
+            job.action, job.transaction_id, job.attempts, reason, job.last_error
+        )
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            outcome = None
+            log_token = set_log_transaction_id(job.transaction_id)
+            try:
+                outcome = self._process(job)
+            finally:
+                self._release(job, outcome)
+                reset_log_transaction_id(log_token)
+
+    def _process(self, job: CallbackJob):
+        """
+        Makes one delivery attempt and decides what happens next.
+        Returns (healthy, latency_ms) for the BAP's health tracking, or None if no attempt was made.
+        """
+        timeout = CALLBACK_TIMEOUT_SECONDS
+        if job.deadline is not None:
+            if job.deadline.expired():
+                self._dead_letter(job, "deadline_expired")
+                return None
+            timeout = min(timeout, max(job.deadline.remaining(), 0.001))
+
+        attempt_start_time = time.perf_counter()
+        try:
+            response = deliver_callback_once(job, timeout)
+            latency_ms = (time.perf_counter() - attempt_start_time) * 1000
+            CALLBACK_LATENCY.labels(job.action, "delivered").observe(latency_ms / 1000)
+            with self._condition:
+                self._stats["delivered"] += 1
+            self.app.logger.info(
+                "Successfully sent %s response for transaction %s to %s. Status: %s (attempt %s)",
+                job.action, job.transaction_id, job.target_url, response.status_code, job.attempts
+            )
+            return True, latency_ms
+        except _RetryableDeliveryError as e:
+            latency_ms = (time.perf_counter() - attempt_start_time) * 1000
+            CALLBACK_LATENCY.labels(job.action, "retryable_error").observe(latency_ms / 1000)
+            job.last_error = str(e)
+            if job.attempts >= self.max_attempts:
+                self._dead_letter(job, "retries_exhausted")
+                return False, latency_ms
+            delay = self._backoff(job.attempts)
+            if job.deadline is not None and delay >= job.deadline.remaining():
+                self._dead_letter(job, "deadline_expired")
+                return False, latency_ms
+            with self._condition:
+                self._stats["retried"] += 1
+            self.app.logger.warning(
+                "Attempt %s to send %s for transaction %s failed: %s. Retrying in %.2f s.",
+                job.attempts, job.action, job.transaction_id, e, delay
+            )
+            self._schedule(job, delay=delay)
+            return False, latency_ms
+        except Exception as e:
+            # The BAP answered (e.g. with a 4xx), so this says nothing about its health.
+            latency_ms = (time.perf_counter() - attempt_start_time) * 1000
+            CALLBACK_LATENCY.labels(job.action, "rejected").observe(latency_ms / 1000)
+            job.last_error = str(e)
+            self._dead_letter(job, "non_retryable_error")
+            return True, latency_ms
+
+    def replay(self, job_id: str) -> bool:
+        """
+        Moves a dead-lettered job back onto the queue with a fresh attempt count.
+        Replays are operator-initiated, so the original transaction deadline no longer applies.
+        """
+        job = self.dead_letters.pop(job_id)
+        if job is None:
+            return False
+        job.attempts = 0
+        job.deadline = None
+        self.enqueue(job)
+        self.app.logger.info("Replaying dead-lettered %s for transaction %s.", job.action, job.transaction_id)
+        return True
+
+    def get_stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats["queued"] = len(self._heap)
+            stats["in_flight"] = {audience: host.in_flight for audience, host in self._hosts.items() if host.in_flight}
+        stats["dead_letter_size"] = len(self.dead_letters)
+        return stats
+
+    def get_host_stats(self):
+        """Circuit state, concurrency limit and latency per BAP."""
+        with self._condition:
+            return {audience: host.snapshot() for audience, host in self._hosts.items()}
+
+    def shutdown(self, timeout: float = 5.0):
+        with self._condition:
+            self._running = False
+            pending = len(self._heap)
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+        self._workers = []
+        self.app.logger.info("Callback delivery stopped. %d callbacks were still queued.", pending)
+
+
+def initialize_callback_delivery(app):
+    """
+    Creates and starts the global callback delivery worker pool.
+    This should be called only once at application startup.
+    """
+    global callback_delivery
+    if callback_delivery is None:
+        callback_delivery = CallbackDeliveryQueue(
+            app,
+            num_workers=app.config.get('CALLBACK_DELIVERY_WORKERS', 4),
+            max_attempts=app.config.get('CALLBACK_MAX_ATTEMPTS', 5),
+            backoff_base_seconds=app.config.get('CALLBACK_BACKOFF_BASE_SECONDS', 0.5),
+            backoff_max_seconds=app.config.get('CALLBACK_BACKOFF_MAX_SECONDS', 30.0),
+            per_host_concurrency=app.config.get('CALLBACK_PER_HOST_CONCURRENCY', 4),
+            min_host_concurrency=app.config.get('CALLBACK_MIN_HOST_CONCURRENCY', 1),
+            max_host_concurrency=app.config.get('CALLBACK_MAX_HOST_CONCURRENCY', 16),
+            circuit_failure_threshold=app.config.get('CIRCUIT_FAILURE_THRESHOLD', 5),
+            circuit_open_seconds=app.config.get('CIRCUIT_OPEN_SECONDS', 30.0),
+            dead_letter_max_entries=app.config.get('DEAD_LETTER_MAX_ENTRIES', 1000)
+        )
+        callback_delivery.start()
+    return callback_delivery
+
+def get_callback_delivery():
+    """
+    Returns the global callback delivery worker pool, or None if it has not been initialized.
+    """
+    return callback_delivery
+
+def shutdown_callback_delivery(app=None):
+    """Stops the delivery workers."""
+    global callback_delivery
+    if callback_delivery:
+        callback_delivery.shutdown()
+        callback_delivery = None
@@ -0,0 +1,115 @@
+# app/utils/circuit_breaker.py
+#
+# Per-destination health tracking for outbound callbacks. These classes are not
+# thread-safe on their own: CallbackDeliveryQueue calls them while holding its lock.
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker.
+
+    closed    -> open after `failure_threshold` consecutive failures.
+    open      -> half_open once `open_seconds` have passed.
+    half_open -> one probe at a time; success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, open_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+
+    def allow(self, now: float, in_flight: int) -> bool:
+        if self.state == OPEN:
+            if now - self.opened_at < self.open_seconds:
+                return False
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            return in_flight == 0
+        return True
+
+    def retry_at(self) -> float:
+        """Monotonic time at which an open circuit will let a probe through."""
+        return self.opened_at + self.open_seconds
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.state = CLOSED
+
+    def record_failure(self, now: float):
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = now
+
+
+class AIMDLimiter:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit.
+    Each success adds 1/limit (about +1 per full window); each failure halves it.
+    """
+
+    def __init__(self, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 16, backoff_ratio: float = 0.5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self._limit = float(max(min_limit, min(initial_limit, max_limit)))
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    def on_success(self):
+        self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+
+    def on_failure(self):
+        self._limit = max(self.min_limit, self._limit * self.backoff_ratio)
+
+
+class HostHealth:
+    """
+    Breaker, concurrency limit and latency statistics for one BAP (token audience).
+    """
+
+    _EWMA_ALPHA = 0.2
+
+    def __init__(self, breaker: CircuitBreaker, limiter: AIMDLimiter):
+        self.breaker = breaker
+        self.limiter = limiter
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self.ewma_latency_ms = None
+        self.max_latency_ms = 0.0
+
+    def record(self, now: float, healthy: bool, latency_ms: float):
+        if healthy:
+            self.successes += 1
+            self.breaker.record_success()
+            self.limiter.on_success()
+        else:
+            self.failures += 1
+            self.breaker.record_failure(now)
+            self.limiter.on_failure()
+        if self.ewma_latency_ms is None:
+            self.ewma_latency_ms = latency_ms
+        else:
+            self.ewma_latency_ms += self._EWMA_ALPHA * (latency_ms - self.ewma_latency_ms)
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+
+    def snapshot(self):
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "concurrency_limit": self.limiter.limit,
+            "in_flight": self.in_flight,
+            "successes": self.successes,
+            "failures": self.failures,
+            "ewma_latency_ms": round(self.ewma_latency_ms, 2) if self.ewma_latency_ms is not None else None,
+            "max_latency_ms": round(self.max_latency_ms, 2),
+        }
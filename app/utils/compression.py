@@ -0,0 +1,85 @@
+# app/utils/compression.py
+import gzip
+import logging
+import threading
+
+try:
+    import zstandard # Optional: only needed for CALLBACK_COMPRESSION=zstd
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+IDENTITY = "identity"
+GZIP = "gzip"
+ZSTD = "zstd"
+
+
+class CompressionNegotiator:
+    """
+    Decides the Content-Encoding for each callback body.
+
+    Bodies smaller than `min_bytes` are sent as-is. Larger ones use the
+    configured encoding, limited to `allowed_audiences` when that set is
+    non-empty. A BAP that rejects a compressed body with 415 Unsupported
+    Media Type is remembered and gets identity encoding from then on.
+    """
+
+    def __init__(self, encoding: str = IDENTITY, min_bytes: int = 8192, allowed_audiences=None, gzip_level: int = 6):
+        if encoding == ZSTD and zstandard is None:
+            logger.warning("CALLBACK_COMPRESSION=zstd but the 'zstandard' package is not installed. Falling back to gzip.")
+            encoding = GZIP
+        self.encoding = encoding
+        self.min_bytes = min_bytes
+        self.allowed_audiences = set(allowed_audiences or [])
+        self.gzip_level = gzip_level
+        self._rejected_audiences = set()
+        self._lock = threading.Lock()
+
+    def choose_encoding(self, audience: str, size: int) -> str:
+        if self.encoding == IDENTITY or size < self.min_bytes:
+            return IDENTITY
+        if self.allowed_audiences and audience not in self.allowed_audiences:
+            return IDENTITY
+        with self._lock:
+            if audience in self._rejected_audiences:
+                return IDENTITY
+        return self.encoding
+
+    def mark_unsupported(self, audience: str):
+        with self._lock:
+            self._rejected_audiences.add(audience)
+        logger.warning("BAP %s rejected a compressed callback. Sending it uncompressed from now on.", audience)
+
+    def encode(self, audience: str, body: bytes):
+        """
+        Returns (body, content_encoding). content_encoding is None for identity.
+        """
+        encoding = self.choose_encoding(audience, len(body))
+        if encoding == GZIP:
+            return gzip.compress(body, compresslevel=self.gzip_level), GZIP
+        if encoding == ZSTD:
+            return zstandard.ZstdCompressor().compress(body), ZSTD
+        return body, None
+
+
+compression_negotiator = CompressionNegotiator() # Identity until configure_compression() is called
+
+
+def configure_compression(app):
+    """
+    Builds the callback compression settings from app config.
+    This should be called once at application startup.
+    """
+    global compression_negotiator
+    allowed = [audience.strip() for audience in app.config.get('CALLBACK_COMPRESSION_AUDIENCES', '').split(',') if audience.strip()]
+    compression_negotiator = CompressionNegotiator(
+        encoding=app.config.get('CALLBACK_COMPRESSION', IDENTITY),
+        min_bytes=app.config.get('CALLBACK_COMPRESSION_MIN_BYTES', 8192),
+        allowed_audiences=allowed
+    )
+    app.logger.info(f"Callback compression: {compression_negotiator.encoding} above {compression_negotiator.min_bytes} bytes.")
+    return compression_negotiator
+
+def get_compression_negotiator():
+    return compression_negotiator
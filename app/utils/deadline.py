@@ -0,0 +1,56 @@
+# app/utils/deadline.py
+import time
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a transaction's time budget runs out before or during a stage.
+    Background tasks catch this and abandon the transaction without a callback.
+    """
+
+    def __init__(self, stage: str, overrun_seconds: float = 0.0):
+        self.stage = stage
+        self.overrun_seconds = overrun_seconds
+        super().__init__(f"Deadline exceeded at stage '{stage}' (overrun {overrun_seconds * 1000:.2f} ms).")
+
+
+class Deadline:
+    """
+    End-to-end time budget for a single Beckn transaction.
+
+    Created once in the controller from context.timestamp + context.ttl and
+    passed through SearchService, ProductSearchService and BecknService, so
+    that each stage (embedding, SQL, callback) only gets the time that is left.
+    """
+
+    __slots__ = ("expires_at",)
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at # Epoch seconds
+
+    @classmethod
+    def after(cls, seconds: float):
+        return cls(time.time() + seconds)
+
+    def remaining(self) -> float:
+        """Seconds left in the budget, never negative."""
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self) -> bool:
+        return time.time() >= self.expires_at
+
+    def check(self, stage: str):
+        """Raises DeadlineExceeded if the budget is already spent."""
+        overrun = time.time() - self.expires_at
+        if overrun >= 0:
+            raise DeadlineExceeded(stage, overrun)
+
+    def timeout_for(self, stage: str, cap: float = None) -> float:
+        """
+        Returns the timeout (seconds) to give a stage: the remaining budget,
+        optionally capped by the stage's own maximum.
+        Raises DeadlineExceeded if nothing is left.
+        """
+        self.check(stage)
+        remaining = max(self.remaining(), 0.001) # Never hand out a zero timeout, which some clients treat as "no timeout"
+        return min(remaining, cap) if cap is not None else remaining
@@ -0,0 +1,158 @@
+# app/utils/http_client.py
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+http_client = None
+
+
+class _ConnectionStats:
+    """
+    Per-host counters for outbound requests and newly opened connections.
+    reuse_ratio is the share of requests that did not need a new TCP (+TLS) handshake.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host_entry(self, host):
+        entry = self._hosts.get(host)
+        if entry is None:
+            entry = {"requests": 0, "new_connections": 0, "total_handshake_ms": 0.0, "max_handshake_ms": 0.0}
+            self._hosts[host] = entry
+        return entry
+
+    def record_request(self, host):
+        with self._lock:
+            self._host_entry(host)["requests"] += 1
+
+    def record_handshake(self, host, elapsed_ms):
+        with self._lock:
+            entry = self._host_entry(host)
+            entry["new_connections"] += 1
+            entry["total_handshake_ms"] += elapsed_ms
+            entry["max_handshake_ms"] = max(entry["max_handshake_ms"], elapsed_ms)
+
+    def snapshot(self):
+        with self._lock:
+            hosts = {host: dict(entry) for host, entry in self._hosts.items()}
+        for entry in hosts.values():
+            requests_count = entry["requests"]
+            new_connections = entry["new_connections"]
+            entry["reuse_ratio"] = max(0.0, 1 - new_connections / requests_count) if requests_count else 0.0
+            entry["avg_handshake_ms"] = entry["total_handshake_ms"] / new_connections if new_connections else 0.0
+            del entry["total_handshake_ms"]
+        return hosts
+
+
+_connection_stats = _ConnectionStats()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _connection_stats.record_handshake(self.host, (time.perf_counter() - start) * 1000)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        # For HTTPS this covers both the TCP connect and the TLS handshake.
+        start = time.perf_counter()
+        super().connect()
+        _connection_stats.record_handshake(self.host, (time.perf_counter() - start) * 1000)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+class OutboundHTTPClient:
+    """
+    Shared keep-alive HTTP client for callbacks to BAPs.
+
+    Wraps a single requests.Session whose adapter keeps up to `pool_maxsize`
+    idle connections per host, for up to `pool_connections` hosts, so that
+    consecutive on_search/on_select callbacks to the same BAP reuse an open
+    TCP+TLS connection instead of paying a new handshake each time.
+    """
+
+    def __init__(self, pool_connections: int = 20, pool_maxsize: int = 10, pool_block: bool = False):
+        self.session = requests.Session()
+        adapter = _PooledAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            max_retries=0 # Retries are the caller's decision
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Connection"] = "keep-alive"
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        _connection_stats.record_request(urlparse(url).hostname)
+        return self.session.request(method=method, url=url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def initialize_http_client(app):
+    """
+    Creates the shared outbound HTTP client from app config.
+    This should be called only once at application startup.
+    """
+    global http_client
+    if http_client is None:
+        http_client = OutboundHTTPClient(
+            pool_connections=app.config.get('OUTBOUND_HTTP_POOL_CONNECTIONS', 20),
+            pool_maxsize=app.config.get('OUTBOUND_HTTP_POOL_MAXSIZE', 10),
+            pool_block=app.config.get('OUTBOUND_HTTP_POOL_BLOCK', False)
+        )
+        app.logger.info("Outbound HTTP client initialized.")
+    return http_client
+
+def get_http_client():
+    """
+    Returns the shared outbound HTTP client, creating one with default
+    settings if the app did not initialize it (e.g. in standalone scripts).
+    """
+    global http_client
+    if http_client is None:
+        logger.warning("Outbound HTTP client not initialized. Creating one with default pool settings.")
+        http_client = OutboundHTTPClient()
+    return http_client
+
+def get_http_client_stats():
+    return _connection_stats.snapshot()
+
+def close_http_client(app=None):
+    """Closes all pooled connections."""
+    global http_client
+    if http_client:
+        http_client.close()
+        http_client = None
+        if app:
+            app.logger.info("Outbound HTTP client closed.")
@@ -0,0 +1,265 @@
+# app/utils/id_token_manager.py
+import base64
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+id_token_manager = None
+
+# Used when a token's 'exp' claim cannot be read. Google ID tokens are valid for 1 hour.
+_FALLBACK_TOKEN_LIFETIME_SECONDS = 3300
+
+
+def decode_jwt_expiry(token: str):
+    """
+    Returns the 'exp' claim (epoch seconds) of a JWT without verifying its
+    signature, or None if the token cannot be decoded.
+    """
+    try:
+        payload_segment = token.split('.')[1]
+        payload_segment += '=' * (-len(payload_segment) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload_segment))
+        return float(claims['exp'])
+    except (IndexError, KeyError, ValueError, TypeError):
+        return None
+
+
+class GoogleIdTokenSource:
+    """
+    Mints Google ID tokens via Application Default Credentials.
+
+    ID-token credentials are created once per audience and then only
+    refreshed, instead of re-running credential discovery on every fetch.
+    """
+
+    def __init__(self):
+        self._id_token_module = None # Loaded by the first fetch (or the startup warmup)
+        self._request = None
+        self._credentials = {}
+        self._lock = threading.Lock()
+
+    def _load_sdk(self):
+        # Imported on first use so the Google auth SDK stays off the cold-start path.
+        import google.auth.transport.requests as google_auth_requests
+        import google.oauth2.id_token
+
+        with self._lock:
+            if self._id_token_module is None:
+                self._request = google_auth_requests.Request()
+                self._id_token_module = google.oauth2.id_token
+
+    def fetch(self, audience: str) -> str:
+        if self._id_token_module is None:
+            self._load_sdk()
+        with self._lock:
+            credentials = self._credentials.get(audience)
+        if credentials is None:
+            credentials = self._id_token_module.fetch_id_token_credentials(audience, request=self._request)
+            with self._lock:
+                self._credentials[audience] = credentials
+        credentials.refresh(self._request)
+        return credentials.token
+
+
+class FakeTokenSource:
+    """
+    Token source for tests and local runs without Google credentials.
+    Mints unsigned JWTs with a real 'exp' claim and counts fetches per audience.
+    """
+
+    def __init__(self, lifetime_seconds: float = 3600, fetch_delay_seconds: float = 0.0):
+        self.lifetime_seconds = lifetime_seconds
+        self.fetch_delay_seconds = fetch_delay_seconds
+        self.fetch_counts = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, audience: str) -> str:
+        if self.fetch_delay_seconds:
+            time.sleep(self.fetch_delay_seconds)
+        with self._lock:
+            self.fetch_counts[audience] = self.fetch_counts.get(audience, 0) + 1
+
+        def encode(segment):
+            return base64.urlsafe_b64encode(json.dumps(segment).encode('utf-8')).rstrip(b'=').decode('ascii')
+
+        claims = {"aud": audience, "iat": int(time.time()), "exp": int(time.time() + self.lifetime_seconds)}
+        return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode(claims)}.fake-signature"
+
+
+class _CachedToken:
+    __slots__ = ("token", "expires_at")
+
+    def __init__(self, token, expires_at):
+        self.token = token
+        self.expires_at = expires_at
+
+
+class IdTokenManager:
+    """
+    Caches ID tokens per audience until their real 'exp', and refreshes them
+    in the background `refresh_margin_seconds` before they expire.
+
+    Concurrent requests for a missing or expired token are coalesced: one
+    thread fetches while the others wait for its result (single-flight). In
+    steady state callers always get a cached token and never wait on minting.
+    """
+
+    def __init__(self, token_source=None, refresh_margin_seconds: float = 300, refresh_interval_seconds: float = 30):
+        self.token_source = token_source or GoogleIdTokenSource()
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.refresh_interval_seconds = refresh_interval_seconds
+
+        self._tokens = {} # audience -> _CachedToken
+        self._in_flight = {} # audience -> threading.Event set when the fetch finishes
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._refresher = None
+        self._stats = {"hits": 0, "fetches": 0, "coalesced_waits": 0, "background_refreshes": 0, "fetch_errors": 0}
+
+    def start(self):
+        if self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_loop, name="id-token-refresher", daemon=True)
+            self._refresher.start()
+
+    def get_token(self, audience: str) -> str:
+        """
+        Returns a valid ID token for the audience.
+
+        Raises:
+            ConnectionError: If no valid token is cached and fetching one fails.
+        """
+        now = time.time()
+        with self._lock:
+            cached = self._tokens.get(audience)
+            if cached and cached.expires_at > now:
+                self._stats["hits"] += 1
+                needs_refresh = cached.expires_at - now < self.refresh_margin_seconds
+            else:
+                cached = None
+                needs_refresh = False
+
+        if cached:
+            if needs_refresh:
+                # Still valid: hand it out now and let a background thread replace it.
+                self._start_fetch(audience, background=True)
+            return cached.token
+
+        self._fetch_single_flight(audience)
+        with self._lock:
+            cached = self._tokens.get(audience)
+        if cached is None or cached.expires_at <= time.time():
+            raise ConnectionError(f"Authentication setup failed: Could not get ID token for audience {audience}.")
+        return cached.token
+
+    def _start_fetch(self, audience, background):
+        """
+        Claims the fetch for this audience. Returns the Event to wait on and
+        whether this caller is the one that must perform the fetch.
+        """
+        with self._lock:
+            event = self._in_flight.get(audience)
+            if event is not None:
+                return event, False
+            event = threading.Event()
+            self._in_flight[audience] = event
+
+        if background:
+            threading.Thread(target=self._fetch, args=(audience, event, True), daemon=True).start()
+            return event, False
+        return event, True
+
+    def _fetch_single_flight(self, audience):
+        event, is_leader = self._start_fetch(audience, background=False)
+        if is_leader:
+            self._fetch(audience, event, False)
+        else:
+            with self._lock:
+                self._stats["coalesced_waits"] += 1
+            event.wait()
+
+    def _fetch(self, audience, event, background):
+        try:
+            token = self.token_source.fetch(audience)
+            expires_at = decode_jwt_expiry(token) or (time.time() + _FALLBACK_TOKEN_LIFETIME_SECONDS)
+            with self._lock:
+                self._tokens[audience] = _CachedToken(token, expires_at)
+                self._stats["fetches"] += 1
+                if background:
+                    self._stats["background_refreshes"] += 1
+            logger.info("Fetched ID token for audience %s, expires in %.0f s.", audience, expires_at - time.time())
+        except Exception as e:
+            with self._lock:
+                self._stats["fetch_errors"] += 1
+            logger.error("Failed to fetch ID token for audience %s: %s", audience, e, exc_info=True)
+        finally:
+            with self._lock:
+                self._in_flight.pop(audience, None)
+            event.set()
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval_seconds):
+            now = time.time()
+            with self._lock:
+                due = [audience for audience, cached in self._tokens.items()
+                       if cached.expires_at - now < self.refresh_margin_seconds]
+            for audience in due:
+                event, is_leader = self._start_fetch(audience, background=False)
+                if is_leader:
+                    self._fetch(audience, event, True)
+
+    def prime(self, audience: str):
+        """Fetches a token ahead of the first callback to this audience."""
+        self.get_token(audience)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            now = time.time()
+            stats["audiences"] = {audience: round(cached.expires_at - now, 1) for audience, cached in self._tokens.items()}
+        return stats
+
+    def shutdown(self):
+        self._stop_event.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=5)
+            self._refresher = None
+
+
+def initialize_id_token_manager(app, token_source=None):
+    """
+    Creates and starts the global ID-token manager.
+    This should be called only once at application startup.
+    """
+    global id_token_manager
+    if id_token_manager is None:
+        if token_source is None and app.config.get('ID_TOKEN_SOURCE', 'google') == 'fake':
+            app.logger.warning("ID_TOKEN_SOURCE=fake: callbacks will carry unsigned test tokens.")
+            token_source = FakeTokenSource()
+        id_token_manager = IdTokenManager(
+            token_source=token_source,
+            refresh_margin_seconds=app.config.get('ID_TOKEN_REFRESH_MARGIN_SECONDS', 300),
+            refresh_interval_seconds=app.config.get('ID_TOKEN_REFRESH_INTERVAL_SECONDS', 30)
+        )
+        id_token_manager.start()
+    return id_token_manager
+
+def get_id_token_manager():
+    """
+    Returns the global ID-token manager, creating one with default settings
+    if the app did not initialize it (e.g. in standalone scripts).
+    """
+    global id_token_manager
+    if id_token_manager is None:
+        id_token_manager = IdTokenManager()
+        id_token_manager.start()
+    return id_token_manager
+
+def shutdown_id_token_manager(app=None):
+    """Stops the background refresher."""
+    global id_token_manager
+    if id_token_manager:
+        id_token_manager.shutdown()
+        id_token_manager = None
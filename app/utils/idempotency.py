@@ -0,0 +1,149 @@
+# app/utils/idempotency.py
+import threading
+import time
+from collections import OrderedDict
+
+idempotency_cache = None
+
+IN_FLIGHT = "in_flight"
+COMPLETED = "completed"
+
+# Outcomes returned by IdempotencyCache.begin()
+NEW = "new"
+DUPLICATE_IN_FLIGHT = "duplicate_in_flight"
+DUPLICATE_COMPLETED = "duplicate_completed"
+
+
+class IdempotencyRecord:
+    __slots__ = ("status", "response", "expires_at", "in_flight_until")
+
+    def __init__(self, expires_at, in_flight_until):
+        self.status = IN_FLIGHT
+        self.response = None # Serialized callback body once completed
+        self.expires_at = expires_at # time.monotonic() based
+        self.in_flight_until = in_flight_until # Epoch transaction deadline, or None
+
+
+class IdempotencyCache:
+    """
+    Remembers recent (action, transaction_id, message_id) requests so that
+    retries from BAPs and gateways do not start a second search/select.
+
+    begin() atomically claims a key. A duplicate of an in-flight request is
+    told to attach to it (its callback is already on the way); a duplicate of
+    a completed one gets the stored callback body to re-deliver. Failed
+    requests call forget() so a retry recomputes. Records live for
+    `ttl_seconds`, at most `max_entries` of them (oldest dropped first).
+
+    Per process; with a shared PENDING_BACKEND the app uses the SQLite or
+    Redis cache from shared_idempotency instead.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._records = OrderedDict() # key -> IdempotencyRecord, oldest first
+        self._lock = threading.Lock()
+        self._stats = {NEW: 0, DUPLICATE_IN_FLIGHT: 0, DUPLICATE_COMPLETED: 0, "forgotten": 0, "evicted": 0}
+
+    def begin(self, action, transaction_id, message_id, in_flight_until=None):
+        """
+        Returns (outcome, stored_response). stored_response is only set for
+        DUPLICATE_COMPLETED.
+
+        in_flight_until is the transaction deadline (epoch seconds): an
+        in-flight record older than that is treated as abandoned (e.g. the
+        scheduler dropped the expired job) and the key can be claimed again.
+        """
+        key = (action, transaction_id, message_id)
+        now = time.monotonic()
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None and record.expires_at >= now:
+                if record.status == COMPLETED:
+                    self._stats[DUPLICATE_COMPLETED] += 1
+                    return DUPLICATE_COMPLETED, record.response
+                if record.in_flight_until is None or record.in_flight_until >= time.time():
+                    self._stats[DUPLICATE_IN_FLIGHT] += 1
+                    return DUPLICATE_IN_FLIGHT, None
+
+            self._records.pop(key, None)
+            # Entries share one TTL, so expired ones are always at the front.
+            while self._records:
+                oldest = next(iter(self._records.values()))
+                if oldest.expires_at >= now and len(self._records) < self.max_entries:
+                    break
+                self._records.popitem(last=False)
+                self._stats["evicted"] += 1
+            self._records[key] = IdempotencyRecord(now + self.ttl_seconds, in_flight_until)
+            self._stats[NEW] += 1
+            return NEW, None
+
+    def complete(self, action, transaction_id, message_id, response: bytes):
+        with self._lock:
+            record = self._records.get((action, transaction_id, message_id))
+            if record is not None:
+                record.status = COMPLETED
+                record.response = response
+
+    def forget(self, action, transaction_id, message_id):
+        with self._lock:
+            if self._records.pop((action, transaction_id, message_id), None) is not None:
+                self._stats["forgotten"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._records)
+        stats["dedup_hits"] = stats[DUPLICATE_IN_FLIGHT] + stats[DUPLICATE_COMPLETED]
+        stats["backend"] = "memory"
+        return stats
+
+    def shutdown(self):
+        pass # Nothing to release
+
+
+def _build_cache(config):
+    # Follows the pending stores: a retry handled by another worker must see the original.
+    backend = config.get('PENDING_BACKEND', 'memory')
+    max_entries = config.get('IDEMPOTENCY_MAX_ENTRIES', 10000)
+    ttl_seconds = config.get('IDEMPOTENCY_TTL_SECONDS', 600)
+    if backend == 'sqlite':
+        from app.utils.shared_idempotency import SQLiteIdempotencyCache
+        return SQLiteIdempotencyCache(config.get('PENDING_SQLITE_PATH', '/tmp/bpp-pending.sqlite3'),
+                                      max_entries=max_entries, ttl_seconds=ttl_seconds)
+    if backend == 'redis':
+        from app.utils.shared_idempotency import RedisIdempotencyCache
+        return RedisIdempotencyCache(url=config.get('PENDING_REDIS_URL', 'redis://localhost:6379/0'),
+                                     key_prefix=config.get('IDEMPOTENCY_REDIS_KEY_PREFIX', 'bpp:idempotency:'),
+                                     ttl_seconds=ttl_seconds)
+    return IdempotencyCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+def initialize_idempotency_cache(app):
+    """
+    Creates the global dedup cache from app config, shared by all workers
+    when PENDING_BACKEND is 'sqlite' or 'redis'.
+    This should be called only once at application startup.
+    """
+    global idempotency_cache
+    if idempotency_cache is None:
+        idempotency_cache = _build_cache(app.config)
+        app.logger.info("Idempotency cache ready: backend=%s, %s s TTL.",
+                        idempotency_cache.get_stats()["backend"], idempotency_cache.ttl_seconds)
+    return idempotency_cache
+
+def get_idempotency_cache():
+    """
+    Returns the global dedup cache, creating one with default settings
+    if the app did not initialize it (e.g. in standalone scripts).
+    """
+    global idempotency_cache
+    if idempotency_cache is None:
+        idempotency_cache = IdempotencyCache()
+    return idempotency_cache
+
+def shutdown_idempotency_cache(app=None):
+    global idempotency_cache
+    if idempotency_cache is not None:
+        idempotency_cache.shutdown()
+        idempotency_cache = None
@@ -0,0 +1,177 @@
+# app/utils/job_scheduler.py
+import heapq
+import itertools
+import threading
+import time
+
+from app.utils.metrics import QUEUE_WAIT, ERRORS
+
+# Priority classes: lower value runs first. A /select is a user at checkout,
+# so it always goes ahead of the /search backlog.
+PRIORITY_SELECT = 0
+PRIORITY_SEARCH = 1
+
+job_scheduler = None
+
+
+class JobScheduler:
+    """
+    Runs background Beckn jobs on a fixed pool of worker threads.
+
+    Jobs are ordered by priority class first and by deadline second
+    (earliest-deadline-first inside a class). A job whose deadline has
+    already passed when a worker picks it up is dropped instead of run,
+    because the BAP will no longer accept its callback.
+
+    The queue holds at most `max_queue` jobs (0 = unbounded). submit() refuses
+    jobs beyond that, so the caller can NACK the request instead of ACKing
+    work that would only expire in the queue.
+    """
+
+    def __init__(self, app, num_workers: int = 8, drop_expired: bool = True, max_queue: int = 0):
+        self.app = app
+        self.num_workers = num_workers
+        self.drop_expired = drop_expired
+        self.max_queue = max_queue
+
+        self._heap = []
+        self._sequence = itertools.count() # Tie-breaker so equal keys keep FIFO order
+        self._condition = threading.Condition()
+        self._workers = []
+        self._running = False
+
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "dropped_expired": 0,
+            "shed": 0,
+            "total_queue_wait_ms": 0.0,
+        }
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-scheduler-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        self.app.logger.info("Job scheduler started with %d workers.", self.num_workers)
+
+    def submit(self, job_name: str, priority: int, deadline: float, func, *args, on_drop=None) -> bool:
+        """
+        Queues func(*args) for execution. Returns False, without queuing, when
+        the queue is full.
+
+        Args:
+            job_name (str): Label used in logs, e.g. "search:<transaction_id>".
+            priority (int): One of the PRIORITY_* constants.
+            deadline (float): Epoch seconds after which the result is useless.
+            func: The callable to run on a worker thread.
+            on_drop: Called on the worker thread instead of func if the job
+                expires in the queue.
+        """
+        with self._condition:
+            if self.max_queue and len(self._heap) >= self.max_queue:
+                self._stats["shed"] += 1
+                queued = len(self._heap)
+            else:
+                heapq.heappush(self._heap, (priority, deadline, next(self._sequence), time.monotonic(), job_name, func, args, on_drop))
+                self._stats["submitted"] += 1
+                self._condition.notify()
+                queued = None
+        if queued is not None:
+            ERRORS.labels("job_shed").inc()
+            self.app.logger.warning("Shedding job %s: %d jobs already queued.", job_name, queued)
+            return False
+        self.app.logger.debug("Queued job %s (priority=%s, deadline in %.2f s).", job_name, priority, deadline - time.time())
+        return True
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                while self._running and not self._heap:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                priority, deadline, _, enqueued_at, job_name, func, args, on_drop = heapq.heappop(self._heap)
+                queue_wait_ms = (time.monotonic() - enqueued_at) * 1000
+                self._stats["total_queue_wait_ms"] += queue_wait_ms
+            QUEUE_WAIT.labels(job_name.split(":", 1)[0]).observe(queue_wait_ms / 1000) # Job names are "<kind>:<transaction_id>"
+
+            if self.drop_expired and time.time() > deadline:
+                with self._condition:
+                    self._stats["dropped_expired"] += 1
+                ERRORS.labels("job_expired").inc()
+                self.app.logger.warning(
+                    "Dropping expired job %s: deadline passed %.2f s ago (queue wait %.2f ms).",
+                    job_name, time.time() - deadline, queue_wait_ms
+                )
+                if on_drop is not None:
+                    try:
+                        on_drop()
+                    except Exception as e:
+                        self.app.logger.error("Drop handler of job %s failed: %s", job_name, e, exc_info=True)
+                continue
+
+            try:
+                func(*args)
+                with self._condition:
+                    self._stats["completed"] += 1
+            except Exception as e:
+                with self._condition:
+                    self._stats["failed"] += 1
+                self.app.logger.error("Job %s raised an unhandled error: %s", job_name, e, exc_info=True)
+
+    def get_stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats["queued"] = len(self._heap)
+        dequeued = stats["completed"] + stats["failed"] + stats["dropped_expired"]
+        stats["avg_queue_wait_ms"] = stats["total_queue_wait_ms"] / dequeued if dequeued else 0.0
+        stats["workers"] = self.num_workers
+        stats["max_queue"] = self.max_queue
+        return stats
+
+    def shutdown(self, timeout: float = 5.0):
+        with self._condition:
+            self._running = False
+            pending = len(self._heap)
+            self._heap.clear()
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+        self._workers = []
+        self.app.logger.info("Job scheduler stopped. Discarded %d queued jobs.", pending)
+
+
+def initialize_job_scheduler(app):
+    """
+    Creates and starts the global job scheduler.
+    This should be called only once at application startup.
+    """
+    global job_scheduler
+    if job_scheduler is None:
+        job_scheduler = JobScheduler(
+            app,
+            num_workers=app.config.get('SCHEDULER_WORKERS', 8),
+            drop_expired=app.config.get('SCHEDULER_DROP_EXPIRED', True),
+            max_queue=app.config.get('SCHEDULER_MAX_QUEUE', 0)
+        )
+        job_scheduler.start()
+    return job_scheduler
+
+def get_job_scheduler():
+    """
+    Returns the global job scheduler, or None if it has not been initialized.
+    """
+    return job_scheduler
+
+def shutdown_job_scheduler(app=None):
+    """Stops the worker threads."""
+    global job_scheduler
+    if job_scheduler:
+        job_scheduler.shutdown()
+        job_scheduler = None
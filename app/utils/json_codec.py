@@ -0,0 +1,65 @@
+# app/utils/json_codec.py
+import decimal
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson # Optional: several times faster than the stdlib for our payloads
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _default(obj):
+    # Types orjson/json cannot serialize natively but that can come back from psycopg2.
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj) -> bytes:
+        """Serializes obj to compact UTF-8 JSON bytes."""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def loads(data):
+        """Parses JSON from bytes or str."""
+        return orjson.loads(data)
+else:
+    def dumps(obj) -> bytes:
+        """Serializes obj to compact UTF-8 JSON bytes."""
+        return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def loads(data):
+        """Parses JSON from bytes or str."""
+        return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by the fast codec, so request.get_json() and
+    jsonify() use orjson when it is installed.
+    Pretty-printed output (debug mode / compact=False) still goes through the stdlib.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b"\n", mimetype=self.mimetype)
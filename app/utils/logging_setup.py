@@ -0,0 +1,204 @@
+# app/utils/logging_setup.py
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+from app.utils import json_codec
+
+log_listener = None
+payload_sampler = None
+_listener_pid = None # Process whose thread runs log_listener
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(transaction_id)s] %(message)s'
+
+# Transaction the current thread is working on; stamped onto every record it logs.
+_transaction_id = contextvars.ContextVar("log_transaction_id", default=None)
+
+
+def set_log_transaction_id(transaction_id):
+    """
+    Tags records logged from the current thread with transaction_id.
+    Returns a token for reset_log_transaction_id().
+    """
+    return _transaction_id.set(transaction_id)
+
+def reset_log_transaction_id(token):
+    _transaction_id.reset(token)
+
+
+class TransactionContextFilter(logging.Filter):
+    """
+    Copies the current transaction_id onto the record. Must run in the thread
+    that logged the record, i.e. on the QueueHandler, not behind the queue.
+    """
+
+    def filter(self, record):
+        if not hasattr(record, "transaction_id"):
+            record.transaction_id = _transaction_id.get() or "-"
+        return True
+
+
+class JSONLogFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, thread, transaction_id, message
+    (and exc_info when present).
+    """
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "transaction_id": getattr(record, "transaction_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json_codec.dumps(entry).decode("utf-8")
+
+
+# Argument types that cannot change between the log call and the listener formatting the record
+_IMMUTABLE_ARG_TYPES = frozenset((str, int, float, bool, bytes, type(None)))
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that enqueues the record untouched when all of its args are
+    immutable scalars. The stdlib version always merges args into the message
+    in the caller's thread; here that happens on the listener thread, so a
+    request thread only pays for creating the record.
+
+    A record with any other argument (a dict, a list, a LazyJSON, ...) is
+    formatted here instead, because the caller may go on to mutate it.
+    """
+
+    def prepare(self, record):
+        args = record.args
+        if args and (type(args) is not tuple or any(type(arg) not in _IMMUTABLE_ARG_TYPES for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class LazyJSON:
+    """
+    Log argument that is only serialized if the record is actually emitted,
+    i.e. passes the logger's level.
+    """
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return json_codec.dumps(self.obj).decode("utf-8")
+
+
+class PayloadSampler:
+    """
+    Decides per route whether a request/response body gets logged.
+
+    Rates come from a spec such as "search=0.01,select=0.1,*=0": the fraction
+    of requests on that route whose payload is logged. '*' is the default for
+    routes not listed.
+    """
+
+    def __init__(self, rates=None, default_rate: float = 0.0):
+        self.rates = dict(rates or {})
+        self.default_rate = self.rates.pop("*", default_rate)
+
+    @classmethod
+    def from_spec(cls, spec: str):
+        rates = {}
+        for part in (spec or "").split(","):
+            route, _, rate = part.partition("=")
+            if route.strip() and rate.strip():
+                rates[route.strip()] = min(1.0, max(0.0, float(rate)))
+        return cls(rates)
+
+    def should_log(self, route: str) -> bool:
+        rate = self.rates.get(route, self.default_rate)
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+def should_log_payload(route: str) -> bool:
+    """
+    True if this request's payload on `route` should be logged.
+    Without configure_logging() payloads are always logged.
+    """
+    return payload_sampler is None or payload_sampler.should_log(route)
+
+
+def configure_logging(app, stream=None):
+    """
+    Installs the root handlers from app config. Call before the first use of
+    app.logger so Flask does not attach its own synchronous handler.
+
+    With LOG_ASYNC, request threads only put records on an in-memory queue;
+    a single QueueListener thread formats and writes them to `stream`
+    (stderr by default).
+    """
+    global log_listener, payload_sampler, _listener_pid
+
+    payload_sampler = PayloadSampler.from_spec(app.config.get('LOG_PAYLOAD_SAMPLE_RATES', '*=1.0'))
+
+    root = logging.getLogger()
+    root.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+    if log_listener is not None:
+        return log_listener # Already configured (e.g. create_app called twice in one process)
+
+    stream_handler = logging.StreamHandler(stream or sys.stderr)
+    if app.config.get('LOG_FORMAT', 'text') == 'json':
+        stream_handler.setFormatter(JSONLogFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    if app.config.get('LOG_ASYNC', True):
+        log_queue = queue.SimpleQueue()
+        queue_handler = DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(TransactionContextFilter())
+        root.addHandler(queue_handler)
+        log_listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        log_listener.start()
+        _listener_pid = os.getpid()
+    else:
+        stream_handler.addFilter(TransactionContextFilter())
+        root.addHandler(stream_handler)
+    return log_listener
+
+def ensure_log_listener():
+    """
+    Restarts the listener in a forked child (e.g. a preloaded gunicorn
+    worker), where the parent's listener thread does not exist. The child
+    gets a fresh queue so records the parent had not written yet are not
+    written twice.
+    """
+    global log_listener, _listener_pid
+    if log_listener is None or _listener_pid == os.getpid():
+        return log_listener
+    log_queue = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, DeferredQueueHandler):
+            handler.queue = log_queue
+    log_listener = logging.handlers.QueueListener(log_queue, *log_listener.handlers, respect_handler_level=True)
+    log_listener.start()
+    _listener_pid = os.getpid()
+    return log_listener
+
+def shutdown_logging(app=None):
+    """Flushes queued records and stops the listener thread."""
+    global log_listener
+    if log_listener is not None and _listener_pid == os.getpid():
+        log_listener.stop()
+        log_listener = None
@@ -0,0 +1,388 @@
+# app/utils/metrics.py
+#
+# Process-local counters and fixed-bucket histograms, rendered in the
+# Prometheus text format at /metrics.
+#
+# Multiprocess mode (METRICS_MULTIPROC_DIR set): every worker writes a
+# snapshot of its metrics to <dir>/metrics-<pid>-<start ms>.json every
+# METRICS_FLUSH_SECONDS and at exit, and whichever worker answers /metrics
+# merges all snapshots (counters and histogram buckets are summed). Its own
+# numbers are current; other workers' are at most one flush interval old.
+# When a worker exits, the gunicorn master folds its snapshot into
+# metrics-exited.json and removes it, so totals never go backwards and the
+# directory does not grow with worker restarts. The directory is emptied when
+# gunicorn starts (see gunicorn.conf.py).
+import bisect
+import glob
+import logging
+import os
+import threading
+import time
+
+from app.utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+metrics_flusher = None
+
+# Seconds. Covers sub-millisecond ACKs up to callbacks near the transaction TTL.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+EXITED_SNAPSHOT = "metrics-exited.json" # Exited workers' totals, written only by the gunicorn master
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self, lock):
+        self._lock = lock
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_buckets", "counts", "sum")
+
+    def __init__(self, lock, buckets):
+        self._lock = lock
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._buckets, value) # Upper bounds are inclusive ('le')
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {} # label values tuple -> child
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *label_values):
+        """Returns the series for these label values (positional, in labelnames order)."""
+        child = self._children.get(label_values)
+        if child is None:
+            if len(label_values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {label_values}")
+            with self._lock:
+                child = self._children.setdefault(label_values, self._new_child())
+        return child
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild(self._lock)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def snapshot(self):
+        with self._lock:
+            return {"samples": [[list(key), child.value] for key, child in self._children.items()]}
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self._lock, self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "buckets": list(self.buckets),
+                "samples": [[list(key), list(child.counts), child.sum] for key, child in self._children.items()],
+            }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered.")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        """All metrics as a JSON-serializable dict (the multiprocess file format)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            metric.name: dict(metric.snapshot(), type=metric.kind, help=metric.documentation, labelnames=list(metric.labelnames))
+            for metric in metrics
+        }
+
+
+def merge_snapshots(snapshots):
+    """Sums counters and histogram buckets series by series."""
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = {key: value for key, value in metric.items() if key != "samples"}
+                target["series"] = {}
+            series = target["series"]
+            for sample in metric["samples"]:
+                key = tuple(sample[0])
+                if metric["type"] == "counter":
+                    series[key] = series.get(key, 0.0) + sample[1]
+                else:
+                    counts, total = series.get(key, ([0] * len(sample[1]), 0.0))
+                    series[key] = ([a + b for a, b in zip(counts, sample[1])], total + sample[2])
+    return merged
+
+
+def _as_snapshot(merged):
+    """Turns merge_snapshots() output back into the snapshot file format."""
+    snapshot = {}
+    for name, metric in merged.items():
+        entry = {key: value for key, value in metric.items() if key != "series"}
+        if metric["type"] == "counter":
+            entry["samples"] = [[list(key), value] for key, value in metric["series"].items()]
+        else:
+            entry["samples"] = [[list(key), counts, total] for key, (counts, total) in metric["series"].items()]
+        snapshot[name] = entry
+    return snapshot
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else f"{int(value)}"
+
+def render_prometheus(merged) -> str:
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        labelnames = metric["labelnames"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key in sorted(metric["series"]):
+            value = metric["series"][key]
+            if metric["type"] == "counter":
+                lines.append(f"{name}_total{_format_labels(labelnames, key)} {_format_value(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(metric["buckets"], counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labelnames, key, ('le', repr(float(bound))))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labelnames, key)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsFlusher:
+    """
+    Writes this process's snapshot to the shared directory periodically.
+    Files are replaced atomically, so readers never see a partial snapshot.
+    """
+
+    def __init__(self, registry, directory: str, interval_seconds: float = 5):
+        self.registry = registry
+        self.directory = directory
+        self.interval_seconds = interval_seconds
+        self.pid = os.getpid()
+        self.started_ms = int(time.time() * 1000) # Tells this process's file from an earlier one with a reused pid
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"metrics-{self.pid}-{self.started_ms}.json")
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.flush()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name="metrics-flusher", daemon=True)
+            self._thread.start()
+
+    def flush(self):
+        _write_snapshot_file(self.path, self.registry.snapshot())
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning("Writing the metrics snapshot to %s failed: %s", self.path, e)
+
+    def read_all(self):
+        """This process's live snapshot plus every other process's last file."""
+        snapshots = [self.registry.snapshot()]
+        retired = set()
+        try:
+            exited = _read_snapshot_file(os.path.join(self.directory, EXITED_SNAPSHOT))
+            snapshots.append(exited["metrics"])
+            retired.update(exited["files"]) # Files already counted in it that may not be removed yet
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping the exited workers' metrics snapshot: %s", e)
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+            name = os.path.basename(path)
+            if path == self.path or name == EXITED_SNAPSHOT or name in retired:
+                continue
+            try:
+                with open(path, "rb") as f:
+                    snapshots.append(json_codec.loads(f.read()))
+            except (OSError, ValueError) as e: # Vanished or unreadable; skip this scrape
+                logger.warning("Skipping metrics snapshot %s: %s", path, e)
+        return snapshots
+
+    def shutdown(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            self.flush() # Final numbers survive the worker
+        except OSError:
+            pass
+
+
+def _read_snapshot_file(path):
+    with open(path, "rb") as f:
+        return json_codec.loads(f.read())
+
+def _write_snapshot_file(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(json_codec.dumps(data))
+    os.replace(tmp_path, path)
+
+def retire_worker_snapshots(directory: str, pid: int):
+    """
+    Folds the snapshot of an exited worker into metrics-exited.json and
+    removes it. Call from the gunicorn master's child_exit hook, the only
+    writer of that file. Returns the number of files retired.
+    """
+    paths = glob.glob(os.path.join(directory, f"metrics-{pid}-*.json"))
+    if not paths:
+        return 0
+    exited_path = os.path.join(directory, EXITED_SNAPSHOT)
+    try:
+        exited = _read_snapshot_file(exited_path)
+    except (OSError, ValueError):
+        exited = {"files": [], "metrics": {}}
+    # Only names whose file still exists can be double counted by a reader
+    files = [name for name in exited["files"] if os.path.exists(os.path.join(directory, name))]
+    snapshots = [exited["metrics"]]
+    for path in paths:
+        try:
+            snapshots.append(_read_snapshot_file(path))
+            files.append(os.path.basename(path))
+        except (OSError, ValueError) as e:
+            logger.warning("Dropping unreadable metrics snapshot %s: %s", path, e)
+    _write_snapshot_file(exited_path, {"files": files, "metrics": _as_snapshot(merge_snapshots(snapshots))})
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return len(paths)
+
+def clear_multiprocess_dir(directory: str):
+    """Removes snapshots left by a previous server run."""
+    for path in glob.glob(os.path.join(directory, "metrics-*.json*")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def initialize_metrics(app):
+    """
+    Starts this process's snapshot writer when METRICS_MULTIPROC_DIR is set.
+    This should be called once per serving process (after fork).
+    """
+    global metrics_flusher
+    directory = app.config.get('METRICS_MULTIPROC_DIR')
+    if directory and (metrics_flusher is None or metrics_flusher.pid != os.getpid()):
+        metrics_flusher = MetricsFlusher(registry, directory, app.config.get('METRICS_FLUSH_SECONDS', 5))
+        metrics_flusher.start()
+        app.logger.info("Metrics: multiprocess mode, snapshots in %s.", directory)
+    return metrics_flusher
+
+def render_latest_metrics() -> str:
+    """Prometheus text for this process, or for all workers in multiprocess mode."""
+    if metrics_flusher is not None and metrics_flusher.pid == os.getpid():
+        return render_prometheus(merge_snapshots(metrics_flusher.read_all()))
+    return render_prometheus(merge_snapshots([registry.snapshot()]))
+
+def shutdown_metrics(app=None):
+    """Writes the final snapshot."""
+    global metrics_flusher
+    if metrics_flusher is not None and metrics_flusher.pid == os.getpid():
+        metrics_flusher.shutdown()
+    metrics_flusher = None
+
+
+registry = MetricsRegistry()
+
+# --- Latency per stage (seconds) ---
+ACK_LATENCY = registry.histogram("bpp_ack_duration_seconds", "Time to validate, store and ACK a /search or /select.", ["action"])
+QUEUE_WAIT = registry.histogram("bpp_job_queue_wait_seconds", "Time a background job waited for a scheduler worker.", ["job"])
+EMBEDDING_LATENCY = registry.histogram("bpp_embedding_duration_seconds", "Embedding API call duration.")
+POOL_ACQUIRE_LATENCY = registry.histogram("bpp_db_pool_acquire_seconds", "Time to get a connection from the DB pool.", ["query"])
+SQL_LATENCY = registry.histogram("bpp_db_query_duration_seconds", "SQL execution and fetch time.", ["query"])
+RESPONSE_BUILD_LATENCY = registry.histogram("bpp_response_build_seconds", "Time to build and serialize a callback body.", ["action"])
+CALLBACK_LATENCY = registry.histogram("bpp_callback_delivery_seconds", "Duration of one callback delivery attempt.", ["action", "outcome"])
+
+# --- Outcomes ---
+RESULTS = registry.counter("bpp_results", "Searches and selects that produced a result.", ["action"])
+EMPTY_RESULTS = registry.counter("bpp_empty_results", "Searches and selects that found nothing.", ["action"])
+ERRORS = registry.counter("bpp_errors", "Failures by stage.", ["stage"])
+SLOW_QUERIES = registry.counter("bpp_slow_queries", "Queries over SLOW_QUERY_THRESHOLD_MS (see /admin/slow_queries).", ["query"])
+ANN_ROUTES = registry.counter("bpp_ann_routes", "Searches by vector index: a category partition (by column) or the global index.", ["target"])
+CACHE_LOOKUPS = registry.counter("bpp_cache_lookups", "Cache lookups by cache and outcome (hit or miss).", ["cache", "outcome"])
@@ -0,0 +1,310 @@
+# app/utils/pending_store.py
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from app.utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+pending_search_store = None
+pending_select_store = None
+
+# Upper bound on entries removed per stripe lock hold by the sweeper, so a
+# large expiry wave never holds a stripe long enough to stall a request.
+_SWEEP_BATCH = 256
+
+
+class PendingEntry:
+    """
+    One in-flight transaction. `criteria` is the search criteria for /search
+    and the product id for /select.
+    """
+
+    __slots__ = ("callback_uri", "criteria", "context", "status", "created_at", "expires_at",
+                 "beckn_response", "payload_bytes")
+
+    def __init__(self, callback_uri, criteria, context, expires_at):
+        self.callback_uri = callback_uri
+        self.criteria = criteria
+        self.context = context
+        self.status = "pending"
+        self.created_at = time.time()
+        self.expires_at = expires_at # Epoch seconds, as in the shared stores
+        self.beckn_response = None
+        self.payload_bytes = 0
+
+    def as_dict(self):
+        return {
+            "callback_uri": self.callback_uri,
+            "criteria": self.criteria,
+            "context": self.context,
+            "status": self.status,
+            "timestamp": self.created_at,
+            "beckn_response": json_codec.loads(self.beckn_response) if self.beckn_response is not None else None,
+        }
+
+
+class _Stripe:
+    __slots__ = ("lock", "entries", "payload_bytes", "stats")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # transaction_id -> PendingEntry, oldest first
+        self.payload_bytes = 0
+        self.stats = {"stored": 0, "completed": 0, "retrieved": 0, "misses": 0,
+                      "evicted_capacity": 0, "evicted_expired": 0}
+
+
+def serialize_payload(beckn_response) -> bytes:
+    """
+    Results are stored as JSON bytes, encoded once here and served as-is.
+    on_search bodies already arrive pre-rendered.
+    """
+    if isinstance(beckn_response, bytes):
+        return beckn_response
+    return json_codec.dumps(beckn_response)
+
+
+class PendingRequestStore:
+    """
+    Bounded, expiring map of transaction_id -> PendingEntry, local to one
+    process. See shared_pending_store for the cross-worker backends.
+
+    Keys are spread over `stripes` independent OrderedDicts, each with its own
+    lock, so request threads and background workers rarely contend. Each
+    stripe holds at most max_entries / stripes entries; inserting into a full
+    stripe drops its oldest entry, which is O(1). Expired entries are ignored
+    on read and removed by a background sweeper in small batches, so the
+    request path never waits on a bulk eviction.
+    """
+
+    def __init__(self, name: str, max_entries: int = 10000, ttl_seconds: float = 300,
+                 stripes: int = 16, sweep_interval_seconds: float = 5):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self._stripes = [_Stripe() for _ in range(max(1, stripes))]
+        self._stripe_capacity = max(1, max_entries // len(self._stripes))
+        self._stop_event = threading.Event()
+        self._sweeper = None
+
+    def _stripe_for(self, transaction_id) -> _Stripe:
+        # crc32 rather than hash(): stable across processes and cheap on short ids.
+        return self._stripes[zlib.crc32(str(transaction_id).encode("utf-8")) % len(self._stripes)]
+
+    def start(self):
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep_loop, name=f"pending-sweeper-{self.name}", daemon=True)
+            self._sweeper.start()
+
+    def put(self, transaction_id, callback_uri, criteria, context):
+        entry = PendingEntry(callback_uri, criteria, context, time.time() + self.ttl_seconds)
+        stripe = self._stripe_for(transaction_id)
+        with stripe.lock:
+            previous = stripe.entries.pop(transaction_id, None)
+            if previous is not None:
+                stripe.payload_bytes -= previous.payload_bytes
+            elif len(stripe.entries) >= self._stripe_capacity:
+                _, evicted = stripe.entries.popitem(last=False)
+                stripe.payload_bytes -= evicted.payload_bytes
+                stripe.stats["evicted_capacity"] += 1
+            stripe.entries[transaction_id] = entry
+            stripe.stats["stored"] += 1
+        return entry
+
+    def complete(self, transaction_id, beckn_response) -> bool:
+        """
+        Attaches the serialized result to a still-live entry. Returns False if
+        the entry is gone (expired, evicted or never stored).
+        """
+        payload = serialize_payload(beckn_response) # Outside the lock
+        payload_bytes = len(payload)
+        stripe = self._stripe_for(transaction_id)
+        with stripe.lock:
+            entry = stripe.entries.get(transaction_id)
+            if entry is None or entry.expires_at < time.time():
+                return False
+            stripe.payload_bytes += payload_bytes - entry.payload_bytes
+            entry.beckn_response = payload
+            entry.payload_bytes = payload_bytes
+            entry.status = "completed"
+            stripe.stats["completed"] += 1
+        return True
+
+    def fail(self, transaction_id, status="failed") -> bool:
+        """
+        Sets a still-pending entry's status to `status` ("failed" or
+        "expired"). Returns False if the entry is gone or already completed.
+        """
+        stripe = self._stripe_for(transaction_id)
+        with stripe.lock:
+            entry = stripe.entries.get(transaction_id)
+            if entry is None or entry.status != "pending":
+                return False
+            entry.status = status
+        return True
+
+    def get(self, transaction_id):
+        stripe = self._stripe_for(transaction_id)
+        with stripe.lock:
+            entry = stripe.entries.get(transaction_id)
+        if entry is None or entry.expires_at < time.time():
+            return None
+        return entry
+
+    def peek_result(self, transaction_id):
+        """
+        Returns the serialized result (JSON bytes) for a completed transaction
+        without removing it, or None if it is still pending, expired or unknown.
+        """
+        stripe = self._stripe_for(transaction_id)
+        with stripe.lock:
+            entry = stripe.entries.get(transaction_id)
+        if entry is None or entry.expires_at < time.time():
+            return None
+        return entry.beckn_response
+
+    def pop_result(self, transaction_id):
+        """
+        Returns and removes the serialized result (JSON bytes) for a completed
+        transaction, or None if it is still pending, expired or unknown.
+        """
+        stripe = self._stripe_for(transaction_id)
+        with stripe.lock:
+            entry = stripe.entries.get(transaction_id)
+            if entry is None or entry.beckn_response is None or entry.expires_at < time.time():
+                stripe.stats["misses"] += 1
+                return None
+            del stripe.entries[transaction_id]
+            stripe.payload_bytes -= entry.payload_bytes
+            stripe.stats["retrieved"] += 1
+        return entry.beckn_response
+
+    def sweep(self):
+        """
+        Removes expired entries, one stripe and at most _SWEEP_BATCH entries
+        per lock hold. Entries share one TTL, so each stripe's OrderedDict is
+        in expiry order and only its head needs checking.
+        """
+        removed = 0
+        for stripe in self._stripes:
+            while True:
+                now = time.time()
+                with stripe.lock:
+                    batch = 0
+                    while stripe.entries and batch < _SWEEP_BATCH:
+                        transaction_id, entry = next(iter(stripe.entries.items()))
+                        if entry.expires_at >= now:
+                            break
+                        del stripe.entries[transaction_id]
+                        stripe.payload_bytes -= entry.payload_bytes
+                        batch += 1
+                    stripe.stats["evicted_expired"] += batch
+                removed += batch
+                if batch < _SWEEP_BATCH:
+                    break
+        return removed
+
+    def _sweep_loop(self):
+        while not self._stop_event.wait(self.sweep_interval_seconds):
+            try:
+                self.sweep()
+            except Exception as e: # Never let the sweeper die; the next pass retries
+                logger.error("Pending-request sweep for %s failed: %s", self.name, e, exc_info=True)
+
+    def get_stats(self):
+        totals = {"entries": 0, "payload_bytes": 0}
+        for stripe in self._stripes:
+            with stripe.lock:
+                totals["entries"] += len(stripe.entries)
+                totals["payload_bytes"] += stripe.payload_bytes
+                for key, value in stripe.stats.items():
+                    totals[key] = totals.get(key, 0) + value
+        totals["backend"] = "memory"
+        totals["capacity"] = self._stripe_capacity * len(self._stripes)
+        totals["stripes"] = len(self._stripes)
+        totals["ttl_seconds"] = self.ttl_seconds
+        return totals
+
+    def shutdown(self):
+        self._stop_event.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=5)
+            self._sweeper = None
+
+
+def _build_store(name, config):
+    backend = config.get('PENDING_BACKEND', 'memory')
+    if backend in ('sqlite', 'redis'):
+        # Imported here so the optional Redis client is only needed when selected.
+        from app.utils.shared_pending_store import SQLitePendingStore, RedisPendingStore
+        if backend == 'sqlite':
+            return SQLitePendingStore(
+                name,
+                path=config.get('PENDING_SQLITE_PATH', '/tmp/bpp-pending.sqlite3'),
+                max_entries=config.get('PENDING_MAX_ENTRIES', 10000),
+                ttl_seconds=config.get('PENDING_TTL_SECONDS', 300),
+                sweep_interval_seconds=config.get('PENDING_SWEEP_INTERVAL_SECONDS', 5)
+            )
+        return RedisPendingStore(
+            name,
+            url=config.get('PENDING_REDIS_URL', 'redis://localhost:6379/0'),
+            key_prefix=config.get('PENDING_REDIS_KEY_PREFIX', 'bpp:pending:'),
+            ttl_seconds=config.get('PENDING_TTL_SECONDS', 300)
+        )
+    if backend != 'memory':
+        raise ValueError(f"Unknown PENDING_BACKEND '{backend}'. Expected 'memory', 'sqlite' or 'redis'.")
+    return PendingRequestStore(
+        name,
+        max_entries=config.get('PENDING_MAX_ENTRIES', 10000),
+        ttl_seconds=config.get('PENDING_TTL_SECONDS', 300),
+        stripes=config.get('PENDING_STORE_STRIPES', 16),
+        sweep_interval_seconds=config.get('PENDING_SWEEP_INTERVAL_SECONDS', 5)
+    )
+
+def initialize_pending_stores(app):
+    """
+    Creates and starts the /search and /select pending-request stores.
+    This should be called only once at application startup.
+    """
+    global pending_search_store, pending_select_store
+    if pending_search_store is None:
+        pending_search_store = _build_store("search", app.config)
+        pending_search_store.start()
+    if pending_select_store is None:
+        pending_select_store = _build_store("select", app.config)
+        pending_select_store.start()
+    stats = pending_search_store.get_stats()
+    app.logger.info("Pending-request stores ready: backend=%s, %s entries max, %s s TTL.",
+                    stats["backend"], stats.get("capacity", "-"), stats["ttl_seconds"])
+    return pending_search_store, pending_select_store
+
+def get_pending_search_store():
+    """
+    Returns the /search store, creating one with default settings if the app
+    did not initialize it (e.g. in standalone scripts).
+    """
+    global pending_search_store
+    if pending_search_store is None:
+        pending_search_store = PendingRequestStore("search")
+        pending_search_store.start()
+    return pending_search_store
+
+def get_pending_select_store():
+    global pending_select_store
+    if pending_select_store is None:
+        pending_select_store = PendingRequestStore("select")
+        pending_select_store.start()
+    return pending_select_store
+
+def shutdown_pending_stores(app=None):
+    """Stops the sweepers."""
+    global pending_search_store, pending_select_store
+    for store in (pending_search_store, pending_select_store):
+        if store is not None:
+            store.shutdown()
+    pending_search_store = None
+    pending_select_store = None
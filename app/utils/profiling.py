@@ -0,0 +1,288 @@
+# app/utils/profiling.py
+#
+# On-demand profiling of a live worker, behind the admin token:
+#   - per-request cProfile, for a request carrying the X-Profile header
+#   - a time-boxed sampling profiler over all threads, returning collapsed
+#     stacks (flamegraph.pl, speedscope, inferno)
+#   - tracemalloc snapshots diffed against a baseline, for memory growth in
+#     the pending stores and caches
+#
+# With PROFILING_ENABLED off, nothing here is installed: no request hooks,
+# no routes and no profiler or tracemalloc hooks, so there is no overhead.
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+
+from flask import g, request
+
+from app.utils.admin_auth import is_admin_request
+
+PROFILE_HEADER = "X-Profile"
+
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(_APP_ROOT))
+
+# Leaf frames of threads parked in a wait; left out of samples unless asked for.
+_IDLE_LEAVES = {
+    ("threading.py", "Condition.wait"), ("threading.py", "Thread.join"), ("threading.py", "Thread._wait_for_tstate_lock"),
+    ("selectors.py", "EpollSelector.select"), ("selectors.py", "PollSelector.select"), ("selectors.py", "SelectSelector.select"),
+    ("socket.py", "socket.accept"), ("queue.py", "Queue.get"), ("handlers.py", "QueueListener.dequeue"),
+}
+
+_THREAD_NUMBER_PATTERN = re.compile(r"[-_]\d+")
+
+_SAMPLE_TIMEOUT_MARGIN_SECONDS = 10 # Sampling ends this long before the worker timeout would kill the worker
+
+
+class RequestProfileStore:
+    """The last `max_profiles` per-request profiles of this process."""
+
+    def __init__(self, max_profiles: int = 20):
+        self.max_profiles = max_profiles
+        self._profiles = OrderedDict() # profile id -> dict
+        self._lock = threading.Lock()
+        self._active = threading.Lock() # One cProfile at a time; concurrent profilers skew each other
+
+    def begin(self):
+        if not self._active.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def end(self, profiler, method, path, status_code, elapsed_seconds):
+        profiler.disable()
+        self._active.release()
+        profiler.create_stats()
+        profile_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._profiles[profile_id] = {
+                "id": profile_id,
+                "pid": os.getpid(),
+                "method": method,
+                "path": path,
+                "status": status_code,
+                "ms": round(elapsed_seconds * 1000, 2),
+                "at": time.time(),
+                "stats": profiler.stats,
+            }
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def abort(self, profiler):
+        profiler.disable()
+        self._active.release()
+
+    def list(self):
+        with self._lock:
+            return [{key: value for key, value in profile.items() if key != "stats"} for profile in reversed(self._profiles.values())]
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+
+def format_profile_text(profile, sort_by: str = "cumulative", limit: int = 60) -> str:
+    stream = io.StringIO()
+    stats = pstats.Stats(_StatsHolder(profile["stats"]), stream=stream)
+    stats.sort_stats(sort_by).print_stats(limit)
+    header = f"{profile['method']} {profile['path']} -> {profile['status']} in {profile['ms']} ms (pid {profile['pid']})\n"
+    return header + stream.getvalue()
+
+def dump_profile(profile) -> bytes:
+    """The .prof format written by cProfile.Profile.dump_stats(), for snakeviz and pstats."""
+    return marshal.dumps(profile["stats"])
+
+
+class _StatsHolder:
+    # pstats.Stats accepts any object with create_stats() and a stats dict.
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def install_request_profiling(app, store):
+    """
+    Profiles requests that carry both the X-Profile header and the admin
+    token. The profile id is returned in the X-Profile-Id response header.
+    Requests served natively by the ASGI app do not pass through Flask and
+    are not profiled; use the sampling profiler there.
+    """
+    @app.before_request
+    def _start_request_profile():
+        if PROFILE_HEADER not in request.headers or not is_admin_request(app.config):
+            return
+        g._request_profiler = store.begin()
+        g._request_profile_start = time.perf_counter()
+
+    @app.after_request
+    def _finish_request_profile(response):
+        profiler = g.pop('_request_profiler', None)
+        if profiler is not None:
+            elapsed = time.perf_counter() - g.pop('_request_profile_start')
+            response.headers["X-Profile-Id"] = store.end(profiler, request.method, request.full_path.rstrip('?'), response.status_code, elapsed)
+        elif PROFILE_HEADER in request.headers and is_admin_request(app.config):
+            response.headers["X-Profile-Id"] = "busy" # Another request is being profiled
+        return response
+
+    @app.teardown_request
+    def _abort_request_profile(exception=None):
+        profiler = g.pop('_request_profiler', None) # Still set only if after_request did not run
+        if profiler is not None:
+            store.abort(profiler)
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    if filename.startswith(_APP_ROOT):
+        filename = os.path.relpath(filename, _PROJECT_ROOT)
+    else:
+        filename = os.path.basename(filename)
+    return f"{filename}:{getattr(code, 'co_qualname', code.co_name)}"
+
+def _is_idle(frame):
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), getattr(code, 'co_qualname', code.co_name)) in _IDLE_LEAVES
+
+
+class SamplingProfiler:
+    """
+    Samples every thread's Python stack at a fixed interval for a bounded
+    time and aggregates them as collapsed stacks ("thread;outer;...;inner count").
+    Runs in the calling thread; one run at a time per process.
+    """
+
+    def __init__(self, max_seconds: float = 30):
+        self.max_seconds = max_seconds
+        self._running = threading.Lock()
+
+    def sample(self, seconds: float, interval_seconds: float = 0.005, include_idle: bool = False):
+        """Returns (Counter of collapsed stacks, number of sampling rounds), or None if a run is in progress."""
+        if not self._running.acquire(blocking=False):
+            return None
+        try:
+            seconds = max(0.0, min(seconds, self.max_seconds))
+            own_thread = threading.get_ident()
+            stacks = Counter()
+            rounds = 0
+            thread_names = {}
+            end = time.monotonic() + seconds
+            while time.monotonic() < end:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread or (not include_idle and _is_idle(frame)):
+                        continue
+                    name = thread_names.get(thread_id)
+                    if name is None:
+                        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+                        name = thread_names.get(thread_id, str(thread_id))
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    labels.append(_THREAD_NUMBER_PATTERN.sub("", name)) # Threads of one pool share a root
+                    labels.reverse()
+                    stacks[";".join(labels)] += 1
+                rounds += 1
+                time.sleep(interval_seconds)
+            return stacks, rounds
+        finally:
+            self._running.release()
+
+
+def format_collapsed(stacks) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class TracemallocTracker:
+    """
+    Starts and stops tracemalloc for this process and diffs snapshots against
+    the one taken at start (or the previous one), to find what keeps growing.
+    """
+
+    def __init__(self):
+        self._baseline = None
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def start(self, frames: int = 10):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self._baseline = self._previous = tracemalloc.take_snapshot()
+
+    def stop(self):
+        with self._lock:
+            tracemalloc.stop()
+            self._baseline = self._previous = None
+
+    def is_tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def compare(self, against: str = "baseline", group_by: str = "lineno", limit: int = 25, path_filter: str = None):
+        """
+        Top allocation sites by growth since the baseline or previous snapshot.
+        path_filter (e.g. 'app/') keeps only allocations made from matching files.
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                return None
+            snapshot = tracemalloc.take_snapshot()
+            reference = self._baseline if against == "baseline" else self._previous
+            self._previous = snapshot
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        if path_filter:
+            filters.append(tracemalloc.Filter(True, f"*{path_filter}*"))
+        differences = snapshot.filter_traces(filters).compare_to(reference.filter_traces(filters), group_by)
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "pid": os.getpid(),
+            "against": against,
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [{
+                "where": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                "size_bytes": stat.size,
+                "size_diff_bytes": stat.size_diff,
+                "count": stat.count,
+                "count_diff": stat.count_diff,
+            } for stat in differences[:limit]],
+        }
+
+
+request_profiles = RequestProfileStore()
+sampling_profiler = SamplingProfiler()
+tracemalloc_tracker = TracemallocTracker()
+
+
+def install_profiling(app):
+    """
+    Registers the /admin profiler routes and the per-request profiling hooks
+    when PROFILING_ENABLED is set; otherwise does nothing. The other /admin
+    routes do not depend on this (see create_app).
+    """
+    if not app.config.get('PROFILING_ENABLED'):
+        return False
+    from app.controllers.profiling_controller import profiling_bp
+    request_profiles.max_profiles = app.config.get('PROFILING_KEEP_PROFILES', 20)
+    # A sampling run holds its request thread (the whole worker, with sync workers) until it ends
+    timeout_cap = max(1.0, app.config.get('GUNICORN_TIMEOUT', 60) - _SAMPLE_TIMEOUT_MARGIN_SECONDS)
+    sampling_profiler.max_seconds = min(app.config.get('PROFILING_MAX_SAMPLE_SECONDS', 30), timeout_cap)
+    app.register_blueprint(profiling_bp, url_prefix='/admin')
+    install_request_profiling(app, request_profiles)
+    if not app.config.get('ADMIN_TOKEN'):
+        app.logger.warning("PROFILING_ENABLED is set without ADMIN_TOKEN; all profiling requests will be refused.")
+    else:
+        app.logger.info("Profiling endpoints enabled under /admin.")
+    return True
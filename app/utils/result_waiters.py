@@ -0,0 +1,128 @@
+# app/utils/result_waiters.py
+import asyncio
+import threading
+import time
+
+
+class _Waiter:
+    __slots__ = ("condition", "generation", "count", "async_events")
+
+    def __init__(self, lock):
+        self.condition = threading.Condition(lock)
+        self.generation = 0 # Bumped by every notify()
+        self.count = 0
+        self.async_events = [] # (loop, asyncio.Event) per coroutine waiting via wait_async()
+
+
+class ResultWaiters:
+    """
+    Per-transaction wake-ups for long-poll and SSE clients.
+
+    All clients waiting on one transaction share a Condition, created on the
+    first wait and dropped with the last, so an idle waiter costs one blocked
+    thread and no CPU. Coroutines (the ASGI app) wait with wait_async() on an
+    asyncio.Event instead and cost no thread at all. notify() wakes every
+    waiter of a transaction, from any thread.
+    """
+
+    def __init__(self):
+        self._waiters = {} # transaction_id -> _Waiter
+        self._lock = threading.Lock()
+
+    def wait(self, transaction_id, timeout: float, check, recheck_interval: float = None):
+        """
+        Returns check() as soon as it is truthy, or its last (falsy) value
+        after `timeout` seconds.
+
+        check() runs after registering, so a notify() that races with it is
+        never lost. recheck_interval additionally re-runs check() periodically,
+        for results written by another worker process whose notify() cannot
+        reach this one.
+        """
+        with self._lock:
+            waiter = self._waiters.get(transaction_id)
+            if waiter is None:
+                waiter = self._waiters[transaction_id] = _Waiter(self._lock)
+            waiter.count += 1
+            seen_generation = waiter.generation
+        try:
+            deadline = time.monotonic() + timeout
+            result = check()
+            while not result:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if recheck_interval:
+                    remaining = min(remaining, recheck_interval)
+                with self._lock:
+                    if waiter.generation == seen_generation:
+                        waiter.condition.wait(remaining)
+                    seen_generation = waiter.generation
+                result = check()
+            return result
+        finally:
+            with self._lock:
+                waiter.count -= 1
+                if waiter.count == 0 and self._waiters.get(transaction_id) is waiter:
+                    del self._waiters[transaction_id]
+
+    async def wait_async(self, transaction_id, timeout: float, check, recheck_interval: float = None):
+        """
+        Coroutine version of wait(). `check` is a coroutine function; the
+        same ordering guarantees apply.
+        """
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        with self._lock:
+            waiter = self._waiters.get(transaction_id)
+            if waiter is None:
+                waiter = self._waiters[transaction_id] = _Waiter(self._lock)
+            waiter.count += 1
+            waiter.async_events.append((loop, event))
+        try:
+            deadline = loop.time() + timeout
+            result = await check()
+            while not result:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                if recheck_interval:
+                    remaining = min(remaining, recheck_interval)
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                event.clear() # Cleared before check(), so a notify() during it is not lost
+                result = await check()
+            return result
+        finally:
+            with self._lock:
+                waiter.count -= 1
+                waiter.async_events.remove((loop, event))
+                if waiter.count == 0 and self._waiters.get(transaction_id) is waiter:
+                    del self._waiters[transaction_id]
+
+    def notify(self, transaction_id):
+        with self._lock:
+            waiter = self._waiters.get(transaction_id)
+            if waiter is None:
+                return
+            waiter.generation += 1
+            waiter.condition.notify_all()
+            async_events = list(waiter.async_events)
+        for loop, event in async_events:
+            try:
+                loop.call_soon_threadsafe(event.set) # asyncio.Event is not thread-safe
+            except RuntimeError:
+                pass # Loop already closed
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "transactions": len(self._waiters),
+                "waiters": sum(waiter.count for waiter in self._waiters.values()),
+            }
+
+
+search_result_waiters = ResultWaiters()
+select_result_waiters = ResultWaiters()
@@ -0,0 +1,244 @@
+# app/utils/shared_idempotency.py
+#
+# Dedup caches shared by every worker process, used with the shared pending
+# stores (PENDING_BACKEND=sqlite/redis): a retry that lands on another worker
+# than the original still attaches to it or gets its stored response. Both
+# expose the same interface as IdempotencyCache.
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import redis # Optional: only needed for PENDING_BACKEND=redis
+except ImportError:
+    redis = None
+
+from app.utils.idempotency import IN_FLIGHT, COMPLETED, NEW, DUPLICATE_IN_FLIGHT, DUPLICATE_COMPLETED
+
+# Claims between two clean-ups of expired and over-capacity SQLite rows, and
+# the most rows one clean-up statement removes; keeps each write lock short.
+_SWEEP_EVERY = 256
+_SWEEP_BATCH = 256
+
+
+class _Stats:
+    """Per-process outcome counters, same keys as IdempotencyCache's."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {NEW: 0, DUPLICATE_IN_FLIGHT: 0, DUPLICATE_COMPLETED: 0, "forgotten": 0, "evicted": 0}
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            self._counts[key] += amount
+            return self._counts[key]
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._counts)
+        stats["dedup_hits"] = stats[DUPLICATE_IN_FLIGHT] + stats[DUPLICATE_COMPLETED]
+        return stats
+
+
+class SQLiteIdempotencyCache:
+    """
+    Single-host dedup cache in the pending store's SQLite file.
+
+    begin() claims a key with one INSERT OR IGNORE, or one guarded UPDATE for
+    an expired or abandoned record, so of several workers racing on the same
+    retry exactly one gets NEW. Times are wall-clock so they agree across
+    processes. Every `_SWEEP_EVERY` claims, the claiming worker removes
+    expired rows and rows over `max_entries` (oldest first).
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl_seconds: float = 600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._stats = _Stats()
+        self._init_schema()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # Created before fork (see create_app); each worker opens its own.
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+            " action TEXT NOT NULL,"
+            " transaction_id TEXT NOT NULL,"
+            " message_id TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " response BLOB,"
+            " expires_at REAL NOT NULL,"
+            " in_flight_until REAL,"
+            " PRIMARY KEY (action, transaction_id, message_id))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idempotency_keys_expiry ON idempotency_keys (expires_at)")
+
+    def begin(self, action, transaction_id, message_id, in_flight_until=None):
+        key = (action, transaction_id, message_id)
+        conn = self._connection()
+        while True:
+            now = time.time()
+            if conn.execute(
+                "INSERT OR IGNORE INTO idempotency_keys"
+                " (action, transaction_id, message_id, status, response, expires_at, in_flight_until)"
+                " VALUES (?, ?, ?, ?, NULL, ?, ?)",
+                key + (IN_FLIGHT, now + self.ttl_seconds, in_flight_until)
+            ).rowcount:
+                break
+            # An expired record, or one in flight past its transaction deadline, is claimed again
+            if conn.execute(
+                "UPDATE idempotency_keys SET status = ?, response = NULL, expires_at = ?, in_flight_until = ?"
+                " WHERE action = ? AND transaction_id = ? AND message_id = ?"
+                " AND (expires_at < ? OR (status = ? AND in_flight_until < ?))",
+                (IN_FLIGHT, now + self.ttl_seconds, in_flight_until) + key + (now, IN_FLIGHT, now)
+            ).rowcount:
+                break
+            row = conn.execute(
+                "SELECT status, response FROM idempotency_keys WHERE action = ? AND transaction_id = ? AND message_id = ?", key
+            ).fetchone()
+            if row is None:
+                continue # Forgotten in between; claim it
+            if row[0] == COMPLETED:
+                self._stats.incr(DUPLICATE_COMPLETED)
+                return DUPLICATE_COMPLETED, bytes(row[1])
+            self._stats.incr(DUPLICATE_IN_FLIGHT)
+            return DUPLICATE_IN_FLIGHT, None
+
+        if self._stats.incr(NEW) % _SWEEP_EVERY == 0:
+            self._stats.incr("evicted", self.sweep())
+        return NEW, None
+
+    def complete(self, action, transaction_id, message_id, response: bytes):
+        self._connection().execute(
+            "UPDATE idempotency_keys SET status = ?, response = ? WHERE action = ? AND transaction_id = ? AND message_id = ?",
+            (COMPLETED, response, action, transaction_id, message_id)
+        )
+
+    def forget(self, action, transaction_id, message_id):
+        if self._connection().execute(
+            "DELETE FROM idempotency_keys WHERE action = ? AND transaction_id = ? AND message_id = ?",
+            (action, transaction_id, message_id)
+        ).rowcount:
+            self._stats.incr("forgotten")
+
+    def sweep(self):
+        """Removes up to one batch of expired rows and one of rows over capacity."""
+        conn = self._connection()
+        removed = conn.execute(
+            "DELETE FROM idempotency_keys WHERE rowid IN ("
+            " SELECT rowid FROM idempotency_keys WHERE expires_at < ? LIMIT ?)",
+            (time.time(), _SWEEP_BATCH)
+        ).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0] - self.max_entries
+        if excess > 0:
+            removed += conn.execute(
+                "DELETE FROM idempotency_keys WHERE rowid IN ("
+                " SELECT rowid FROM idempotency_keys ORDER BY expires_at LIMIT ?)",
+                (min(excess, _SWEEP_BATCH),)
+            ).rowcount
+        return removed
+
+    def get_stats(self):
+        stats = self._stats.snapshot() # This worker's operations only
+        stats["entries"] = self._connection().execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0]
+        stats["backend"] = "sqlite"
+        stats["path"] = self.path
+        return stats
+
+    def shutdown(self):
+        pass # Per-thread connections close with their threads
+
+
+# Claims the key unless it holds a completed record, or an in-flight one whose
+# transaction deadline (in_flight_until, '' for none) has not passed.
+_BEGIN_SCRIPT = """
+local status = redis.call('HGET', KEYS[1], 'status')
+if status == ARGV[4] then
+    return {status, redis.call('HGET', KEYS[1], 'response')}
+end
+if status == ARGV[3] then
+    local in_flight_until = redis.call('HGET', KEYS[1], 'in_flight_until')
+    if in_flight_until == '' or tonumber(in_flight_until) >= tonumber(ARGV[2]) then
+        return {status}
+    end
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'status', ARGV[3], 'in_flight_until', ARGV[1])
+redis.call('PEXPIRE', KEYS[1], ARGV[5])
+return {'new'}
+"""
+
+# HSET keeps the key's expiry; EXISTS stops a late complete() from recreating a forgotten key.
+_COMPLETE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HSET', KEYS[1], 'status', ARGV[1], 'response', ARGV[2])
+end
+"""
+
+
+class RedisIdempotencyCache:
+    """
+    Multi-instance dedup cache on any Redis-protocol server. Each key is a
+    hash `<prefix><action>:<transaction_id>:<message_id>` expiring after
+    `ttl_seconds`; begin() and complete() are Lua scripts, so a claim is
+    atomic across instances. The server does all eviction.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", key_prefix: str = "bpp:idempotency:",
+                 ttl_seconds: float = 600, client=None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("PENDING_BACKEND=redis but the 'redis' package is not installed.")
+            client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self._client = client
+        self._prefix = key_prefix
+        self._begin = client.register_script(_BEGIN_SCRIPT)
+        self._complete = client.register_script(_COMPLETE_SCRIPT)
+        self._stats = _Stats()
+
+    def _key(self, action, transaction_id, message_id):
+        return f"{self._prefix}{action}:{transaction_id}:{message_id}"
+
+    def begin(self, action, transaction_id, message_id, in_flight_until=None):
+        reply = self._begin(keys=[self._key(action, transaction_id, message_id)],
+                            args=["" if in_flight_until is None else in_flight_until, time.time(),
+                                  IN_FLIGHT, COMPLETED, int(self.ttl_seconds * 1000)])
+        status = reply[0].decode() if isinstance(reply[0], bytes) else reply[0]
+        if status == COMPLETED:
+            self._stats.incr(DUPLICATE_COMPLETED)
+            return DUPLICATE_COMPLETED, reply[1]
+        if status == IN_FLIGHT:
+            self._stats.incr(DUPLICATE_IN_FLIGHT)
+            return DUPLICATE_IN_FLIGHT, None
+        self._stats.incr(NEW)
+        return NEW, None
+
+    def complete(self, action, transaction_id, message_id, response: bytes):
+        self._complete(keys=[self._key(action, transaction_id, message_id)], args=[COMPLETED, response])
+
+    def forget(self, action, transaction_id, message_id):
+        if self._client.delete(self._key(action, transaction_id, message_id)):
+            self._stats.incr("forgotten")
+
+    def get_stats(self):
+        stats = self._stats.snapshot() # This worker's operations only
+        stats["backend"] = "redis"
+        stats["key_prefix"] = self._prefix
+        return stats
+
+    def shutdown(self):
+        self._client.close()
@@ -0,0 +1,331 @@
+# app/utils/shared_pending_store.py
+#
+# Pending-request stores shared by every worker process, so /get_*_results
+# finds a transaction no matter which worker accepted it. Both backends expose
+# the same interface as PendingRequestStore and keep results as JSON bytes.
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import redis # Optional: only needed for PENDING_BACKEND=redis
+except ImportError:
+    redis = None
+
+from app.utils import json_codec
+from app.utils.pending_store import PendingEntry, serialize_payload
+
+logger = logging.getLogger(__name__)
+
+# Rows removed per statement by the SQLite sweeper; keeps each write lock short.
+_SWEEP_BATCH = 256
+
+
+def _encode_meta(callback_uri, criteria, context, created_at, expires_at) -> bytes:
+    return json_codec.dumps({
+        "callback_uri": callback_uri,
+        "criteria": criteria,
+        "context": context,
+        "created_at": created_at,
+        "expires_at": expires_at,
+    })
+
+def _decode_entry(meta_bytes, beckn_response):
+    meta = json_codec.loads(meta_bytes)
+    entry = PendingEntry(meta["callback_uri"], meta["criteria"], meta["context"], meta["expires_at"])
+    entry.created_at = meta["created_at"]
+    entry.status = meta.get("status", "pending")
+    if beckn_response is not None:
+        entry.beckn_response = bytes(beckn_response)
+        entry.payload_bytes = len(entry.beckn_response)
+        entry.status = "completed"
+    return entry
+
+
+class _Counters:
+    """Per-process operation counters for the stats endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {"stored": 0, "completed": 0, "retrieved": 0, "misses": 0}
+
+    def incr(self, key):
+        with self._lock:
+            self._counts[key] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+class SQLitePendingStore:
+    """
+    Single-host store in one SQLite file (WAL mode) shared by all workers.
+
+    Every thread gets its own connection. Expiry uses wall-clock time, so it
+    agrees across processes. Expired rows are invisible to readers and removed,
+    together with rows over `max_entries`, by a background sweeper in small
+    batches; request threads only ever touch their own row.
+    """
+
+    def __init__(self, name: str, path: str, max_entries: int = 10000, ttl_seconds: float = 300,
+                 sweep_interval_seconds: float = 5):
+        self.name = name
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self._local = threading.local()
+        self._counters = _Counters()
+        self._evictions = {"evicted_capacity": 0, "evicted_expired": 0}
+        self._stop_event = threading.Event()
+        self._sweeper = None
+        self._init_schema()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection inherited through fork (gunicorn --preload) must not be reused.
+        if conn is None or self._local.pid != os.getpid():
+            # Autocommit: every statement below is a single atomic write.
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending_requests ("
+            " store TEXT NOT NULL,"
+            " transaction_id TEXT NOT NULL,"
+            " meta BLOB NOT NULL,"
+            " response BLOB,"
+            " created_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " PRIMARY KEY (store, transaction_id))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS pending_requests_expiry ON pending_requests (store, expires_at)")
+
+    def start(self):
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep_loop, name=f"pending-sweeper-{self.name}", daemon=True)
+            self._sweeper.start()
+
+    def put(self, transaction_id, callback_uri, criteria, context):
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        self._connection().execute(
+            "INSERT OR REPLACE INTO pending_requests (store, transaction_id, meta, response, created_at, expires_at)"
+            " VALUES (?, ?, ?, NULL, ?, ?)",
+            (self.name, transaction_id, _encode_meta(callback_uri, criteria, context, now, expires_at), now, expires_at)
+        )
+        self._counters.incr("stored")
+
+    def complete(self, transaction_id, beckn_response) -> bool:
+        cursor = self._connection().execute(
+            "UPDATE pending_requests SET response = ? WHERE store = ? AND transaction_id = ? AND expires_at >= ?",
+            (serialize_payload(beckn_response), self.name, transaction_id, time.time())
+        )
+        if cursor.rowcount:
+            self._counters.incr("completed")
+            return True
+        return False
+
+    def fail(self, transaction_id, status="failed") -> bool:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT meta FROM pending_requests WHERE store = ? AND transaction_id = ? AND response IS NULL",
+            (self.name, transaction_id)
+        ).fetchone()
+        if row is None:
+            return False
+        meta = json_codec.loads(row[0])
+        meta["status"] = status
+        # Guarded on the old meta, so a concurrent complete() or put() wins
+        cursor = conn.execute(
+            "UPDATE pending_requests SET meta = ? WHERE store = ? AND transaction_id = ? AND response IS NULL AND meta = ?",
+            (json_codec.dumps(meta), self.name, transaction_id, row[0])
+        )
+        return cursor.rowcount > 0
+
+    def get(self, transaction_id):
+        row = self._connection().execute(
+            "SELECT meta, response FROM pending_requests WHERE store = ? AND transaction_id = ? AND expires_at >= ?",
+            (self.name, transaction_id, time.time())
+        ).fetchone()
+        return _decode_entry(row[0], row[1]) if row else None
+
+    def peek_result(self, transaction_id):
+        row = self._connection().execute(
+            "SELECT response FROM pending_requests WHERE store = ? AND transaction_id = ? AND response IS NOT NULL AND expires_at >= ?",
+            (self.name, transaction_id, time.time())
+        ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def pop_result(self, transaction_id):
+        # SELECT, then a DELETE whose rowcount decides which of several
+        # concurrent callers gets the result. No DELETE ... RETURNING, which
+        # needs SQLite >= 3.35, and a miss never takes the write lock.
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT response FROM pending_requests WHERE store = ? AND transaction_id = ? AND response IS NOT NULL AND expires_at >= ?",
+            (self.name, transaction_id, time.time())
+        ).fetchone()
+        if row is None or not conn.execute(
+            "DELETE FROM pending_requests WHERE store = ? AND transaction_id = ? AND response IS NOT NULL",
+            (self.name, transaction_id)
+        ).rowcount:
+            self._counters.incr("misses")
+            return None
+        self._counters.incr("retrieved")
+        return bytes(row[0])
+
+    def sweep(self):
+        conn = self._connection()
+        removed_expired = 0
+        while True:
+            deleted = conn.execute(
+                "DELETE FROM pending_requests WHERE rowid IN ("
+                " SELECT rowid FROM pending_requests WHERE store = ? AND expires_at < ? LIMIT ?)",
+                (self.name, time.time(), _SWEEP_BATCH)
+            ).rowcount
+            removed_expired += deleted
+            if deleted < _SWEEP_BATCH:
+                break
+
+        removed_capacity = 0
+        excess = conn.execute("SELECT COUNT(*) FROM pending_requests WHERE store = ?", (self.name,)).fetchone()[0] - self.max_entries
+        while excess > 0:
+            deleted = conn.execute(
+                "DELETE FROM pending_requests WHERE rowid IN ("
+                " SELECT rowid FROM pending_requests WHERE store = ? ORDER BY expires_at LIMIT ?)",
+                (self.name, min(excess, _SWEEP_BATCH))
+            ).rowcount
+            if not deleted:
+                break
+            removed_capacity += deleted
+            excess -= deleted
+
+        self._evictions["evicted_expired"] += removed_expired
+        self._evictions["evicted_capacity"] += removed_capacity
+        return removed_expired + removed_capacity
+
+    def _sweep_loop(self):
+        while not self._stop_event.wait(self.sweep_interval_seconds):
+            try:
+                self.sweep()
+            except sqlite3.Error as e: # Typically a busy database; the next pass retries
+                logger.warning("Pending-request sweep for %s failed: %s", self.name, e)
+
+    def get_stats(self):
+        entries, payload_bytes = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(response)), 0) FROM pending_requests WHERE store = ?", (self.name,)
+        ).fetchone()
+        stats = {"entries": entries, "payload_bytes": payload_bytes}
+        stats.update(self._counters.snapshot()) # This worker's operations only
+        stats.update(self._evictions)
+        stats["backend"] = "sqlite"
+        stats["path"] = self.path
+        stats["capacity"] = self.max_entries
+        stats["ttl_seconds"] = self.ttl_seconds
+        return stats
+
+    def shutdown(self):
+        self._stop_event.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=5)
+            self._sweeper = None
+
+
+class RedisPendingStore:
+    """
+    Multi-instance store on any Redis-protocol server (Redis, Valkey, ...).
+
+    Each transaction is two keys: `<prefix><store>:<id>` holds the metadata
+    and `...:result` the serialized result. Both carry the same absolute
+    expiry, so the server does all TTL eviction; the capacity bound is the
+    server's maxmemory policy. Needs GETDEL (Redis >= 6.2).
+    """
+
+    def __init__(self, name: str, url: str = "redis://localhost:6379/0", key_prefix: str = "bpp:pending:",
+                 ttl_seconds: float = 300, client=None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("PENDING_BACKEND=redis but the 'redis' package is not installed.")
+            client = redis.Redis.from_url(url)
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self._client = client
+        self._prefix = f"{key_prefix}{name}:"
+        self._counters = _Counters()
+
+    def _meta_key(self, transaction_id):
+        return f"{self._prefix}{transaction_id}"
+
+    def _result_key(self, transaction_id):
+        return f"{self._prefix}{transaction_id}:result"
+
+    def start(self):
+        pass # The server expires keys itself
+
+    def put(self, transaction_id, callback_uri, criteria, context):
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        pipe = self._client.pipeline(transaction=True)
+        pipe.set(self._meta_key(transaction_id), _encode_meta(callback_uri, criteria, context, now, expires_at),
+                 pxat=int(expires_at * 1000))
+        pipe.delete(self._result_key(transaction_id))
+        pipe.execute()
+        self._counters.incr("stored")
+
+    def complete(self, transaction_id, beckn_response) -> bool:
+        meta = self._client.get(self._meta_key(transaction_id))
+        if meta is None:
+            return False
+        expires_at = json_codec.loads(meta)["expires_at"]
+        if expires_at <= time.time():
+            return False
+        # Same absolute expiry as the metadata, so a result never outlives its transaction.
+        self._client.set(self._result_key(transaction_id), serialize_payload(beckn_response), pxat=int(expires_at * 1000))
+        self._counters.incr("completed")
+        return True
+
+    def fail(self, transaction_id, status="failed") -> bool:
+        meta_key = self._meta_key(transaction_id)
+        meta = self._client.get(meta_key)
+        if meta is None or self._client.exists(self._result_key(transaction_id)):
+            return False
+        meta = json_codec.loads(meta)
+        meta["status"] = status
+        # xx: never recreate a key that expired in between
+        return bool(self._client.set(meta_key, json_codec.dumps(meta), pxat=int(meta["expires_at"] * 1000), xx=True))
+
+    def get(self, transaction_id):
+        meta, result = self._client.mget(self._meta_key(transaction_id), self._result_key(transaction_id))
+        return _decode_entry(meta, result) if meta is not None else None
+
+    def peek_result(self, transaction_id):
+        return self._client.get(self._result_key(transaction_id))
+
+    def pop_result(self, transaction_id):
+        result = self._client.getdel(self._result_key(transaction_id))
+        if result is None:
+            self._counters.incr("misses")
+            return None
+        self._client.delete(self._meta_key(transaction_id))
+        self._counters.incr("retrieved")
+        return result
+
+    def get_stats(self):
+        stats = self._counters.snapshot() # This worker's operations only
+        stats["backend"] = "redis"
+        stats["key_prefix"] = self._prefix
+        stats["ttl_seconds"] = self.ttl_seconds
+        return stats
+
+    def shutdown(self):
+        self._client.close()
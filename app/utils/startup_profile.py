@@ -0,0 +1,50 @@
+# app/utils/startup_profile.py
+import os
+import threading
+import time
+
+
+class StartupProfile:
+    """
+    Wall-clock breakdown of process startup, for the startup report.
+
+    lap(name) records the time since the previous lap (or since the profile
+    was created) as phase `name`, so startup code only needs one line after
+    each section. record() adds a phase measured elsewhere, e.g. by the
+    warmup thread. A forked worker inherits the master's phases and appends
+    its own.
+    """
+
+    def __init__(self):
+        self._phases = [] # (name, seconds, pid)
+        self._lock = threading.Lock()
+        self._last_lap = time.perf_counter()
+
+    def restart_lap(self):
+        """Starts timing the next lap from now (e.g. at the start of a worker)."""
+        self._last_lap = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.record(name, now - self._last_lap)
+        self._last_lap = now
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._phases.append((name, seconds, os.getpid()))
+
+    def get_report(self):
+        with self._lock:
+            phases = list(self._phases)
+        return {
+            "phases": [{"name": name, "ms": round(seconds * 1000, 2), "pid": pid} for name, seconds, pid in phases],
+            "total_ms": round(sum(seconds for _, seconds, _ in phases) * 1000, 2),
+        }
+
+    def format_report(self):
+        report = self.get_report()
+        parts = ", ".join(f"{phase['name']} {phase['ms']:.0f} ms" for phase in report["phases"])
+        return f"{parts}; total {report['total_ms']:.0f} ms"
+
+
+startup_profile = StartupProfile()
@@ -0,0 +1,438 @@
+# app/utils/tracing.py
+#
+# Transaction-scoped tracing. A Beckn transaction is one trace: its id comes
+# from an incoming W3C `traceparent` header, or else is derived from the
+# transaction_id, so /search, /select, retries and every worker process of
+# one transaction land in the same trace without coordination. Every span
+# carries beckn.transaction_id and beckn.message_id.
+#
+# Spans cross thread hops explicitly: bind_to_current_span() for scheduler
+# jobs and CallbackJob.trace_parent for callback delivery. Outbound callbacks
+# carry a `traceparent` header.
+#
+# Exporters (TRACING_EXPORTER): 'off' (default, no spans are created),
+# 'memory' (only the recent-transactions buffer behind /admin/traces/<id>),
+# 'file' (JSON lines) or 'otlp' (OTLP/HTTP JSON, e.g. an OpenTelemetry
+# Collector on :4318). Finished spans are exported in batches from a
+# background thread; the request path only appends to a queue.
+import contextlib
+import contextvars
+import functools
+import hashlib
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+from app.utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+tracer = None
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# perf_counter() readings (what the code already measures) -> epoch nanoseconds
+_EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+
+_TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# OTLP span kinds and status codes
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+_INHERITED_ATTRIBUTES = ("beckn.transaction_id", "beckn.message_id")
+
+_NOOP_SPAN = contextlib.nullcontext()
+
+
+def _perf_to_epoch_ns(perf_seconds):
+    return _EPOCH_OFFSET_NS + int(perf_seconds * 1e9)
+
+def _new_span_id():
+    return os.urandom(8).hex()
+
+def trace_id_for_transaction(transaction_id):
+    """Deterministic trace id, so every process derives the same one."""
+    return hashlib.sha256(str(transaction_id).encode("utf-8")).hexdigest()[:32]
+
+def parse_traceparent(header):
+    """Returns (trace_id, parent_span_id, sampled) or None for a missing/invalid header."""
+    if not header:
+        return None
+    match = _TRACEPARENT_PATTERN.match(header.strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns",
+                 "attributes", "status", "error", "sampled")
+
+    def __init__(self, trace_id, parent_id, name, kind, start_ns, attributes, sampled):
+        self.trace_id = trace_id
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = STATUS_UNSET
+        self.error = None
+        self.sampled = sampled
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def as_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_unix_nano": self.start_ns,
+            "end_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": "error" if self.status == STATUS_ERROR else "unset",
+            "error": self.error,
+        }
+
+
+class FileSpanExporter:
+    """Appends finished spans as JSON lines; one write() per batch, so workers can share a file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        data = b"".join(json_codec.dumps(span.as_dict()) + b"\n" for span in spans)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def shutdown(self):
+        pass
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class OTLPHttpSpanExporter:
+    """POSTs batches to an OTLP/HTTP traces endpoint using the JSON encoding."""
+
+    def __init__(self, endpoint, service_name, timeout_seconds: float = 5):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout_seconds = timeout_seconds
+        self._session = requests.Session() # Separate from the callback client and its pool limits
+
+    def _encode(self, spans):
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": span.kind,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+                "status": {"code": span.status, "message": span.error or ""},
+            }
+            if span.parent_id:
+                otlp_span["parentSpanId"] = span.parent_id
+            otlp_spans.append(otlp_span)
+        return json_codec.dumps({"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "bpp-server"}, "spans": otlp_spans}],
+        }]})
+
+    def export(self, spans):
+        response = self._session.post(self.endpoint, data=self._encode(spans), timeout=self.timeout_seconds,
+                                      headers={"Content-Type": "application/json"})
+        response.raise_for_status()
+
+    def shutdown(self):
+        self._session.close()
+
+
+class Tracer:
+    """
+    Creates spans, keeps the last `recent_transactions` transactions' spans
+    in memory and hands sampled spans to `exporter` (may be None) from a
+    background batching thread. When the export queue is full, spans are
+    dropped and counted rather than slowing requests down.
+    """
+
+    def __init__(self, exporter=None, sample_rate: float = 1.0, recent_transactions: int = 1000,
+                 export_interval_seconds: float = 1.0, max_queue: int = 10000, batch_size: int = 512):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.recent_transactions = recent_transactions
+        self.export_interval_seconds = export_interval_seconds
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._recent = OrderedDict() # transaction_id -> [Span], oldest first
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._stats = {"spans": 0, "exported": 0, "dropped": 0, "export_errors": 0}
+
+    def start(self):
+        if self.exporter is not None and self._thread is None:
+            self._thread = threading.Thread(target=self._export_loop, name="span-exporter", daemon=True)
+            self._thread.start()
+
+    def _is_sampled(self, trace_id):
+        # From the trace id, so every process makes the same decision for a transaction.
+        return int(trace_id[:8], 16) < self.sample_rate * 0x100000000
+
+    def new_span(self, name, parent=None, traceparent=None, kind=KIND_INTERNAL, start_perf=None, attributes=None):
+        span_attributes = {}
+        if parent is not None:
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+            for key in _INHERITED_ATTRIBUTES:
+                if key in parent.attributes:
+                    span_attributes[key] = parent.attributes[key]
+        else:
+            remote = parse_traceparent(traceparent)
+            if remote is not None:
+                trace_id, parent_id, sampled = remote # The caller's sampling decision wins
+            else:
+                transaction_id = (attributes or {}).get("beckn.transaction_id")
+                trace_id = trace_id_for_transaction(transaction_id) if transaction_id else os.urandom(16).hex()
+                parent_id, sampled = None, self._is_sampled(trace_id)
+        if attributes:
+            span_attributes.update((key, value) for key, value in attributes.items() if value is not None)
+        start_ns = _perf_to_epoch_ns(start_perf) if start_perf is not None else time.time_ns()
+        return Span(trace_id, parent_id, name, kind, start_ns, span_attributes, sampled)
+
+    def finish(self, span, end_perf=None):
+        span.end_ns = _perf_to_epoch_ns(end_perf) if end_perf is not None else time.time_ns()
+        transaction_id = span.attributes.get("beckn.transaction_id")
+        with self._lock:
+            self._stats["spans"] += 1
+            if transaction_id is not None:
+                spans = self._recent.get(transaction_id)
+                if spans is None:
+                    spans = self._recent[transaction_id] = []
+                    if len(self._recent) > self.recent_transactions:
+                        self._recent.popitem(last=False)
+                spans.append(span)
+        if self.exporter is not None and span.sampled:
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                with self._lock:
+                    self._stats["dropped"] += 1
+
+    def get_transaction_spans(self, transaction_id):
+        with self._lock:
+            spans = list(self._recent.get(transaction_id, ()))
+        return sorted((span.as_dict() for span in spans), key=lambda span: span["start_unix_nano"])
+
+    def _drain(self, first=None):
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _export_batch(self, batch):
+        if not batch:
+            return
+        try:
+            self.exporter.export(batch)
+            with self._lock:
+                self._stats["exported"] += len(batch)
+        except Exception as e: # Collector down or disk full: drop this batch, keep serving
+            with self._lock:
+                self._stats["export_errors"] += 1
+                self._stats["dropped"] += len(batch)
+            logger.warning("Exporting %d spans failed: %s", len(batch), e)
+
+    def _export_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                first = self._queue.get(timeout=self.export_interval_seconds)
+            except queue.Empty:
+                continue
+            self._export_batch(self._drain(first))
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["recent_transactions"] = len(self._recent)
+        stats["queued"] = self._queue.qsize()
+        stats["exporter"] = type(self.exporter).__name__ if self.exporter is not None else None
+        stats["sample_rate"] = self.sample_rate
+        return stats
+
+    def shutdown(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self.exporter is not None:
+            while not self._queue.empty():
+                self._export_batch(self._drain())
+            self.exporter.shutdown()
+
+
+# --- Instrumentation API: every function is a cheap no-op while tracing is off ---
+
+def current_span():
+    return _current_span.get() if tracer is not None else None
+
+def start_span(name, parent=None, traceparent=None, kind=KIND_INTERNAL, start_perf=None, transaction_id=None,
+               message_id=None, attributes=None):
+    """
+    Context manager yielding a Span (or None when tracing is off) that is the
+    current span inside the block. Without `parent`, the current span is the
+    parent; without either, a new trace starts. An exception marks the span
+    as failed and is re-raised.
+    """
+    if tracer is None:
+        return _NOOP_SPAN
+    span_attributes = dict(attributes) if attributes else {}
+    if transaction_id is not None:
+        span_attributes["beckn.transaction_id"] = transaction_id
+    if message_id is not None:
+        span_attributes["beckn.message_id"] = message_id
+    return _active_span(tracer.new_span(name, parent or _current_span.get(), traceparent, kind, start_perf, span_attributes))
+
+@contextlib.contextmanager
+def _active_span(span):
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.status = STATUS_ERROR
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        if tracer is not None:
+            tracer.finish(span)
+
+def record_span(name, start_perf, end_perf, attributes=None, kind=KIND_INTERNAL, parent=None, error=None):
+    """
+    Records an already-timed section (perf_counter() readings) as a child of
+    `parent` or the current span. Does nothing outside a trace.
+    """
+    if tracer is None:
+        return
+    parent = parent or _current_span.get()
+    if parent is None:
+        return
+    span = tracer.new_span(name, parent, kind=kind, start_perf=start_perf, attributes=attributes)
+    if error is not None:
+        span.status = STATUS_ERROR
+        span.error = error
+    tracer.finish(span, end_perf=end_perf)
+
+def mark_current_span_failed(error):
+    """For failures that are handled (logged) rather than raised out of the span."""
+    span = current_span()
+    if span is not None:
+        span.status = STATUS_ERROR
+        span.error = f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else str(error)
+
+def bind_to_current_span(func, queue_span_name="scheduler.queue_wait"):
+    """
+    Wraps `func` so that, when it later runs on another thread, the current
+    span here is its parent. The time until it starts is recorded as
+    `queue_span_name`.
+    """
+    parent = current_span()
+    if parent is None:
+        return func
+    enqueued_at = time.perf_counter()
+
+    @functools.wraps(func)
+    def run_in_span(*args, **kwargs):
+        record_span(queue_span_name, enqueued_at, time.perf_counter(), parent=parent)
+        token = _current_span.set(parent)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+    return run_in_span
+
+def traced(name, kind=KIND_INTERNAL):
+    """Decorator: runs the function inside a child span of the current span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if tracer is None or _current_span.get() is None:
+                return func(*args, **kwargs)
+            with start_span(name, kind=kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _build_exporter(config):
+    exporter = config.get('TRACING_EXPORTER', 'off')
+    if exporter == 'memory':
+        return None
+    if exporter == 'file':
+        return FileSpanExporter(config.get('TRACING_FILE_PATH', '/tmp/bpp-spans.jsonl'))
+    if exporter == 'otlp':
+        return OTLPHttpSpanExporter(config.get('TRACING_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces'),
+                                    config.get('TRACING_SERVICE_NAME', 'bpp-server'))
+    raise ValueError(f"Unknown TRACING_EXPORTER '{exporter}'. Expected 'off', 'memory', 'file' or 'otlp'.")
+
+def initialize_tracing(app):
+    """
+    Creates this process's tracer unless TRACING_EXPORTER is 'off'.
+    This should be called once per serving process (after fork).
+    """
+    global tracer
+    if app.config.get('TRACING_EXPORTER', 'off') == 'off':
+        return None
+    if tracer is None:
+        tracer = Tracer(
+            exporter=_build_exporter(app.config),
+            sample_rate=app.config.get('TRACING_SAMPLE_RATE', 1.0),
+            recent_transactions=app.config.get('TRACING_RECENT_TRANSACTIONS', 1000),
+            export_interval_seconds=app.config.get('TRACING_EXPORT_INTERVAL_SECONDS', 1.0)
+        )
+        tracer.start()
+        app.logger.info("Tracing enabled: exporter=%s, sample rate %.3f.", app.config.get('TRACING_EXPORTER'), tracer.sample_rate)
+    return tracer
+
+def get_tracer():
+    return tracer
+
+def shutdown_tracing(app=None):
+    """Exports what is still queued."""
+    global tracer
+    if tracer is not None:
+        tracer.shutdown()
+        tracer = None
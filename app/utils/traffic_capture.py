@@ -0,0 +1,228 @@
+# app/utils/traffic_capture.py
+#
+# Opt-in capture of sampled /search and /select bodies, for replaying real
+# traffic offline with benchmarks/replay_traffic.py. Each captured request
+# is one compact JSON line:
+#
+#   {"t": <arrival, epoch seconds>, "action": "search", "body": {...}}
+#
+# Sampling is by transaction_id, so when a search is captured its select is
+# too and the replay keeps the search -> select flow. The request thread only
+# enqueues the body; a writer thread scrubs personal data (contact, billing,
+# addresses, GPS, emails and phone numbers in free text, plus whatever
+# TRAFFIC_CAPTURE_SCRUB_PATTERN matches) and appends each
+# batch with a single O_APPEND write, so all workers can share one file.
+# When the queue is full, or the file has reached TRAFFIC_CAPTURE_MAX_BYTES,
+# requests are dropped from the capture and counted; the ACK never waits.
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+
+from app.utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+traffic_capture = None
+
+REDACTED = "[redacted]"
+
+# Subtrees replaced wholesale, matched on the last segment of the key ("@ondc/org/settlement_details" -> "settlement_details").
+_PII_KEYS = frozenset({
+    "address", "gps", "contact", "phone", "email", "billing", "customer", "person", "tax_number",
+    "settlement_details", "bank_account_number", "beneficiary_name", "upi_address", "card", "authorization",
+})
+_EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+# Phone-number candidates in any national or international format ("+44 20 7946 0958", "(555) 123-4567",
+# "98765 43210"); only runs of 9 to 15 digits (E.164's longest) are redacted, which leaves dates and prices alone.
+# The first alternative matches the query grammar's price parts ("price 5000 - 15000", "price:10000-50000",
+# "price > 1000", see parse_query_string), which are kept so that replayed traffic keeps its price filters.
+_PHONE_PATTERN = re.compile(
+    r"(?P<price>\bprice\s*(?:[:=]|[<>]=?)?\s*\d+(?:\.\d+)?(?:\s*(?:-|to)\s*\d+(?:\.\d+)?)?)"
+    r"|(?<![\w+-])\+?(?:\(\d{1,4}\)|\d)[\d\s().-]{6,22}\d(?![\w-])",
+    re.IGNORECASE
+)
+_PHONE_DIGITS = range(9, 16)
+_SPACED_DASH = re.compile(r"\s-|-\s") # "5000 - 15000" is a range of two numbers, not one phone number
+
+
+def _redact_phone(match):
+    text = match.group()
+    if match.group("price") or _SPACED_DASH.search(text):
+        return text
+    return REDACTED if sum(c.isdigit() for c in text) in _PHONE_DIGITS else text
+
+def _scrub_text(value, extra_pattern=None):
+    if "@" in value:
+        value = _EMAIL_PATTERN.sub(REDACTED, value)
+    value = _PHONE_PATTERN.sub(_redact_phone, value)
+    return extra_pattern.sub(REDACTED, value) if extra_pattern is not None else value
+
+def scrub_pii(value, key=None, extra_pattern=None):
+    """
+    A copy of `value` with personal data replaced by "[redacted]". Identifier
+    fields (keys ending in "id") are kept as they are; replay needs them.
+    `extra_pattern` is a compiled regex redacted in free text besides emails
+    and phone numbers.
+    """
+    if isinstance(value, dict):
+        return {k: REDACTED if isinstance(k, str) and k.rsplit("/", 1)[-1].lower() in _PII_KEYS
+                else scrub_pii(v, k, extra_pattern) for k, v in value.items()}
+    if isinstance(value, list):
+        return [scrub_pii(item, key, extra_pattern) for item in value]
+    if isinstance(value, str) and not (isinstance(key, str) and key.lower().endswith("id")):
+        return _scrub_text(value, extra_pattern)
+    return value
+
+def scrub_body(body, extra_pattern=None):
+    """Scrubs message; the Beckn context carries only ids, URIs and routing fields and is kept."""
+    if not isinstance(body, dict):
+        return scrub_pii(body, extra_pattern=extra_pattern)
+    scrubbed = dict(body)
+    if "message" in scrubbed:
+        scrubbed["message"] = scrub_pii(scrubbed["message"], extra_pattern=extra_pattern)
+    return scrubbed
+
+
+class TrafficCapture:
+    """
+    Appends sampled request bodies to `path` as JSON lines from a background
+    thread. Bodies are queued untouched and scrubbed on the writer thread, so
+    they must not be mutated after record() (the request path never does).
+    """
+
+    def __init__(self, path, sample_rate: float = 0.01, max_bytes: int = 1 << 30, max_queue: int = 10000,
+                 flush_interval_seconds: float = 1.0, batch_size: int = 512, scrub_pattern=None):
+        self.path = path
+        self.scrub_pattern = re.compile(scrub_pattern) if scrub_pattern else None
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.flush_interval_seconds = flush_interval_seconds
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._full = False
+        self._stats = {"written": 0, "dropped_queue_full": 0, "dropped_max_bytes": 0, "write_errors": 0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._write_loop, name="traffic-capture", daemon=True)
+            self._thread.start()
+
+    def is_sampled(self, transaction_id):
+        # From the transaction id, so every worker makes the same decision for a search and its select.
+        if transaction_id is None:
+            return False
+        return zlib.crc32(str(transaction_id).encode("utf-8")) < self.sample_rate * 0x100000000
+
+    def record(self, action, body, arrived_at=None):
+        """Queues `body` for capture if its transaction is sampled. Cheap when it is not."""
+        context = body.get("context") if isinstance(body, dict) else None
+        if self._full or not isinstance(context, dict) or not self.is_sampled(context.get("transaction_id")):
+            return
+        try:
+            self._queue.put_nowait((arrived_at if arrived_at is not None else time.time(), action, body))
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped_queue_full"] += 1
+
+    def _drain(self, first=None):
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        try:
+            data = b"".join(
+                json_codec.dumps({"t": round(arrived_at, 6), "action": action, "body": scrub_body(body, self.scrub_pattern)}) + b"\n"
+                for arrived_at, action, body in batch
+            )
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                if os.fstat(fd).st_size + len(data) > self.max_bytes:
+                    self._full = True
+                    with self._lock:
+                        self._stats["dropped_max_bytes"] += len(batch)
+                    logger.warning("Traffic capture file %s reached %d bytes; capture stopped in pid %d.", self.path, self.max_bytes, os.getpid())
+                    return
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+            with self._lock:
+                self._stats["written"] += len(batch)
+        except Exception as e: # Disk full or an unserializable body: drop this batch, keep serving
+            with self._lock:
+                self._stats["write_errors"] += 1
+            logger.warning("Writing %d captured requests to %s failed: %s", len(batch), self.path, e)
+
+    def _write_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval_seconds)
+            except queue.Empty:
+                continue
+            self._write_batch(self._drain(first))
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        stats["path"] = self.path
+        stats["sample_rate"] = self.sample_rate
+        stats["stopped_at_max_bytes"] = self._full
+        return stats
+
+    def shutdown(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        while not self._queue.empty():
+            self._write_batch(self._drain())
+
+
+def capture_request(action, body):
+    """Called by the /search and /select handlers on arrival; a no-op unless capture is enabled."""
+    if traffic_capture is not None:
+        traffic_capture.record(action, body)
+
+def initialize_traffic_capture(app):
+    """
+    Starts this process's capture writer if TRAFFIC_CAPTURE_ENABLED is set.
+    This should be called once per serving process (after fork).
+    """
+    global traffic_capture
+    if not app.config.get('TRAFFIC_CAPTURE_ENABLED'):
+        return None
+    if traffic_capture is None:
+        traffic_capture = TrafficCapture(
+            path=app.config.get('TRAFFIC_CAPTURE_PATH', '/tmp/bpp-traffic.jsonl'),
+            sample_rate=app.config.get('TRAFFIC_CAPTURE_SAMPLE_RATE', 0.01),
+            max_bytes=app.config.get('TRAFFIC_CAPTURE_MAX_BYTES', 1 << 30),
+            scrub_pattern=app.config.get('TRAFFIC_CAPTURE_SCRUB_PATTERN')
+        )
+        traffic_capture.start()
+        app.logger.warning("Traffic capture enabled in pid %d: %.1f%% of transactions appended to %s (PII scrubbed).",
+                           os.getpid(), traffic_capture.sample_rate * 100, traffic_capture.path)
+    return traffic_capture
+
+def get_traffic_capture():
+    return traffic_capture
+
+def shutdown_traffic_capture(app=None):
+    """Writes what is still queued."""
+    global traffic_capture
+    if traffic_capture is not None:
+        traffic_capture.shutdown()
+        traffic_capture = None
@@ -0,0 +1,232 @@
+# app/utils/warmup.py
+#
+# Per-process readiness warmup: everything the first /search would otherwise
+# pay for (DB connections, the search service and its SDK import, callback ID
+# tokens and, when WARMUP_EMBEDDING is set, the first embedding call) is done
+# before /readyz reports ready.
+import threading
+import time
+
+from app.utils.deadline import Deadline
+from app.utils.startup_profile import startup_profile
+
+warmup = None
+
+PENDING = "pending"
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed" # A required step failed and is being retried
+
+
+def import_sdk_modules():
+    """
+    Imports the SDKs that are otherwise loaded on first use. Used when the
+    app is preloaded, so forked workers share the modules instead of each
+    importing them again.
+    """
+    from app.services.product_search_service import load_genai
+    load_genai()
+
+
+def _warm_db_connections(app):
+    # The pool opens DB_POOL_MIN_CONNECTIONS eagerly; hold several at once so
+    # that distinct connections are opened, and run a query on each.
+    from app.db.db_pool_manager import get_db_connection, put_db_connection
+    count = min(app.config.get('WARMUP_DB_CONNECTIONS', 2), app.config.get('DB_POOL_MAX_CONNECTIONS', 10))
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(get_db_connection()) # Also registers the pgvector type
+        for connection in connections:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+    finally:
+        for connection in connections:
+            put_db_connection(connection)
+
+def _warm_search_service(app):
+    from app.services.search_service import SearchService
+    SearchService._get_product_search_service() # Imports the embedding SDK and configures it
+
+def _warm_embedding(app):
+    from app.services.search_service import SearchService
+    deadline = Deadline.after(app.config.get('WARMUP_EMBEDDING_TIMEOUT_SECONDS', 10))
+    if SearchService._get_product_search_service().get_embedding("warmup", deadline=deadline) is None:
+        raise RuntimeError("Embedding call returned no result.")
+
+def _warm_attribute_dictionary(app):
+    # Brands and article types for the query parser's recognizer come from the catalog
+    from app.db.db_pool_manager import get_db_connection, put_db_connection
+    from app.services.attribute_dictionary import load_attribute_dictionary
+    connection = get_db_connection()
+    try:
+        dictionary = load_attribute_dictionary(connection, app.config.get('ATTRIBUTE_DICTIONARY_MAX_VALUES', 500))
+    finally:
+        put_db_connection(connection)
+    app.logger.info("Attribute dictionary loaded from the catalog: %s", dictionary.get_stats())
+
+def _warm_ann_partitions(app):
+    from app.db.ann_partitions import get_ann_router
+    ann_router = get_ann_router()
+    if ann_router is not None:
+        ann_router.refresh_from_pool(app)
+
+def _warm_id_tokens(app):
+    from app.utils.id_token_manager import get_id_token_manager
+    for audience in app.config.get('WARMUP_CALLBACK_AUDIENCES', []):
+        get_id_token_manager().prime(audience)
+
+
+class WarmupStep:
+    __slots__ = ("name", "func", "required")
+
+    def __init__(self, name, func, required):
+        self.name = name
+        self.func = func
+        self.required = required # Readiness waits for required steps to succeed
+
+
+def build_warmup_steps(config):
+    """
+    The steps enabled by config, in order. Optional steps only save the first
+    request some latency, so their failure is logged but does not block
+    readiness.
+    """
+    steps = []
+    if config.get('WARMUP_DB_CONNECTIONS', 2) > 0:
+        steps.append(WarmupStep("db_connections", _warm_db_connections, required=True))
+    steps.append(WarmupStep("search_service", _warm_search_service, required=True))
+    if config.get('WARMUP_EMBEDDING', False):
+        steps.append(WarmupStep("embedding", _warm_embedding, required=False))
+    if config.get('WARMUP_DB_CONNECTIONS', 2) > 0 and config.get('ATTRIBUTE_DICTIONARY_MAX_VALUES', 500) > 0:
+        steps.append(WarmupStep("attribute_dictionary", _warm_attribute_dictionary, required=False))
+    if config.get('WARMUP_DB_CONNECTIONS', 2) > 0 and config.get('ANN_ROUTING_ENABLED', True):
+        steps.append(WarmupStep("ann_partitions", _warm_ann_partitions, required=False))
+    if config.get('WARMUP_CALLBACK_AUDIENCES'):
+        steps.append(WarmupStep("id_tokens", _warm_id_tokens, required=False))
+    return steps
+
+
+class Warmup:
+    """
+    Runs the warmup steps once per process, in a background thread or inline,
+    retrying failed required steps every `retry_interval_seconds` until they
+    succeed. is_ready() gates /readyz.
+
+    Inline runs stop blocking after `blocking_timeout_seconds`: the process
+    then starts serving as not ready and the retries go on in the background,
+    so a DB outage at boot does not hang workers until gunicorn kills them.
+    """
+
+    def __init__(self, app, steps, retry_interval_seconds: float = 5):
+        self.app = app
+        self.steps = steps
+        self.retry_interval_seconds = retry_interval_seconds
+        self.state = PENDING
+        self._results = {} # step name -> {"status", "ms", "attempts", "error"}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._started_at = None
+        self._finished_at = None
+
+    def start(self, background: bool = True, blocking_timeout_seconds: float = 30):
+        self._started_at = time.perf_counter()
+        if background:
+            self._thread = threading.Thread(target=self._run, name="startup-warmup", daemon=True)
+            self._thread.start()
+        else:
+            self._run(block_until=time.monotonic() + blocking_timeout_seconds)
+
+    def _run_step(self, step):
+        with self._lock:
+            result = self._results.setdefault(step.name, {"status": PENDING, "ms": None, "attempts": 0, "error": None})
+            result["attempts"] += 1
+        step_start = time.perf_counter()
+        try:
+            with self.app.app_context():
+                step.func(self.app)
+            status, error = "ok", None
+        except Exception as e:
+            status, error = "failed", str(e)
+            log = self.app.logger.error if step.required else self.app.logger.warning
+            log("Warmup step '%s' failed: %s", step.name, e)
+        elapsed = time.perf_counter() - step_start
+        with self._lock:
+            result.update(status=status, ms=round(elapsed * 1000, 2), error=error)
+        if status == "ok":
+            startup_profile.record(f"warmup.{step.name}", elapsed)
+        return status == "ok"
+
+    def _run(self, block_until=None):
+        self.state = RUNNING
+        pending = [step for step in self.steps if not self._run_step(step) and step.required]
+        self._retry(pending, block_until)
+
+    def _retry(self, pending, block_until=None):
+        while pending:
+            self.state = FAILED
+            if block_until is not None and time.monotonic() + self.retry_interval_seconds > block_until:
+                self.app.logger.error("Warmup steps %s still failing after the blocking timeout; serving as not ready and retrying in the background.",
+                                      ", ".join(step.name for step in pending))
+                self._thread = threading.Thread(target=self._retry, args=(pending,), name="startup-warmup", daemon=True)
+                self._thread.start()
+                return
+            if self._stop_event.wait(self.retry_interval_seconds):
+                return
+            pending = [step for step in pending if not self._run_step(step)]
+        self._finished_at = time.perf_counter()
+        self.state = READY
+        self.app.logger.info("Warmup finished in %.0f ms; ready. Startup breakdown: %s",
+                             (self._finished_at - self._started_at) * 1000, startup_profile.format_report())
+
+    def is_ready(self) -> bool:
+        return self.state == READY
+
+    def get_report(self):
+        with self._lock:
+            steps = {name: dict(result) for name, result in self._results.items()}
+        report = {"state": self.state, "steps": steps}
+        if self._finished_at is not None:
+            report["warmup_ms"] = round((self._finished_at - self._started_at) * 1000, 2)
+        return report
+
+    def shutdown(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+def initialize_warmup(app):
+    """
+    Creates and starts this process's warmup according to WARMUP_MODE:
+    'background' (serve at once, /readyz turns ready when done), 'blocking'
+    (finish before returning) or 'off' (ready immediately).
+    This should be called only once per process, after the DB pool exists.
+    """
+    global warmup
+    if warmup is None:
+        mode = app.config.get('WARMUP_MODE', 'background')
+        if mode not in ('background', 'blocking', 'off'):
+            raise ValueError(f"Unknown WARMUP_MODE '{mode}'. Expected 'background', 'blocking' or 'off'.")
+        steps = build_warmup_steps(app.config) if mode != 'off' else []
+        warmup = Warmup(app, steps, retry_interval_seconds=app.config.get('WARMUP_RETRY_SECONDS', 5))
+        app.logger.info("Starting warmup (%s): %s.", mode, ", ".join(step.name for step in steps) or "no steps")
+        warmup.start(background=mode == 'background', blocking_timeout_seconds=app.config.get('WARMUP_BLOCKING_TIMEOUT_SECONDS', 30))
+    return warmup
+
+def get_warmup():
+    """
+    Returns this process's warmup, or None before init_process_resources()
+    (e.g. in a preloading gunicorn master).
+    """
+    return warmup
+
+def shutdown_warmup(app=None):
+    """Stops a warmup that is still retrying."""
+    global warmup
+    if warmup is not None:
+        warmup.shutdown()
+        warmup = None
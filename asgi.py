@@ -0,0 +1,11 @@
+# asgi.py
+#
+# ASGI entry point: `uvicorn asgi:app --host 0.0.0.0 --port 8080`.
+# run.py / gunicorn serve the same app over WSGI; see app/asgi_app.py.
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.asgi_app import create_asgi_app
+
+app = create_asgi_app()
@@ -0,0 +1,26 @@
+# benchmarks/ack_app.py
+"""
+WSGI entry point for benchmarking the ACK path under gunicorn without a
+database: the DB pool is not opened, background search/select work is not
+started and there is no warmup. Everything else (config, logging, stores, dedup, JSON) is the
+real app.
+
+    gunicorn -c gunicorn.conf.py benchmarks.ack_app:app
+"""
+import logging
+import os
+
+os.environ.setdefault('FLASK_ENV', 'testing')
+os.environ.setdefault('ID_TOKEN_SOURCE', 'fake')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('WARMUP_MODE', 'off') # Nothing to warm without a DB
+
+import app as app_package
+from app.services import beckn_intake_service
+
+app_package.initialize_db_pool = lambda flask_app: None
+beckn_intake_service.run_async_task = lambda *args, **kwargs: True
+beckn_intake_service.run_async_select_task = lambda *args, **kwargs: True
+
+app = app_package.create_app()
+logging.getLogger().setLevel(os.environ['LOG_LEVEL'])
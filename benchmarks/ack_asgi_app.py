@@ -0,0 +1,11 @@
+# benchmarks/ack_asgi_app.py
+"""
+ASGI counterpart of benchmarks.ack_app (same stubs: no DB, no background
+search/select work), served through app.asgi_app.
+
+    uvicorn benchmarks.ack_asgi_app:app
+"""
+from benchmarks.ack_app import app as flask_app
+from app.asgi_app import create_asgi_app
+
+app = create_asgi_app(flask_app)
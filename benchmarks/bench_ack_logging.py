@@ -0,0 +1,126 @@
+# benchmarks/bench_ack_logging.py
+"""
+Measures /search ACK latency through the real Flask view under different
+logging setups. Background work is stubbed out so only the synchronous ACK
+path (parsing, logging, ACK rendering) is timed; log output goes to a
+temporary file so real write() calls happen. --write-latency-us adds a delay
+to every write to mimic a slow sink (a full stderr pipe, a container log
+driver under pressure), which is where the queue handler pays off.
+
+  legacy          synchronous handler, every body logged with json.dumps(indent=2)
+  sync            synchronous handler, every body logged lazily (LazyJSON)
+  async           QueueHandler/QueueListener, every body logged lazily
+  async+sampled   QueueHandler/QueueListener, bodies sampled at search=0.01
+
+Usage (from the project root):
+    python -m benchmarks.bench_ack_logging [--requests 2000] [--format text|json] [--write-latency-us 0]
+"""
+import argparse
+import json
+import logging
+import statistics
+import tempfile
+import time
+
+from flask import Flask, request, current_app
+
+from app.controllers import beckn_controller
+from app.services import beckn_intake_service
+from app.utils import logging_setup
+from app.utils.json_codec import FastJSONProvider
+from benchmarks.bench_json_codec import build_context
+
+MODES = {
+    # name: (LOG_ASYNC, LOG_PAYLOAD_SAMPLE_RATES, legacy eager body logging)
+    "legacy": (False, "*=0", True),
+    "sync": (False, "*=1.0", False),
+    "async": (True, "*=1.0", False),
+    "async+sampled": (True, "search=0.01,*=0", False),
+}
+
+
+class SlowStream:
+    """File wrapper that sleeps before every write."""
+
+    def __init__(self, stream, write_latency_seconds):
+        self.stream = stream
+        self.write_latency_seconds = write_latency_seconds
+
+    def write(self, data):
+        time.sleep(self.write_latency_seconds)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def build_search_body():
+    context = build_context()
+    return {
+        "context": context,
+        "message": {
+            "intent": {
+                "item": {"descriptor": {"name": "navy blue slim fit cotton shirt for men under 1500"}},
+                "fulfillment": {"type": "Delivery", "end": {"location": {"gps": "12.9716,77.5946", "address": {"area_code": "560001"}}}},
+                "payment": {"@ondc/org/buyer_app_finder_fee_type": "percent", "@ondc/org/buyer_app_finder_fee_amount": "3"},
+                "tags": [{"code": "bap_terms", "list": [{"code": "static_terms_new", "value": "https://buyer-app.example.com/terms"}]}],
+            }
+        },
+    }
+
+
+def build_app(mode, log_format, stream):
+    log_async, sample_rates, legacy = MODES[mode]
+
+    class BenchConfig:
+        DEBUG = False
+        TESTING = True
+        LOG_LEVEL = 'INFO'
+        LOG_FORMAT = log_format
+        LOG_ASYNC = log_async
+        LOG_PAYLOAD_SAMPLE_RATES = sample_rates
+        SCHEDULER_DEFAULT_TTL_SECONDS = 30
+
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.config.from_object(BenchConfig)
+    logging_setup.configure_logging(app, stream=stream)
+    if legacy:
+        @app.before_request
+        def log_body_eagerly():
+            current_app.logger.info(f"Received /search request. Body: {json.dumps(request.get_json(), indent=2)}")
+    app.register_blueprint(beckn_controller.beckn_bp, url_prefix='/beckn')
+    return app
+
+
+def run(request_count, log_format, write_latency_us):
+    # Only the ACK path is measured: no scheduler, DB or callbacks.
+    beckn_intake_service.run_async_task = lambda *args, **kwargs: True
+    body = build_search_body()
+    print(f"{'mode':>14} {'mean us':>9} {'p50 us':>8} {'p99 us':>8}")
+    for mode in MODES:
+        with tempfile.TemporaryFile(mode="w") as stream:
+            sink = SlowStream(stream, write_latency_us / 1e6) if write_latency_us else stream
+            app = build_app(mode, log_format, sink)
+            client = app.test_client()
+            for _ in range(200): # Warm-up
+                client.post('/beckn/search', json=body)
+            latencies = []
+            for _ in range(request_count):
+                start = time.perf_counter()
+                client.post('/beckn/search', json=body)
+                latencies.append((time.perf_counter() - start) * 1e6)
+            logging_setup.shutdown_logging(app) # Drain the queue before the next mode
+            logging.getLogger().handlers.clear()
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"{mode:>14} {statistics.fmean(latencies):>9.1f} {statistics.median(latencies):>8.1f} {p99:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--format", choices=["text", "json"], default="text")
+    parser.add_argument("--write-latency-us", type=float, default=0)
+    args = parser.parse_args()
+    run(args.requests, args.format, args.write_latency_us)
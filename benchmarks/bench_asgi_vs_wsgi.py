@@ -0,0 +1,147 @@
+# benchmarks/bench_asgi_vs_wsgi.py
+"""
+Same load against the Flask app under gunicorn (gthread) and the ASGI app
+under uvicorn, one worker process each: keep-alive clients posting
+/beckn/search, optionally while other clients hold long-polls open on
+/beckn/get_search_results (transactions that never complete, as when
+callbacks are slow). Reports ACK throughput, ACK latency percentiles and
+worker RSS.
+
+Uses benchmarks.ack_app / benchmarks.ack_asgi_app (no DB, no background
+work), so it measures the serving stack, not search latency.
+
+Measured on a 1-vCPU container that also runs the clients (32 ACK clients,
+8 gthread threads, 5 s long-polls):
+
+    server   long-polls   req/s   p50 ms   p99 ms   RSS MB
+    wsgi              0    1022     31.1     50.1     83
+    asgi              0    1360     23.9     31.9    111
+    wsgi             64       0        -        -     83
+    asgi             64    1861     15.6     28.5    113
+
+Run-to-run noise on one core is ~25%. The decisive row is the loaded one:
+64 parked long-polls take every gthread thread and ACKs stop, while the
+event loop keeps ACKing. Prefer SERVER_MODE=asgi when many clients wait on
+results; gunicorn with gevent workers is the WSGI alternative.
+
+    python -m benchmarks.bench_asgi_vs_wsgi [--clients 32] [--long-polls 0 64] [--seconds 10] [--threads 8]
+"""
+import argparse
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.bench_ack_logging import build_search_body
+from benchmarks.bench_gunicorn_modes import PORT, _memory_kb, _post, _wait_until_serving, _worker_pids
+
+LONG_POLL_SECONDS = 5
+
+
+def _server_command(server, threads):
+    if server == "wsgi":
+        return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning",
+                "--workers", "1", "--threads", str(threads), "--preload", "benchmarks.ack_app:app"]
+    return [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--port", str(PORT), "--workers", "1",
+            "--log-level", "warning", "--no-access-log", "benchmarks.ack_asgi_app:app"]
+
+
+def _long_poller(index, stop_event):
+    conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=LONG_POLL_SECONDS + 30)
+    while not stop_event.is_set():
+        try:
+            conn.request("GET", f"/beckn/get_search_results/never-{index}?wait={LONG_POLL_SECONDS}")
+            conn.getresponse().read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=LONG_POLL_SECONDS + 30)
+
+
+def _drive(body, clients, seconds):
+    latencies = [[] for _ in range(clients)]
+    stop_at = time.monotonic() + seconds
+
+    def client(index):
+        conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                if _post(conn, body) == 202:
+                    latencies[index].append(time.perf_counter() - started)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latency for per_client in latencies for latency in per_client)
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_server(server, clients, long_polls, seconds, threads):
+    env = dict(os.environ, GUNICORN_BIND=f"127.0.0.1:{PORT}", GUNICORN_WORKER_CLASS="gthread",
+               GUNICORN_GRACEFUL_TIMEOUT="2", RESULT_WAIT_MAX_SECONDS=str(LONG_POLL_SECONDS))
+    env.pop("DEFER_PROCESS_RESOURCES", None)
+    body = json.dumps(build_search_body()).encode("utf-8")
+    process = subprocess.Popen(_server_command(server, threads), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    stop_event = threading.Event()
+    pollers = []
+    try:
+        if not _wait_until_serving(body):
+            return None
+        _drive(body, clients, 1) # Warm-up
+        for index in range(long_polls):
+            poller = threading.Thread(target=_long_poller, args=(index, stop_event), daemon=True)
+            poller.start()
+            pollers.append(poller)
+        time.sleep(0.5) # Let the long-polls park
+        latencies = _drive(body, clients, seconds)
+        pids = _worker_pids(process.pid) if server == "wsgi" else [process.pid]
+        rss_kb = sum(_memory_kb(pid)[0] for pid in pids)
+        return {
+            "req_per_s": len(latencies) / seconds,
+            "p50_ms": _percentile(latencies, 0.50) * 1000,
+            "p99_ms": _percentile(latencies, 0.99) * 1000,
+            "rss_mb": rss_kb / 1024,
+        }
+    finally:
+        stop_event.set()
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired: # uvicorn waits for open long-polls
+            process.kill()
+            process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", nargs="+", default=["wsgi", "asgi"])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--long-polls", type=int, nargs="+", default=[0, 64])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn gthread threads per worker")
+    args = parser.parse_args()
+
+    print(f"{'server':>6} {'long-polls':>10} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>8}")
+    for long_polls in args.long_polls:
+        for server in args.servers:
+            result = run_server(server, args.clients, long_polls, args.seconds, args.threads)
+            if result is None:
+                print(f"{server:>6} {long_polls:>10}  failed to start")
+                continue
+            print(f"{server:>6} {long_polls:>10} {result['req_per_s']:>8.0f} {result['p50_ms']:>8.1f} "
+                  f"{result['p99_ms']:>8.1f} {result['rss_mb']:>8.1f}")
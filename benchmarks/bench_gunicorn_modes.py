@@ -0,0 +1,137 @@
+# benchmarks/bench_gunicorn_modes.py
+"""
+Starts gunicorn with gunicorn.conf.py in each worker mode and measures
+/beckn/search ACK throughput with keep-alive clients, time until the first
+ACK, and worker memory (RSS and PSS; PSS counts copy-on-write pages shared
+with the master only partially).
+
+Uses benchmarks.ack_app (no DB, no background work), so it measures the
+serving stack, not search latency.
+
+Usage (from the project root):
+    python -m benchmarks.bench_gunicorn_modes [--modes sync gthread gevent] [--workers 2] [--clients 32] [--seconds 10]
+"""
+import argparse
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.bench_ack_logging import build_search_body
+
+PORT = 18080
+
+
+def _worker_pids(master_pid):
+    try:
+        with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def _memory_kb(pid):
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values.get("Rss", 0), values.get("Pss", 0)
+
+
+def _post(conn, body):
+    conn.request("POST", "/beckn/search", body=body, headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def _wait_until_serving(body, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=2)
+            if _post(conn, body) == 202:
+                conn.close()
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def _drive(body, clients, seconds):
+    counts = [0] * clients
+    stop_at = time.monotonic() + seconds
+
+    def client(index):
+        conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=10)
+        while time.monotonic() < stop_at:
+            try:
+                if _post(conn, body) == 202:
+                    counts[index] += 1
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=10)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / seconds
+
+
+def run_mode(mode, preload, workers, clients, seconds):
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=mode, GUNICORN_WORKERS=str(workers),
+               GUNICORN_PRELOAD="true" if preload else "false", GUNICORN_BIND=f"127.0.0.1:{PORT}")
+    env.pop("DEFER_PROCESS_RESOURCES", None)
+    body = json.dumps(build_search_body()).encode("utf-8")
+    started = time.monotonic()
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning", "benchmarks.ack_app:app"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        if not _wait_until_serving(body):
+            return None
+        first_ack_seconds = time.monotonic() - started
+        time.sleep(1) # Let every worker finish booting
+        _drive(body, clients, 1) # Warm-up
+        throughput = _drive(body, clients, seconds)
+        memory = [_memory_kb(pid) for pid in _worker_pids(master.pid)]
+        return {
+            "req_per_s": throughput,
+            "first_ack_s": first_ack_seconds,
+            "rss_mb": sum(rss for rss, _ in memory) / 1024 / max(1, len(memory)),
+            "pss_mb": sum(pss for _, pss in memory) / 1024 / max(1, len(memory)),
+        }
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["sync", "gthread", "gevent"])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{'mode':>8} {'preload':>8} {'req/s':>8} {'first ACK s':>12} {'RSS/worker MB':>14} {'PSS/worker MB':>14}")
+    for mode in args.modes:
+        for preload in (False, True):
+            result = run_mode(mode, preload, args.workers, args.clients, args.seconds)
+            if result is None:
+                print(f"{mode:>8} {str(preload):>8}  failed to start")
+                continue
+            print(f"{mode:>8} {str(preload):>8} {result['req_per_s']:>8.0f} {result['first_ack_s']:>12.2f} "
+                  f"{result['rss_mb']:>14.1f} {result['pss_mb']:>14.1f}")
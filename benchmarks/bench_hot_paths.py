@@ -0,0 +1,234 @@
+# benchmarks/bench_hot_paths.py
+"""
+Microbenchmarks for the pure-Python request path, with a stored baseline
+and a regression gate:
+
+  parse_ondc_query_string       typical, long and adversarial query strings
+  extract_search_criteria       query, structured item + tags, many tag groups
+  generate_ack_response         typical and oversized contexts
+  generate_on_search_response   dict bodies for 10 and 100 items
+  render_on_search_response     fragment-cache bodies for 10 and 100 items (warm)
+  generate_on_select_response   typical product, oversized article_attributes
+
+Each case is timed with timeit (auto-ranged loop, --repeat runs) and the
+best run per call is kept; it is the least noisy statistic on a shared box.
+Each case is also expressed relative to a fixed pure-Python calibration
+loop timed right before it, and --check compares those ratios, so a
+baseline recorded on one machine still gates runs on another of a
+different speed (same Python version), and CPU frequency drift during a
+run largely cancels out.
+
+Logging inside the functions is timed at WARNING level (INFO calls reduce
+to a level check); bench_ack_logging measures the logging setups.
+
+Usage (from the project root):
+    python -m benchmarks.bench_hot_paths                     # run and print
+    python -m benchmarks.bench_hot_paths --save              # record benchmarks/baselines/hot_paths.json
+    python -m benchmarks.bench_hot_paths --check [--threshold 0.25]   # exit 1 on a regression
+    python -m benchmarks.bench_hot_paths --only on_select --repeat 9
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import timeit
+
+from flask import Flask
+
+from app.services.beckn_service import BecknService
+from app.services.parse_query_string import parse_ondc_query_string
+from app.utils.beckn_utils import extract_search_criteria, generate_ack_response
+from benchmarks.bench_json_codec import build_context, build_products
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "hot_paths.json")
+
+
+def _calibration():
+    # Fixed interpreter-bound work (attribute lookups, dict and string ops) used to normalize across machines
+    total = 0
+    words = {}
+    for i in range(2000):
+        key = "k" + str(i % 97)
+        words[key] = words.get(key, 0) + i
+        total += len(key)
+    return total
+
+
+def build_select_product(attribute_count=6, value_length=12):
+    attributes = {"Fit": "Slim Fit", "Fabric": "Cotton", "Sleeve Length": "Long Sleeves", "Collar": "Spread Collar",
+                  "Pattern": "Solid", "Occasion": "Casual"}
+    for i in range(len(attributes), attribute_count):
+        attributes[f"Custom Attribute {i}"] = ("v" * value_length) + str(i)
+    return {
+        "id": "15970",
+        "name": "Roadster Men Navy Blue Slim Fit Cotton Casual Shirt",
+        "description": "Navy blue solid casual shirt, has a spread collar, long sleeves, button placket and a curved hem.",
+        "price": 1299.0,
+        "currency": "INR",
+        "brand": "Roadster",
+        "master_category": "Apparel",
+        "sub_category": "Topwear",
+        "article_type": "Shirts",
+        "base_color": "Navy Blue",
+        "age_group": "Adults-Men",
+        "gender": "Men",
+        "usage": "Casual",
+        "article_attributes": dict(list(attributes.items())[:attribute_count]),
+    }
+
+
+def build_tagged_item_message(groups, values_per_group):
+    tags = [{"code": f"attr_{g}", "list": [{"code": "name", "value": f"value {g}-{v}"} for v in range(values_per_group)]}
+            for g in range(groups)]
+    return {
+        "intent": {
+            "item": {"descriptor": {"name": "navy blue slim fit shirt", "tags": tags}, "category_id": "Topwear"},
+            "payment": {"min_amount": "500", "max_amount": "2500"},
+        }
+    }
+
+
+def build_cases():
+    """(name, zero-argument callable) for every benchmark, in report order."""
+    context = build_context()
+    long_query = ",".join([f"keyword{i}" for i in range(150)] + [f"price > {i}" for i in range(25)] + [f"price < {9000 - i}" for i in range(25)])
+    no_separator_query = "navy blue slim fit cotton shirt " * 300 # ~10 KB, a single part
+    spaced_price_query = ",".join(["price" + " " * 200 + ">" + " " * 200 + "1" * 40] * 20)
+    big_context = dict(context, **{f"x-extension-{i}": "v" * 64 for i in range(60)})
+    products_10, products_100 = build_products(10), build_products(100)
+    select_typical = build_select_product()
+    select_big = build_select_product(attribute_count=200, value_length=200)
+
+    cases = [
+        ("parse_query/typical", lambda: parse_ondc_query_string("t-shirt,black,price > 1000,price < 2000")),
+        ("parse_query/200_parts", lambda: parse_ondc_query_string(long_query)),
+        ("parse_query/10kb_single_part", lambda: parse_ondc_query_string(no_separator_query)),
+        ("parse_query/padded_prices", lambda: parse_ondc_query_string(spaced_price_query)),
+        ("extract_criteria/query", lambda: extract_search_criteria({"intent": {"query": "shirt,navy blue,price >= 500,price < 2000"}})),
+        ("extract_criteria/item", lambda m=build_tagged_item_message(3, 2): extract_search_criteria(m)),
+        ("extract_criteria/100_tag_groups", lambda m=build_tagged_item_message(100, 20): extract_search_criteria(m)),
+        ("ack/typical", lambda: generate_ack_response(context, "search", context["transaction_id"], context["message_id"])),
+        ("ack/60_extra_context_keys", lambda: generate_ack_response(big_context, "search", context["transaction_id"], context["message_id"])),
+        ("on_search_dict/10_items", lambda: BecknService.generate_on_search_response(products_10, "txn", "msg", context)),
+        ("on_search_dict/100_items", lambda: BecknService.generate_on_search_response(products_100, "txn", "msg", context)),
+        ("on_search_render/10_items", lambda: BecknService.render_on_search_response(products_10, "txn", "msg", context)),
+        ("on_search_render/100_items", lambda: BecknService.render_on_search_response(products_100, "txn", "msg", context)),
+        ("on_select/typical", lambda: BecknService.generate_on_select_response(select_typical, "txn", "msg", context)),
+        ("on_select/200_attributes", lambda: BecknService.generate_on_select_response(select_big, "txn", "msg", context)),
+    ]
+    return cases
+
+
+def time_case(func, repeat, min_seconds):
+    """Best and median microseconds per call over `repeat` runs of an auto-ranged loop."""
+    func() # Warm caches (fragments, compiled regexes) before timing
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_seconds:
+        number = max(number, int(number * min_seconds / max(elapsed, 1e-9)))
+    runs = [t / number * 1e6 for t in timer.repeat(repeat=repeat, number=number)]
+    return min(runs), statistics.median(runs)
+
+
+def measure_case(func, repeat, min_seconds):
+    # Calibrate next to each case so clock and frequency drift during the run cancels out
+    calibration_us = time_case(_calibration, max(3, repeat // 2), min_seconds / 2)[0]
+    best_us, median_us = time_case(func, repeat, min_seconds)
+    return {"best_us": round(best_us, 3), "median_us": round(median_us, 3), "relative": round(best_us / calibration_us, 5),
+            "calibration_us": round(calibration_us, 3)}
+
+
+def select_cases(only):
+    return [(name, func) for name, func in build_cases() if not only or any(part in name for part in only)]
+
+
+def run(cases, repeat, min_seconds):
+    results = {name: measure_case(func, repeat, min_seconds) for name, func in cases}
+    calibrations = [result.pop("calibration_us") for result in results.values()]
+    return {"calibration": {"best_us": round(min(calibrations), 3), "median_us": round(statistics.median(calibrations), 3),
+                            "relative": 1.0}, **results}
+
+
+def compare(results, baseline, threshold):
+    """Rows of (name, baseline relative, current relative, change, regressed) for cases in both."""
+    rows = []
+    for name, result in results.items():
+        previous = baseline["results"].get(name)
+        if name == "calibration" or previous is None:
+            continue
+        change = result["relative"] / previous["relative"] - 1
+        rows.append((name, previous["relative"], result["relative"], change, change > threshold))
+    return rows
+
+
+def confirm_regressions(cases, results, baseline, threshold, attempts, repeat, min_seconds):
+    """
+    Re-times each case over the threshold up to `attempts` more times and
+    keeps its best ratio, so one noisy pass on a shared host does not fail
+    the gate; a real regression stays over the threshold on every attempt.
+    """
+    funcs = dict(cases)
+    for name, previous, _, _, regressed in compare(results, baseline, threshold):
+        for _ in range(attempts if regressed else 0):
+            retry = measure_case(funcs[name], repeat, min_seconds)
+            if retry["relative"] < results[name]["relative"]:
+                results[name].update(best_us=retry["best_us"], median_us=retry["median_us"], relative=retry["relative"])
+            if results[name]["relative"] / previous - 1 <= threshold:
+                break
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="compare with the baseline; exit 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown vs the baseline (0.25 = 25%%)")
+    parser.add_argument("--confirm", type=int, default=3, help="re-timings of a case over the threshold before it counts as regressed")
+    parser.add_argument("--repeat", type=int, default=15, help="timed runs per case")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="minimum duration of each timed run")
+    parser.add_argument("--only", nargs="+", default=None, help="run only cases whose name contains one of these")
+    args = parser.parse_args()
+
+    app = Flask("bench_hot_paths")
+    app.logger.setLevel(logging.WARNING)
+    app.app_context().push()
+    cases = select_cases(args.only)
+    results = run(cases, args.repeat, args.min_seconds)
+    baseline = None
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        confirm_regressions(cases, results, baseline, args.threshold, args.confirm, args.repeat, args.min_seconds)
+
+    print(f"Python {platform.python_version()} ({platform.python_implementation()}), calibration {results['calibration']['best_us']:.1f} us")
+    print(f"{'case':<34} {'best us':>10} {'median us':>10} {'relative':>10}")
+    for name, result in results.items():
+        print(f"{name:<34} {result['best_us']:>10.2f} {result['median_us']:>10.2f} {result['relative']:>10.4f}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({"python": platform.python_version(), "implementation": platform.python_implementation(),
+                       "machine": platform.machine(), "results": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+
+    if args.check:
+        if baseline.get("python", "").rsplit(".", 1)[0] != platform.python_version().rsplit(".", 1)[0]:
+            print(f"\nWarning: baseline was recorded on Python {baseline.get('python')}; ratios may not be comparable.")
+        rows = compare(results, baseline, args.threshold)
+        print(f"\n{'case':<34} {'baseline':>10} {'current':>10} {'change':>8}")
+        for name, previous, current, change, regressed in rows:
+            print(f"{name:<34} {previous:>10.4f} {current:>10.4f} {change:>+7.1%}  {'REGRESSED' if regressed else 'ok'}")
+        regressions = [row[0] for row in rows if row[4]]
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\nNo case regressed by more than {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/bench_json_codec.py
+"""
+Compares stdlib json with app.utils.json_codec, and gzip/zstd compression,
+on realistic on_search payloads built by BecknService.generate_on_search_response.
+
+Usage (from the project root):
+    python -m benchmarks.bench_json_codec [--items 10 100] [--repeat 2000]
+"""
+import argparse
+import gzip
+import json
+import random
+import timeit
+
+from app.services.beckn_service import BecknService
+from app.utils import json_codec
+from app.utils.compression import zstandard
+
+_BRANDS = ["Roadster", "HRX by Hrithik Roshan", "Puma", "Nike", "WROGN", "Mast & Harbour", "U.S. Polo Assn."]
+_COLOURS = ["Black", "Navy Blue", "White", "Olive", "Maroon", "Grey Melange"]
+_TYPES = ["Tshirts", "Shirts", "Jeans", "Casual Shoes", "Track Pants", "Kurtas"]
+
+
+def build_context():
+    return {
+        "domain": "ONDC:RET10",
+        "action": "search",
+        "country": "IND",
+        "city": "std:080",
+        "core_version": "1.2.0",
+        "bap_id": "buyer-app.example.com",
+        "bap_uri": "https://buyer-app.example.com/protocol/v1",
+        "bpp_id": "bpp.example.com",
+        "bpp_uri": "https://bpp.example.com/beckn",
+        "transaction_id": "6d5f4c3b-2a19-4e8f-9d7c-1b2a3c4d5e6f",
+        "message_id": "a1b2c3d4-e5f6-7a8b-9c0d-e1f2a3b4c5d6",
+        "timestamp": "2026-10-19T10:00:00.000Z",
+        "ttl": "PT30S",
+    }
+
+
+def build_products(count, seed=42):
+    rng = random.Random(seed)
+    products = []
+    for i in range(count):
+        brand = rng.choice(_BRANDS)
+        products.append({
+            "id": str(10000 + i),
+            "name": f"{brand} Men {rng.choice(_COLOURS)} {rng.choice(_TYPES)} Slim Fit Cotton",
+            "brand": brand,
+            "price": float(rng.randint(299, 4999)),
+            "currency": "INR",
+        })
+    return products
+
+
+def build_on_search_payload(item_count):
+    context = build_context()
+    return BecknService.generate_on_search_response(
+        build_products(item_count), context["transaction_id"], context["message_id"], context
+    )
+
+
+def _per_call_us(func, repeat):
+    return min(timeit.repeat(func, number=repeat, repeat=3)) / repeat * 1e6
+
+
+def run(item_counts, repeat):
+    print(f"JSON backend: {json_codec.JSON_BACKEND}; zstd available: {zstandard is not None}")
+    header = f"{'items':>6} {'bytes':>8} {'json.dumps us':>14} {'codec.dumps us':>15} {'json.loads us':>14} {'codec.loads us':>15} {'gzip bytes':>11} {'gzip us':>9}"
+    if zstandard is not None:
+        header += f" {'zstd bytes':>11} {'zstd us':>9}"
+    print(header)
+
+    for count in item_counts:
+        payload = build_on_search_payload(count)
+        body = json_codec.dumps(payload)
+        row = (
+            f"{count:>6} {len(body):>8} "
+            f"{_per_call_us(lambda: json.dumps(payload).encode('utf-8'), repeat):>14.1f} "
+            f"{_per_call_us(lambda: json_codec.dumps(payload), repeat):>15.1f} "
+            f"{_per_call_us(lambda: json.loads(body), repeat):>14.1f} "
+            f"{_per_call_us(lambda: json_codec.loads(body), repeat):>15.1f} "
+            f"{len(gzip.compress(body, compresslevel=6)):>11} "
+            f"{_per_call_us(lambda: gzip.compress(body, compresslevel=6), max(1, repeat // 10)):>9.1f}"
+        )
+        if zstandard is not None:
+            compressor = zstandard.ZstdCompressor()
+            row += (
+                f" {len(compressor.compress(body)):>11} "
+                f"{_per_call_us(lambda: compressor.compress(body), max(1, repeat // 10)):>9.1f}"
+            )
+        print(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.items, args.repeat)
@@ -0,0 +1,41 @@
+# benchmarks/bench_on_search_render.py
+"""
+Compares building an on_search body as a dict and encoding it with
+rendering it from pre-serialized catalog item fragments (warm cache).
+
+Usage (from the project root):
+    python -m benchmarks.bench_on_search_render [--items 10 100] [--repeat 2000]
+"""
+import argparse
+import timeit
+
+from app.services.beckn_service import BecknService
+from app.utils import json_codec
+from benchmarks.bench_json_codec import build_context, build_products
+
+
+def run(item_counts, repeat):
+    print(f"JSON backend: {json_codec.JSON_BACKEND}")
+    print(f"{'items':>6} {'dict + dumps us':>16} {'fragments us':>13} {'speedup':>8}")
+    context = build_context()
+    for count in item_counts:
+        products = build_products(count)
+        BecknService.render_on_search_response(products, "txn", "msg", context) # Warm the fragment cache
+
+        def build_and_encode():
+            return json_codec.dumps(BecknService.generate_on_search_response(products, "txn", "msg", context))
+
+        def render():
+            return BecknService.render_on_search_response(products, "txn", "msg", context)
+
+        baseline_us = min(timeit.repeat(build_and_encode, number=repeat, repeat=3)) / repeat * 1e6
+        fragments_us = min(timeit.repeat(render, number=repeat, repeat=3)) / repeat * 1e6
+        print(f"{count:>6} {baseline_us:>16.1f} {fragments_us:>13.1f} {baseline_us / fragments_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.items, args.repeat)
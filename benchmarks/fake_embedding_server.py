@@ -0,0 +1,148 @@
+# benchmarks/fake_embedding_server.py
+"""
+Local stand-in for the Gemini embedding API (REST embedContent), with
+configurable latency and failure distributions. Vectors come from
+benchmarks.synthetic_catalog.fake_embedding, so they match the synthetic
+catalog.
+
+Point the BPP at it with:
+
+    EMBEDDING_API_ENDPOINT=http://127.0.0.1:8090 GOOGLE_API_KEY=fake
+
+Latency is log-normal around --latency-ms (median) with shape --latency-sigma;
+--error-rate answers 503, --throttle-rate answers 429 and --hang-rate holds
+the request for --hang-seconds (longer than the client timeout, to exercise
+deadlines). GET /stats returns counts by outcome.
+
+    python -m benchmarks.fake_embedding_server [--port 8090] [--latency-ms 40] [--latency-sigma 0.5] [--error-rate 0.01]
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.synthetic_catalog import fake_embedding
+
+_EMBED_PATH = re.compile(r"^/v1(beta)?/models/[^/:]+:embedContent")
+
+
+class FakeEmbeddingBehaviour:
+    def __init__(self, latency_ms=40.0, latency_sigma=0.5, error_rate=0.0, throttle_rate=0.0, hang_rate=0.0, hang_seconds=30.0, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.outcomes = Counter()
+
+    def draw(self):
+        """Returns (outcome, delay seconds) for one request."""
+        with self._lock:
+            roll = self._rng.random()
+            delay = self.latency_ms / 1000 * math.exp(self._rng.gauss(0.0, self.latency_sigma)) if self.latency_ms > 0 else 0.0
+        if roll < self.hang_rate:
+            return "hang", self.hang_seconds
+        roll -= self.hang_rate
+        if roll < self.error_rate:
+            return "error", delay
+        roll -= self.error_rate
+        if roll < self.throttle_rate:
+            return "throttled", delay
+        return "ok", delay
+
+    def count(self, outcome):
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+
+def _make_handler(behaviour):
+    class FakeEmbeddingHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # Keep-alive, like the real API
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with behaviour._lock:
+                    self._reply(200, dict(behaviour.outcomes))
+            else:
+                self._reply(404, {"error": {"code": 404, "message": "Not found"}})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not _EMBED_PATH.match(self.path):
+                self._reply(404, {"error": {"code": 404, "message": f"Unsupported path {self.path}"}})
+                return
+            outcome, delay = behaviour.draw()
+            time.sleep(delay)
+            behaviour.count(outcome)
+            if outcome == "error":
+                self._reply(503, {"error": {"code": 503, "message": "The service is currently unavailable.", "status": "UNAVAILABLE"}})
+                return
+            if outcome == "throttled":
+                self._reply(429, {"error": {"code": 429, "message": "Resource has been exhausted.", "status": "RESOURCE_EXHAUSTED"}})
+                return
+            try:
+                request = json.loads(body)
+                text = " ".join(part.get("text", "") for part in request["content"]["parts"])
+            except (ValueError, KeyError, TypeError):
+                self._reply(400, {"error": {"code": 400, "message": "Invalid request body.", "status": "INVALID_ARGUMENT"}})
+                return
+            self._reply(200, {"embedding": {"values": fake_embedding(text)}})
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeEmbeddingHandler
+
+
+def start_fake_embedding_server(behaviour, host="127.0.0.1", port=8090):
+    """Starts the server on a daemon thread and returns it (port 0 picks a free port)."""
+    server = ThreadingHTTPServer((host, port), _make_handler(behaviour))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-embedding-server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="median latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal shape; 0 for a fixed latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction answered 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction answered 429")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="fraction held for --hang-seconds")
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    behaviour = FakeEmbeddingBehaviour(args.latency_ms, args.latency_sigma, args.error_rate, args.throttle_rate,
+                                       args.hang_rate, args.hang_seconds, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(behaviour))
+    server.daemon_threads = True
+    print(f"Fake embedding API on http://{args.host}:{args.port} (median {args.latency_ms} ms, sigma {args.latency_sigma}, "
+          f"errors {args.error_rate:.1%}, throttled {args.throttle_rate:.1%}, hangs {args.hang_rate:.1%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"Outcomes: {dict(behaviour.outcomes)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# benchmarks/load_driver.py
+"""
+Open-loop load driver for a running BPP: sends a /search and /select mix at
+fixed rates and receives the callbacks on an in-process mock BAP. Reports,
+per rate step:
+
+  - ACK latency percentiles and non-202 responses
+  - end-to-end latency: request scheduled -> on_search/on_select received
+  - the fraction of ACKed requests whose callback arrived
+
+It also reports the max sustainable RPS: the highest step that meets the
+SLOs (--slo-ack-ms, --slo-e2e-ms, <1% errors, >=99% callbacks).
+
+Arrivals follow a fixed schedule and latency is measured from the scheduled
+send time. When the BPP or the client threads fall behind, the queueing
+shows up in the numbers instead of silently lowering the offered load
+(coordinated omission).
+
+The local stack, all stand-ins (no Google APIs, no Cloud SQL):
+
+    docker compose -f benchmarks/docker-compose.loadtest.yml up -d
+    python -m benchmarks.synthetic_catalog --rows 100000 --jobs 4
+    python -m benchmarks.fake_embedding_server --port 8090 --latency-ms 40 &
+    FLASK_ENV=production GOOGLE_API_KEY=fake EMBEDDING_API_ENDPOINT=http://127.0.0.1:8090 ID_TOKEN_SOURCE=fake \\
+        DB_HOST=127.0.0.1 DB_PORT=5433 DB_NAME=bench DB_USER=bench DB_PASSWORD=bench \\
+        gunicorn -c gunicorn.conf.py run:app &
+    python -m benchmarks.load_driver --target http://127.0.0.1:8080 --rates 10 25 50 100 --seconds 30 --catalog-rows 100000
+"""
+import argparse
+import http.client
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from benchmarks.bench_json_codec import build_context
+from benchmarks.mock_bap import CallbackRecorder, start_mock_bap
+from benchmarks.synthetic_catalog import product_id_for, random_query
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def build_request(action, bap_uri, rng, catalog_rows, ttl_seconds):
+    context = build_context()
+    context.update(
+        action=action,
+        bpp_uri=bap_uri, # Callbacks go to context.bpp_uri
+        transaction_id=str(uuid.uuid4()),
+        message_id=str(uuid.uuid4()),
+        timestamp=datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+        ttl=f"PT{ttl_seconds}S",
+    )
+    if action == "search":
+        message = {"intent": {"item": {"descriptor": {"name": random_query(rng)}}}}
+    else:
+        message = {"order": {"items": [{"id": product_id_for(rng.randrange(catalog_rows))}]}}
+    return context["transaction_id"], json.dumps({"context": context, "message": message}).encode("utf-8")
+
+
+class StepResult:
+    def __init__(self, rate):
+        self.rate = rate
+        self.sent = {"search": [], "select": []} # (transaction_id, scheduled_at) of ACKed requests
+        self.ack_latencies = []
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.started_at = None
+        self.finished_at = None
+
+
+def run_step(target, rate, seconds, select_ratio, bap_uri, catalog_rows, connections, ttl_seconds, seed):
+    """Offers `rate` requests/s for `seconds`; returns the StepResult (callbacks are collected afterwards)."""
+    parsed = urlparse(target)
+    total = int(rate * seconds)
+    counter = itertools.count()
+    result = StepResult(rate)
+    result.started_at = time.perf_counter() + 0.2 # Lets every client thread get ready
+    rng_lock = threading.Lock()
+    rng = random.Random(seed)
+
+    def client():
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+        while True:
+            index = next(counter)
+            if index >= total:
+                break
+            scheduled_at = result.started_at + index / rate
+            with rng_lock:
+                action = "select" if rng.random() < select_ratio else "search"
+                transaction_id, body = build_request(action, bap_uri, rng, catalog_rows, ttl_seconds)
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                conn.request("POST", f"/beckn/{action}", body=body, headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+                status = None
+            ack_latency = time.perf_counter() - scheduled_at
+            with result.lock:
+                if status == 202:
+                    result.ack_latencies.append(ack_latency)
+                    result.sent[action].append((transaction_id, scheduled_at))
+                else:
+                    result.errors += 1
+        conn.close()
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.finished_at = time.perf_counter()
+    return result
+
+
+def collect_callbacks(result, recorder, drain_seconds):
+    """Waits up to `drain_seconds` for outstanding callbacks; returns the report dict for the step."""
+    expected = [(f"on_{action}", transaction_id, scheduled_at) for action, sent in result.sent.items() for transaction_id, scheduled_at in sent]
+    wait_until = time.perf_counter() + drain_seconds
+    while time.perf_counter() < wait_until:
+        if all(recorder.arrival(action, transaction_id) is not None for action, transaction_id, _ in expected):
+            break
+        time.sleep(0.2)
+
+    e2e = {"on_search": [], "on_select": []}
+    empty = 0
+    for action, transaction_id, scheduled_at in expected:
+        arrival = recorder.arrival(action, transaction_id)
+        if arrival is not None:
+            e2e[action].append(arrival[0] - scheduled_at)
+            empty += arrival[1] == 0 and action == "on_search"
+    all_e2e = sorted(e2e["on_search"] + e2e["on_select"])
+    acks = sorted(result.ack_latencies)
+    offered = len(acks) + result.errors
+    report = {
+        "rate": result.rate,
+        "achieved_rps": len(acks) / max(result.finished_at - result.started_at, 1e-9),
+        "requests": offered,
+        "errors": result.errors,
+        "ack_p50_ms": _percentile(acks, 0.50) * 1000,
+        "ack_p90_ms": _percentile(acks, 0.90) * 1000,
+        "ack_p99_ms": _percentile(acks, 0.99) * 1000,
+        "ack_max_ms": (acks[-1] if acks else float("nan")) * 1000,
+        "callbacks": len(all_e2e),
+        "callback_ratio": len(all_e2e) / len(expected) if expected else 0.0,
+        "empty_results": empty,
+        "e2e_p50_ms": _percentile(all_e2e, 0.50) * 1000,
+        "e2e_p90_ms": _percentile(all_e2e, 0.90) * 1000,
+        "e2e_p99_ms": _percentile(all_e2e, 0.99) * 1000,
+    }
+    for action in ("on_search", "on_select"):
+        report[f"{action}_e2e_p99_ms"] = _percentile(sorted(e2e[action]), 0.99) * 1000
+    return report
+
+
+def meets_slo(report, slo_ack_ms, slo_e2e_ms):
+    return (report["requests"] > 0
+            and report["errors"] / report["requests"] <= 0.01
+            and report["callback_ratio"] >= 0.99
+            and report["ack_p99_ms"] <= slo_ack_ms
+            and report["e2e_p99_ms"] <= slo_e2e_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="http://127.0.0.1:8080", help="BPP base URL")
+    parser.add_argument("--rates", type=float, nargs="+", default=[10, 25, 50, 100], help="requests/s per step, ascending")
+    parser.add_argument("--seconds", type=float, default=30, help="duration of each step")
+    parser.add_argument("--select-ratio", type=float, default=0.2, help="fraction of requests that are /select")
+    parser.add_argument("--catalog-rows", type=int, default=100000, help="rows loaded by synthetic_catalog (for /select ids)")
+    parser.add_argument("--connections", type=int, default=64, help="client threads (keep-alive connections)")
+    parser.add_argument("--ttl-seconds", type=int, default=30, help="context.ttl of each request")
+    parser.add_argument("--drain-seconds", type=float, default=15, help="how long to wait for late callbacks after a step")
+    parser.add_argument("--bap-port", type=int, default=9090)
+    parser.add_argument("--bap-host", default="127.0.0.1", help="address the BPP uses to reach the mock BAP")
+    parser.add_argument("--slo-ack-ms", type=float, default=200)
+    parser.add_argument("--slo-e2e-ms", type=float, default=3000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print one JSON object per step")
+    args = parser.parse_args()
+
+    recorder = CallbackRecorder()
+    start_mock_bap(recorder, host="0.0.0.0", port=args.bap_port)
+    bap_uri = f"http://{args.bap_host}:{args.bap_port}/bap"
+
+    if not args.json:
+        print(f"{'rate':>6} {'achieved':>9} {'errors':>7} {'ACK p50':>8} {'p90':>7} {'p99':>7} {'max':>8} "
+              f"{'callbacks':>10} {'e2e p50':>8} {'p90':>7} {'p99':>7}  SLO")
+    max_sustainable = None
+    failures = 0
+    for step, rate in enumerate(args.rates):
+        result = run_step(args.target, rate, args.seconds, args.select_ratio, bap_uri, args.catalog_rows,
+                          args.connections, args.ttl_seconds, args.seed + step)
+        report = collect_callbacks(result, recorder, args.drain_seconds)
+        report["meets_slo"] = meets_slo(report, args.slo_ack_ms, args.slo_e2e_ms)
+        if args.json:
+            print(json.dumps(report))
+        else:
+            print(f"{rate:>6.0f} {report['achieved_rps']:>9.1f} {report['errors']:>7} {report['ack_p50_ms']:>8.1f} "
+                  f"{report['ack_p90_ms']:>7.1f} {report['ack_p99_ms']:>7.1f} {report['ack_max_ms']:>8.1f} "
+                  f"{report['callback_ratio']:>9.1%} {report['e2e_p50_ms']:>8.0f} {report['e2e_p90_ms']:>7.0f} "
+                  f"{report['e2e_p99_ms']:>7.0f}  {'ok' if report['meets_slo'] else 'MISS'}")
+        if report["meets_slo"]:
+            max_sustainable = rate
+            failures = 0
+        else:
+            failures += 1
+            if failures >= 2: # Two misses in a row: higher rates will not recover
+                break
+
+    summary = {"max_sustainable_rps": max_sustainable, "slo_ack_p99_ms": args.slo_ack_ms, "slo_e2e_p99_ms": args.slo_e2e_ms,
+               "callbacks": recorder.get_stats()}
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(f"\nMax sustainable RPS: {max_sustainable if max_sustainable is not None else 'none of the steps'} "
+              f"(ACK p99 <= {args.slo_ack_ms:.0f} ms, e2e p99 <= {args.slo_e2e_ms:.0f} ms, <1% errors, >=99% callbacks)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# benchmarks/mock_bap.py
+"""
+Mock BAP that ACKs /on_search and /on_select callbacks and records when
+each one arrived, by (action, transaction_id). The load driver runs one
+in-process so arrival times share its clock; standalone, GET /stats returns
+the arrival counts and the last callbacks seen.
+
+Requests carry the BAP base URI in context.bpp_uri (that is where this BPP
+sends callbacks), e.g. http://127.0.0.1:9090/bap -> POST /bap/on_search.
+
+    python -m benchmarks.mock_bap [--port 9090] [--latency-ms 0] [--error-rate 0]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_ACK = json.dumps({"message": {"ack": {"status": "ACK"}}}).encode("utf-8")
+
+
+class CallbackRecorder:
+    """Arrival times (time.perf_counter()) of callbacks, with waiters for the load driver."""
+
+    def __init__(self):
+        self._arrivals = {} # (action, transaction_id) -> first arrival
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, action, transaction_id, arrived_at, item_count):
+        with self._lock:
+            self._counts[action] += 1
+            if (action, transaction_id) in self._arrivals:
+                self._counts[f"{action}_duplicates"] += 1
+            else:
+                self._arrivals[(action, transaction_id)] = (arrived_at, item_count)
+
+    def arrival(self, action, transaction_id):
+        """(arrival time, number of items) or None."""
+        with self._lock:
+            return self._arrivals.get((action, transaction_id))
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+def _item_count(payload):
+    try:
+        catalog = payload["message"]["catalog"]
+        return sum(len(provider.get("items", [])) for provider in catalog.get("bpp/providers", catalog.get("providers", [])))
+    except (KeyError, TypeError, AttributeError):
+        return 0
+
+
+def _make_handler(recorder, latency_ms=0.0, error_rate=0.0):
+    rng = random.Random()
+
+    class MockBAPHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status, data):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            arrived_at = time.perf_counter()
+            action = self.path.rstrip("/").rsplit("/", 1)[-1]
+            if action not in ("on_search", "on_select"):
+                self._reply(404, b'{"error": "unknown action"}')
+                return
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            if error_rate and rng.random() < error_rate:
+                self._reply(503, b'{"error": "mock BAP failure"}') # The BPP retries; the retry's arrival counts
+                return
+            try:
+                payload = json.loads(body)
+                transaction_id = payload["context"]["transaction_id"]
+            except (ValueError, KeyError, TypeError):
+                self._reply(400, b'{"error": "invalid callback body"}')
+                return
+            recorder.record(action, transaction_id, arrived_at, _item_count(payload))
+            self._reply(200, _ACK)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._reply(200, json.dumps(recorder.get_stats()).encode("utf-8"))
+            else:
+                self._reply(404, b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockBAPHandler
+
+
+def start_mock_bap(recorder, host="127.0.0.1", port=9090, latency_ms=0.0, error_rate=0.0):
+    """Starts the mock BAP on a daemon thread and returns the server (port 0 picks a free port)."""
+    server = ThreadingHTTPServer((host, port), _make_handler(recorder, latency_ms, error_rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-bap", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9090)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay before answering each callback")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of callbacks answered 503")
+    args = parser.parse_args()
+
+    recorder = CallbackRecorder()
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(recorder, args.latency_ms, args.error_rate))
+    server.daemon_threads = True
+    print(f"Mock BAP on http://{args.host}:{args.port} (use context.bpp_uri=http://{args.host}:{args.port}/bap)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"Callbacks: {recorder.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
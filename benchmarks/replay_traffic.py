@@ -0,0 +1,245 @@
+# benchmarks/replay_traffic.py
+"""
+Replays captured /search and /select traffic (TRAFFIC_CAPTURE_ENABLED, see
+app/utils/traffic_capture.py) against a BPP and receives the callbacks on
+an in-process mock BAP.
+
+--speed 1 keeps the recorded timing, --speed N compresses it N times (the
+inter-arrival shape, bursts included, is preserved) and --speed max sends
+as fast as --connections allow. Latency is measured from each request's
+scheduled send time, as in benchmarks/load_driver.py, so a BPP or client
+that falls behind shows up as latency rather than a lower offered rate.
+
+Each replayed request gets fresh transaction and message ids (one new
+transaction_id per captured one, so a search and its select stay paired),
+a current timestamp, and context.bpp_uri pointed at the mock BAP.
+
+Reports ACK and end-to-end latency, callback completeness, empty results
+and, from the target's /metrics (before vs after), the hit rate of every
+cache counted in bpp_cache_lookups. Set METRICS_MULTIPROC_DIR on the target
+so /metrics covers all of its workers.
+
+    python -m benchmarks.replay_traffic /tmp/bpp-traffic.jsonl --target http://127.0.0.1:8080 --speed 4
+    python -m benchmarks.replay_traffic capture-*.jsonl --speed max --connections 128 --limit 20000 --json
+"""
+import argparse
+import http.client
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from benchmarks.load_driver import StepResult, collect_callbacks
+from benchmarks.mock_bap import CallbackRecorder, start_mock_bap
+
+_SAMPLE_LINE = re.compile(r'^(\w+)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def load_capture(paths, limit=None):
+    """Captured records sorted by arrival time, and the number of unreadable lines skipped."""
+    records = []
+    skipped = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if record["action"] in ("search", "select") and isinstance(record["body"].get("context"), dict):
+                        records.append(record)
+                        continue
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    pass
+                skipped += 1
+    records.sort(key=lambda record: record["t"]) # Workers append concurrently; files are only roughly ordered
+    return records[:limit] if limit else records, skipped
+
+
+def schedule(records, speed):
+    """Send offsets in seconds from the start of the replay; None (as fast as possible) for --speed max."""
+    if speed is None:
+        return [None] * len(records)
+    first = records[0]["t"] if records else 0.0
+    return [(record["t"] - first) / speed for record in records]
+
+
+def rewrite_body(body, bap_uri, transaction_ids):
+    context = dict(body["context"])
+    original_transaction_id = context.get("transaction_id")
+    transaction_id = transaction_ids.get(original_transaction_id)
+    if transaction_id is None:
+        transaction_id = transaction_ids[original_transaction_id] = str(uuid.uuid4())
+    context.update(
+        transaction_id=transaction_id,
+        message_id=str(uuid.uuid4()),
+        bpp_uri=bap_uri, # Callbacks go to context.bpp_uri
+        timestamp=datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+    )
+    return transaction_id, json.dumps(dict(body, context=context)).encode("utf-8")
+
+
+def read_metrics(target, names):
+    """{(metric, labels tuple): value} for the *_total series of `names` in the target's /metrics; {} if unavailable."""
+    parsed = urlparse(target)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=10)
+    try:
+        conn.request("GET", "/metrics")
+        response = conn.getresponse()
+        text = response.read().decode("utf-8")
+        if response.status != 200:
+            return {}
+    except (OSError, http.client.HTTPException):
+        return {}
+    finally:
+        conn.close()
+    samples = {}
+    for line in text.splitlines():
+        match = _SAMPLE_LINE.match(line)
+        if match is None or not match.group(1).endswith("_total") or match.group(1)[:-len("_total")] not in names:
+            continue
+        labels = tuple(sorted(_LABEL.findall(match.group(2) or "")))
+        samples[(match.group(1)[:-len("_total")], labels)] = float(match.group(3))
+    return samples
+
+
+def metrics_delta(before, after):
+    """Cache hit rates and result counts accumulated between two read_metrics() calls."""
+    delta = {key: value - before.get(key, 0.0) for key, value in after.items()}
+    lookups = defaultdict(lambda: {"hit": 0.0, "miss": 0.0})
+    results = defaultdict(float)
+    for (name, labels), value in delta.items():
+        labels = dict(labels)
+        if name == "bpp_cache_lookups":
+            lookups[labels.get("cache")][labels.get("outcome")] += value
+        else:
+            results[f"{name}_{labels.get('action')}"] += value
+    caches = {cache: {"hits": int(counts["hit"]), "misses": int(counts["miss"]),
+                      "hit_rate": counts["hit"] / (counts["hit"] + counts["miss"]) if counts["hit"] + counts["miss"] else None}
+              for cache, counts in lookups.items()}
+    return caches, {key: int(value) for key, value in results.items()}
+
+
+def replay(target, records, offsets, bap_uri, connections):
+    """Sends every record at its offset; returns (StepResult, max send lag in seconds)."""
+    parsed = urlparse(target)
+    counter = itertools.count()
+    transaction_ids = {}
+    duration = max((offset for offset in offsets if offset is not None), default=0.0)
+    result = StepResult(len(records) / duration if duration else float("inf"))
+    result.started_at = time.perf_counter() + 0.2 # Lets every client thread get ready
+    lag = [0.0]
+    build_lock = threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+        while True:
+            index = next(counter)
+            if index >= len(records):
+                break
+            record = records[index]
+            scheduled_at = result.started_at + (offsets[index] or 0.0)
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            with build_lock:
+                transaction_id, body = rewrite_body(record["body"], bap_uri, transaction_ids)
+            sent_at = time.perf_counter()
+            if offsets[index] is None: # --speed max: no schedule to fall behind, latency counts from the send
+                scheduled_at = sent_at
+            try:
+                conn.request("POST", f"/beckn/{record['action']}", body=body, headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+                status = None
+            ack_latency = time.perf_counter() - scheduled_at
+            with result.lock:
+                lag[0] = max(lag[0], sent_at - scheduled_at)
+                if status == 202:
+                    result.ack_latencies.append(ack_latency)
+                    result.sent[record["action"]].append((transaction_id, scheduled_at))
+                else:
+                    result.errors += 1
+        conn.close()
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.finished_at = time.perf_counter()
+    return result, lag[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("captures", nargs="+", help="capture files (JSON lines); several are merged by arrival time")
+    parser.add_argument("--target", default="http://127.0.0.1:8080", help="BPP base URL")
+    parser.add_argument("--speed", default="1", help="time compression factor (1 = as recorded) or 'max'")
+    parser.add_argument("--limit", type=int, default=None, help="replay only the first N captured requests")
+    parser.add_argument("--connections", type=int, default=64, help="client threads (keep-alive connections)")
+    parser.add_argument("--drain-seconds", type=float, default=15, help="how long to wait for late callbacks")
+    parser.add_argument("--bap-port", type=int, default=9090)
+    parser.add_argument("--bap-host", default="127.0.0.1", help="address the BPP uses to reach the mock BAP")
+    parser.add_argument("--json", action="store_true", help="print the report as one JSON object")
+    args = parser.parse_args()
+
+    speed = None if args.speed == "max" else float(args.speed)
+    records, skipped = load_capture(args.captures, args.limit)
+    if not records:
+        parser.error("no replayable records in the capture files")
+    offsets = schedule(records, speed)
+    captured_seconds = records[-1]["t"] - records[0]["t"]
+
+    recorder = CallbackRecorder()
+    start_mock_bap(recorder, host="0.0.0.0", port=args.bap_port)
+    bap_uri = f"http://{args.bap_host}:{args.bap_port}/bap"
+
+    metric_names = {"bpp_cache_lookups", "bpp_results", "bpp_empty_results"}
+    before = read_metrics(args.target, metric_names)
+    if not args.json:
+        print(f"Replaying {len(records)} requests ({skipped} unreadable lines skipped) captured over {captured_seconds:.1f} s "
+              f"at {'max speed' if speed is None else f'{speed:g}x'} against {args.target}...")
+    result, send_lag = replay(args.target, records, offsets, bap_uri, args.connections)
+    report = collect_callbacks(result, recorder, args.drain_seconds)
+    caches, results = metrics_delta(before, read_metrics(args.target, metric_names)) if before else ({}, {})
+    report.update(
+        speed=args.speed,
+        captured_seconds=captured_seconds,
+        replay_seconds=result.finished_at - result.started_at,
+        max_send_lag_ms=send_lag * 1000,
+        searches=len(result.sent["search"]),
+        selects=len(result.sent["select"]),
+        caches=caches,
+        target_results=results,
+    )
+    del report["rate"]
+
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"Sent {report['requests']} in {report['replay_seconds']:.1f} s ({report['achieved_rps']:.1f} ACKed/s), "
+          f"{report['errors']} errors; client send lag max {report['max_send_lag_ms']:.0f} ms")
+    print(f"ACK ms      p50 {report['ack_p50_ms']:.1f}  p90 {report['ack_p90_ms']:.1f}  p99 {report['ack_p99_ms']:.1f}  max {report['ack_max_ms']:.1f}")
+    print(f"E2E ms      p50 {report['e2e_p50_ms']:.0f}  p90 {report['e2e_p90_ms']:.0f}  p99 {report['e2e_p99_ms']:.0f}  "
+          f"(on_search p99 {report['on_search_e2e_p99_ms']:.0f}, on_select p99 {report['on_select_e2e_p99_ms']:.0f})")
+    print(f"Callbacks   {report['callbacks']} ({report['callback_ratio']:.1%}), {report['empty_results']} on_search with no items")
+    if not before:
+        print("Caches      /metrics not available on the target")
+    for cache, stats in sorted(caches.items()):
+        hit_rate = f"{stats['hit_rate']:.1%}" if stats["hit_rate"] is not None else "n/a"
+        print(f"Cache       {cache}: {hit_rate} hits ({stats['hits']} hits, {stats['misses']} misses)")
+    if results:
+        print(f"Target      {', '.join(f'{key}={value}' for key, value in sorted(results.items()))}")
+
+
+if __name__ == "__main__":
+    main()
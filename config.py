@@ -10,6 +10,8 @@ class Config:
     # --- Google Generative AI Configuration ---
     # Default to Google's text-embedding-004 model if not set
     EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'models/text-embedding-004')  # Default to Google's text-embedding-004
+    # Alternative API host (REST transport), e.g. http://127.0.0.1:8090 for benchmarks/fake_embedding_server.py
+    EMBEDDING_API_ENDPOINT = os.environ.get('EMBEDDING_API_ENDPOINT')
 
     # --- Database Credentials ---
     DB_HOST = os.environ.get('DB_HOST')
@@ -17,6 +19,139 @@ class Config:
     DB_NAME = os.environ.get('DB_NAME')
     DB_USER = os.environ.get('DB_USER')
     DB_PASSWORD = os.environ.get('DB_PASSWORD')
+    # Per worker process. Size for request threads + SCHEDULER_WORKERS (see gunicorn.conf.py).
+    DB_POOL_MIN_CONNECTIONS = int(os.environ.get('DB_POOL_MIN_CONNECTIONS', 1))
+    DB_POOL_MAX_CONNECTIONS = int(os.environ.get('DB_POOL_MAX_CONNECTIONS', 10))
+
+    # Set by gunicorn.conf.py when the app is preloaded: sockets and threads are
+    # then created per worker by its post_fork hook instead of in create_app().
+    DEFER_PROCESS_RESOURCES = os.environ.get('DEFER_PROCESS_RESOURCES', 'false').lower() == 'true'
+
+    # --- Background Job Scheduler ---
+    SCHEDULER_WORKERS = int(os.environ.get('SCHEDULER_WORKERS', 8))
+    # Used when a request's context carries no valid 'ttl'
+    SCHEDULER_DEFAULT_TTL_SECONDS = int(os.environ.get('SCHEDULER_DEFAULT_TTL_SECONDS', 30))
+    CONTEXT_MAX_CLOCK_SKEW_SECONDS = float(os.environ.get('CONTEXT_MAX_CLOCK_SKEW_SECONDS', 5)) # How far in the future a context.timestamp may be
+    SCHEDULER_DROP_EXPIRED = os.environ.get('SCHEDULER_DROP_EXPIRED', 'true').lower() == 'true'
+    SCHEDULER_MAX_QUEUE = int(os.environ.get('SCHEDULER_MAX_QUEUE', 1000)) # Queued jobs per worker before /search and /select are NACKed with 503; 0 = unbounded
+
+    # --- Outbound HTTP Client (callbacks to BAPs) ---
+    OUTBOUND_HTTP_POOL_CONNECTIONS = int(os.environ.get('OUTBOUND_HTTP_POOL_CONNECTIONS', 20)) # Number of hosts to keep pools for
+    OUTBOUND_HTTP_POOL_MAXSIZE = int(os.environ.get('OUTBOUND_HTTP_POOL_MAXSIZE', 10)) # Idle keep-alive connections per host
+    OUTBOUND_HTTP_POOL_BLOCK = os.environ.get('OUTBOUND_HTTP_POOL_BLOCK', 'false').lower() == 'true'
+
+    # --- Callback Delivery (retries and dead-letter store) ---
+    CALLBACK_DELIVERY_WORKERS = int(os.environ.get('CALLBACK_DELIVERY_WORKERS', 4))
+    CALLBACK_MAX_ATTEMPTS = int(os.environ.get('CALLBACK_MAX_ATTEMPTS', 5))
+    CALLBACK_BACKOFF_BASE_SECONDS = float(os.environ.get('CALLBACK_BACKOFF_BASE_SECONDS', 0.5))
+    CALLBACK_BACKOFF_MAX_SECONDS = float(os.environ.get('CALLBACK_BACKOFF_MAX_SECONDS', 30))
+    CALLBACK_PER_HOST_CONCURRENCY = int(os.environ.get('CALLBACK_PER_HOST_CONCURRENCY', 4)) # Initial in-flight limit per BAP (adapted by AIMD)
+    CALLBACK_MIN_HOST_CONCURRENCY = int(os.environ.get('CALLBACK_MIN_HOST_CONCURRENCY', 1))
+    CALLBACK_MAX_HOST_CONCURRENCY = int(os.environ.get('CALLBACK_MAX_HOST_CONCURRENCY', 16))
+    CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5)) # Consecutive failures before a BAP's circuit opens
+    CIRCUIT_OPEN_SECONDS = float(os.environ.get('CIRCUIT_OPEN_SECONDS', 30))
+    DEAD_LETTER_MAX_ENTRIES = int(os.environ.get('DEAD_LETTER_MAX_ENTRIES', 1000))
+    # Content-Encoding for large callback bodies: 'identity', 'gzip' or 'zstd' (needs the 'zstandard' package)
+    CALLBACK_COMPRESSION = os.environ.get('CALLBACK_COMPRESSION', 'identity')
+    CALLBACK_COMPRESSION_MIN_BYTES = int(os.environ.get('CALLBACK_COMPRESSION_MIN_BYTES', 8192))
+    # Comma-separated BAP audiences (scheme://host) that accept compressed bodies; empty means all
+    CALLBACK_COMPRESSION_AUDIENCES = os.environ.get('CALLBACK_COMPRESSION_AUDIENCES', '')
+
+    # --- Google ID Tokens for callbacks ---
+    ID_TOKEN_SOURCE = os.environ.get('ID_TOKEN_SOURCE', 'google') # 'google' or 'fake' (unsigned tokens for local testing)
+    ID_TOKEN_REFRESH_MARGIN_SECONDS = int(os.environ.get('ID_TOKEN_REFRESH_MARGIN_SECONDS', 300)) # Refresh this long before 'exp'
+    ID_TOKEN_REFRESH_INTERVAL_SECONDS = int(os.environ.get('ID_TOKEN_REFRESH_INTERVAL_SECONDS', 30))
+
+    # --- Catalog Item Fragment Cache (pre-serialized on_search items) ---
+    CATALOG_VERSION = os.environ.get('CATALOG_VERSION', '1') # Bump after a catalog reload to invalidate all fragments
+    CATALOG_FRAGMENT_CACHE_SIZE = int(os.environ.get('CATALOG_FRAGMENT_CACHE_SIZE', 10000))
+    CATALOG_FRAGMENT_TTL_SECONDS = int(os.environ.get('CATALOG_FRAGMENT_TTL_SECONDS', 300)) # Ages out unused entries; changed products re-render on their next search regardless
+
+    # --- Pending-request stores (in-flight /search and /select transactions) ---
+    PENDING_MAX_ENTRIES = int(os.environ.get('PENDING_MAX_ENTRIES', 10000)) # Per store; oldest entries are dropped beyond this
+    PENDING_TTL_SECONDS = int(os.environ.get('PENDING_TTL_SECONDS', 300)) # Unretrieved results are discarded after this
+    PENDING_STORE_STRIPES = int(os.environ.get('PENDING_STORE_STRIPES', 16)) # Independent locks per store
+    PENDING_SWEEP_INTERVAL_SECONDS = float(os.environ.get('PENDING_SWEEP_INTERVAL_SECONDS', 5))
+    # 'memory' (per process), 'sqlite' (shared by all workers on one host) or 'redis' (shared across instances)
+    PENDING_BACKEND = os.environ.get('PENDING_BACKEND', 'memory')
+    PENDING_SQLITE_PATH = os.environ.get('PENDING_SQLITE_PATH', '/tmp/bpp-pending.sqlite3')
+    PENDING_REDIS_URL = os.environ.get('PENDING_REDIS_URL', 'redis://localhost:6379/0')
+    PENDING_REDIS_KEY_PREFIX = os.environ.get('PENDING_REDIS_KEY_PREFIX', 'bpp:pending:')
+    # Dedup of retried /search and /select (same transaction_id + message_id)
+    IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 600)) # How long a completed response is re-delivered
+    IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', 10000))
+    IDEMPOTENCY_REDIS_KEY_PREFIX = os.environ.get('IDEMPOTENCY_REDIS_KEY_PREFIX', 'bpp:idempotency:') # PENDING_BACKEND=redis; the SQLite backend uses PENDING_SQLITE_PATH
+    # Long-poll (?wait=) and SSE result retrieval
+    RESULT_WAIT_MAX_SECONDS = float(os.environ.get('RESULT_WAIT_MAX_SECONDS', 30)) # Upper bound for one long-poll/SSE wait
+    RESULT_WAIT_RECHECK_SECONDS = float(os.environ.get('RESULT_WAIT_RECHECK_SECONDS', 0.5)) # Store re-check for sqlite/redis backends
+    SSE_KEEPALIVE_SECONDS = float(os.environ.get('SSE_KEEPALIVE_SECONDS', 15))
+
+    # --- Startup warmup (gates /readyz) ---
+    WARMUP_MODE = os.environ.get('WARMUP_MODE', 'background') # 'background', 'blocking' or 'off'
+    WARMUP_DB_CONNECTIONS = int(os.environ.get('WARMUP_DB_CONNECTIONS', 2)) # Connections opened and tested per worker; 0 skips the DB
+    WARMUP_EMBEDDING = os.environ.get('WARMUP_EMBEDDING', 'false').lower() == 'true' # One billed embedding call per worker boot to open the API channel
+    WARMUP_EMBEDDING_TIMEOUT_SECONDS = float(os.environ.get('WARMUP_EMBEDDING_TIMEOUT_SECONDS', 10))
+    # Comma-separated BAP audiences (scheme://host) whose callback ID tokens are fetched ahead of time
+    WARMUP_CALLBACK_AUDIENCES = [audience.strip() for audience in os.environ.get('WARMUP_CALLBACK_AUDIENCES', '').split(',') if audience.strip()]
+    WARMUP_RETRY_SECONDS = float(os.environ.get('WARMUP_RETRY_SECONDS', 5)) # Retry interval for failed required steps (DB, search service)
+    WARMUP_BLOCKING_TIMEOUT_SECONDS = float(os.environ.get('WARMUP_BLOCKING_TIMEOUT_SECONDS', 30)) # WARMUP_MODE=blocking: then serve as not ready; keep below GUNICORN_TIMEOUT
+
+    # --- Search attribute filters (see app/services/attribute_dictionary.py) ---
+    # Attribute values recognized among bare search words: 'boost' (rank matches higher), 'filter' (hard predicate) or 'off'.
+    # Explicit "color:black" / "gender in (...)" filters are hard predicates when their values are in the dictionary.
+    SEARCH_RECOGNIZED_ATTRIBUTES = os.environ.get('SEARCH_RECOGNIZED_ATTRIBUTES', 'off')
+    SEARCH_ATTRIBUTE_BOOST = float(os.environ.get('SEARCH_ATTRIBUTE_BOOST', 0.05)) # Subtracted from the vector distance per matching attribute
+    SEARCH_BOOST_CANDIDATE_FACTOR = int(os.environ.get('SEARCH_BOOST_CANDIDATE_FACTOR', 4)) # Nearest candidates re-ranked per result when boosting
+    ATTRIBUTE_DICTIONARY_MAX_VALUES = int(os.environ.get('ATTRIBUTE_DICTIONARY_MAX_VALUES', 500)) # Catalog values loaded per column at warmup; 0 keeps the built-in dictionary
+
+    # --- Per-category ANN indexes (python -m app.db.catalog_indexes --ann-partitions) ---
+    ANN_ROUTING_ENABLED = os.environ.get('ANN_ROUTING_ENABLED', 'true').lower() == 'true' # Route searches with a single-category hard filter to partition indexes
+    ANN_PARTITION_REFRESH_SECONDS = float(os.environ.get('ANN_PARTITION_REFRESH_SECONDS', 300)) # How often each worker's refresher thread re-reads the partition index list
+
+    # --- Slow-query log (/admin/slow_queries) ---
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 500)) # 0 turns the log off
+    SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', 200)) # Slow queries kept per worker
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 0.1)) # Fraction re-run under EXPLAIN (ANALYZE, BUFFERS); 0 never
+    SLOW_QUERY_EXPLAIN_MIN_INTERVAL_SECONDS = float(os.environ.get('SLOW_QUERY_EXPLAIN_MIN_INTERVAL_SECONDS', 30)) # At most one EXPLAIN per interval per worker
+    SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(os.environ.get('SLOW_QUERY_EXPLAIN_TIMEOUT_MS', 10000)) # statement_timeout of the re-run
+
+    # --- Metrics (/metrics, Prometheus text format) ---
+    # Shared directory for merging metrics across gunicorn workers; unset means this process only.
+    METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')
+    METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5)) # How stale other workers' numbers may be
+
+    # --- Tracing (spans per stage, keyed by transaction_id/message_id) ---
+    TRACING_EXPORTER = os.environ.get('TRACING_EXPORTER', 'off') # 'off', 'memory' (/admin/traces/<id> only), 'file' or 'otlp'
+    TRACING_SAMPLE_RATE = float(os.environ.get('TRACING_SAMPLE_RATE', 1.0)) # Fraction of transactions exported; a caller's traceparent decides for its own
+    TRACING_FILE_PATH = os.environ.get('TRACING_FILE_PATH', '/tmp/bpp-spans.jsonl') # JSON lines, shared by all workers
+    TRACING_OTLP_ENDPOINT = os.environ.get('TRACING_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces') # OTLP/HTTP (JSON) traces endpoint
+    TRACING_SERVICE_NAME = os.environ.get('TRACING_SERVICE_NAME', 'bpp-server')
+    TRACING_RECENT_TRANSACTIONS = int(os.environ.get('TRACING_RECENT_TRANSACTIONS', 1000)) # Per process, for /admin/traces/<id>
+    TRACING_EXPORT_INTERVAL_SECONDS = float(os.environ.get('TRACING_EXPORT_INTERVAL_SECONDS', 1.0))
+
+    # --- Traffic capture (sampled /search and /select bodies for benchmarks/replay_traffic.py) ---
+    TRAFFIC_CAPTURE_ENABLED = os.environ.get('TRAFFIC_CAPTURE_ENABLED', 'false').lower() == 'true'
+    TRAFFIC_CAPTURE_PATH = os.environ.get('TRAFFIC_CAPTURE_PATH', '/tmp/bpp-traffic.jsonl') # JSON lines, shared by all workers
+    TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.environ.get('TRAFFIC_CAPTURE_SAMPLE_RATE', 0.01)) # Fraction of transactions captured
+    TRAFFIC_CAPTURE_MAX_BYTES = int(os.environ.get('TRAFFIC_CAPTURE_MAX_BYTES', 1 << 30)) # Capture stops once the file reaches this size
+    TRAFFIC_CAPTURE_SCRUB_PATTERN = os.environ.get('TRAFFIC_CAPTURE_SCRUB_PATTERN') # Extra regex redacted in captured free text (e.g. national id formats), beside emails and phone numbers
+
+    # --- Operator endpoints (/admin: stats, dead letters, traces, slow queries) ---
+    ADMIN_ENABLED = os.environ.get('ADMIN_ENABLED', 'true').lower() == 'true'
+    # Sent as X-Admin-Token; unset refuses every /admin request. PROFILING_ADMIN_TOKEN is the older name.
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN') or os.environ.get('PROFILING_ADMIN_TOKEN')
+
+    # --- Profiling (/admin/profile, /admin/tracemalloc; not registered at all unless enabled) ---
+    GUNICORN_TIMEOUT = int(os.environ.get('GUNICORN_TIMEOUT', 60)) # Same variable as gunicorn.conf.py; bounds admin requests that block
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILING_MAX_SAMPLE_SECONDS = float(os.environ.get('PROFILING_MAX_SAMPLE_SECONDS', 30)) # Cap for one sampling run; also kept 10 s below GUNICORN_TIMEOUT
+    PROFILING_KEEP_PROFILES = int(os.environ.get('PROFILING_KEEP_PROFILES', 20)) # Per-request profiles kept per worker
+
+    # --- Logging ---
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text') # 'text' or 'json' (one object per line with transaction_id)
+    LOG_ASYNC = os.environ.get('LOG_ASYNC', 'true').lower() == 'true' # Write log records from a background listener thread
+    # Fraction of request payloads logged per route, e.g. "search=0.01,select=0.1,*=0"
+    LOG_PAYLOAD_SAMPLE_RATES = os.environ.get('LOG_PAYLOAD_SAMPLE_RATES', 'search=0.01,select=0.1,*=0')
 
     DEBUG = False
     TESTING = False
@@ -25,10 +160,12 @@ class Config:
 class DevelopmentConfig(Config):
     DEBUG = True
     LOG_LEVEL = 'DEBUG'
+    LOG_PAYLOAD_SAMPLE_RATES = os.environ.get('LOG_PAYLOAD_SAMPLE_RATES', '*=1.0')
 
 class ProductionConfig(Config):
     DEBUG = False
     LOG_LEVEL = 'INFO'
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
 
 class TestingConfig(Config):
     TESTING = True
@@ -0,0 +1,119 @@
+# gunicorn.conf.py
+#
+# Deployment profile for `gunicorn -c gunicorn.conf.py run:app`.
+#
+# Worker models (GUNICORN_WORKER_CLASS):
+#   gthread (default)  one process per core, GUNICORN_THREADS request threads each.
+#                      /search and /select only parse, ACK and enqueue, so threads
+#                      are cheap; long-poll/SSE waiters each hold one thread.
+#   gevent             greenlets; best for many concurrent long-poll/SSE clients.
+#                      Needs the 'gevent' package; 'psycogreen' makes psycopg2 cooperative.
+#   sync               one request at a time per process; only for comparison.
+#
+# With GUNICORN_PRELOAD=true (default) the app is imported once in the master and
+# forked, so code, config and read-only caches are shared copy-on-write. Anything
+# owning sockets or threads (DB pool, HTTP client, token refresher, callback
+# workers, scheduler, log listener) is created per worker after fork instead.
+#
+# Set METRICS_MULTIPROC_DIR (e.g. a tmpfs path) so /metrics reports all workers
+# rather than whichever one answers the scrape.
+#
+# Size DB_POOL_MAX_CONNECTIONS per worker for GUNICORN_THREADS + SCHEDULER_WORKERS;
+# Postgres sees workers * DB_POOL_MAX_CONNECTIONS connections in the worst case.
+#
+# Measured with benchmarks/bench_gunicorn_modes.py: 2 workers, 32 keep-alive
+# clients, /beckn/search ACKs with DB and background work stubbed, on a 1-vCPU
+# container that also runs the client:
+#
+#   mode     preload   req/s   first ACK   RSS/worker   PSS/worker
+#   sync     no          815     2.59 s      107 MB        84 MB
+#   sync     yes         725     1.49 s       83 MB        35 MB
+#   gthread  no          758     3.03 s      107 MB        84 MB
+#   gthread  yes         714     1.24 s       83 MB        34 MB
+#   gevent   no          778     2.94 s      111 MB        87 MB
+#   gevent   yes         742     1.71 s       87 MB        37 MB
+#
+# On one core the ACK path is CPU-bound, so the worker models are within ~10%.
+# What differs is concurrency: a sync worker is blocked by a single long-poll or
+# SSE client, a gthread worker by GUNICORN_THREADS of them, a gevent worker by
+# none. Preloading halves time to first ACK and cuts unshared memory (PSS) per
+# worker by ~60%, at a ~5-10% throughput cost from copy-on-write faults.
+import gc
+import multiprocessing
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+_is_gevent = worker_class in ('gevent', 'gunicorn.workers.ggevent.GeventWorker')
+
+if _is_gevent:
+    # Patch before the app (and its threading/socket users) is imported in the master.
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8080')
+_default_workers = multiprocessing.cpu_count() * 2 + 1 if worker_class == 'sync' else multiprocessing.cpu_count()
+workers = int(os.environ.get('GUNICORN_WORKERS', _default_workers))
+threads = int(os.environ.get('GUNICORN_THREADS', 8)) # gthread only
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000)) # gevent only
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60)) # Must exceed RESULT_WAIT_MAX_SECONDS for long-poll/SSE
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0)) # 0 disables worker recycling
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+if preload_app:
+    # Read by config.Config: create_app() in the master skips sockets and threads.
+    os.environ.setdefault('DEFER_PROCESS_RESOURCES', 'true')
+
+
+def _init_worker_resources(worker):
+    from app import init_process_resources
+    init_process_resources(worker.app.wsgi()) # The preloaded Flask app, inherited from the master
+
+
+def when_ready(server):
+    metrics_dir = os.environ.get('METRICS_MULTIPROC_DIR')
+    if metrics_dir:
+        # Counters restart from zero with the new workers; drop the previous run's snapshots.
+        from app.utils.metrics import clear_multiprocess_dir
+        clear_multiprocess_dir(metrics_dir)
+    if preload_app:
+        # Move everything the master allocated into the permanent generation, so
+        # the workers' garbage collector never writes to (and un-shares) those pages.
+        gc.freeze()
+        server.log.info("Preloaded app: froze %d objects for copy-on-write sharing.", gc.get_freeze_count())
+
+
+def child_exit(server, worker):
+    metrics_dir = os.environ.get('METRICS_MULTIPROC_DIR')
+    if metrics_dir:
+        # Keep the worker's totals but not its file, so restarts don't pile up snapshots.
+        from app.utils.metrics import retire_worker_snapshots
+        retire_worker_snapshots(metrics_dir, worker.pid)
+
+
+def post_fork(server, worker):
+    if _is_gevent:
+        _patch_gevent_drivers(server)
+        return # Resources are created in post_worker_init, once the worker's hub is running
+    if preload_app:
+        _init_worker_resources(worker)
+
+
+def post_worker_init(worker):
+    if _is_gevent and preload_app:
+        _init_worker_resources(worker)
+
+
+def _patch_gevent_drivers(server):
+    try:
+        from psycogreen.gevent import patch_psycopg # Optional: makes psycopg2 yield to the gevent hub
+        patch_psycopg()
+    except ImportError:
+        server.log.warning("psycogreen is not installed: database calls will block the gevent worker.")
+    try:
+        import grpc.experimental.gevent as grpc_gevent # google.generativeai talks gRPC
+        grpc_gevent.init_gevent()
+    except ImportError:
+        pass
@@ -0,0 +1,37 @@
+# tests/conftest.py
+import logging
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('WARMUP_MODE', 'off') # Nothing to warm without a DB
+os.environ.setdefault('ID_TOKEN_SOURCE', 'fake')
+os.environ.setdefault('FLASK_ENV', 'testing')
+os.environ.setdefault('LOG_ASYNC', 'false') # The listener thread would outlive pytest's captured streams
+
+
+@pytest.fixture(scope="session")
+def app():
+    """
+    The Flask app with its per-process resources (scheduler, pending stores,
+    callback delivery, ...) but without a database pool.
+    """
+    import app as app_package
+    original = app_package.initialize_db_pool
+    app_package.initialize_db_pool = lambda flask_app: None
+    try:
+        flask_app = app_package.create_app()
+    finally:
+        app_package.initialize_db_pool = original
+    flask_app.config['TESTING'] = True
+    yield flask_app
+    # The atexit shutdown handlers log after pytest has closed its captured streams
+    for handler in logging.getLogger().handlers:
+        if type(handler) is logging.StreamHandler:
+            handler.setStream(sys.__stderr__)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
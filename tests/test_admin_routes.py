@@ -0,0 +1,39 @@
+# tests/test_admin_routes.py
+import pytest
+
+ADMIN_TOKEN = "test-admin-token"
+
+
+@pytest.fixture
+def admin_token(app, monkeypatch):
+    """The /admin blueprint is registered by create_app; the token is read per request."""
+    monkeypatch.setitem(app.config, "ADMIN_TOKEN", ADMIN_TOKEN)
+    return {"X-Admin-Token": ADMIN_TOKEN}
+
+
+@pytest.mark.parametrize("path", ["/scheduler_stats", "/pending_stats", "/dead_letters", "/idempotency_stats", "/startup_stats"])
+def test_debug_routes_are_not_on_the_public_blueprint(client, path):
+    assert client.get(f"/beckn{path}").status_code == 404
+
+
+def test_admin_routes_require_the_token(client, admin_token):
+    assert client.get("/admin/scheduler_stats").status_code == 403
+    assert client.get("/admin/scheduler_stats", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.post("/admin/dead_letters/x/replay").status_code == 403
+
+
+def test_admin_routes_refuse_everyone_without_a_configured_token(client, app, monkeypatch):
+    monkeypatch.setitem(app.config, "ADMIN_TOKEN", None)
+    assert client.get("/admin/scheduler_stats", headers={"X-Admin-Token": ""}).status_code == 403
+
+
+def test_admin_routes_answer_with_the_token_without_profiling(app, client, admin_token):
+    assert not app.config.get("PROFILING_ENABLED")
+    response = client.get("/admin/scheduler_stats", headers=admin_token)
+    assert response.status_code == 200
+    assert "queued" in response.get_json()
+    assert client.get("/admin/pending_stats", headers=admin_token).status_code == 200
+    assert client.get("/admin/dead_letters", headers=admin_token).status_code == 200
+    assert client.post("/admin/dead_letters/unknown/replay", headers=admin_token).status_code == 404
+    # The profiler endpoints exist only with PROFILING_ENABLED
+    assert client.get("/admin/profile/requests", headers=admin_token).status_code == 404
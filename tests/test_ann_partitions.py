@@ -0,0 +1,91 @@
+# tests/test_ann_partitions.py
+import json
+import time
+
+import pytest
+
+from app.db import db_pool_manager
+from app.db.ann_partitions import AnnPartitionRouter, partition_index_name
+
+
+def _index_row(column, value, rows=50000):
+    return partition_index_name(column, value), json.dumps({"column": column, "value": value, "rows": rows, "method": "hnsw"})
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        self.connection.queries += 1
+        if self.connection.fail:
+            raise RuntimeError("database is down")
+
+    def fetchall(self):
+        return list(self.connection.rows)
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+        self.fail = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def router():
+    router = AnnPartitionRouter(refresh_seconds=300)
+    router.refresh(FakeConnection([_index_row("master_category", "footwear"), _index_row("article_type", "tshirts")]))
+    return router
+
+
+def test_routes_only_single_value_hard_filters(router):
+    assert router.route({"master_category": ["Footwear"]}) == (
+        "master_category", "footwear", partition_index_name("master_category", "footwear"))
+    assert router.route({"master_category": ["footwear"], "article_type": ["tshirts"]})[0] == "article_type"
+    assert router.route({"master_category": ["footwear", "apparel"]}) is None
+    assert router.route({"master_category": ["apparel"]}) is None
+    assert router.route({"base_color": ["black"]}) is None
+    assert router.route({}) is None
+    assert router.route(None) is None
+
+
+def test_refresher_thread_picks_up_new_indexes(app, monkeypatch):
+    connection = FakeConnection([_index_row("master_category", "footwear")])
+    monkeypatch.setattr(db_pool_manager, "get_db_connection", lambda: connection)
+    monkeypatch.setattr(db_pool_manager, "put_db_connection", lambda conn: None)
+    router = AnnPartitionRouter(refresh_seconds=0.02)
+    router.start(app)
+    try:
+        deadline = time.monotonic() + 5
+        while router.route({"master_category": ["footwear"]}) is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert router.route({"master_category": ["footwear"]}) is not None
+
+        connection.fail = True # Errors keep the previous list
+        queries = connection.queries
+        while connection.queries < queries + 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert router.route({"master_category": ["footwear"]}) is not None
+
+        connection.fail = False
+        connection.rows = [_index_row("article_type", "tshirts")]
+        while router.route({"article_type": ["tshirts"]}) is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert router.route({"master_category": ["footwear"]}) is None
+    finally:
+        router.shutdown()
+    assert router._thread is None
+    assert router.get_stats()["refresh_seconds"] == 0.02
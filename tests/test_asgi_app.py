@@ -0,0 +1,55 @@
+# tests/test_asgi_app.py
+import asyncio
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.asgi_app import create_asgi_app
+from app.services import beckn_intake_service
+from app.services.beckn_intake_service import BecknIntakeService
+from app.utils.beckn_utils import mark_pending_request_failed, store_pending_request
+
+
+@pytest.fixture
+def asgi_client(app):
+    return TestClient(create_asgi_app(app))
+
+
+def _search_body(transaction_id):
+    return {"context": {"transaction_id": transaction_id, "message_id": f"{transaction_id}-m", "ttl": "PT30S"},
+            "message": {"intent": {"item": {"descriptor": {"name": "black shirt"}}}}}
+
+
+def test_intake_runs_off_the_event_loop(asgi_client, monkeypatch):
+    calls = []
+
+    def accept_search(data, traceparent=None):
+        try:
+            asyncio.get_running_loop()
+            calls.append("event loop")
+        except RuntimeError:
+            calls.append("thread")
+        return {"message": {"ack": {"status": "ACK"}}}, 202
+
+    monkeypatch.setattr(BecknIntakeService, "accept_search", staticmethod(accept_search))
+    response = asgi_client.post("/beckn/search", json=_search_body("txn-asgi-thread"))
+    assert response.status_code == 202
+    assert calls == ["thread"]
+
+
+def test_search_is_acked_through_the_shared_intake(asgi_client, monkeypatch):
+    monkeypatch.setattr(beckn_intake_service, "run_async_task", lambda *args, **kwargs: True)
+    response = asgi_client.post("/beckn/search", json=_search_body("txn-asgi"))
+    assert response.status_code == 202
+    assert response.json()["context"]["transaction_id"] == "txn-asgi"
+
+
+def test_failed_transaction_ends_the_long_poll_and_stream(app, asgi_client):
+    with app.app_context():
+        store_pending_request("txn-asgi-failed", None, {}, {})
+        mark_pending_request_failed("txn-asgi-failed", "expired")
+    response = asgi_client.get("/beckn/get_search_results/txn-asgi-failed?timeout=5")
+    assert response.status_code == 410
+    assert response.json()["status"] == "expired"
+    stream = asgi_client.get("/beckn/stream_search_results/txn-asgi-failed?timeout=5")
+    assert 'event: expired\ndata: {"status": "expired"}' in stream.text
@@ -0,0 +1,45 @@
+# tests/test_beckn_utils.py
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from app.utils.beckn_utils import get_context_deadline, parse_iso8601_duration
+
+
+def _iso(epoch_seconds):
+    return datetime.fromtimestamp(epoch_seconds, tz=timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+@pytest.mark.parametrize("duration, seconds", [
+    ("PT30S", 30), ("PT1M", 60), ("P1DT2H", 93600), ("PT0.5S", 0.5), ("30S", None), ("", None), (None, None),
+])
+def test_parse_iso8601_duration(duration, seconds):
+    assert parse_iso8601_duration(duration) == seconds
+
+
+def test_deadline_counts_from_a_current_timestamp(app):
+    sent_at = time.time() + 2 # A BAP clock slightly ahead of ours, within the skew allowance
+    with app.app_context():
+        deadline = get_context_deadline({"timestamp": _iso(sent_at), "ttl": "PT30S"}, 10)
+    assert deadline == pytest.approx(sent_at + 30, abs=0.01)
+
+
+def test_stale_timestamp_gives_a_deadline_in_the_past(app):
+    sent_at = time.time() - 3600
+    with app.app_context():
+        deadline = get_context_deadline({"timestamp": _iso(sent_at), "ttl": "PT30S"}, 10)
+    assert deadline == pytest.approx(sent_at + 30, abs=0.01)
+    assert deadline < time.time()
+
+
+def test_future_timestamp_is_clamped_to_the_skew_allowance(app):
+    with app.app_context():
+        deadline = get_context_deadline({"timestamp": _iso(time.time() + 3600), "ttl": "PT30S"}, 10, max_clock_skew_seconds=5)
+    assert deadline == pytest.approx(time.time() + 35, abs=1)
+
+
+def test_missing_fields_fall_back_to_receipt_and_default_ttl(app):
+    with app.app_context():
+        deadline = get_context_deadline({"timestamp": "yesterday"}, 10)
+    assert deadline == pytest.approx(time.time() + 10, abs=1)
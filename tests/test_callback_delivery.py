@@ -0,0 +1,78 @@
+# tests/test_callback_delivery.py
+import pytest
+import requests
+from flask import Flask
+
+from app.utils import callback_delivery
+from app.utils.callback_delivery import CallbackDeliveryQueue, CallbackJob
+from app.utils.compression import CompressionNegotiator, GZIP
+
+AUDIENCE = "https://bap.example"
+
+
+def _response(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = f"{AUDIENCE}/on_search"
+    return response
+
+
+class FakeBap(list):
+    """Records the headers of every POST and answers with `statuses`, in order."""
+
+    def __init__(self, statuses):
+        super().__init__()
+        self.statuses = list(statuses)
+
+    def request(self, url, method, headers=None, data=None, audience=None, timeout=None, **kwargs):
+        self.append(dict(headers))
+        return _response(self.statuses.pop(0))
+
+
+@pytest.fixture
+def negotiator(monkeypatch):
+    negotiator = CompressionNegotiator(encoding=GZIP, min_bytes=0)
+    monkeypatch.setattr(callback_delivery, "get_compression_negotiator", lambda: negotiator)
+    return negotiator
+
+
+def _bap(monkeypatch, *statuses):
+    bap = FakeBap(statuses)
+    monkeypatch.setattr(callback_delivery, "make_authenticated_request", bap.request)
+    return bap
+
+
+def _queue():
+    return CallbackDeliveryQueue(Flask(__name__), num_workers=1, max_attempts=3, backoff_base_seconds=0.01)
+
+
+def _job():
+    return CallbackJob("txn-1", "on_search", f"{AUDIENCE}/on_search", AUDIENCE, b'{"message":{}}')
+
+
+def test_415_to_a_compressed_body_is_resent_uncompressed_in_the_same_attempt(monkeypatch, negotiator):
+    bap = _bap(monkeypatch, 415, 200)
+    queue = _queue()
+    job = _job()
+    healthy, _ = queue._process(job)
+    assert healthy
+    assert job.attempts == 1
+    assert [headers.get("Content-Encoding") for headers in bap] == [GZIP, None]
+    assert queue.get_stats()["retried"] == 0
+    assert negotiator.choose_encoding(AUDIENCE, 10**6) == "identity" # Remembered for later callbacks
+
+
+def test_5xx_is_retried_and_reported_unhealthy(monkeypatch, negotiator):
+    _bap(monkeypatch, 503)
+    queue = _queue()
+    healthy, _ = queue._process(_job())
+    assert not healthy
+    assert queue.get_stats()["retried"] == 1
+
+
+def test_4xx_is_dead_lettered_without_blaming_the_host(monkeypatch, negotiator):
+    _bap(monkeypatch, 400)
+    queue = _queue()
+    healthy, _ = queue._process(_job())
+    assert healthy
+    assert queue.dead_letters.list_entries()[0]["reason"] == "non_retryable_error"
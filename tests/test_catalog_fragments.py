@@ -0,0 +1,39 @@
+# tests/test_catalog_fragments.py
+import json
+
+from app.services.beckn_service import BecknService
+from app.services.catalog_fragments import CatalogFragmentCache
+
+
+def _product(price=1499.0, name="Black Shirt"):
+    return {"id": "p-1", "name": name, "brand": "Nike", "price": price, "currency": "INR"}
+
+
+def _render(cache, product):
+    return json.loads(cache.get_fragments([product], BecknService._build_catalog_item)[0])
+
+
+def test_unchanged_product_is_served_from_the_cache():
+    cache = CatalogFragmentCache()
+    _render(cache, _product())
+    _render(cache, _product())
+    assert (cache.get_stats()["hits"], cache.get_stats()["misses"]) == (1, 1)
+
+
+def test_changed_price_re_renders_the_fragment():
+    cache = CatalogFragmentCache(ttl_seconds=3600)
+    assert _render(cache, _product(price=1499.0))["price"]["value"] == "1499.0"
+    item = _render(cache, _product(price=999.0))
+    assert item["price"]["value"] == "999.0"
+    assert _render(cache, _product(price=999.0, name="Black Shirt (new)"))["name"] == "Black Shirt (new)"
+    assert cache.get_stats()["misses"] == 3
+    assert cache.get_stats()["size"] == 1
+
+
+def test_catalog_version_bump_drops_every_fragment():
+    cache = CatalogFragmentCache()
+    _render(cache, _product())
+    cache.set_catalog_version("2")
+    assert cache.get_stats()["size"] == 0
+    _render(cache, _product())
+    assert cache.get_stats()["misses"] == 2
@@ -0,0 +1,49 @@
+# tests/test_catalog_indexes.py
+from app.db.catalog_indexes import create_attribute_indexes
+
+
+class FakeCursor:
+    def __init__(self, invalid):
+        self.invalid = invalid
+        self.statements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql.strip())
+        self._params = params
+
+    def fetchall(self):
+        return [(name,) for name in self._params[0] if name in self.invalid]
+
+
+class FakeConnection:
+    def __init__(self, invalid=()):
+        self.autocommit = False
+        self.cursor_ = FakeCursor(set(invalid))
+
+    def cursor(self):
+        return self.cursor_
+
+
+def test_invalid_indexes_are_dropped_and_rebuilt():
+    connection = FakeConnection(invalid={"products_brand_name_lower"})
+    create_attribute_indexes(connection, log=lambda message: None)
+    statements = connection.cursor_.statements
+    assert connection.autocommit
+    drop = statements.index("DROP INDEX CONCURRENTLY IF EXISTS products_brand_name_lower")
+    assert statements[drop + 1].startswith("CREATE INDEX CONCURRENTLY IF NOT EXISTS products_brand_name_lower")
+    assert sum(statement.startswith("DROP") for statement in statements) == 1
+    assert statements[-1] == "ANALYZE products"
+
+
+def test_valid_indexes_are_left_alone():
+    connection = FakeConnection()
+    create_attribute_indexes(connection, concurrently=False, log=lambda message: None)
+    statements = connection.cursor_.statements
+    assert not any(statement.startswith("DROP") for statement in statements)
+    assert "CREATE INDEX IF NOT EXISTS products_gender_lower ON products (lower(gender))" in statements
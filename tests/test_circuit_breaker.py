@@ -0,0 +1,108 @@
+# tests/test_circuit_breaker.py
+import threading
+import time
+
+from flask import Flask
+
+from app.utils.callback_delivery import CallbackDeliveryQueue, CallbackJob
+from app.utils.circuit_breaker import AIMDLimiter, CircuitBreaker, CLOSED, HALF_OPEN, OPEN
+from app.utils.deadline import Deadline
+
+AUDIENCE = "https://bap.example"
+
+
+def _job(transaction_id="txn-1", deadline=None):
+    return CallbackJob(transaction_id, "on_search", f"{AUDIENCE}/on_search", AUDIENCE, b'{"message":{}}', deadline)
+
+
+def _queue(**kwargs):
+    queue = CallbackDeliveryQueue(Flask(__name__), num_workers=0, **kwargs)
+    queue._running = True # Jobs are taken by the test instead of worker threads
+    return queue
+
+
+def test_breaker_opens_after_consecutive_failures_and_success_resets_the_count():
+    breaker = CircuitBreaker(failure_threshold=3, open_seconds=10)
+    breaker.record_failure(now=1)
+    breaker.record_failure(now=2)
+    breaker.record_success()
+    breaker.record_failure(now=3)
+    breaker.record_failure(now=4)
+    assert breaker.state == CLOSED
+    breaker.record_failure(now=5)
+    assert breaker.state == OPEN
+    assert not breaker.allow(now=14.9, in_flight=0)
+    assert breaker.retry_at() == 15
+
+
+def test_half_open_lets_a_single_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, open_seconds=10)
+    breaker.record_failure(now=0)
+    assert breaker.allow(now=10, in_flight=0)
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow(now=10, in_flight=1) # The probe is still out
+
+    breaker.record_failure(now=11) # A failed probe re-opens at once
+    assert breaker.state == OPEN
+    assert not breaker.allow(now=20, in_flight=0)
+    assert breaker.allow(now=21, in_flight=0)
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow(now=21, in_flight=5)
+
+
+def test_aimd_limit_grows_by_about_one_per_window_and_halves_on_failure():
+    limiter = AIMDLimiter(initial_limit=4, min_limit=1, max_limit=8)
+    for _ in range(4):
+        limiter.on_success()
+    assert limiter.limit == 4 # +1/limit per success: just under 5 after one window
+    limiter.on_success()
+    assert limiter.limit == 5
+    limiter.on_failure()
+    assert limiter.limit == 2
+    for _ in range(5):
+        limiter.on_failure()
+    assert limiter.limit == 1
+    for _ in range(200):
+        limiter.on_success()
+    assert limiter.limit == 8
+
+
+def test_job_for_a_busy_host_is_pushed_back_until_a_slot_frees():
+    queue = _queue(per_host_concurrency=1)
+    first, second = _job("txn-1"), _job("txn-2")
+    queue.enqueue(first)
+    queue.enqueue(second)
+    assert queue._next_job() is first
+
+    taken = []
+    taker = threading.Thread(target=lambda: taken.append(queue._next_job()))
+    taker.start()
+    time.sleep(0.1) # Several busy re-checks
+    assert taken == []
+    assert queue.get_stats()["queued"] == 1 # Re-pushed, not lost
+    queue._release(first, (True, 5.0))
+    taker.join(5)
+    assert taken == [second]
+    assert queue.get_host_stats()[AUDIENCE]["in_flight"] == 1
+    queue.shutdown()
+
+
+def test_open_circuit_holds_jobs_and_dead_letters_those_out_of_budget():
+    queue = _queue(circuit_failure_threshold=1, circuit_open_seconds=30)
+    probe = _job("txn-probe")
+    queue.enqueue(probe)
+    assert queue._next_job() is probe
+    queue._release(probe, (False, 5.0))
+    assert queue.get_host_stats()[AUDIENCE]["state"] == OPEN
+
+    queue.enqueue(_job("txn-short", deadline=Deadline.after(1)))
+    queue.enqueue(_job("txn-long", deadline=Deadline.after(60)))
+    timer = threading.Timer(0.2, queue.shutdown) # _next_job() blocks until the circuit half-opens
+    timer.start()
+    assert queue._next_job() is None
+    timer.join()
+    assert [entry["transaction_id"] for entry in queue.dead_letters.list_entries()] == ["txn-short"]
+    (retry_at, _, job), = queue._heap
+    assert job.transaction_id == "txn-long"
+    assert retry_at > time.monotonic() + 25
@@ -0,0 +1,104 @@
+# tests/test_id_token_manager.py
+import threading
+import time
+
+import pytest
+
+from app.utils.id_token_manager import FakeTokenSource, IdTokenManager, decode_jwt_expiry
+
+AUDIENCE = "https://bap.example"
+
+
+class FlakyTokenSource(FakeTokenSource):
+    """Fails every fetch once `fail` is set."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.fail = False
+
+    def fetch(self, audience):
+        if self.fail:
+            raise OSError("metadata server unreachable")
+        return super().fetch(audience)
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_token_is_cached_until_its_expiry():
+    source = FakeTokenSource(lifetime_seconds=3600)
+    manager = IdTokenManager(token_source=source, refresh_margin_seconds=300)
+    token = manager.get_token(AUDIENCE)
+    assert manager.get_token(AUDIENCE) == token
+    assert source.fetch_counts == {AUDIENCE: 1}
+    assert decode_jwt_expiry(token) == pytest.approx(time.time() + 3600, abs=5)
+
+
+def test_concurrent_misses_share_one_fetch():
+    source = FakeTokenSource(fetch_delay_seconds=0.2)
+    manager = IdTokenManager(token_source=source)
+    barrier = threading.Barrier(8)
+    tokens = []
+
+    def fetch():
+        barrier.wait()
+        tokens.append(manager.get_token(AUDIENCE))
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(tokens) == 8 and len(set(tokens)) == 1
+    assert source.fetch_counts == {AUDIENCE: 1}
+    assert manager.get_stats()["coalesced_waits"] == 7
+
+
+def test_token_inside_the_refresh_margin_is_served_and_replaced_in_the_background():
+    # Tokens live 100 s, which is already inside the 300 s margin.
+    source = FakeTokenSource(lifetime_seconds=100, fetch_delay_seconds=0.5)
+    manager = IdTokenManager(token_source=source, refresh_margin_seconds=300)
+    manager.get_token(AUDIENCE)
+
+    started = time.perf_counter()
+    manager.get_token(AUDIENCE)
+    assert time.perf_counter() - started < 0.25 # Served from the cache, not waiting on the refresh
+    assert _wait_until(lambda: manager.get_stats()["background_refreshes"] == 1)
+    assert source.fetch_counts[AUDIENCE] == 2
+
+
+def test_refresher_thread_renews_tokens_before_they_expire():
+    source = FakeTokenSource(lifetime_seconds=100)
+    manager = IdTokenManager(token_source=source, refresh_margin_seconds=300, refresh_interval_seconds=0.05)
+    manager.get_token(AUDIENCE)
+    manager.start()
+    try:
+        assert _wait_until(lambda: source.fetch_counts[AUDIENCE] >= 2)
+    finally:
+        manager.shutdown()
+
+
+def test_failed_refresh_keeps_serving_the_still_valid_token():
+    source = FlakyTokenSource(lifetime_seconds=100)
+    manager = IdTokenManager(token_source=source, refresh_margin_seconds=300)
+    token = manager.get_token(AUDIENCE)
+    source.fail = True
+    assert manager.get_token(AUDIENCE) == token
+    assert _wait_until(lambda: manager.get_stats()["fetch_errors"] == 1)
+    assert manager.get_token(AUDIENCE) == token
+
+
+def test_failed_fetch_without_a_valid_token_raises():
+    source = FlakyTokenSource()
+    source.fail = True
+    manager = IdTokenManager(token_source=source)
+    with pytest.raises(ConnectionError):
+        manager.get_token(AUDIENCE)
+    source.fail = False
+    assert manager.get_token(AUDIENCE) # Recovers on the next call
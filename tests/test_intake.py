@@ -0,0 +1,98 @@
+# tests/test_intake.py
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from app.services import beckn_intake_service
+from app.services.beckn_service import BecknService
+from app.utils import idempotency
+from app.utils.beckn_utils import get_pending_request_details
+from app.utils.shared_idempotency import SQLiteIdempotencyCache
+
+
+def _search_body(transaction_id, timestamp=None):
+    context = {"transaction_id": transaction_id, "message_id": f"{transaction_id}-m", "ttl": "PT30S",
+               "bpp_uri": "http://bap.invalid/receiver"}
+    if timestamp is not None:
+        context["timestamp"] = datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat().replace('+00:00', 'Z')
+    return {"context": context, "message": {"intent": {"item": {"descriptor": {"name": "black shirt"}}}}}
+
+
+def test_search_is_nacked_with_503_when_the_job_queue_is_full(client, app, monkeypatch):
+    monkeypatch.setattr(beckn_intake_service, "run_async_task", lambda *args, **kwargs: False)
+    response = client.post("/beckn/search", json=_search_body("txn-shed"))
+    assert response.status_code == 503
+    assert response.get_json()["message"]["ack"]["status"] == "NACK"
+    assert response.get_json()["error"]["code"] == "BUSY"
+    with app.app_context():
+        assert get_pending_request_details("txn-shed")["status"] == "failed"
+
+
+def test_search_is_acked_when_queued(client, monkeypatch):
+    monkeypatch.setattr(beckn_intake_service, "run_async_task", lambda *args, **kwargs: True)
+    response = client.post("/beckn/search", json=_search_body("txn-ack"))
+    assert response.status_code == 202
+    assert response.get_json()["message"]["ack"]["status"] == "ACK"
+
+
+@pytest.mark.parametrize("action", ["search", "select"])
+def test_requests_expired_on_arrival_are_nacked_and_not_queued(client, app, monkeypatch, action):
+    queued = []
+    monkeypatch.setattr(beckn_intake_service, "run_async_task", lambda *args, **kwargs: queued.append(args) or True)
+    monkeypatch.setattr(beckn_intake_service, "run_async_select_task", lambda *args, **kwargs: queued.append(args) or True)
+    body = _search_body(f"txn-stale-{action}", timestamp=time.time() - 60)
+    body["message"] = {"order": {"items": [{"id": "p-1"}]}} if action == "select" else body["message"]
+    response = client.post(f"/beckn/{action}", json=body)
+    assert response.status_code == 400
+    assert response.get_json()["message"]["ack"]["status"] == "NACK"
+    assert response.get_json()["error"]["code"] == "EXPIRED"
+    assert queued == []
+    with app.app_context():
+        assert get_pending_request_details(f"txn-stale-{action}") is None
+
+
+def test_retried_search_is_deduplicated_across_workers(client, monkeypatch, tmp_path):
+    path = str(tmp_path / "pending.sqlite3")
+    worker_a, worker_b = SQLiteIdempotencyCache(path), SQLiteIdempotencyCache(path) # Two processes' caches
+    jobs, callbacks = [], []
+    monkeypatch.setattr(beckn_intake_service, "run_async_task", lambda *args, **kwargs: jobs.append(args) or True)
+    monkeypatch.setattr(BecknService, "send_on_search_callback",
+                        staticmethod(lambda uri, body, transaction_id, deadline=None: callbacks.append((uri, body))))
+    body = _search_body("txn-dedup")
+
+    monkeypatch.setattr(idempotency, "idempotency_cache", worker_a)
+    assert client.post("/beckn/search", json=body).status_code == 202
+    monkeypatch.setattr(idempotency, "idempotency_cache", worker_b)
+    assert client.post("/beckn/search", json=body).status_code == 202 # Attached to the in-flight original
+    assert (len(jobs), callbacks) == (1, [])
+
+    worker_a.complete("search", "txn-dedup", "txn-dedup-m", b'{"message": "done"}')
+    response = client.post("/beckn/search", json=body)
+    assert response.get_json()["message"]["ack"]["status"] == "ACK"
+    assert len(jobs) == 1
+    assert callbacks == [("http://bap.invalid/caller", b'{"message": "done"}')]
+    assert worker_b.get_stats()["dedup_hits"] == 2
+
+
+INVALID_BODIES = ["[]", '"text"', "42", "null", '{"context": "x"}', '{"message": []}', "{not json"]
+
+
+@pytest.mark.parametrize("body", INVALID_BODIES)
+@pytest.mark.parametrize("action", ["search", "select"])
+def test_non_object_bodies_get_a_400_on_flask(client, action, body):
+    response = client.post(f"/beckn/{action}", data=body, content_type="application/json")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+@pytest.mark.parametrize("body", INVALID_BODIES)
+@pytest.mark.parametrize("action", ["search", "select"])
+def test_non_object_bodies_get_the_same_400_on_asgi(app, client, action, body):
+    from starlette.testclient import TestClient
+    from app.asgi_app import create_asgi_app
+    asgi_response = TestClient(create_asgi_app(app)).post(f"/beckn/{action}", content=body,
+                                                          headers={"Content-Type": "application/json"})
+    flask_response = client.post(f"/beckn/{action}", data=body, content_type="application/json")
+    assert asgi_response.status_code == 400
+    assert asgi_response.json() == flask_response.get_json()
@@ -0,0 +1,49 @@
+# tests/test_job_scheduler.py
+import threading
+import time
+
+from flask import Flask
+
+from app.utils.job_scheduler import JobScheduler, PRIORITY_SEARCH, PRIORITY_SELECT
+
+
+def test_select_runs_before_search_and_earliest_deadline_first():
+    scheduler = JobScheduler(Flask(__name__), num_workers=1)
+    ran = []
+    done = threading.Event()
+    now = time.time()
+    scheduler.submit("search:late", PRIORITY_SEARCH, now + 20, ran.append, "search-late")
+    scheduler.submit("search:early", PRIORITY_SEARCH, now + 10, ran.append, "search-early")
+    scheduler.submit("select:a", PRIORITY_SELECT, now + 30, ran.append, "select")
+    scheduler.submit("search:last", PRIORITY_SEARCH, now + 40, lambda: done.set())
+    scheduler.start()
+    try:
+        assert done.wait(5)
+    finally:
+        scheduler.shutdown()
+    assert ran == ["select", "search-early", "search-late"]
+
+
+def test_full_queue_sheds_new_jobs():
+    scheduler = JobScheduler(Flask(__name__), num_workers=1, max_queue=2) # Not started: nothing dequeues
+    deadline = time.time() + 30
+    assert scheduler.submit("search:1", PRIORITY_SEARCH, deadline, print)
+    assert scheduler.submit("search:2", PRIORITY_SEARCH, deadline, print)
+    assert not scheduler.submit("search:3", PRIORITY_SEARCH, deadline, print)
+    stats = scheduler.get_stats()
+    assert stats["queued"] == 2
+    assert stats["shed"] == 1
+
+
+def test_expired_job_is_dropped_and_its_drop_handler_runs():
+    scheduler = JobScheduler(Flask(__name__), num_workers=1)
+    dropped = threading.Event()
+    ran = []
+    scheduler.submit("search:stale", PRIORITY_SEARCH, time.time() - 1, ran.append, "ran", on_drop=dropped.set)
+    scheduler.start()
+    try:
+        assert dropped.wait(5)
+    finally:
+        scheduler.shutdown()
+    assert ran == []
+    assert scheduler.get_stats()["dropped_expired"] == 1
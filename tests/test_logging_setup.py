@@ -0,0 +1,44 @@
+# tests/test_logging_setup.py
+import logging
+import queue
+
+from app.utils.logging_setup import DeferredQueueHandler, LazyJSON, set_log_transaction_id, reset_log_transaction_id
+from app.utils.logging_setup import TransactionContextFilter
+
+
+def _enqueue(msg, *args):
+    log_queue = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    record = logging.getLogger("test").makeRecord("test", logging.INFO, __file__, 1, msg, args, None)
+    handler.handle(record)
+    return log_queue.get_nowait()
+
+
+def test_immutable_args_are_left_for_the_listener_thread():
+    record = _enqueue("%s took %.1f ms", "search", 12.5)
+    assert record.args == ("search", 12.5)
+    assert record.getMessage() == "search took 12.5 ms"
+
+
+def test_mutable_args_are_formatted_before_the_caller_can_change_them():
+    criteria = {"keywords": ["shirt"]}
+    body = {"context": {"transaction_id": "t1"}}
+    record = _enqueue("Criteria: %s. Body: %s", criteria, LazyJSON(body))
+    criteria["keywords"].append("black")
+    body["context"]["transaction_id"] = "t2"
+    assert record.args is None
+    assert record.getMessage() == 'Criteria: {\'keywords\': [\'shirt\']}. Body: {"context":{"transaction_id":"t1"}}'
+
+
+def test_transaction_id_is_stamped_from_the_logging_thread_and_resettable():
+    context_filter = TransactionContextFilter()
+    token = set_log_transaction_id("txn-1")
+    try:
+        record = logging.makeLogRecord({"msg": "inside"})
+        context_filter.filter(record)
+        assert record.transaction_id == "txn-1"
+    finally:
+        reset_log_transaction_id(token)
+    record = logging.makeLogRecord({"msg": "outside"})
+    context_filter.filter(record)
+    assert record.transaction_id == "-"
@@ -0,0 +1,66 @@
+# tests/test_metrics.py
+import os
+
+import pytest
+
+from app.services import product_search_service
+from app.services.product_search_service import ProductSearchService
+from app.utils.deadline import Deadline, DeadlineExceeded
+from app.utils.metrics import MetricsFlusher, MetricsRegistry, EXITED_SNAPSHOT, ERRORS
+from app.utils.metrics import merge_snapshots, retire_worker_snapshots
+
+
+def _worker(directory, pid, requests):
+    """A registry and flusher standing in for one gunicorn worker."""
+    registry = MetricsRegistry()
+    counter = registry.counter("bpp_requests_total", "Requests.", ["action"])
+    counter.labels("search").inc(requests)
+    flusher = MetricsFlusher(registry, str(directory))
+    flusher.pid = pid
+    flusher.flush()
+    return flusher
+
+
+def _total(flusher):
+    series = merge_snapshots(flusher.read_all())["bpp_requests_total"]["series"]
+    return series[("search",)]
+
+
+def test_exited_worker_snapshot_is_folded_in_and_removed(tmp_path):
+    _worker(tmp_path, 101, 3)
+    _worker(tmp_path, 102, 4)
+    live = _worker(tmp_path, os.getpid(), 2)
+    assert _total(live) == 9
+
+    assert retire_worker_snapshots(str(tmp_path), 101) == 1
+    assert retire_worker_snapshots(str(tmp_path), 102) == 1
+    assert retire_worker_snapshots(str(tmp_path), 999) == 0
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([EXITED_SNAPSHOT, os.path.basename(live.path)])
+    assert _total(live) == 9 # Totals never go backwards
+
+
+def test_a_retired_file_that_is_still_there_is_not_counted_twice(tmp_path, monkeypatch):
+    _worker(tmp_path, 101, 3)
+    live = _worker(tmp_path, os.getpid(), 2)
+    monkeypatch.setattr(os, "remove", lambda path: None) # The master died between the two steps
+    retire_worker_snapshots(str(tmp_path), 101)
+    assert _total(live) == 5
+
+
+class _FailingGenai:
+    @staticmethod
+    def embed_content(**kwargs):
+        raise TimeoutError("deadline")
+
+
+def test_embedding_timeout_at_the_deadline_is_not_an_embedding_error(app, monkeypatch):
+    monkeypatch.setattr(product_search_service, "genai", _FailingGenai)
+    service = object.__new__(ProductSearchService) # Skips the API key setup
+    service.EMBEDDING_MODEL = "models/test"
+    errors_before = ERRORS.labels("embedding").value
+    with app.app_context():
+        with pytest.raises(DeadlineExceeded):
+            service.get_embedding("black shirt", deadline=Deadline(0))
+        assert ERRORS.labels("embedding").value == errors_before
+        assert service.get_embedding("black shirt", deadline=Deadline.after(30)) is None
+    assert ERRORS.labels("embedding").value == errors_before + 1
@@ -0,0 +1,90 @@
+# tests/test_parse_query_string.py
+import pytest
+
+from app.services import attribute_dictionary as attribute_dictionary_module
+from app.services.attribute_dictionary import AttributeDictionary
+from app.services.parse_query_string import parse_ondc_query_string, process_search_request
+from app.utils.beckn_utils import extract_search_criteria
+
+
+@pytest.fixture
+def catalog_dictionary(monkeypatch):
+    """The built-in vocabulary plus a few catalog brands and article types, as the warmup step loads them."""
+    dictionary = AttributeDictionary.with_catalog_values({
+        "brand_name": ["nike", "u.s. polo assn."], "article_type": ["shirts", "tshirts", "casual shoes"],
+    })
+    monkeypatch.setattr(attribute_dictionary_module, "attribute_dictionary", dictionary)
+    return dictionary
+
+
+@pytest.mark.parametrize("query, attributes", [
+    ("color:black", {"base_color": ["black"]}),
+    ("colour = Navy", {"base_color": ["navy blue"]}),
+    ("gender:mens|women", {"gender": ["men", "women"]}),
+    ("gender in (mens, Women, men)", {"gender": ["men", "women"]}),
+    ("brand: U.S. Polo Assn.", {"brand_name": ["u.s. polo assn."]}),
+    ("type:shirt", {"article_type": ["shirts"]}),
+    ("color:black, color in (white)", {"base_color": ["black", "white"]}),
+])
+def test_explicit_filters_resolve_to_catalog_values(catalog_dictionary, query, attributes):
+    parsed = parse_ondc_query_string(query)
+    assert parsed["attributes"] == attributes
+    assert parsed["keywords"] == []
+
+
+@pytest.mark.parametrize("query, keywords", [
+    ("type: casual wear", ["casual wear"]),
+    ("brand:Unknown Label, shirts", ["Unknown Label", "shirts"]),
+    ("color in (black, ultraviolet)", ["black", "ultraviolet"]),
+])
+def test_unknown_values_fall_back_to_keywords(catalog_dictionary, query, keywords):
+    parsed = parse_ondc_query_string(query)
+    assert parsed["attributes"] == {}
+    assert parsed["keywords"] == keywords
+
+
+def test_unknown_attribute_names_stay_keywords(catalog_dictionary):
+    parsed = parse_ondc_query_string("material:cotton, fit in (slim)")
+    assert parsed["attributes"] == {}
+    assert parsed["keywords"] == ["material:cotton", "fit in (slim)"]
+
+
+@pytest.mark.parametrize("query, low, high", [
+    ("price > 1000", 1000, None),
+    ("price<=2000", None, 2000),
+    ("price > 1000, price < 2000", 1000, 2000),
+    ("price > 500, price > 1000, price < 3000, price < 2000", 1000, 2000),
+    ("price 1000-2000", 1000, 2000),
+    ("price:2000 to 1000", 1000, 2000),
+    ("price 1000-2000, price < 1500", 1000, 1500),
+    ("price > 2000, price < 1000", None, None),
+    ("price 12.5-99.9", 12.5, 99.9),
+])
+def test_price_bounds(query, low, high):
+    parsed = parse_ondc_query_string(query)
+    assert (parsed["min_price_val"], parsed["max_price_val"]) == (low, high)
+    assert parsed["keywords"] == []
+
+
+def test_mixed_query(catalog_dictionary):
+    parsed = parse_ondc_query_string("slim fit nike shirts for men, color in (black, navy), price 500-1500, type: casual wear")
+    assert parsed["attributes"] == {"base_color": ["black", "navy blue"]}
+    assert parsed["keywords"] == ["slim fit nike shirts for men", "casual wear"]
+    assert (parsed["min_price_val"], parsed["max_price_val"]) == (500, 1500)
+    assert parsed["recognized_attributes"] == {"brand_name": ["nike"], "article_type": ["shirts"], "gender": ["men"]}
+
+
+def test_empty_and_malformed_requests():
+    assert parse_ondc_query_string("")["keywords"] == []
+    assert process_search_request({"message": {}})["error"]
+
+
+def test_item_tags_resolve_like_the_query_parser(app, catalog_dictionary):
+    message = {"intent": {"item": {"descriptor": {"name": "shirt", "tags": [
+        {"code": "colour", "list": [{"code": "name", "value": "Black"}]},
+        {"code": "type", "list": [{"code": "name", "value": "casual wear"}]},
+    ]}}}}
+    with app.app_context():
+        criteria = extract_search_criteria(message)
+    assert criteria["attributes"] == {"base_color": ["black"]}
+    assert criteria["keywords"] == ["shirt", "casual wear"]
@@ -0,0 +1,61 @@
+# tests/test_pending_store.py
+import json
+import time
+
+import pytest
+
+from app.utils import json_codec
+from app.utils.pending_store import PendingRequestStore
+from app.utils.shared_pending_store import SQLitePendingStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = PendingRequestStore("search", max_entries=100, ttl_seconds=60)
+    else:
+        store = SQLitePendingStore("search", path=str(tmp_path / "pending.sqlite3"), max_entries=100, ttl_seconds=60)
+    yield store
+    store.shutdown()
+
+
+def test_completed_result_is_served_once(store):
+    store.put("t1", "http://bap.invalid", {"keywords": []}, {})
+    assert store.pop_result("t1") is None # Still pending
+    assert store.complete("t1", {"ok": True})
+    assert store.get("t1").status == "completed"
+    assert json_codec.loads(store.pop_result("t1")) == {"ok": True}
+    assert store.pop_result("t1") is None
+
+
+def test_fail_marks_only_pending_entries(store):
+    store.put("t1", None, {}, {})
+    store.put("t2", None, {}, {})
+    store.complete("t2", {"ok": True})
+    assert store.fail("t1", "expired")
+    assert store.get("t1").status == "expired"
+    assert not store.fail("t2")
+    assert store.get("t2").status == "completed"
+    assert not store.fail("unknown")
+
+
+def test_expiry_is_wall_clock_in_every_backend(store):
+    store.put("t1", None, {}, {})
+    assert store.get("t1").expires_at == pytest.approx(time.time() + 60, abs=5)
+
+
+def test_entry_details_are_json_serializable(store):
+    store.put("t1", "http://bap.invalid", {"keywords": ["shirt"]}, {"transaction_id": "t1"})
+    store.complete("t1", {"message": {"catalog": {}}})
+    details = store.get("t1").as_dict()
+    assert details["beckn_response"] == {"message": {"catalog": {}}}
+    json.dumps(details)
+
+
+def test_sqlite_result_is_popped_by_exactly_one_worker(tmp_path):
+    path = str(tmp_path / "pending.sqlite3")
+    first, second = SQLitePendingStore("search", path=path), SQLitePendingStore("search", path=path)
+    first.put("t1", None, {}, {})
+    second.complete("t1", {"ok": True})
+    results = [first.pop_result("t1"), second.pop_result("t1")]
+    assert results.count(None) == 1
@@ -0,0 +1,67 @@
+# tests/test_profiling.py
+import threading
+import time
+
+from flask import Flask
+
+from app.utils.profiling import SamplingProfiler, install_profiling, sampling_profiler
+
+ADMIN_TOKEN = "test-admin-token"
+
+
+def _install(**config):
+    profiled_app = Flask(__name__)
+    profiled_app.config.update(PROFILING_ENABLED=True, ADMIN_TOKEN=ADMIN_TOKEN, **config)
+    assert install_profiling(profiled_app)
+    return profiled_app
+
+
+def test_sampling_stays_below_the_worker_timeout():
+    _install(GUNICORN_TIMEOUT=30, PROFILING_MAX_SAMPLE_SECONDS=60)
+    assert sampling_profiler.max_seconds == 20
+    _install(GUNICORN_TIMEOUT=120, PROFILING_MAX_SAMPLE_SECONDS=15)
+    assert sampling_profiler.max_seconds == 15
+    _install(GUNICORN_TIMEOUT=5, PROFILING_MAX_SAMPLE_SECONDS=15)
+    assert sampling_profiler.max_seconds == 1
+
+
+def test_stacks_endpoint_reports_the_capped_duration():
+    client = _install(GUNICORN_TIMEOUT=60, PROFILING_MAX_SAMPLE_SECONDS=0.2).test_client()
+    started = time.monotonic()
+    response = client.get("/admin/profile/stacks?seconds=600&interval_ms=10", headers={"X-Admin-Token": ADMIN_TOKEN})
+    assert response.status_code == 200
+    assert response.headers["X-Profile-Seconds"] == "0.2"
+    assert time.monotonic() - started < 5
+
+
+def test_profiler_routes_require_the_token():
+    client = _install(PROFILING_MAX_SAMPLE_SECONDS=0.1).test_client()
+    assert client.get("/admin/profile/requests").status_code == 403
+    assert client.get("/admin/profile/requests", headers={"X-Admin-Token": ADMIN_TOKEN}).status_code == 200
+    assert client.get("/admin/scheduler_stats", headers={"X-Admin-Token": ADMIN_TOKEN}).status_code == 404 # Registered by create_app
+
+
+def test_one_sampling_run_at_a_time():
+    profiler = SamplingProfiler(max_seconds=1)
+    busy = threading.Event()
+    stop = threading.Event()
+
+    def spin():
+        busy.set()
+        while not stop.is_set():
+            sum(range(100))
+
+    worker = threading.Thread(target=spin, name="spinner-1")
+    worker.start()
+    busy.wait()
+    results = []
+    runner = threading.Thread(target=lambda: results.append(profiler.sample(0.3, 0.01)))
+    runner.start()
+    time.sleep(0.05)
+    assert profiler.sample(0.1) is None
+    runner.join()
+    stop.set()
+    worker.join()
+    stacks, rounds = results[0]
+    assert rounds > 0
+    assert any(stack.startswith("spinner;") for stack in stacks)
@@ -0,0 +1,102 @@
+# tests/test_result_waiters.py
+import asyncio
+import threading
+import time
+
+from app.utils import json_codec
+from app.utils.beckn_utils import store_pending_request, update_pending_request_with_result
+from app.utils.beckn_utils import wait_for_pending_request_results, wait_for_pending_request_results_async
+from app.utils.beckn_utils import get_pending_request_results, mark_pending_request_failed
+from app.utils.beckn_utils import mark_pending_select_request_failed, store_pending_select_request
+from app.utils.beckn_utils import wait_for_pending_select_request_results_async
+from app.utils.result_waiters import ResultWaiters
+
+
+def test_notify_wakes_every_waiter():
+    waiters = ResultWaiters()
+    ready = threading.Event()
+    results = []
+
+    def wait():
+        results.append(waiters.wait("t1", 5, lambda: ready.is_set()))
+
+    threads = [threading.Thread(target=wait) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    ready.set()
+    waiters.notify("t1")
+    for thread in threads:
+        thread.join(5)
+    assert results == [True] * 5
+    assert waiters.get_stats() == {"transactions": 0, "waiters": 0}
+
+
+def test_every_long_poll_client_gets_the_result(app):
+    results = []
+
+    def long_poll():
+        with app.app_context():
+            results.append(wait_for_pending_request_results("txn-waiters", 5))
+
+    with app.app_context():
+        store_pending_request("txn-waiters", None, {}, {})
+        threads = [threading.Thread(target=long_poll) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        update_pending_request_with_result("txn-waiters", {"message": "done"})
+        for thread in threads:
+            thread.join(5)
+        assert [json_codec.loads(result) for result in results] == [{"message": "done"}] * 4
+        # Still there for a client that reconnects; the plain GET removes it
+        assert wait_for_pending_request_results("txn-waiters", 0.1) is not None
+        assert get_pending_request_results("txn-waiters") is not None
+        assert get_pending_request_results("txn-waiters") is None
+
+
+def test_async_waiters_peek_too(app):
+    async def scenario():
+        waiting = [asyncio.create_task(wait_for_pending_request_results_async("txn-async", 5)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        await asyncio.to_thread(update_pending_request_with_result, "txn-async", {"message": "done"})
+        return await asyncio.gather(*waiting)
+
+    with app.app_context():
+        store_pending_request("txn-async", None, {}, {})
+        assert [json_codec.loads(result) for result in asyncio.run(scenario())] == [{"message": "done"}] * 3
+
+
+def test_failure_wakes_long_poll_clients_with_the_status(app, client):
+    results = []
+
+    def long_poll():
+        with app.app_context():
+            results.append(wait_for_pending_request_results("txn-failed", 10))
+
+    with app.app_context():
+        store_pending_request("txn-failed", None, {}, {})
+        thread = threading.Thread(target=long_poll)
+        started = time.monotonic()
+        thread.start()
+        time.sleep(0.05)
+        mark_pending_request_failed("txn-failed")
+        thread.join(5)
+    assert results == ["failed"]
+    assert time.monotonic() - started < 5
+
+    response = client.get("/beckn/get_search_results/txn-failed?timeout=5")
+    assert response.status_code == 410
+    assert response.get_json()["status"] == "failed"
+    stream = client.get("/beckn/stream_search_results/txn-failed?timeout=5")
+    assert b'event: failed\ndata: {"status": "failed"}' in stream.get_data()
+
+
+def test_async_waiters_see_an_expired_select(app):
+    async def scenario():
+        waiting = asyncio.create_task(wait_for_pending_select_request_results_async("txn-expired", 10))
+        await asyncio.sleep(0.05)
+        await asyncio.to_thread(mark_pending_select_request_failed, "txn-expired", "expired")
+        return await asyncio.wait_for(waiting, 5)
+
+    with app.app_context():
+        store_pending_select_request("txn-expired", None, "p-1", {})
+        assert asyncio.run(scenario()) == "expired"
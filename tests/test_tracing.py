@@ -0,0 +1,123 @@
+# tests/test_tracing.py
+import threading
+import time
+
+import pytest
+import requests
+from flask import Flask
+
+from app.services import beckn_intake_service
+from app.utils import callback_delivery, tracing
+from app.utils.callback_delivery import CallbackJob, deliver_callback_once
+from app.utils.compression import CompressionNegotiator
+from app.utils.job_scheduler import JobScheduler, PRIORITY_SEARCH
+from app.utils.tracing import Tracer, bind_to_current_span, current_span, parse_traceparent, start_span
+from app.utils.tracing import trace_id_for_transaction
+
+REMOTE_TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+REMOTE_PARENT_ID = "00f067aa0ba902b7"
+
+
+@pytest.fixture
+def memory_tracer(monkeypatch):
+    """TRACING_EXPORTER=memory: spans are kept for /admin/traces/<id> and not exported."""
+    monkeypatch.setattr(tracing, "tracer", None)
+    traced_app = Flask(__name__)
+    traced_app.config.update(TRACING_EXPORTER="memory", TRACING_SAMPLE_RATE=1.0)
+    tracer = tracing.initialize_tracing(traced_app)
+    yield tracer
+    tracing.shutdown_tracing()
+
+
+def _spans(tracer, transaction_id):
+    return {span["name"]: span for span in tracer.get_transaction_spans(transaction_id)}
+
+
+@pytest.mark.parametrize("header, expected", [
+    (f"00-{REMOTE_TRACE_ID}-{REMOTE_PARENT_ID}-01", (REMOTE_TRACE_ID, REMOTE_PARENT_ID, True)),
+    (f" 00-{REMOTE_TRACE_ID.upper()}-{REMOTE_PARENT_ID}-00 ", (REMOTE_TRACE_ID, REMOTE_PARENT_ID, False)),
+    (f"00-{REMOTE_TRACE_ID}-{REMOTE_PARENT_ID}-03", (REMOTE_TRACE_ID, REMOTE_PARENT_ID, True)),
+    (f"00-{'0' * 32}-{REMOTE_PARENT_ID}-01", None),
+    (f"00-{REMOTE_TRACE_ID}-{'0' * 16}-01", None),
+    (f"01-{REMOTE_TRACE_ID}-{REMOTE_PARENT_ID}-01", None),
+    (f"00-{REMOTE_TRACE_ID[:-1]}-{REMOTE_PARENT_ID}-01", None),
+    ("", None),
+    (None, None),
+])
+def test_traceparent_parsing(header, expected):
+    assert parse_traceparent(header) == expected
+
+
+def test_callback_continues_the_callers_trace(client, memory_tracer, monkeypatch):
+    jobs, sent_headers = [], []
+
+    def run_async_task(app_instance, transaction_id, message_id, search_criteria, context, callback_uri, deadline):
+        jobs.append(CallbackJob(transaction_id, "on_search", callback_uri, "http://bap.invalid", b"{}", deadline))
+        return True
+
+    def bap(url, method, headers=None, data=None, audience=None, timeout=None, **kwargs):
+        sent_headers.append(dict(headers))
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+    monkeypatch.setattr(beckn_intake_service, "run_async_task", run_async_task)
+    monkeypatch.setattr(callback_delivery, "make_authenticated_request", bap)
+    monkeypatch.setattr(callback_delivery, "get_compression_negotiator", lambda: CompressionNegotiator())
+    body = {"context": {"transaction_id": "txn-traced", "message_id": "txn-traced-m", "ttl": "PT30S",
+                        "bpp_uri": "http://bap.invalid/receiver"},
+            "message": {"intent": {"item": {"descriptor": {"name": "black shirt"}}}}}
+    response = client.post("/beckn/search", json=body, headers={"traceparent": f"00-{REMOTE_TRACE_ID}-{REMOTE_PARENT_ID}-01"})
+    assert response.status_code == 202
+
+    deliver_callback_once(jobs[0], timeout=1) # On a callback worker thread in production
+    spans = _spans(memory_tracer, "txn-traced")
+    intake, deliver = spans["beckn.search"], spans["callback.deliver"]
+    assert (intake["trace_id"], intake["parent_span_id"]) == (REMOTE_TRACE_ID, REMOTE_PARENT_ID)
+    assert (deliver["trace_id"], deliver["parent_span_id"]) == (REMOTE_TRACE_ID, intake["span_id"])
+    assert deliver["attributes"]["beckn.message_id"] == "txn-traced-m"
+    assert sent_headers[0]["traceparent"] == f"00-{REMOTE_TRACE_ID}-{deliver['span_id']}-01"
+
+
+def test_scheduler_job_runs_in_the_submitting_span(memory_tracer):
+    scheduler = JobScheduler(Flask(__name__), num_workers=1)
+    seen = []
+    done = threading.Event()
+
+    def job():
+        seen.append((current_span(), threading.current_thread().name))
+        done.set()
+
+    scheduler.start()
+    try:
+        with start_span("beckn.search", transaction_id="txn-bound") as parent:
+            scheduler.submit("search:txn-bound", PRIORITY_SEARCH, time.time() + 30, bind_to_current_span(job))
+        assert current_span() is None
+        assert done.wait(5)
+    finally:
+        scheduler.shutdown()
+
+    span, thread_name = seen[0]
+    assert span is parent
+    assert thread_name != threading.current_thread().name
+    queue_wait = _spans(memory_tracer, "txn-bound")["scheduler.queue_wait"]
+    assert (queue_wait["trace_id"], queue_wait["parent_span_id"]) == (parent.trace_id, parent.span_id)
+
+
+def test_sampling_is_decided_by_the_transaction_id():
+    transaction_ids = [f"txn-{i}" for i in range(400)]
+
+    def sampled(tracer):
+        return [tracer.new_span("beckn.search", attributes={"beckn.transaction_id": transaction_id}).sampled
+                for transaction_id in transaction_ids]
+
+    worker_a, worker_b = Tracer(sample_rate=0.25), Tracer(sample_rate=0.25) # Two processes
+    decisions = sampled(worker_a)
+    assert decisions == sampled(worker_b)
+    assert 50 < sum(decisions) < 150
+    assert worker_a.new_span("x", attributes={"beckn.transaction_id": "txn-7"}).trace_id == trace_id_for_transaction("txn-7")
+    assert not any(sampled(Tracer(sample_rate=0.0)))
+    assert all(sampled(Tracer(sample_rate=1.0)))
+    # A caller's traceparent decides for its own trace
+    remote = Tracer(sample_rate=0.0).new_span("beckn.search", traceparent=f"00-{REMOTE_TRACE_ID}-{REMOTE_PARENT_ID}-01")
+    assert remote.sampled and remote.trace_id == REMOTE_TRACE_ID
@@ -0,0 +1,63 @@
+# tests/test_traffic_capture.py
+import json
+import re
+
+import pytest
+
+from app.utils.traffic_capture import REDACTED, TrafficCapture, scrub_body, scrub_pii
+
+
+@pytest.mark.parametrize("phone", [
+    "+91 98765 43210", "9876543210", "+1 (555) 123-4567", "(555) 123-4567", "+44 20 7946 0958",
+    "020 7946 0958", "+49 30 901820", "+61 2 9374 4000", "555.123.4567",
+])
+def test_phone_numbers_in_any_format_are_redacted(phone):
+    assert scrub_pii(f"call {phone} after 6") == f"call {REDACTED} after 6"
+
+
+@pytest.mark.parametrize("text", [
+    "delivered 2024-01-15", "Rs 1499.00 incl. tax", "pack of 12", "2024-01-15T10:30:00Z", "SKU-20240115-998877",
+    "price 5000 - 15000", "price 10000-50000", "price:10000-50000", "Price 10000 to 50000", "price >= 100000000",
+    "shirts, price 10000-50000, color:black", "between 5000 - 15000",
+])
+def test_dates_prices_and_codes_are_kept(text):
+    assert scrub_pii(text) == text
+
+
+def test_captured_query_keeps_its_price_range():
+    body = {"context": {}, "message": {"intent": {"query": "shirts,price 5000 - 15000,call 9876543210"}}}
+    assert scrub_body(body)["message"]["intent"]["query"] == f"shirts,price 5000 - 15000,call {REDACTED}"
+
+
+def test_pii_subtrees_are_replaced_and_ids_kept():
+    message = {
+        "intent": {
+            "fulfillment": {"end": {"contact": {"phone": "9876543210"}, "location": {"gps": "12.9,77.6"}}},
+            "item": {"descriptor": {"name": "shirts, mail jane@example.com"}},
+        },
+        "order_id": "9876543210",
+    }
+    scrubbed = scrub_pii(message)
+    assert scrubbed["intent"]["fulfillment"]["end"]["contact"] == REDACTED
+    assert scrubbed["intent"]["fulfillment"]["end"]["location"]["gps"] == REDACTED
+    assert scrubbed["intent"]["item"]["descriptor"]["name"] == f"shirts, mail {REDACTED}"
+    assert scrubbed["order_id"] == "9876543210"
+
+
+def test_extra_pattern_and_context_kept():
+    body = {"context": {"bap_id": "bap.example.com", "note": "AB123456C"}, "message": {"note": "ni AB123456C"}}
+    scrubbed = scrub_body(body, re.compile(r"\b[A-Z]{2}\d{6}[A-D]\b"))
+    assert scrubbed["message"]["note"] == f"ni {REDACTED}"
+    assert scrubbed["context"] == body["context"]
+    assert body["message"]["note"] == "ni AB123456C"
+
+
+def test_capture_writes_scrubbed_lines(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    capture = TrafficCapture(str(path), sample_rate=1.0, scrub_pattern=r"secret-\w+")
+    capture.start()
+    capture.record("search", {"context": {"transaction_id": "t-1"}, "message": {"q": "secret-x +91 98765 43210"}})
+    capture.shutdown()
+    line = json.loads(path.read_text().splitlines()[0])
+    assert line["action"] == "search"
+    assert line["body"]["message"]["q"] == f"{REDACTED} {REDACTED}"
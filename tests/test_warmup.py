@@ -0,0 +1,50 @@
+# tests/test_warmup.py
+import time
+
+from flask import Flask
+
+from app.utils.warmup import Warmup, WarmupStep, build_warmup_steps, FAILED, READY
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_embedding_step_is_opt_in():
+    assert "embedding" not in [step.name for step in build_warmup_steps({})]
+    assert "embedding" in [step.name for step in build_warmup_steps({"WARMUP_EMBEDDING": True})]
+
+
+def test_optional_step_failure_does_not_block_readiness():
+    def fail(app):
+        raise RuntimeError("no API key")
+
+    warmup = Warmup(Flask(__name__), [WarmupStep("optional", fail, required=False)])
+    warmup.start(background=False)
+    assert warmup.is_ready()
+    assert warmup.get_report()["steps"]["optional"]["status"] == "failed"
+
+
+def test_blocking_warmup_gives_up_waiting_and_keeps_retrying_in_the_background():
+    database = {"up": False}
+
+    def connect(app):
+        if not database["up"]:
+            raise ConnectionError("database unreachable")
+
+    warmup = Warmup(Flask(__name__), [WarmupStep("db_connections", connect, required=True)], retry_interval_seconds=0.05)
+    started = time.monotonic()
+    warmup.start(background=False, blocking_timeout_seconds=0.2)
+    try:
+        assert time.monotonic() - started < 1
+        assert warmup.state == FAILED and not warmup.is_ready()
+        database["up"] = True
+        assert _wait_until(warmup.is_ready)
+        assert warmup.state == READY
+    finally:
+        warmup.shutdown()